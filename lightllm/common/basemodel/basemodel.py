@@ -8,12 +8,13 @@ from typing import final
 from lightllm.common.basemodel.layer_weights.hf_load_utils import load_hf_weights
 from lightllm.common.basemodel.infer_struct import InferStateInfo
 from lightllm.common.mem_manager import MemoryManager
-from lightllm.common.req_manager import ReqManager
+from lightllm.common.req_manager import ReqManager, ReqSamplingParamsManager
 from lightllm.common.infer_utils import init_req_to_token_indexes
 from lightllm.common.build_utils import repair_config
 from lightllm.common.basemodel.triton_kernel.copy_kv_index_to_req import copy_kv_index_to_req
 from lightllm.common.basemodel.layer_infer.cache_tensor_manager import g_cache_manager
 from lightllm.common.basemodel.cuda_graph import CudaGraph
+from lightllm.common.basemodel.cuda_graph_bucket import pad_decode_batch
 from lightllm.common.quantization import Quantcfg
 from lightllm.utils.log_utils import init_logger
 from lightllm.utils.dist_utils import get_dp_world_size
@@ -67,6 +68,7 @@ class TpPartBaseModel:
             else self.graph_max_batch_size
         )
         self.graph_max_len_in_batch = kvargs.get("graph_max_len_in_batch", 8192)
+        self.graph_batch_buckets = kvargs.get("graph_batch_buckets", None)
         self.disable_cudagraph = kvargs.get("disable_cudagraph", False)
         self.quant_type = kvargs.get("quant_type", "none")
         self.quant_cfg_path = kvargs.get("quant_cfg", None)
@@ -82,6 +84,7 @@ class TpPartBaseModel:
         self._verify_must()
         self._verify_params()
         self._init_quant()
+        self._init_req_sampling_params_manager()
 
         # 更连续的显存分配可以有更好的性能
         if self.max_total_token_num is None:
@@ -187,6 +190,13 @@ class TpPartBaseModel:
             create_max_seq_len = max(create_max_seq_len, self.max_seq_length)
 
         self.req_manager = ReqManager(self.max_req_num, create_max_seq_len, self.mem_manager)
+        self.req_manager.req_sampling_params_manager = self.req_sampling_params_manager
+        return
+
+    def _init_req_sampling_params_manager(self):
+        # 按请求 slot 保存的输出 token 计数表有 (max_req_num + 1) * vocab_size 个 int32, 词表较大时会占用数百 MB
+        # 显存，需要在根据 mem_fraction 估计 kv cache 的容量之前申请，使估计时扣除这部分显存。
+        self.req_sampling_params_manager = ReqSamplingParamsManager(self.max_req_num, self.config["vocab_size"])
         return
 
     def _init_infer_layer(self):
@@ -220,7 +230,9 @@ class TpPartBaseModel:
 
     def _init_cudagraph(self):
         self.graph = (
-            None if self.disable_cudagraph else CudaGraph(self.graph_max_batch_size, self.graph_max_len_in_batch)
+            None
+            if self.disable_cudagraph
+            else CudaGraph(self.graph_max_batch_size, self.graph_max_len_in_batch, self.graph_batch_buckets)
         )
         if self.graph is not None:
             if get_env_start_args().enable_decode_microbatch_overlap:
@@ -295,17 +307,33 @@ class TpPartBaseModel:
         self,
         model_input: ModelInput,
     ):
+        real_batch_size = model_input.batch_size
+        graph_bucket = None
+        if self.graph is not None and self.graph.can_run(model_input.batch_size, model_input.max_len_in_batch):
+            # padding 到不小于当前 batch size 的最小的桶上，使用该桶预先捕获的图进行推理
+            graph_bucket = self.graph.find_bucket(model_input.batch_size)
+            model_input = pad_decode_batch(
+                model_input, graph_bucket, self.req_manager.HOLD_REQUEST_ID, self.mem_manager.HOLD_TOKEN_MEMINDEX
+            )
+
         infer_state = self._create_inferstate(model_input)
         copy_kv_index_to_req(
             self.req_manager.req_to_token_indexs, model_input.b_req_idx, model_input.b_seq_len, infer_state.mem_index
         )
         infer_state.init_some_extra_state(self, model_input.input_ids)
-        if self.graph is not None and self.graph.can_run(model_input.batch_size, model_input.max_len_in_batch):
-            if self.graph.need_capture(model_input.batch_size):
+        if graph_bucket is not None:
+            if self.graph.need_capture(graph_bucket):
                 infer_state.is_cuda_graph = True
-                return self.graph.capture_decode(self._token_forward, model_input.input_ids, infer_state)
+                model_output = self.graph.capture_decode(self._token_forward, model_input.input_ids, infer_state)
             else:
-                return self.graph.replay(model_input.input_ids, infer_state)
+                model_output = self.graph.replay(model_input.input_ids, infer_state)
+                self.graph.record_replay(graph_bucket, real_batch_size)
+            if graph_bucket == real_batch_size:
+                return model_output
+            hidden_states = model_output.hidden_states
+            if hidden_states is not None:
+                hidden_states = hidden_states[0:real_batch_size]
+            return ModelOutput(logits=model_output.logits[0:real_batch_size], hidden_states=hidden_states)
 
         return self._token_forward(model_input.input_ids, infer_state)
 
@@ -314,6 +342,15 @@ class TpPartBaseModel:
         assert batch.batch_size == batch1.batch_size
         assert batch.mem_indexes.is_cuda
         assert batch1.mem_indexes.is_cuda
+        real_batch_size = batch.batch_size
+        graph_bucket = None
+        if self.graph is not None and self.graph.can_run(
+            batch.batch_size, max(batch.max_len_in_batch, batch1.max_len_in_batch)
+        ):
+            graph_bucket = self.graph.find_bucket(batch.batch_size)
+            hold_req_id, hold_mem_index = self.req_manager.HOLD_REQUEST_ID, self.mem_manager.HOLD_TOKEN_MEMINDEX
+            batch = pad_decode_batch(batch, graph_bucket, hold_req_id, hold_mem_index)
+            batch1 = pad_decode_batch(batch1, graph_bucket, hold_req_id, hold_mem_index)
         input_ids, input_ids1 = batch.input_ids, batch1.input_ids
 
         def create_inferstate(cur_batch: DecodeMicroBatch, batch_index):
@@ -349,11 +386,8 @@ class TpPartBaseModel:
         infer_state.init_some_extra_state(self, input_ids)
         infer_state1.init_some_extra_state(self, input_ids1)
 
-        batch_size = batch.batch_size
-        max_len_in_batch = max(batch.max_len_in_batch, batch1.max_len_in_batch)
-
-        if self.graph is not None and self.graph.can_run(batch_size, max_len_in_batch):
-            if self.graph.need_capture(batch_size):
+        if graph_bucket is not None:
+            if self.graph.need_capture(graph_bucket):
                 infer_state.is_cuda_graph = True
                 infer_state1.is_cuda_graph = True
 
@@ -368,6 +402,8 @@ class TpPartBaseModel:
                 predict_logits, predict_logits1 = self.graph.replay(
                     input_ids, infer_state, input_ids1=input_ids1, infer_state1=infer_state1
                 )
+                self.graph.record_replay(graph_bucket, real_batch_size)
+            predict_logits, predict_logits1 = predict_logits[0:real_batch_size], predict_logits1[0:real_batch_size]
         else:
             predict_logits, predict_logits1 = self._overlap_tpsp_token_forward(
                 input_ids, infer_state, input_ids1=input_ids1, infer_state1=infer_state1
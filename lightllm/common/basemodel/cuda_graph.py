@@ -6,6 +6,7 @@ from lightllm.utils.envs_utils import get_env_start_args
 from lightllm.distributed import dist_group_manager, lightllm_capture_graph, CustomProcessGroup
 from lightllm.common.basemodel.microbatch_overlap_objs import DecodeMicroBatch
 from lightllm.common.basemodel.batch_objs import ModelInput, ModelOutput
+from lightllm.common.basemodel.cuda_graph_bucket import GraphBatchBuckets, build_graph_batch_buckets
 from lightllm.common.spec_info import SpeculativeDecodeAlgorithm
 
 logger = init_logger(__name__)
@@ -14,16 +15,24 @@ logger = init_logger(__name__)
 class CudaGraph:
     # CudaGraph forward pass for the decoding stage.
 
-    def __init__(self, max_batch_size=8, max_len_in_batch=8192):
+    def __init__(self, max_batch_size=8, max_len_in_batch=8192, batch_buckets=None):
         self.graph = {}
         self.mempool = torch.cuda.graph_pool_handle() if torch.cuda.is_available() else None
         self.max_batch_size = max_batch_size
         self.graph_max_len_in_batch = max_len_in_batch
         self.enable_decode_microbatch_overlap = get_env_start_args().enable_decode_microbatch_overlap
+        # 只为桶中的 batch size 捕获图，其他 batch size 会被 padding 到最近的桶上
+        self.buckets = GraphBatchBuckets(build_graph_batch_buckets(max_batch_size, batch_buckets))
 
     def can_run(self, batch_size, max_len_in_batch):
         return batch_size <= self.max_batch_size and max_len_in_batch <= self.graph_max_len_in_batch
 
+    def find_bucket(self, batch_size):
+        return self.buckets.find_bucket(batch_size)
+
+    def record_replay(self, bucket, batch_size):
+        self.buckets.record_replay(bucket, batch_size)
+
     def need_capture(self, batch_size):
         return batch_size not in self.graph
 
@@ -131,7 +140,7 @@ class CudaGraph:
     def warmup(self, model):
         logger.info("Begin capture cudagraph, use the --disable_cudagraph to disable it.")
         decode_len = model.spec_algo.decode_len()
-        for batch_size in range(self.max_batch_size, 0, -1):
+        for batch_size in reversed(self.buckets.buckets):
             # dummy prefill
             prefill_input_len = 1
             dummy_input_ids = torch.ones((batch_size,), dtype=torch.int32, device="cuda")
@@ -198,14 +207,14 @@ class CudaGraph:
                     del locals()[var_name]
             torch.cuda.empty_cache()
         logger.info(
-            f"Capture cudagraph success, batch_size <={self.max_batch_size} "
+            f"Capture cudagraph success, batch buckets {self.buckets.buckets}, batch_size <={self.max_batch_size} "
             f"and max_len_in_batch <= {self.graph_max_len_in_batch} will infer with cudagraph."
         )
 
     @torch.no_grad()
     def warmup_overlap(self, model):
         logger.info("Begin capture overlap cudagraph, use the --disable_cudagraph to disable it.")
-        for batch_size in range(self.max_batch_size, 0, -1):
+        for batch_size in reversed(self.buckets.buckets):
             decode_batches = []
             for micro_batch_index in [0, 1]:
                 # dummy prefill
@@ -270,6 +279,7 @@ class CudaGraph:
             torch.cuda.empty_cache()
 
         logger.info(
-            f"Capture overlap cudagraph success, batch_size <={self.max_batch_size} "
+            f"Capture overlap cudagraph success, batch buckets {self.buckets.buckets}, "
+            f"batch_size <={self.max_batch_size} "
             f"and max_len_in_batch <= {self.graph_max_len_in_batch} will infer with cudagraph."
         )
@@ -0,0 +1,94 @@
+import time
+import bisect
+import dataclasses
+import torch
+from typing import Dict, List, Optional, Tuple
+from lightllm.utils.log_utils import init_logger
+
+logger = init_logger(__name__)
+
+
+def build_graph_batch_buckets(max_batch_size: int, buckets: Optional[List[int]] = None) -> List[int]:
+    """
+    返回需要捕获 cuda graph 的 batch size 列表(从小到大排列)。buckets 为 None 时每个 batch size 单独捕获一个图，
+    否则只捕获 buckets 中不超过 max_batch_size 的部分，max_batch_size 本身总是会被加入，保证所有可以使用
+    cuda graph 的 batch 都能找到对应的桶。
+    """
+    if buckets is None or len(buckets) == 0:
+        return list(range(1, max_batch_size + 1))
+    assert all(e > 0 for e in buckets), f"graph batch buckets must be positive, but get {buckets}"
+    ans = set(e for e in buckets if e <= max_batch_size)
+    ans.add(max_batch_size)
+    return sorted(ans)
+
+
+class GraphBatchBuckets:
+    """
+    cuda graph 的 batch size 分桶，decode 时 batch 会被 padding 到不小于其 batch size 的最小的桶上，使用该桶
+    预先捕获的图进行推理。同时统计每个桶被 replay 的次数以及 padding 的请求数量，用于调整桶的设置。
+    """
+
+    def __init__(self, buckets: List[int], log_interval: float = 60.0):
+        self.buckets = sorted(set(buckets))
+        assert len(self.buckets) > 0
+        self.log_interval = log_interval
+        # bucket -> [replay 次数, padding 的请求数量]
+        self.replay_stats: Dict[int, List[int]] = {bucket: [0, 0] for bucket in self.buckets}
+        self.last_log_time = time.time()
+
+    @property
+    def max_batch_size(self) -> int:
+        return self.buckets[-1]
+
+    def find_bucket(self, batch_size: int) -> Optional[int]:
+        index = bisect.bisect_left(self.buckets, batch_size)
+        if index == len(self.buckets):
+            return None
+        return self.buckets[index]
+
+    def record_replay(self, bucket: int, batch_size: int):
+        stats = self.replay_stats[bucket]
+        stats[0] += 1
+        stats[1] += bucket - batch_size
+        if self.log_interval > 0 and time.time() - self.last_log_time >= self.log_interval:
+            self.last_log_time = time.time()
+            logger.info(f"cuda graph bucket replay stats: {self.format_replay_stats()}")
+        return
+
+    def get_replay_stats(self) -> Dict[int, Tuple[int, int]]:
+        return {bucket: tuple(stats) for bucket, stats in self.replay_stats.items()}
+
+    def format_replay_stats(self) -> str:
+        return ", ".join(
+            f"bs {bucket}: replay {stats[0]} pad {stats[1]}" for bucket, stats in self.replay_stats.items()
+        )
+
+
+def pad_decode_batch(batch, padded_batch_size: int, hold_req_id: int, hold_mem_index: int):
+    """
+    将 decode 的 batch(ModelInput 或者 DecodeMicroBatch) padding 到 padded_batch_size, padding 的请求使用
+    req_manager 中预留的 HOLD_REQUEST_ID 和 mem_manager 中预留的 HOLD_TOKEN_MEMINDEX, 与 dp 模式下 padding
+    假请求的方式相同。返回新的 batch 对象，原对象不会被修改。
+    """
+    pad_num = padded_batch_size - batch.batch_size
+    assert pad_num >= 0
+    if pad_num == 0:
+        return batch
+
+    def _pad(tensor: torch.Tensor, value):
+        padding = torch.full((pad_num,) + tuple(tensor.shape[1:]), value, dtype=tensor.dtype, device=tensor.device)
+        return torch.cat((tensor, padding), dim=0)
+
+    pad_seq_len = 2
+    changes = {
+        "batch_size": padded_batch_size,
+        "total_token_num": batch.total_token_num + pad_seq_len * pad_num,
+        "max_len_in_batch": max(batch.max_len_in_batch, pad_seq_len),
+        "input_ids": _pad(batch.input_ids, 1),
+        "mem_indexes": _pad(batch.mem_indexes, hold_mem_index),
+        "b_req_idx": _pad(batch.b_req_idx, hold_req_id),
+        "b_seq_len": _pad(batch.b_seq_len, pad_seq_len),
+    }
+    if getattr(batch, "hidden_states", None) is not None:
+        changes["hidden_states"] = _pad(batch.hidden_states, 0)
+    return dataclasses.replace(batch, **changes)
@@ -0,0 +1,108 @@
+import torch
+
+import triton
+import triton.language as tl
+
+
+@triton.jit
+def _fwd_kernel_apply_penalty_gpu_cache(
+    Logits,
+    b_req_idx,
+    req_to_presence_penalty,
+    req_to_frequency_penalty,
+    req_to_repetition_penalty,
+    req_to_exponential_decay_length_penalty,
+    req_to_exponential_decay_start,
+    req_to_min_new_tokens,
+    req_to_out_token_len,
+    req_to_out_token_id_counter,
+    eos_ids,
+    stride_logit_b,
+    stride_counter_b,
+    vocab_size,
+    counter_vocab_size,
+    BLOCK: tl.constexpr,
+    EOS_ID_NUM: tl.constexpr,
+):
+    cur_batch = tl.program_id(0)
+    block_index = tl.program_id(1)
+    cur_req_idx = tl.load(b_req_idx + cur_batch)
+    cur_presence = tl.load(req_to_presence_penalty + cur_req_idx)
+    cur_freqency = tl.load(req_to_frequency_penalty + cur_req_idx)
+    cur_repetition = tl.load(req_to_repetition_penalty + cur_req_idx)
+
+    offs = block_index * BLOCK + tl.arange(0, BLOCK)
+    token_counts = tl.load(
+        req_to_out_token_id_counter + cur_req_idx * stride_counter_b + offs, mask=offs < counter_vocab_size, other=0
+    )
+    logit_ptrs = Logits + cur_batch * stride_logit_b + offs
+    cur_logits = tl.load(logit_ptrs, mask=offs < vocab_size, other=0.0)
+    rep_logits = tl.where(cur_logits > 0, cur_logits / cur_repetition, cur_logits * cur_repetition)
+    freq_logits = rep_logits - token_counts * cur_freqency
+    pre_logits = freq_logits - cur_presence
+    cur_logits = tl.where(token_counts > 0, pre_logits, cur_logits)
+
+    # eos 的长度惩罚在计数惩罚之后进行，与 eos 所在的块由同一个 program 处理，避免写冲突
+    out_token_len = tl.load(req_to_out_token_len + cur_req_idx)
+    exponential_decay_length_penalty = tl.load(req_to_exponential_decay_length_penalty + cur_req_idx)
+    exponential_decay_start = tl.load(req_to_exponential_decay_start + cur_req_idx)
+    min_new_tokens = tl.load(req_to_min_new_tokens + cur_req_idx)
+    length_penalty = tl.maximum(out_token_len - exponential_decay_start, 0)
+    penalty_scale = tl.exp2(tl.log2(exponential_decay_length_penalty) * length_penalty) - 1
+    mask_eos = out_token_len < min_new_tokens - 1
+
+    is_eos = offs < 0
+    for eos_index in range(EOS_ID_NUM):
+        eos_id = tl.load(eos_ids + eos_index)
+        is_eos = is_eos | (offs == eos_id)
+    eos_logits = cur_logits + tl.abs(cur_logits) * penalty_scale
+    eos_logits = tl.where(mask_eos, -10000000.0, eos_logits)
+    cur_logits = tl.where(is_eos, eos_logits, cur_logits)
+    tl.store(logit_ptrs, cur_logits, mask=offs < vocab_size)
+    return
+
+
+@torch.no_grad()
+def apply_penalty_gpu_cache(
+    Logits,
+    b_req_idx,
+    req_to_presence_penalty,
+    req_to_frequency_penalty,
+    req_to_repetition_penalty,
+    req_to_exponential_decay_length_penalty,
+    req_to_exponential_decay_start,
+    req_to_min_new_tokens,
+    req_to_out_token_len,
+    req_to_out_token_id_counter,
+    eos_ids,
+):
+    """
+    与 apply_penalty 的计算相同，但是采样参数和 token 计数都按照请求的 req_idx 从 ReqSamplingParamsManager
+    中的 per slot 张量读取，token 计数为稠密的 [max_request_num + 1, vocab_size] 计数表。
+    """
+    assert Logits.is_contiguous()
+    BLOCK = 2048
+    num_warps = 8
+    batch_size, vocab_size = Logits.shape
+    grid = (batch_size, triton.cdiv(vocab_size, BLOCK))
+    _fwd_kernel_apply_penalty_gpu_cache[grid](
+        Logits,
+        b_req_idx,
+        req_to_presence_penalty,
+        req_to_frequency_penalty,
+        req_to_repetition_penalty,
+        req_to_exponential_decay_length_penalty,
+        req_to_exponential_decay_start,
+        req_to_min_new_tokens,
+        req_to_out_token_len,
+        req_to_out_token_id_counter,
+        eos_ids,
+        Logits.stride(0),
+        req_to_out_token_id_counter.stride(0),
+        vocab_size,
+        req_to_out_token_id_counter.shape[1],
+        num_warps=num_warps,
+        BLOCK=BLOCK,
+        EOS_ID_NUM=eos_ids.shape[0],
+    )
+    return
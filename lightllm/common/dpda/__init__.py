@@ -0,0 +1,4 @@
+from .core import T, NT, compute_graph
+from .lr_table import LRTable
+from .json_grammar import get_builtin_grammar, BUILTIN_GRAMMARS
+from .token_table import TokenTable, DpdaMatcher, build_token_table, get_token_bytes, get_default_cache_dir
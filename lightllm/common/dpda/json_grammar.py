@@ -0,0 +1,137 @@
+from typing import Dict, List, Optional, Tuple, Union
+from .core import T, NT
+
+# 终结符按照字节划分，字符串以外出现的字符各自是一个终结符，只在字符串中出现且作用相同的字节合并为一类，
+# 以减少 lr(1) 状态和预计算的数量。小于 0x20 的字节中只有空白字符可以出现，并且只能出现在字符串以外。
+_LITERAL_CHARS = '{}[],:"\\/-+.0trueflsnabE'
+_BYTE_CLASSES = {
+    "1-9": b"123456789",
+    "sp": b" ",
+    "ctl_ws": b"\t\n\r",
+    "hex": b"cdABCDF",
+}
+_OTHER = "other"
+
+_HEX_TERMS = ["0", "1-9", "a", "b", "e", "f", "E", "hex"]
+_ESCAPE_TERMS = ['"', "\\", "/", "b", "f", "n", "r", "t"]
+
+
+def get_json_byte_to_term() -> List[Optional[str]]:
+    """
+    返回长度为 256 的列表，每个字节对应的终结符名字，None 表示该字节不能出现在 json 中。
+    """
+    byte_to_term: List[Optional[str]] = [None] * 256
+    for c in set(_LITERAL_CHARS):
+        byte_to_term[ord(c)] = c
+    for name, chars in _BYTE_CLASSES.items():
+        for b in chars:
+            byte_to_term[b] = name
+    for b in range(0x20, 256):
+        if byte_to_term[b] is None:
+            byte_to_term[b] = _OTHER
+    return byte_to_term
+
+
+def get_json_grammar() -> Tuple[List[Tuple[NT, List[Union[NT, T]]]], List[T]]:
+    """
+    返回字节级别的 json 文法(与 format_out/grammer/json.ebnf 相同，最外层为 object 或者 array)以及终结符列表。
+    core.compute_graph 不支持 "ε" 表达式，可选的部分都展开为多个生成式，空白和字符串中的字符使用左递归，
+    解析时状态栈的深度只与嵌套的层数有关。
+    """
+    terminals = sorted(set(e for e in get_json_byte_to_term() if e is not None))
+    t = {name: T(name) for name in terminals}
+
+    S, J, E, V, WS, W = NT("S'"), NT("J"), NT("E"), NT("V"), NT("WS"), NT("W")
+    Obj, Mems, Mem, K = NT("Obj"), NT("Mems"), NT("Mem"), NT("K")
+    Arr, Elems = NT("Arr"), NT("Elems")
+    Str, Chars, Ch, C, Esc, H = NT("Str"), NT("Chars"), NT("Ch"), NT("C"), NT("Esc"), NT("H")
+    Num, Int, Digs, Dg, Frac, Exp, Ex = NT("Num"), NT("Int"), NT("Digs"), NT("Dg"), NT("Frac"), NT("Exp"), NT("Ex")
+
+    def word(s: str):
+        return [t[c] for c in s]
+
+    grammar = [
+        (S, [J]),
+        (J, [Obj]),
+        (J, [Arr]),
+        (E, [V]),
+        (E, [V, WS]),
+        (V, [Obj]),
+        (V, [Arr]),
+        (V, [Str]),
+        (V, [Num]),
+        (V, word("true")),
+        (V, word("false")),
+        (V, word("null")),
+        (WS, [W]),
+        (WS, [WS, W]),
+        (W, [t["sp"]]),
+        (W, [t["ctl_ws"]]),
+        (Obj, [t["{"], t["}"]]),
+        (Obj, [t["{"], WS, t["}"]]),
+        (Obj, [t["{"], Mems, t["}"]]),
+        (Obj, [t["{"], WS, Mems, t["}"]]),
+        (Mems, [Mem]),
+        (Mems, [Mems, t[","], Mem]),
+        (Mems, [Mems, t[","], WS, Mem]),
+        (Mem, [K, t[":"], E]),
+        (Mem, [K, t[":"], WS, E]),
+        (K, [Str]),
+        (K, [Str, WS]),
+        (Arr, [t["["], t["]"]]),
+        (Arr, [t["["], WS, t["]"]]),
+        (Arr, [t["["], Elems, t["]"]]),
+        (Arr, [t["["], WS, Elems, t["]"]]),
+        (Elems, [E]),
+        (Elems, [Elems, t[","], E]),
+        (Elems, [Elems, t[","], WS, E]),
+        (Str, [t['"'], t['"']]),
+        (Str, [t['"'], Chars, t['"']]),
+        (Chars, [Ch]),
+        (Chars, [Chars, Ch]),
+        (Ch, [C]),
+        (Ch, [t["\\"], Esc]),
+        (Esc, [t["u"], H, H, H, H]),
+        (Num, [Int]),
+        (Num, [Int, Frac]),
+        (Num, [Int, Exp]),
+        (Num, [Int, Frac, Exp]),
+        (Int, [t["0"]]),
+        (Int, [t["1-9"]]),
+        (Int, [t["1-9"], Digs]),
+        (Int, [t["-"], t["0"]]),
+        (Int, [t["-"], t["1-9"]]),
+        (Int, [t["-"], t["1-9"], Digs]),
+        (Digs, [Dg]),
+        (Digs, [Digs, Dg]),
+        (Dg, [t["0"]]),
+        (Dg, [t["1-9"]]),
+        (Frac, [t["."], Digs]),
+        (Exp, [Ex, Digs]),
+        (Exp, [Ex, t["+"], Digs]),
+        (Exp, [Ex, t["-"], Digs]),
+        (Ex, [t["e"]]),
+        (Ex, [t["E"]]),
+    ]
+    # 字符串中可以直接出现的字符，转义字符以及 \u 后的十六进制字符
+    grammar.extend((C, [t[name]]) for name in terminals if name not in ('"', "\\", "ctl_ws"))
+    grammar.extend((Esc, [t[name]]) for name in _ESCAPE_TERMS)
+    grammar.extend((H, [t[name]]) for name in _HEX_TERMS)
+    return grammar, [t[name] for name in terminals]
+
+
+# 内置的文法，guided_grammar 需要使用这里的名字，guided_json 使用 json 文法
+BUILTIN_GRAMMARS: Dict[str, object] = {
+    "json": (get_json_grammar, get_json_byte_to_term),
+}
+
+
+def get_builtin_grammar(name: str):
+    """
+    返回 (grammar, terminals, byte_to_term)。
+    """
+    if name not in BUILTIN_GRAMMARS:
+        raise ValueError(f"dpda grammar '{name}' is not supported, supported grammars: {list(BUILTIN_GRAMMARS.keys())}")
+    get_grammar, get_byte_to_term = BUILTIN_GRAMMARS[name]
+    grammar, terminals = get_grammar()
+    return grammar, terminals, get_byte_to_term()
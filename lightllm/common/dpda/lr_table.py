@@ -0,0 +1,117 @@
+from typing import Dict, List, Optional, Tuple, Union
+from .core import T, NT, compute_graph
+
+# action 表中的编码，大于等于 0 表示移进后转移到的状态
+ACTION_ERROR = -1
+ACTION_ACCEPT = -2
+# 小于等于 ACTION_REDUCE_BASE 表示使用生成式 ACTION_REDUCE_BASE - action 进行规约
+ACTION_REDUCE_BASE = -3
+
+# 终结符 id 0 固定为结束符
+END_TERM_ID = 0
+
+
+class LRTable:
+    """
+    由 core.compute_graph 构建的 lr(1) 项集族生成的 action / goto 表，即文法对应的确定下推自动机。
+    表使用 python 的嵌套 list 保存，解析时逐个终结符查表的开销比 numpy 的标量索引小很多。
+    """
+
+    def __init__(self, grammar: List[Tuple[NT, List[Union[NT, T]]]], terminals: List[T], start_symbol: str = "S'"):
+        graph = compute_graph(grammar=grammar, start_symbol=start_symbol)
+        graph.check_lr1()
+
+        self.terminals = [T("")] + list(terminals)
+        self.term_to_id: Dict[T, int] = {t: i for i, t in enumerate(self.terminals)}
+        assert len(self.term_to_id) == len(self.terminals), "terminals must be unique"
+        nts = []
+        for nt, _ in grammar:
+            if nt not in nts:
+                nts.append(nt)
+        self.nt_to_id: Dict[NT, int] = {nt: i for i, nt in enumerate(nts)}
+
+        # 生成式 id 与 core.grammar_to_dict 中的 gen_id 相同，即其在 grammar 中的下标
+        self.gen_lhs: List[int] = [self.nt_to_id[nt] for nt, _ in grammar]
+        self.gen_len: List[int] = [len(gen_list) for _, gen_list in grammar]
+        start_nt = NT(start_symbol)
+
+        self.state_num = len(graph.graph_nodes)
+        self.action: List[List[int]] = [[ACTION_ERROR] * len(self.terminals) for _ in range(self.state_num)]
+        self.goto: List[List[int]] = [[ACTION_ERROR] * len(nts) for _ in range(self.state_num)]
+        # 每个状态都是通过同一个符号转移进入的，entry_nt 为进入该状态的非终结符 id, 通过终结符进入时为 -1
+        self.entry_nt: List[int] = [-1] * self.state_num
+        for node in graph.graph_nodes:
+            action_row = self.action[node.node_id]
+            for nt_or_t, next_node in node.edge_to_next.items():
+                if isinstance(nt_or_t, T):
+                    assert nt_or_t in self.term_to_id, f"terminal {nt_or_t} is not in terminals"
+                    action_row[self.term_to_id[nt_or_t]] = next_node.node_id
+                else:
+                    self.goto[node.node_id][self.nt_to_id[nt_or_t]] = next_node.node_id
+                    self.entry_nt[next_node.node_id] = self.nt_to_id[nt_or_t]
+            for item_la in node.item_dict.values():
+                if not item_la.item.is_finished_loc():
+                    continue
+                gen = item_la.item.gen
+                for t in item_la.lookahead_set:
+                    if gen.nt == start_nt:
+                        assert t.is_finished()
+                        action_row[END_TERM_ID] = ACTION_ACCEPT
+                    else:
+                        action_row[self.term_to_id[t]] = ACTION_REDUCE_BASE - gen.gen_id
+
+        # 所有可以接受的输入都使用同一个生成式规约的状态，不需要看下一个输入就可以直接规约
+        self.default_reduce: List[int] = [ACTION_ERROR] * self.state_num
+        for state, action_row in enumerate(self.action):
+            acts = set(act for act in action_row if act != ACTION_ERROR)
+            if len(acts) == 1 and list(acts)[0] <= ACTION_REDUCE_BASE:
+                self.default_reduce[state] = ACTION_REDUCE_BASE - list(acts)[0]
+        return
+
+    def feed(self, stack: List[int], term_id: int) -> Optional[int]:
+        """
+        在状态栈 stack 上输入一个终结符，原地修改 stack。返回 ACTION_ERROR 表示不接受，ACTION_ACCEPT 表示
+        输入结束符后接受，否则返回移进后的状态。
+
+        完整的解析过程中栈底的初始状态不会被弹出，以某个状态 s 为栈底进行预计算时，如果规约需要弹出栈中的全部
+        状态，说明结果依赖 s 以下的内容，此时返回 None。只有一种情况例外: 弹出的状态恰好是整个栈，并且规约得到的
+        非终结符就是进入 s 的符号(如 Chars = Chars Ch 这样的左递归)，由于 s 以下的状态 p 经过该符号转移到的就是 s,
+        规约后的栈仍然是 [s]。
+        """
+        action = self.action
+        while True:
+            act = action[stack[-1]][term_id]
+            if act >= 0:
+                stack.append(act)
+                return act
+            if act == ACTION_ERROR or act == ACTION_ACCEPT:
+                return act
+            gen_id = ACTION_REDUCE_BASE - act
+            pop_len = self.gen_len[gen_id]
+            if pop_len >= len(stack):
+                if pop_len == len(stack) and self.entry_nt[stack[0]] == self.gen_lhs[gen_id]:
+                    del stack[1:]
+                    continue
+                return None
+            del stack[len(stack) - pop_len :]
+            stack.append(self.goto[stack[-1]][self.gen_lhs[gen_id]])
+
+    def reduce_default(self, stack: List[int]):
+        """
+        对栈顶执行所有不需要看下一个输入的规约，使栈顶总是需要根据输入决定动作的状态。解码时每接受一个 token
+        后执行一次，以栈顶状态为栈底的预计算结果依赖栈内容的情况会少很多。
+        """
+        while self.default_reduce[stack[-1]] != ACTION_ERROR:
+            gen_id = self.default_reduce[stack[-1]]
+            del stack[len(stack) - self.gen_len[gen_id] :]
+            stack.append(self.goto[stack[-1]][self.gen_lhs[gen_id]])
+        return
+
+    def feed_terms(self, stack: List[int], term_ids: List[int]) -> bool:
+        for term_id in term_ids:
+            if self.feed(stack, term_id) < 0:
+                return False
+        return True
+
+    def can_accept_end(self, stack: List[int]) -> bool:
+        return self.feed(list(stack), END_TERM_ID) == ACTION_ACCEPT
@@ -0,0 +1,264 @@
+import os
+import re
+import pickle
+import hashlib
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from .core import T
+from .lr_table import LRTable
+from .json_grammar import get_builtin_grammar
+from lightllm.utils.log_utils import init_logger
+
+logger = init_logger(__name__)
+
+# 预计算结果的格式发生变化时需要修改，使旧的磁盘缓存失效
+TOKEN_TABLE_VERSION = 1
+
+_BYTE_TOKEN_PATTERN = re.compile(r"<0x[0-9A-Fa-f]{2}>")
+
+
+def _bytes_to_unicode() -> Dict[int, str]:
+    # gpt2 等 byte level bpe 词表中字节与可见字符的对应关系
+    bs = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    cs = bs[:]
+    n = 0
+    for b in range(256):
+        if b not in bs:
+            bs.append(b)
+            cs.append(256 + n)
+            n += 1
+    return dict(zip(bs, [chr(c) for c in cs]))
+
+
+def get_token_bytes(tokenizer) -> List[Optional[bytes]]:
+    """
+    返回词表中每个 token id 对应的字节串，特殊 token 和额外添加的 token 为 None, 不会被约束模式选择。
+    支持 byte level bpe 词表和 sentencepiece 词表(▁ 替换为空格，<0xXX> 为单个字节)。
+    """
+    vocab: Dict[str, int] = tokenizer.get_vocab()
+    skip_ids = set(tokenizer.all_special_ids)
+    if hasattr(tokenizer, "get_added_vocab"):
+        skip_ids.update(tokenizer.get_added_vocab().values())
+    byte_decoder = {c: b for b, c in _bytes_to_unicode().items()}
+    is_byte_level = any(token.startswith("Ġ") for token in vocab.keys())
+
+    token_bytes: List[Optional[bytes]] = [None] * (max(vocab.values()) + 1)
+    for token, token_id in vocab.items():
+        if token_id in skip_ids:
+            continue
+        if _BYTE_TOKEN_PATTERN.fullmatch(token):
+            token_bytes[token_id] = bytes([int(token[3:5], 16)])
+        elif is_byte_level and all(c in byte_decoder for c in token):
+            token_bytes[token_id] = bytes(byte_decoder[c] for c in token)
+        else:
+            token_bytes[token_id] = token.replace("▁", " ").encode("utf-8")
+    return token_bytes
+
+
+class TokenTable:
+    """
+    文法在词表上的 token 级别转移表。将所有 token 的终结符序列组织为前缀树，对 lr 自动机的每个状态 s, 以 [s]
+    为初始栈在前缀树上做深度优先的模拟，每个 token 的结果分为三类:
+    1. 只依赖栈顶状态 s 就可以确定被接受，记录在 allowed_words[s] 的位图中(与 xgrammar 的位图格式相同)。
+    2. 只依赖栈顶状态 s 就可以确定被拒绝，不需要记录。
+    3. 模拟过程中的规约需要弹出 s, 结果依赖 s 以下的栈内容，记录为 (前缀树节点，此时的局部栈)，在解码时使用
+       请求真实的栈继续模拟，这类 token 通常只有字符串或者数值结束后紧跟其他符号的少量 token。
+    解码时每一步的掩码为 allowed_words[s] 的一次拷贝加上依赖栈的少量 token, 不需要遍历词表。
+    """
+
+    def __init__(self, lr_table: LRTable, token_terms: List[Optional[Tuple[int, ...]]]):
+        self.lr_table = lr_table
+        self.token_terms = token_terms
+        self.vocab_size = len(token_terms)
+        self.word_num = (self.vocab_size + 31) // 32
+        self._build_trie()
+
+        state_num = self.lr_table.state_num
+        self.allowed_words = np.zeros((state_num, self.word_num), dtype=np.uint32)
+        # state -> [(前缀树节点 id, 局部栈)]
+        self.dependents: List[List[Tuple[int, Tuple[int, ...]]]] = []
+        self.has_next: List[bool] = []
+        for state in range(state_num):
+            allowed_token_ids, dependents = self._compute_state(state)
+            self._set_bits(self.allowed_words[state], allowed_token_ids)
+            self.dependents.append(dependents)
+            self.has_next.append(len(allowed_token_ids) > 0 or len(dependents) > 0)
+        return
+
+    def _build_trie(self):
+        # 节点 0 为根节点，节点 id 由 token_terms 的顺序唯一确定，从磁盘加载后重建的前缀树与预计算时相同
+        self.node_children: List[Dict[int, int]] = [{}]
+        self.node_term: List[int] = [-1]
+        self.node_token_ids: List[List[int]] = [[]]
+        for token_id, terms in enumerate(self.token_terms):
+            if terms is None:
+                continue
+            node = 0
+            for term_id in terms:
+                child = self.node_children[node].get(term_id)
+                if child is None:
+                    child = len(self.node_children)
+                    self.node_children[node][term_id] = child
+                    self.node_children.append({})
+                    self.node_term.append(term_id)
+                    self.node_token_ids.append([])
+                node = child
+            self.node_token_ids[node].append(token_id)
+        return
+
+    def _compute_state(self, state: int):
+        allowed_token_ids = []
+        dependents = []
+        todo = [(0, [state])]
+        while todo:
+            node, stack = todo.pop()
+            for term_id, child in self.node_children[node].items():
+                new_stack = list(stack)
+                ans = self.lr_table.feed(new_stack, term_id)
+                if ans is None:
+                    dependents.append((child, tuple(new_stack)))
+                elif ans >= 0:
+                    allowed_token_ids.extend(self.node_token_ids[child])
+                    if self.node_children[child]:
+                        todo.append((child, new_stack))
+        return allowed_token_ids, dependents
+
+    @staticmethod
+    def _set_bits(words: np.ndarray, token_ids: List[int]):
+        if len(token_ids) == 0:
+            return
+        token_ids = np.asarray(token_ids, dtype=np.int64)
+        np.bitwise_or.at(words, token_ids >> 5, np.left_shift(1, token_ids & 31).astype(np.uint32))
+        return
+
+    def walk(self, stack: List[int], node: int, out_token_ids: List[int]):
+        """
+        以完整的栈 stack 从前缀树节点 node 开始模拟，把被接受的 token 加入 out_token_ids, 会修改 stack。
+        """
+        todo = [(node, stack)]
+        while todo:
+            node, stack = todo.pop()
+            ans = self.lr_table.feed(stack, self.node_term[node])
+            if ans is None or ans < 0:
+                continue
+            out_token_ids.extend(self.node_token_ids[node])
+            for child in self.node_children[node].values():
+                todo.append((child, list(stack)))
+        return
+
+    def __getstate__(self):
+        # 前缀树可以由 token_terms 快速重建，不写入磁盘缓存
+        state = self.__dict__.copy()
+        for key in ("node_children", "node_term", "node_token_ids"):
+            state.pop(key)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_trie()
+        return
+
+
+class DpdaMatcher:
+    """
+    单个请求的解析状态，保存 lr 自动机完整的状态栈。
+    """
+
+    def __init__(self, token_table: TokenTable):
+        self.token_table = token_table
+        self.lr_table = token_table.lr_table
+        self.stack = [0]
+
+    def accept_token(self, token_id: int) -> bool:
+        terms = self.token_table.token_terms[token_id] if token_id < self.token_table.vocab_size else None
+        if terms is None:
+            return False
+        stack = list(self.stack)
+        if not self.lr_table.feed_terms(stack, terms):
+            return False
+        self.lr_table.reduce_default(stack)
+        self.stack = stack
+        return True
+
+    def can_end(self) -> bool:
+        return self.lr_table.can_accept_end(self.stack)
+
+    def is_terminated(self) -> bool:
+        # 已经可以结束，并且之后没有任何 token 可以继续输出
+        return self.can_end() and not self.token_table.has_next[self.stack[-1]]
+
+    def get_next_token_bitmask(self) -> Tuple[np.ndarray, List[int]]:
+        """
+        返回 (栈顶状态预计算的位图，依赖栈内容的 token 中被接受的 token id 列表)，位图为只读的共享数据。
+        """
+        state = self.stack[-1]
+        extra_token_ids = []
+        for node, local_stack in self.token_table.dependents[state]:
+            self.token_table.walk(self.stack[:-1] + list(local_stack), node, extra_token_ids)
+        return self.token_table.allowed_words[state], extra_token_ids
+
+
+def _get_token_terms(lr_table: LRTable, byte_to_term: List[Optional[str]], token_bytes: List[Optional[bytes]]):
+    byte_to_term_id = [-1 if name is None else lr_table.term_to_id[T(name)] for name in byte_to_term]
+    token_terms: List[Optional[Tuple[int, ...]]] = []
+    for data in token_bytes:
+        terms = None
+        if data:
+            terms = tuple(byte_to_term_id[b] for b in data)
+            if -1 in terms:
+                # 包含文法中不可能出现的字节的 token 永远不会被接受
+                terms = None
+        token_terms.append(terms)
+    return token_terms
+
+
+def get_token_table_cache_key(grammar_name: str, token_bytes: List[Optional[bytes]]) -> str:
+    md5 = hashlib.md5(f"{TOKEN_TABLE_VERSION}:{grammar_name}:".encode("utf-8"))
+    for data in token_bytes:
+        if data is None:
+            md5.update(b"\xff")
+        else:
+            md5.update(len(data).to_bytes(4, "little"))
+            md5.update(data)
+    return f"{grammar_name}_{md5.hexdigest()}"
+
+
+def get_default_cache_dir() -> str:
+    return os.getenv("LIGHTLLM_DPDA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache/lightllm/dpda"))
+
+
+def build_token_table(grammar_name: str, token_bytes: List[Optional[bytes]], cache_dir: Optional[str] = None):
+    """
+    构建内置文法 grammar_name 在词表 token_bytes 上的 TokenTable, 结果按照词表和文法的哈希值缓存在 cache_dir
+    中，cache_dir 为 None 时不使用磁盘缓存。多个进程同时构建时各自写入临时文件后原子替换，不会读到不完整的文件。
+    """
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, get_token_table_cache_key(grammar_name, token_bytes) + ".pkl")
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, "rb") as f:
+                    token_table = pickle.load(f)
+                logger.info(f"load dpda token table from {cache_path}")
+                return token_table
+            except Exception as e:
+                logger.warning(f"load dpda token table from {cache_path} failed: {str(e)}, rebuild it")
+
+    grammar, terminals, byte_to_term = get_builtin_grammar(grammar_name)
+    lr_table = LRTable(grammar, terminals)
+    token_table = TokenTable(lr_table, _get_token_terms(lr_table, byte_to_term, token_bytes))
+    logger.info(
+        f"build dpda token table for grammar {grammar_name}, lr state num {lr_table.state_num}, "
+        f"dependent num {sum(len(e) for e in token_table.dependents)}"
+    )
+
+    if cache_path is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(token_table, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            logger.warning(f"save dpda token table to {cache_path} failed: {str(e)}")
+    return token_table
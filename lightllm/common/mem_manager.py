@@ -1,6 +1,7 @@
 import re
 import os
 import torch
+import numpy as np
 import torch.distributed as dist
 from typing import List, Union
 from lightllm.server.pd_io_struct import KVMoveTask
@@ -8,6 +9,7 @@ from lightllm.utils.log_utils import init_logger
 from lightllm.server.router.dynamic_prompt.shared_arr import SharedInt
 from lightllm.utils.profile_max_tokens import get_available_gpu_memory, get_total_gpu_memory
 from lightllm.common.kv_trans_kernel.kv_trans import kv_trans
+from lightllm.common.page_allocator import PageAllocator
 from lightllm.utils.dist_utils import get_current_rank_in_node
 from lightllm.utils.envs_utils import get_unique_server_name, get_env_start_args
 from lightllm.distributed.pynccl import PyNcclCommunicator
@@ -34,6 +36,8 @@ class MemoryManager:
         self.mark_end = self.size
 
         self.can_use_mem_size = self.size
+        # 开启按页分配后，token 的分配和回收由 page_allocator 管理，mem_state 不再使用
+        self.page_allocator: PageAllocator = None
 
         # 用共享内存进行共享，router 模块读取进行精确的调度估计, nccl port 作为一个单机中单实列的标记。防止冲突。
         from lightllm.utils.envs_utils import get_unique_server_name
@@ -239,7 +243,40 @@ class MemoryManager:
     def _free_buffers(self):
         self.kv_buffer = None
 
+    def enable_page_alloc(self, page_size: int):
+        """
+        切换为按页分配 token，需要在所有 token 都空闲的时候调用，尾部不足一页的 token 不会被使用。
+        """
+        assert self.can_use_mem_size == self.size, "enable page alloc need all tokens free"
+        self.page_allocator = PageAllocator(self.size // page_size, page_size)
+        self.can_use_mem_size = self.page_allocator.get_can_use_token_num()
+        self.shared_can_use_token_num.set_value(self.can_use_mem_size)
+        logger.info(f"mem manager use page alloc, page size {page_size} page num {self.page_allocator.page_num}")
+        return
+
+    def alloc_append(self, last_token_indexes, need_sizes):
+        """
+        按页分配模式下为一批请求分配 token, 每个请求优先续用其最后一个 token 所在页中的空闲位置，
+        返回所有请求的 token index 和每个请求新的最后一个 token index，空闲页不足时返回 None。
+        """
+        alloc_ans = self.page_allocator.alloc_append(last_token_indexes, need_sizes)
+        if alloc_ans is None:
+            return None
+        ans, new_last_token_indexes = alloc_ans
+        self.can_use_mem_size = self.page_allocator.get_can_use_token_num()
+        self.shared_can_use_token_num.set_value(self.can_use_mem_size)
+        return torch.from_numpy(ans.astype(np.int32)), new_last_token_indexes
+
     def alloc(self, need_size) -> torch.Tensor:
+        if self.page_allocator is not None:
+            ans = self.page_allocator.alloc(need_size)
+            if ans is None:
+                logger.error(f"warn no enough cache need_size {need_size} left_size {self.can_use_mem_size}")
+                assert False, "error alloc state"
+            self.can_use_mem_size = self.page_allocator.get_can_use_token_num()
+            self.shared_can_use_token_num.set_value(self.can_use_mem_size)
+            return torch.from_numpy(ans.astype(np.int32))
+
         if need_size > self.mark_end - self.mark_start:
             logger.error(f"warn no enough cache need_size {need_size} left_size {self.can_use_mem_size}")
             assert False, "error alloc state"
@@ -259,6 +296,13 @@ class MemoryManager:
         Args:
             free_index (torch.Tensor): _description_
         """
+        if self.page_allocator is not None:
+            if isinstance(free_index, torch.Tensor):
+                free_index = free_index.cpu().numpy()
+            self.page_allocator.free(free_index)
+            self.can_use_mem_size = self.page_allocator.get_can_use_token_num()
+            self.shared_can_use_token_num.set_value(self.can_use_mem_size)
+            return
 
         end = self.mark_start
         start = self.mark_start - len(free_index)
@@ -280,6 +324,11 @@ class MemoryManager:
         return
 
     def free_all(self):
+        if self.page_allocator is not None:
+            self.page_allocator.free_all()
+            self.can_use_mem_size = self.page_allocator.get_can_use_token_num()
+            self.shared_can_use_token_num.set_value(self.can_use_mem_size)
+            return
         self.can_use_mem_size = len(self.mem_state)
         self.shared_can_use_token_num.set_value(self.can_use_mem_size)
         self.mem_state.numpy()[:] = list(range(0, len(self.mem_state)))
@@ -0,0 +1,183 @@
+import numpy as np
+from typing import Optional, Tuple
+from lightllm.utils.log_utils import init_logger
+
+logger = init_logger(__name__)
+
+
+class PageAllocator:
+    """
+    按页管理 kv cache token 的分配器，只依赖 numpy，可以脱离 gpu 单独测试。每页包含 page_size 个连续的 token，
+    token index = page_index * page_size + page_offset，所以 attention 等 kernel 仍然按照 token index 进行访问，
+    不需要任何修改。
+    页的引用计数为页内正在被使用的 token 数量，当页内的 token 全部被释放后，页才会被回收到空闲页栈中，
+    所以分配和回收都只需要处理页的粒度，不会产生 token 粒度的碎片。为了让同一个请求的 token 尽量落在同一页内，
+    append 分配会优先使用请求最后一个 token 所在页中的后续空闲位置。
+    """
+
+    def __init__(self, page_num: int, page_size: int):
+        assert page_num > 0 and page_size > 0
+        self.page_num = page_num
+        self.page_size = page_size
+        self.token_num = page_num * page_size
+        # 空闲页栈，[free_page_start:] 为空闲页
+        self.page_stack = np.arange(0, page_num, dtype=np.int64)
+        self.free_page_start = 0
+        self.page_ref = np.zeros((page_num,), dtype=np.int64)
+        self.token_used = np.zeros((self.token_num,), dtype=np.bool_)
+        self.page_offsets = np.arange(0, page_size, dtype=np.int64)
+        # 回收时对页进行去重使用的辅助数组
+        self.page_mark = np.zeros((page_num,), dtype=np.int64)
+
+    def get_free_page_num(self) -> int:
+        return self.page_num - self.free_page_start
+
+    def get_can_use_token_num(self) -> int:
+        return self.get_free_page_num() * self.page_size
+
+    def alloc_pages(self, need_page_num: int) -> Optional[np.ndarray]:
+        """
+        空闲页不足时返回 None, 由调用者决定如何处理，不会修改分配器的状态。
+        """
+        if need_page_num > self.get_free_page_num():
+            logger.warning(f"no enough pages need {need_page_num} left {self.get_free_page_num()}")
+            return None
+        start = self.free_page_start
+        self.free_page_start += need_page_num
+        return self.page_stack[start : self.free_page_start].copy()
+
+    def _free_pages(self, pages: np.ndarray):
+        start = self.free_page_start - len(pages)
+        assert start >= 0, f"error free pages state start: {self.free_page_start} free len {len(pages)}"
+        self.page_stack[start : self.free_page_start] = pages
+        self.free_page_start = start
+        return
+
+    def _pages_to_token_indexes(self, pages: np.ndarray, token_num: int) -> np.ndarray:
+        return (pages[:, None] * self.page_size + self.page_offsets).reshape(-1)[0:token_num]
+
+    def _mark_used(self, token_indexes: np.ndarray):
+        self.token_used[token_indexes] = True
+        np.add.at(self.page_ref, token_indexes // self.page_size, 1)
+        return
+
+    def _unique_pages(self, pages: np.ndarray) -> np.ndarray:
+        # 对页进行 O(n) 的去重，避免每次回收都进行 np.unique 的排序
+        self.page_mark[pages] = np.arange(len(pages), dtype=np.int64)
+        return pages[self.page_mark[pages] == np.arange(len(pages), dtype=np.int64)]
+
+    def alloc(self, need_size: int) -> Optional[np.ndarray]:
+        """
+        按整页分配 need_size 个 token，最后一页中没有被分配出去的位置保留给后续的 append 分配使用，
+        空闲页不足时返回 None。
+        """
+        if need_size == 0:
+            return np.zeros((0,), dtype=np.int64)
+        pages = self.alloc_pages((need_size + self.page_size - 1) // self.page_size)
+        if pages is None:
+            return None
+        token_indexes = self._pages_to_token_indexes(pages, need_size)
+        self._mark_used(token_indexes)
+        return token_indexes
+
+    def get_append_tail_size(self, last_token_indexes: np.ndarray) -> np.ndarray:
+        """
+        计算每个请求最后一个 token 所在页中，紧跟其后可以继续使用的连续空闲位置数量，
+        last_token_indexes 中为 -1 的请求没有可以续用的页。
+        """
+        last_token_indexes = np.asarray(last_token_indexes, dtype=np.int64)
+        last_offsets = last_token_indexes % self.page_size
+        pages = np.maximum(last_token_indexes, 0) // self.page_size
+        valid = (last_token_indexes >= 0) & (last_offsets != self.page_size - 1) & (self.page_ref[pages] > 0)
+        tail_sizes = np.zeros((len(last_token_indexes),), dtype=np.int64)
+        if not valid.any():
+            return tail_sizes
+        last_offsets = last_offsets[valid]
+        # 取出每个请求所在页的使用状态，找到最后一个 token 之后第一个被使用的位置，没有时为页的末尾
+        used = self.token_used[pages[valid, None] * self.page_size + self.page_offsets]
+        used &= self.page_offsets > last_offsets[:, None]
+        first_used = np.where(used.any(axis=1), used.argmax(axis=1), self.page_size)
+        tail_sizes[valid] = first_used - last_offsets - 1
+        return tail_sizes
+
+    def get_append_need_token_nums(self, last_token_indexes: np.ndarray, need_sizes: np.ndarray) -> np.ndarray:
+        """
+        返回每个请求 append 分配需要从空闲页中获取的 token 数量(按整页计算)。
+        """
+        tail_sizes = self.get_append_tail_size(last_token_indexes)
+        left_sizes = np.maximum(np.asarray(need_sizes, dtype=np.int64) - tail_sizes, 0)
+        return (left_sizes + self.page_size - 1) // self.page_size * self.page_size
+
+    def get_append_need_token_num(self, last_token_indexes: np.ndarray, need_sizes: np.ndarray) -> int:
+        """
+        返回 append 分配需要从空闲页中获取的 token 数量(按整页计算)，用于在分配前淘汰 radix cache 腾挪空间。
+        """
+        return int(self.get_append_need_token_nums(last_token_indexes, need_sizes).sum())
+
+    def get_append_fit_num(self, last_token_indexes: np.ndarray, need_sizes: np.ndarray) -> int:
+        """
+        返回按顺序最多前多少个请求的 append 分配可以被当前的空闲页满足。
+        """
+        need_token_nums = np.cumsum(self.get_append_need_token_nums(last_token_indexes, need_sizes))
+        return int(np.searchsorted(need_token_nums, self.get_can_use_token_num(), side="right"))
+
+    def alloc_append(
+        self, last_token_indexes: np.ndarray, need_sizes: np.ndarray
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        为一批请求各自分配 need_sizes[i] 个 token，优先续用请求最后一个 token 所在页的后续空闲位置，
+        不足的部分为每个请求单独分配新页，保证不同请求的 token 不会混合在同一个新页中。
+        返回按请求顺序拼接的 token index 以及每个请求新的最后一个 token index，空闲页不足时返回 None。
+        """
+        last_token_indexes = np.asarray(last_token_indexes, dtype=np.int64)
+        need_sizes = np.asarray(need_sizes, dtype=np.int64)
+        tail_sizes = np.minimum(self.get_append_tail_size(last_token_indexes), need_sizes)
+        left_sizes = need_sizes - tail_sizes
+        new_page_nums = (left_sizes + self.page_size - 1) // self.page_size
+        new_pages = self.alloc_pages(int(new_page_nums.sum()))
+        if new_pages is None:
+            return None
+
+        if (need_sizes == 1).all():
+            # decode 阶段的快速路径，每个请求只需要一个 token
+            ans = np.where(tail_sizes == 1, last_token_indexes + 1, 0)
+            ans[tail_sizes == 0] = new_pages * self.page_size
+        else:
+            ans_list = []
+            page_start = 0
+            for i in range(len(need_sizes)):
+                if tail_sizes[i] > 0:
+                    start = last_token_indexes[i] + 1
+                    ans_list.append(np.arange(start, start + tail_sizes[i], dtype=np.int64))
+                if new_page_nums[i] > 0:
+                    pages = new_pages[page_start : page_start + new_page_nums[i]]
+                    page_start += new_page_nums[i]
+                    ans_list.append(self._pages_to_token_indexes(pages, int(left_sizes[i])))
+            ans = np.concatenate(ans_list) if len(ans_list) != 0 else np.zeros((0,), dtype=np.int64)
+
+        if len(ans) == 0:
+            return ans, last_token_indexes
+        self._mark_used(ans)
+        ans_last_indexes = ans[np.maximum(np.cumsum(need_sizes) - 1, 0)]
+        new_last_token_indexes = np.where(need_sizes > 0, ans_last_indexes, last_token_indexes)
+        return ans, new_last_token_indexes
+
+    def free(self, token_indexes: np.ndarray):
+        token_indexes = np.asarray(token_indexes, dtype=np.int64)
+        if len(token_indexes) == 0:
+            return
+        assert self.token_used[token_indexes].all(), "error free state, free unused token"
+        self.token_used[token_indexes] = False
+        pages = token_indexes // self.page_size
+        np.subtract.at(self.page_ref, pages, 1)
+        freed_pages = self._unique_pages(pages[self.page_ref[pages] == 0])
+        if len(freed_pages) != 0:
+            self._free_pages(freed_pages)
+        return
+
+    def free_all(self):
+        self.page_stack[:] = np.arange(0, self.page_num, dtype=np.int64)
+        self.free_page_start = 0
+        self.page_ref[:] = 0
+        self.token_used[:] = False
+        return
@@ -1,7 +1,8 @@
 import torch
+import numpy as np
 from lightllm.utils.log_utils import init_logger
 from .mem_manager import MemoryManager
-from typing import List
+from typing import List, Optional
 
 logger = init_logger(__name__)
 
@@ -60,6 +61,14 @@ class ReqManager:
         self.mem_manager = mem_manager
         self.max_request_num = max_request_num
         self.HOLD_REQUEST_ID = max_request_num
+        # 按页分配 kv cache 时，记录每个请求最后分配的 token index，用于续用其所在页中的空闲位置，-1 表示没有记录
+        self.req_last_mem_index = np.full((max_request_num + 1,), -1, dtype=np.int64)
+        # 按请求 slot 保存的采样参数和输出 token 计数，推理进程注册时根据词表大小创建
+        self.req_sampling_params_manager: ReqSamplingParamsManager = None
+
+    def init_req_sampling_params_manager(self, vocab_size: int, device="cuda"):
+        self.req_sampling_params_manager = ReqSamplingParamsManager(self.max_request_num, vocab_size, device=device)
+        return
 
     def alloc(self):
         return self.req_list.alloc()
@@ -67,6 +76,9 @@ class ReqManager:
     def free(self, free_req_indexes: List[int], free_token_index):
         for req_index in free_req_indexes:
             self.req_list.free(req_index)
+        self.req_last_mem_index[free_req_indexes] = -1
+        if self.req_sampling_params_manager is not None:
+            self.req_sampling_params_manager.free(free_req_indexes)
 
         if self.req_list.is_all_free():
             logger.debug(f"freed all request size {self.req_list.can_alloc_size}")
@@ -74,6 +86,9 @@ class ReqManager:
 
     def free_req(self, free_req_index: int):
         self.req_list.free(free_req_index)
+        self.req_last_mem_index[free_req_index] = -1
+        if self.req_sampling_params_manager is not None:
+            self.req_sampling_params_manager.free([free_req_index])
         if self.req_list.is_all_free():
             logger.debug(f"freed all request size {self.req_list.can_alloc_size}")
         return
@@ -84,4 +99,162 @@ class ReqManager:
 
     def free_all(self):
         self.req_list = _ReqLinkedList(self.max_request_num)
+        self.req_last_mem_index[:] = -1
+        if self.req_sampling_params_manager is not None:
+            self.req_sampling_params_manager.free_all()
+        return
+
+    def get_alloc_need_token_num(self, req_idxs: List[int], need_sizes: List[int]) -> int:
+        """
+        返回为这些请求分配 token 时需要的空闲 token 数量，按页分配时需要按照整页进行估计。
+        """
+        if self.mem_manager.page_allocator is None:
+            return sum(need_sizes)
+        return self.mem_manager.page_allocator.get_append_need_token_num(
+            self.req_last_mem_index[req_idxs], np.asarray(need_sizes, dtype=np.int64)
+        )
+
+    def get_alloc_fit_req_num(self, req_idxs: List[int], need_sizes: List[int]) -> int:
+        """
+        返回按顺序最多前多少个请求的 token 分配可以被当前空闲的 token 满足。按页分配时页的取整和页内碎片
+        可能使空闲 token 少于 router 的估计，调用者可以只运行能分配成功的部分请求。
+        """
+        if self.mem_manager.page_allocator is None:
+            return len(req_idxs)
+        return self.mem_manager.page_allocator.get_append_fit_num(
+            self.req_last_mem_index[req_idxs], np.asarray(need_sizes, dtype=np.int64)
+        )
+
+    def alloc_token_for_reqs(self, req_idxs: List[int], need_sizes: List[int]) -> Optional[torch.Tensor]:
+        """
+        为一批请求分配 kv cache token, 返回的 token index 按照请求的顺序拼接。按页分配时，每个请求的 token
+        会尽量落在该请求自己的页中，空闲页不足时返回 None。
+        """
+        if self.mem_manager.page_allocator is None:
+            return self.mem_manager.alloc(sum(need_sizes))
+        alloc_ans = self.mem_manager.alloc_append(
+            self.req_last_mem_index[req_idxs], np.asarray(need_sizes, dtype=np.int64)
+        )
+        if alloc_ans is None:
+            return None
+        mem_indexes, new_last_mem_index = alloc_ans
+        self.req_last_mem_index[req_idxs] = new_last_mem_index
+        return mem_indexes
+
+
+class ReqSamplingParamsManager:
+    """
+    以请求管理 id (req_idx) 为下标保存每个请求的采样参数和输出 token 计数，sample 时只需要按照 req_idx 进行 gather。
+    请求的参数在其分配 req_idx 后的第一次采样时批量写入，之后每一步只把新生成的 token 累加到稠密的计数表
+    req_to_out_token_id_counter 中，不再在每一步遍历请求的全部 token 计数。计数表的大小为
+    (max_request_num + 1) * vocab_size 个 int32, 由模型在估计 kv cache 容量之前创建，见 TpPartBaseModel。
+    """
+
+    def __init__(self, max_request_num: int, vocab_size: int, device="cuda"):
+        self.vocab_size = vocab_size
+        self.device = torch.device(device)
+        self.pin_memory = self.device.type == "cuda"
+        size = max_request_num + 1
+        self.req_to_presence_penalty = torch.zeros((size,), dtype=torch.float32, device=self.device)
+        self.req_to_frequency_penalty = torch.zeros((size,), dtype=torch.float32, device=self.device)
+        self.req_to_repetition_penalty = torch.ones((size,), dtype=torch.float32, device=self.device)
+        self.req_to_exponential_decay_length_penalty = torch.ones((size,), dtype=torch.float32, device=self.device)
+        self.req_to_exponential_decay_start = torch.zeros((size,), dtype=torch.int32, device=self.device)
+        self.req_to_min_new_tokens = torch.zeros((size,), dtype=torch.int32, device=self.device)
+        self.req_to_temperature = torch.ones((size,), dtype=torch.float32, device=self.device)
+        self.req_to_top_p = torch.ones((size,), dtype=torch.float32, device=self.device)
+        self.req_to_top_k = torch.full((size,), vocab_size, dtype=torch.int32, device=self.device)
+        self.req_to_out_token_len = torch.zeros((size,), dtype=torch.int32, device=self.device)
+        self.req_to_out_token_id_counter = torch.zeros((size, vocab_size), dtype=torch.int32, device=self.device)
+        # 已经累加到计数表中的输出 token 数量，-1 表示该 req_idx 上的请求还没有写入采样参数
+        self.synced_out_len = np.full((size,), -1, dtype=np.int64)
+
+    def free(self, free_req_indexes: List[int]):
+        self.synced_out_len[free_req_indexes] = -1
         return
+
+    def free_all(self):
+        self.synced_out_len[:] = -1
+        return
+
+    def prepare_sample_reqs(self, reqs: List) -> torch.Tensor:
+        """
+        写入新请求的采样参数，并把上一次采样之后新生成的 token 累加到计数表中, 返回 reqs 对应的 b_req_idx。
+        reqs 为 InferReq 列表，同一个请求可以出现多次。
+        """
+        b_req_idx = []
+        new_reqs = []
+        changed_req_idx = []
+        changed_out_len = []
+        new_token_req_idx = []
+        new_token_ids = []
+        for req in reqs:
+            req_idx = req.req_idx
+            b_req_idx.append(req_idx)
+            synced_len = self.synced_out_len[req_idx]
+            if synced_len == -1:
+                new_reqs.append(req)
+                synced_len = 0
+                self.synced_out_len[req_idx] = 0
+
+            out_len = req.cur_output_len
+            if out_len > synced_len:
+                start = req.shm_req.input_len + synced_len
+                if out_len - synced_len == 1:
+                    new_token_ids.append(int(req.shm_req.shm_prompt_ids.arr[start]))
+                    new_token_req_idx.append(req_idx)
+                else:
+                    new_token_ids.extend(req.shm_req.shm_prompt_ids.arr[start : start + out_len - synced_len].tolist())
+                    new_token_req_idx.extend([req_idx] * (out_len - synced_len))
+                changed_req_idx.append(req_idx)
+                changed_out_len.append(out_len)
+                self.synced_out_len[req_idx] = out_len
+
+        if new_reqs:
+            self._init_reqs(new_reqs)
+        if changed_req_idx:
+            self.req_to_out_token_len[self._to_device(changed_req_idx, torch.int64)] = self._to_device(
+                changed_out_len, torch.int32
+            )
+            self._add_token_counts(new_token_req_idx, new_token_ids)
+        return self._to_device(b_req_idx, torch.int64)
+
+    def get_sample_params(self, b_req_idx: torch.Tensor):
+        return self.req_to_temperature[b_req_idx], self.req_to_top_p[b_req_idx], self.req_to_top_k[b_req_idx]
+
+    def _init_reqs(self, reqs: List):
+        req_idxs = self._to_device([req.req_idx for req in reqs], torch.int64)
+        shm_params = [req.sampling_param.shm_param for req in reqs]
+        decay_params = [e.exponential_decay_length_penalty.to_tuple() for e in shm_params]
+        self.req_to_presence_penalty[req_idxs] = self._to_device([e.presence_penalty for e in shm_params])
+        self.req_to_frequency_penalty[req_idxs] = self._to_device([e.frequency_penalty for e in shm_params])
+        self.req_to_repetition_penalty[req_idxs] = self._to_device([e.repetition_penalty for e in shm_params])
+        self.req_to_exponential_decay_length_penalty[req_idxs] = self._to_device([e[1] for e in decay_params])
+        self.req_to_exponential_decay_start[req_idxs] = self._to_device([e[0] for e in decay_params], torch.int32)
+        self.req_to_min_new_tokens[req_idxs] = self._to_device([e.min_new_tokens for e in shm_params], torch.int32)
+        self.req_to_temperature[req_idxs] = self._to_device([e.temperature for e in shm_params])
+        self.req_to_top_p[req_idxs] = self._to_device([e.top_p for e in shm_params])
+        self.req_to_top_k[req_idxs] = self._to_device([e.top_k for e in shm_params], torch.int32)
+        self.req_to_out_token_len[req_idxs] = 0
+        self.req_to_out_token_id_counter[req_idxs] = 0
+
+        # input_penalty 模式下 prompt 中的 token 也参与惩罚
+        penalty_reqs = [req for req in reqs if req.sampling_param.shm_param.input_penalty]
+        if penalty_reqs:
+            prompt_ids = [req.shm_req.shm_prompt_ids.arr[0 : req.shm_req.input_len] for req in penalty_reqs]
+            prompt_req_idxs = np.repeat([req.req_idx for req in penalty_reqs], [len(e) for e in prompt_ids])
+            self._add_token_counts(prompt_req_idxs, np.concatenate(prompt_ids))
+        return
+
+    def _add_token_counts(self, req_idxs, token_ids):
+        req_idxs = self._to_device(req_idxs, torch.int64)
+        token_ids = self._to_device(token_ids, torch.int64)
+        ones = torch.ones(token_ids.shape, dtype=torch.int32, device=self.device)
+        self.req_to_out_token_id_counter.index_put_((req_idxs, token_ids), ones, accumulate=True)
+        return
+
+    def _to_device(self, values, dtype=torch.float32) -> torch.Tensor:
+        cpu_tensor = torch.as_tensor(values, dtype=dtype)
+        if self.pin_memory:
+            cpu_tensor = cpu_tensor.pin_memory()
+        return cpu_tensor.to(self.device, non_blocking=True)
@@ -5,6 +5,7 @@ class SpeculativeDecodeAlgorithm(IntEnum):
     NONE = auto()
     MTP = auto()
     MTP_MOUDLE = auto()
+    NGRAM = auto()
 
     def is_none(self):
         return self == SpeculativeDecodeAlgorithm.NONE
@@ -15,11 +16,15 @@ class SpeculativeDecodeAlgorithm(IntEnum):
     def is_mtp_module(self):
         return self == SpeculativeDecodeAlgorithm.MTP_MOUDLE
 
+    def is_ngram(self):
+        return self == SpeculativeDecodeAlgorithm.NGRAM
+
     @staticmethod
     def from_string(name: str):
         name_map = {
             "MTP": SpeculativeDecodeAlgorithm.MTP,
             "MTP_MOUDLE": SpeculativeDecodeAlgorithm.MTP_MOUDLE,
+            "NGRAM": SpeculativeDecodeAlgorithm.NGRAM,
             "NONE": SpeculativeDecodeAlgorithm.NONE,
         }
         if name is not None:
@@ -33,3 +38,5 @@ class SpeculativeDecodeAlgorithm(IntEnum):
             return 2
         if self == SpeculativeDecodeAlgorithm.MTP_MOUDLE:
             return 2
+        if self == SpeculativeDecodeAlgorithm.NGRAM:
+            return 1
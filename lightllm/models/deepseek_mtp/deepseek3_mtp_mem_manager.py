@@ -25,6 +25,7 @@ class Deepseek3MTPMemoryManager(Deepseek2MemoryManager):
         self.mark_end = self.size
 
         self.can_use_mem_size = self.size
+        self.page_allocator = None
 
         rank_in_node = get_current_rank_in_node()
         self.shared_can_use_token_num = SharedInt(f"MTP_mem_manger_can_use_token_num_{rank_in_node}")
@@ -2,7 +2,7 @@ import torch
 from lightllm.common.basemodel.triton_kernel.multimodal_emb import multimodal_emb
 from lightllm.distributed.communication_op import all_reduce
 from lightllm.models.qwen_vl.layer_infer.pre_layer_infer import LlamaMultimodalPreLayerInfer
-from lightllm.server.embed_cache.utils import bytes2tensor, get_shm_name_embed, read_shm
+from lightllm.server.embed_cache.utils import read_embed_shm, get_shm_name_embed
 
 
 class Gemma3PreLayerInfer(LlamaMultimodalPreLayerInfer):
@@ -41,8 +41,7 @@ class Gemma3PreLayerInfer(LlamaMultimodalPreLayerInfer):
                 if img["token_id"] in img_start_token_ids:
                     continue
                 # pull the img_embeds by uid from shm
-                data = read_shm(get_shm_name_embed(img["uuid"]))
-                img_weight.append(bytes2tensor(data).cuda().reshape(img["token_num"], -1))
+                img_weight.append(read_embed_shm(get_shm_name_embed(img["uuid"])).reshape(img["token_num"], -1))
                 img_start_token_ids.append(img["token_id"])
                 img_token_lens.append(img["token_num"])
                 img_start_locs.append(img_start_loc)
@@ -9,7 +9,8 @@ from io import BytesIO
 from typing import List, Union
 from safetensors.torch import load_file
 from transformers.processing_utils import ProcessorMixin
-from lightllm.server.embed_cache.utils import tensor2bytes, read_shm, create_shm, get_shm_name_data, get_shm_name_embed
+from lightllm.server.embed_cache.utils import PinnedStagingBuffer, read_shm, create_embed_shm
+from lightllm.server.embed_cache.utils import get_shm_name_data, get_shm_name_embed
 from lightllm.server.multimodal_params import AudioItem
 
 
@@ -90,6 +91,7 @@ class WhisperAudioModel:
         self.max_length = self.max_seconds * self.sampling_rate
         self.cache_port = kvargs["cache_port"]
         self.cache_client = rpyc.connect("localhost", self.cache_port)
+        self.staging_buffer = PinnedStagingBuffer()
         data_type = kvargs["data_type"]
         if data_type in ["bf16", "bfloat16"]:
             self.data_type = torch.bfloat16
@@ -190,8 +192,11 @@ class WhisperAudioModel:
         audio_lens_after_cnn = np.array(audio_lens_after_cnn, dtype=np.int32)
         audio_token_num = (audio_lens_after_cnn - 2) // 2 + 1
 
+        audios = self.staging_buffer.to_cpu(audios)
+        embed_readys = self.cache_client.root.query_embed_many(tuple(uuids))
+        set_embed_uids = []
         for i in range(len(uuids)):
-            if not self.cache_client.root.get_item_embed(uuids[i]):
-                cur_embed_bytes = tensor2bytes(audios[i][: audio_token_num[i]])
-                create_shm(get_shm_name_embed(uuids[i]), cur_embed_bytes)
-                self.cache_client.root.set_item_embed(uuids[i])
+            if not embed_readys[i] and uuids[i] not in set_embed_uids:
+                create_embed_shm(get_shm_name_embed(uuids[i]), audios[i][: audio_token_num[i]])
+                set_embed_uids.append(uuids[i])
+        self.cache_client.root.set_item_embed_many(tuple(set_embed_uids))
@@ -17,6 +17,26 @@ def make_argument_parser() -> argparse.ArgumentParser:
     parser.add_argument("--host", type=str, default="127.0.0.1")
     parser.add_argument("--port", type=int, default=8000)
     parser.add_argument("--httpserver_workers", type=int, default=1)
+    parser.add_argument(
+        "--tokenize_workers",
+        type=int,
+        default=0,
+        help="""the number of tokenizer processes used by each httpserver worker to tokenize text prompts and render
+                chat templates off the event loop, 0 means tokenize in the httpserver event loop.""",
+    )
+    parser.add_argument(
+        "--chat_template_cache_size",
+        type=int,
+        default=1024,
+        help="the number of recently rendered chat template prompts cached by each httpserver worker, 0 to disable.",
+    )
+    parser.add_argument(
+        "--prompt_token_cache_size",
+        type=int,
+        default=256,
+        help="""the number of recently tokenized text prompts cached by each httpserver worker, a new prompt that
+                extends a cached prompt (multi-turn chat) only tokenizes the appended text, 0 to disable.""",
+    )
     parser.add_argument(
         "--zmq_mode",
         type=str,
@@ -114,6 +134,14 @@ def make_argument_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         "--running_max_req_size", type=int, default=1000, help="the max size for forward requests in the same time"
     )
+    parser.add_argument(
+        "--req_shm_arena_token_num",
+        type=int,
+        default=None,
+        help="""the token capacity of the shared memory arena that holds the prompt ids and logprobs of all requests,
+                default is running_max_req_size * 4096. requests that can not get space from the arena fall back to
+                their own shared memory segments, set to 0 to disable the arena.""",
+    )
     parser.add_argument("--nnodes", type=int, default=1, help="the number of nodes")
     parser.add_argument("--node_rank", type=int, default=0, help="the rank of the current node")
     parser.add_argument(
@@ -198,11 +226,84 @@ def make_argument_parser() -> argparse.ArgumentParser:
         help="""aggressive schedule can lead to frequent prefill interruptions during decode.
                 disabling it allows the router_max_wait_tokens parameter to work more effectively.""",
     )
+    parser.add_argument(
+        "--schedule_policy",
+        type=str,
+        choices=["fcfs", "priority", "edf", "sjf"],
+        default="fcfs",
+        help="""the order in which waiting requests are admitted and running requests are paused.
+                fcfs: first come first serve. priority: larger sampling param priority
+                (or X-Request-Priority header) first. edf: earliest ttft / tpot slo deadline first.
+                sjf: shortest remaining prompt first with aging.""",
+    )
+    parser.add_argument(
+        "--default_ttft_slo_ms",
+        type=int,
+        default=3000,
+        help="default time to first token slo (ms) used by --schedule_policy edf when ttft_slo_ms is not set",
+    )
+    parser.add_argument(
+        "--default_tpot_slo_ms",
+        type=int,
+        default=100,
+        help="default time per output token slo (ms) used by --schedule_policy edf when tpot_slo_ms is not set",
+    )
+    parser.add_argument(
+        "--sjf_aging_tokens_per_second",
+        type=float,
+        default=500.0,
+        help="""used by --schedule_policy sjf, every second a request waits reduces its sort key by this many tokens,
+                so long prompts are not starved.""",
+    )
 
     parser.add_argument(
         "--use_dynamic_prompt_cache", action="store_true", help="This argument is deprecated and no longer in use."
     )
     parser.add_argument("--disable_dynamic_prompt_cache", action="store_true", help="disable dynamic prompt cache")
+    parser.add_argument(
+        "--host_kv_cache_token_num",
+        type=int,
+        default=0,
+        help="""the token num of the pinned host memory kv cache used as the second tier of the dynamic prompt cache,
+        kv of the prompt cache evicted from gpu will be moved to host and reloaded when hit again. 0 means disabled""",
+    )
+    parser.add_argument(
+        "--kv_swap_host_token_num",
+        type=int,
+        default=0,
+        help="""the token num of the pinned host memory pool used to swap out the kv of paused requests, a cost model
+        chooses per request between swapping the kv out and recomputing it when the request is resumed,
+        the env LIGHTLLM_KV_SWAP_PCIE_GBPS and LIGHTLLM_KV_SWAP_PREFILL_TOKENS_PER_SECOND tune the cost model.
+        0 means paused requests are always recomputed""",
+    )
+    parser.add_argument(
+        "--prefix_affinity_route",
+        action="store_true",
+        help="""enable prefix affinity routing, each dp rank publishes a summary of its cached prompt prefixes, the
+        router dispatches requests to the dp rank whose prompt cache holds the prefix, and the pd_master selects the
+        prefill and decode nodes in the same way. need to be set on the pd_master and all the pd nodes""",
+    )
+    parser.add_argument(
+        "--prefix_affinity_block_size",
+        type=int,
+        default=64,
+        help="the token num of each block used to hash the prompt prefix in prefix affinity routing",
+    )
+    parser.add_argument(
+        "--prefix_affinity_load_weight",
+        type=float,
+        default=1.0,
+        help="""the weight of the token load in prefix affinity routing, the target with the max
+        (matched prefix ratio - prefix_affinity_load_weight * token load ratio) is selected""",
+    )
+
+    parser.add_argument(
+        "--kv_page_size",
+        type=int,
+        default=0,
+        help="""the token num of each page when the kv cache tokens are allocated by page, the tokens of one request
+        are kept in its own pages and a page is recycled when all its tokens are freed. 0 means token level alloc""",
+    )
 
     parser.add_argument("--chunked_prefill_size", type=int, default=8192, help="chunked prefill size")
     parser.add_argument("--disable_chunked_prefill", action="store_true", help="whether to disable chunked prefill")
@@ -212,9 +313,18 @@ def make_argument_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         "--output_constraint_mode",
         type=str,
-        choices=["outlines", "xgrammar", "none"],
+        choices=["outlines", "xgrammar", "dpda", "none"],
         default="none",
-        help="set the output constraint backend, none means no output constraint",
+        help="""set the output constraint backend, none means no output constraint,
+        dpda is a built-in lr(1) pushdown automaton backend without third-party dependencies, it supports
+        guided_json (constraint the output to be a valid json object or array, the schema is not checked)
+        and guided_grammar with a built-in grammar name (json)""",
+    )
+    parser.add_argument(
+        "--grammar_cache_size",
+        type=int,
+        default=256,
+        help="max number of compiled regex guides / grammars cached by the output constraint backend",
     )
     parser.add_argument(
         "--first_token_constraint_mode",
@@ -276,6 +386,18 @@ def make_argument_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         "--cache_reserved_ratio", type=float, default=0.5, help="cache server reserved capacity ratio after clear"
     )
+    parser.add_argument(
+        "--embed_cache_impl",
+        type=str,
+        choices=["naive", "disk"],
+        default="naive",
+        help="""the multimodal embed cache implementation, disk keeps the embeds of multimodal items on local disk
+                so they can be reused across restarts and replicas sharing the same directory.""",
+    )
+    parser.add_argument("--embed_cache_disk_dir", type=str, default=None, help="the directory of the disk embed cache")
+    parser.add_argument(
+        "--embed_cache_disk_max_gb", type=float, default=64, help="the max size in GB of the disk embed cache"
+    )
     parser.add_argument(
         "--data_type",
         type=str,
@@ -334,6 +456,15 @@ def make_argument_parser() -> argparse.ArgumentParser:
         help="""Maximum batch size that can be captured by the cuda graph for decodign stage.
                 The default value is 8. It will turn into eagar mode if encounters a larger value.""",
     )
+    parser.add_argument(
+        "--graph_batch_buckets",
+        nargs="+",
+        type=int,
+        default=None,
+        help="""Batch sizes to capture cuda graphs for in the decoding stage, e.g. 1 2 4 8 16 32. A decode batch
+                will be padded up to the nearest bucket and replay its graph. graph_max_batch_size is always
+                included. If None, a graph is captured for every batch size up to graph_max_batch_size.""",
+    )
     parser.add_argument(
         "--graph_max_len_in_batch",
         type=int,
@@ -383,10 +514,12 @@ def make_argument_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         "--spec_algo",
         type=str,
-        choices=["none", "MTP"],
+        choices=["none", "MTP", "NGRAM"],
         default="none",
         help="""spec algo used for spec model, none means no spec algo,
-        mtp means use mtp spec algo, only support deepseekv3 model""",
+        mtp means use mtp spec algo, only support deepseekv3 model,
+        ngram means use prompt lookup spec algo without draft model, support all models.
+        both need --disable_chunked_prefill""",
     )
     parser.add_argument(
         "--spec_model_dir",
@@ -399,4 +532,16 @@ def make_argument_parser() -> argparse.ArgumentParser:
         default=1,
         help="spec step for spec algo, only support deepseekv3 model.",
     )
+    parser.add_argument(
+        "--spec_ngram_min_n",
+        type=int,
+        default=1,
+        help="min n-gram length used to match the suffix of the sequence for the ngram spec algo.",
+    )
+    parser.add_argument(
+        "--spec_ngram_max_n",
+        type=int,
+        default=4,
+        help="max n-gram length used to match the suffix of the sequence for the ngram spec algo.",
+    )
     return parser
@@ -22,7 +22,7 @@ from typing import Callable
 from lightllm.server import TokenLoad
 from fastapi import BackgroundTasks, FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import Response, StreamingResponse, JSONResponse
-from lightllm.server.core.objs.sampling_params import SamplingParams
+from lightllm.server.core.objs.sampling_params import SamplingParams, parse_priority
 from .multimodal_params import MultimodalParams
 from .httpserver.manager import HttpServerManager
 from .httpserver_for_pd_master.manager import HttpServerManagerForPDMaster
@@ -69,6 +69,12 @@ async def chat_completions_impl(request: ChatCompletionRequest, raw_request: Req
     if request.function_call != "none":
         return create_error_response(HTTPStatus.BAD_REQUEST, "The function call feature is not supported")
 
+    if "X-Request-Priority" in raw_request.headers:
+        try:
+            parse_priority(raw_request.headers["X-Request-Priority"])
+        except ValueError as e:
+            return create_error_response(HTTPStatus.BAD_REQUEST, str(e))
+
     created_time = int(time.time())
 
     multimodal_params_dict = {"images": []}
@@ -113,6 +113,20 @@ def normal_or_p_d_start(args):
         assert args.disable_dynamic_prompt_cache is True, "need add --disable_dynamic_prompt_cache"
         assert args.disable_chunked_prefill is True, "need add --disable_chunked_prefill"
 
+    if args.host_kv_cache_token_num > 0:
+        assert args.disable_dynamic_prompt_cache is False, "host kv cache need dynamic prompt cache"
+    if args.kv_swap_host_token_num > 0:
+        assert args.spec_algo == "none", "kv swap not support spec decode now"
+    if args.prefix_affinity_route:
+        assert args.disable_dynamic_prompt_cache is False, "prefix affinity route need dynamic prompt cache"
+    if args.kv_page_size > 0:
+        assert args.spec_algo == "none", "kv page alloc not support spec decode now"
+    if args.spec_algo == "NGRAM":
+        assert args.disable_chunked_prefill is True, "need add --disable_chunked_prefill"
+        # 候选 token 的 kv 位置使用 max_req_total_len + 8 的余量
+        assert 1 <= args.spec_step <= 8, "ngram spec algo need 1 <= spec_step <= 8"
+        assert 1 <= args.spec_ngram_min_n <= args.spec_ngram_max_n
+
     # 部分模式还不能支持与高级动态调度算法协同，to do.
     if args.diverse_mode:
         assert args.router_token_ratio == 0.0
@@ -152,6 +166,12 @@ def normal_or_p_d_start(args):
             args.batch_max_tokens >= args.chunked_prefill_size
         ), "chunked prefill mode, batch_max_tokens must >= chunked_prefill_size"
 
+    if args.req_shm_arena_token_num is None:
+        args.req_shm_arena_token_num = args.running_max_req_size * 4096
+
+    if args.embed_cache_impl == "disk":
+        assert args.embed_cache_disk_dir is not None, "--embed_cache_impl disk need --embed_cache_disk_dir"
+
     # help to manage data stored on Ceph
     if "s3://" in args.model_dir:
         from lightllm.utils.petrel_helper import s3_model_prepare
@@ -3,7 +3,6 @@ import zmq
 import zmq.asyncio
 import asyncio
 import uvloop
-import rpyc
 import inspect
 from typing import List
 
@@ -11,6 +10,7 @@ asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 from lightllm.utils.log_utils import init_logger
 from lightllm.server.core.objs.io_objs.group_req import GroupReqIndexes
 from lightllm.server.core.objs.shm_req_manager import ShmReqManager
+from lightllm.server.embed_cache.async_client import AsyncCacheClient
 from lightllm.server.multimodal_params import AudioItem
 from .model_infer.model_rpc import start_model_process, AudioModelRpcClient
 from lightllm.utils.graceful_utils import graceful_registry
@@ -33,7 +33,7 @@ class AudioManager:
 
         self.recv_from_visualserver = context.socket(zmq.PULL)
         self.recv_from_visualserver.bind(f"{args.zmq_mode}127.0.0.1:{audio_port}")
-        self.cache_client = rpyc.connect("localhost", cache_port)
+        self.cache_client = AsyncCacheClient(cache_port)
         self.cache_port = cache_port
         self.waiting_reqs: List[GroupReqIndexes] = []
         self.model_weightdir = args.model_dir
@@ -94,8 +94,10 @@ class AudioManager:
 
                     multimodal_params = group_req_indexes.multimodal_params
 
-                    for audio in multimodal_params.audios:
-                        if not self.cache_client.root.get_item_embed(audio.uuid):
+                    # 一次往返查询这个请求所有的音频是否已经有 embed
+                    embed_readys = await self.cache_client.query_embed_many([e.uuid for e in multimodal_params.audios])
+                    for audio, embed_ready in zip(multimodal_params.audios, embed_readys):
+                        if not embed_ready:
                             audios_need_infer.append(audio)
 
                         if len(audios_need_infer) == self.infer_batch_size:
@@ -1,25 +1,67 @@
+import copy
+import collections
+from typing import Optional
+
 tokenizer = None
+chat_template_cache = None
+
+
+_DICT_TAG = object()
+
+
+def _freeze(obj):
+    # 将消息列表等参数转换为可以直接作为 dict key 的嵌套 tuple, 字符串只引用不拷贝，并且会缓存自身的哈希值，
+    # 比序列化为 json 后再计算 md5 的开销小很多。pydantic 的消息对象直接读取其字段，不进行 model_dump。
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    if isinstance(obj, dict):
+        return (_DICT_TAG,) + tuple((k, _freeze(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return tuple(_freeze(v) for v in obj)
+    if hasattr(obj, "__dict__"):
+        return (type(obj), _freeze(vars(obj)))
+    return str(obj)
+
+
+class ChatTemplateCache:
+    """
+    最近渲染过的 chat template 结果的 lru 缓存，key 为消息列表和渲染参数转换成的嵌套 tuple。
+    多轮对话和重复的系统提示词会反复渲染相同的消息列表，命中缓存时不需要再次渲染。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.cache = collections.OrderedDict()
+
+    @staticmethod
+    def get_key(kwargs: dict, tools: Optional[list]) -> tuple:
+        return (_freeze(kwargs), _freeze(tools))
+
+    def get(self, key: tuple):
+        if key not in self.cache:
+            return None
+        self.cache.move_to_end(key)
+        return copy.copy(self.cache[key])
+
+    def put(self, key: tuple, value):
+        self.cache[key] = copy.copy(value)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.capacity:
+            self.cache.popitem(last=False)
+        return
 
 
 def init_tokenizer(args):
-    global tokenizer
+    global tokenizer, chat_template_cache
     from lightllm.server.tokenizer import get_tokenizer
 
     tokenizer = get_tokenizer(args.model_dir, args.tokenizer_mode, trust_remote_code=args.trust_remote_code)
+    cache_size = getattr(args, "chat_template_cache_size", 0)
+    if cache_size > 0:
+        chat_template_cache = ChatTemplateCache(cache_size)
 
 
-async def build_prompt(request, tools) -> str:
-    global tokenizer
-    messages = request.messages
-    kwargs = {"conversation": messages}
-    if request.character_settings:
-        kwargs["character_settings"] = request.character_settings
-    if request.role_settings:
-        kwargs["role_setting"] = request.role_settings
-
-    if request.chat_template_kwargs:
-        kwargs.update(request.chat_template_kwargs)
-
+def render_chat_template(tokenizer, kwargs: dict, tools: Optional[list]):
     try:
         input_str = tokenizer.apply_chat_template(**kwargs, tokenize=False, add_generation_prompt=True, tools=tools)
     except:
@@ -34,3 +76,34 @@ async def build_prompt(request, tools) -> str:
             tools=tools,
         )
     return input_str
+
+
+async def build_prompt(request, tools) -> str:
+    from lightllm.server.httpserver.tokenize_pool import get_tokenize_pool
+
+    messages = request.messages
+    kwargs = {"conversation": messages}
+    if request.character_settings:
+        kwargs["character_settings"] = request.character_settings
+    if request.role_settings:
+        kwargs["role_setting"] = request.role_settings
+
+    if request.chat_template_kwargs:
+        kwargs.update(request.chat_template_kwargs)
+
+    cache_key = None
+    if chat_template_cache is not None:
+        cache_key = ChatTemplateCache.get_key(kwargs, tools)
+        input_str = chat_template_cache.get(cache_key)
+        if input_str is not None:
+            return input_str
+
+    tokenize_pool = get_tokenize_pool()
+    if tokenize_pool is not None:
+        input_str = await tokenize_pool.apply_chat_template(kwargs, tools)
+    else:
+        input_str = render_chat_template(tokenizer, kwargs, tools)
+
+    if cache_key is not None:
+        chat_template_cache.put(cache_key, input_str)
+    return input_str
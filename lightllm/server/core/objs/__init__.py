@@ -1,4 +1,4 @@
 from .sampling_params import SamplingParams
 from .req import Req, FinishStatus
 from .shm_req_manager import ShmReqManager
-from .rpc_shm import RpcShmParams, RpcShmResults, ShmSyncStatusArray
+from .rpc_shm import RpcShmParams, RpcShmResults, RpcSyncBarrier
@@ -5,6 +5,7 @@ import numpy as np
 from .sampling_params import SamplingParams
 from .out_token_circlequeue import CircularQueue
 from .shm_array import ShmArray
+from .shm_req_arena import get_req_shm_arena
 from lightllm.server.req_id_generator import convert_sub_id_to_group_id
 from lightllm.utils.envs_utils import get_unique_server_name
 from lightllm.utils.envs_utils import get_env_start_args
@@ -64,6 +65,10 @@ class Req(ctypes.Structure):
         ("group_req_id", ctypes.c_int64),
         ("input_len", ctypes.c_int),
         ("alloc_shm_numpy_len", ctypes.c_int),
+        # prompt ids 和 logprobs 在共享内存 arena 中的 token 偏移量，-1 表示使用单独的共享内存段
+        ("shm_arena_offset", ctypes.c_int64),
+        # 请求所属的 httpserver 进程编号，detokenization 进程只通知对应进程的就绪列表
+        ("httpserver_index", ctypes.c_int),
         ("shm_infer_released", ctypes.c_bool),  # 推理进程用于标记请求对象已经被推理进程释放，router进程得到信息后亦可释放shm req对象
         ("shm_cur_kv_len", ctypes.c_int),  # 推理进程记录自己当前占用kv 显存长度
         ("shm_cur_output_len", ctypes.c_int),  # 推理进程记录自己输出长度的计数
@@ -79,6 +84,12 @@ class Req(ctypes.Structure):
         # 直接读取 is_aborted 变量可能会存在异步问题，但是router的执行线程和推理进程之间是线性运行的，所以router
         # 进程写入的router_aborted信息，所有推理进程可以保证同时读取到的是正确信息，不会出现异步问题。
         ("router_aborted", ctypes.c_bool),
+        # detokenization 进程在解码出的文本中匹配到停止字符串时标记 stop_str_matched, 并记录匹配结束位置的 token
+        # 的 index 到 stop_str_token_index 中。与 router_aborted 相同，由 router 进程转写到 router_stop_str_matched
+        # 后推理进程再读取，推理进程读取到后以 FINISHED_STOP 状态结束请求。
+        ("stop_str_matched", ctypes.c_bool),
+        ("router_stop_str_matched", ctypes.c_bool),
+        ("stop_str_token_index", ctypes.c_int),
         # 当FinishStatus 是正常结束状态时，finish_token_index 用于标识结束的
         # token 的index位置
         ("finish_token_index", ctypes.c_int),
@@ -124,12 +135,16 @@ class Req(ctypes.Structure):
         self.finish_status = FinishStatus()
         self.is_aborted = False
         self.router_aborted = False
+        self.stop_str_matched = False
+        self.router_stop_str_matched = False
+        self.stop_str_token_index = -1
         self.shm_infer_released = False
         self.shm_cur_kv_len = 0
         self.shm_cur_output_len = 0
         self.candetoken_out_len = 0
         self.prompt_cache_len = 0
         self.finish_token_index = -1
+        self.httpserver_index = 0
         self.can_released_mark = False
         self.reward_score = math.nan
         self.cumlogprob = 0.0
@@ -143,6 +158,7 @@ class Req(ctypes.Structure):
         self.out_tokens_queue = CircularQueue()
         self.input_len = len(prompt_ids)
         self.alloc_shm_numpy_len = self.input_len + self.sample_params.max_new_tokens + 1024  # + 1024 for safe
+        self.alloc_shm_arena()
         self.create_logprobs_shm_array()
         self.create_prompt_ids_shm_array()
         self.chunked_prefill_size = chunked_prefill_size
@@ -155,7 +171,16 @@ class Req(ctypes.Structure):
         # 子类继承进行一些额外的初始化操作
         pass
 
+    def alloc_shm_arena(self):
+        arena = get_req_shm_arena()
+        self.shm_arena_offset = -1 if arena is None else arena.alloc(self.alloc_shm_numpy_len)
+        return
+
     def create_prompt_ids_shm_array(self):
+        if self.shm_arena_offset >= 0:
+            arena = get_req_shm_arena()
+            self.shm_prompt_ids = arena.get_prompt_ids_view(self.shm_arena_offset, self.alloc_shm_numpy_len)
+            return
         service_uni_name = get_unique_server_name()
         name = f"{service_uni_name}_shm_prompts_{self.index_in_shm_mem}"
         self.shm_prompt_ids = ShmArray(name, (self.alloc_shm_numpy_len,), dtype=np.int64)
@@ -163,6 +188,10 @@ class Req(ctypes.Structure):
         return
 
     def link_prompt_ids_shm_array(self):
+        if self.shm_arena_offset >= 0:
+            arena = get_req_shm_arena()
+            self.shm_prompt_ids = arena.get_prompt_ids_view(self.shm_arena_offset, self.alloc_shm_numpy_len)
+            return
         service_uni_name = get_unique_server_name()
         name = f"{service_uni_name}_shm_prompts_{self.index_in_shm_mem}"
         self.shm_prompt_ids = ShmArray(name, (self.alloc_shm_numpy_len,), dtype=np.int64)
@@ -170,6 +199,10 @@ class Req(ctypes.Structure):
         return
 
     def create_logprobs_shm_array(self):
+        if self.shm_arena_offset >= 0:
+            arena = get_req_shm_arena()
+            self.shm_logprobs = arena.get_logprobs_view(self.shm_arena_offset, self.alloc_shm_numpy_len)
+            return
         service_uni_name = get_unique_server_name()
         name = f"{service_uni_name}_shm_logprobs_{self.index_in_shm_mem}"
         self.shm_logprobs = ShmArray(name, (self.alloc_shm_numpy_len,), dtype=np.float32)
@@ -177,6 +210,10 @@ class Req(ctypes.Structure):
         return
 
     def link_logprobs_shm_array(self):
+        if self.shm_arena_offset >= 0:
+            arena = get_req_shm_arena()
+            self.shm_logprobs = arena.get_logprobs_view(self.shm_arena_offset, self.alloc_shm_numpy_len)
+            return
         service_uni_name = get_unique_server_name()
         name = f"{service_uni_name}_shm_logprobs_{self.index_in_shm_mem}"
         self.shm_logprobs = ShmArray(name, (self.alloc_shm_numpy_len,), dtype=np.float32)
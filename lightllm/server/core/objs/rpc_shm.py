@@ -1,6 +1,8 @@
 import os
+import time
+import ctypes
 import pickle
-import numpy as np
+import multiprocessing as mp
 from multiprocessing import shared_memory
 from typing import List
 from lightllm.utils.envs_utils import get_unique_server_name
@@ -10,6 +12,8 @@ logger = init_logger(__name__)
 
 LIGHTLLM_RPC_BYTE_SIZE = int(os.getenv("LIGHTLLM_RPC_BYTE_SIZE", 1024 * 1024 * 16))  # 默认16M buf
 LIGHTLLM_RPC_RESULT_BYTE_SIZE = int(os.getenv("LIGHTLLM_RPC_RESULT_BYTE_SIZE", 1024 * 1024))  # 默认1M buf
+# 推理进程之间同步时阻塞等待前自旋的时间，单位为微秒
+LIGHTLLM_RPC_SYNC_SPIN_US = int(os.getenv("LIGHTLLM_RPC_SYNC_SPIN_US", 200))
 
 
 class RpcShmParams:
@@ -85,51 +89,38 @@ class RpcShmResults:
         return func_name, ret
 
 
-class ShmSyncStatusArray:
-    def __init__(self, world_size):
-        self.shm = None
-        self.arr = None
-        self.name = f"{get_unique_server_name()}_rpc_result_state"
-        self.dtype_byte_num = np.array([1], dtype=np.int64).dtype.itemsize
-        self.dest_size = np.prod((world_size * 2,)) * self.dtype_byte_num
-        self.shape = (world_size * 2,)
-        self.dtype = np.int64
-        self.world_size = world_size
-
-    def create_or_link_shm(self):
-        try:
-            shm = shared_memory.SharedMemory(name=self.name, create=True, size=self.dest_size)
-        except:
-            shm = shared_memory.SharedMemory(name=self.name, create=False, size=self.dest_size)
-
-        if shm.size != self.dest_size:
-            logger.warning(f"size not same, unlink shm {self.name} and create again")
-            shm.close()
-            shm.unlink()
-            try:
-                shm = shared_memory.SharedMemory(name=self.name, create=True, size=self.dest_size)
-                logger.info(f"create shm {self.name}")
-            except:
-                shm = shared_memory.SharedMemory(name=self.name, create=False, size=self.dest_size)
-                logger.info(f"link shm {self.name}")
-
-        self.shm = shm
-        self.arr = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
-        self.arr[:] = 0
-        self.arr0 = self.arr[0 : self.world_size]
-        self.arr1 = self.arr[self.world_size : 2 * self.world_size]
-        return
+class RpcSyncBarrier:
+    """
+    推理进程之间的同步屏障。每个 rank 到达时在锁内增加到达计数，最后一个到达的 rank 将计数清零，并对其他 rank
+    的信号量各 release 一次(门铃)。其他 rank 先以 acquire(block=False) 自旋 spin_us 微秒，之后阻塞在自己的信号量
+    上，由最后到达的 rank 通过 futex 直接唤醒，不需要 sleep 轮询，长时间的等待也不会占用 cpu。
+    每一轮中每个不是最后到达的 rank 的信号量恰好被 release 一次，所以屏障可以连续重复使用。
+    需要在父进程中创建，作为参数传给各个推理进程。
+    """
 
-    def add_mark(self, tp_rank: int):
-        self.arr0[tp_rank] += 1
-        return
-
-    def add_mark1(self, tp_rank: int):
-        self.arr1[tp_rank] += 1
+    def __init__(self, world_size: int, spin_us: int = LIGHTLLM_RPC_SYNC_SPIN_US):
+        self.world_size = world_size
+        self.spin_s = spin_us / 1e6
+        self.arrived_num = mp.Value(ctypes.c_int, 0)
+        self.doorbells = [mp.Semaphore(0) for _ in range(world_size)]
+
+    def wait(self, rank: int):
+        with self.arrived_num.get_lock():
+            self.arrived_num.value += 1
+            is_last = self.arrived_num.value == self.world_size
+            if is_last:
+                self.arrived_num.value = 0
+
+        if is_last:
+            for i, doorbell in enumerate(self.doorbells):
+                if i != rank:
+                    doorbell.release()
+            return
+
+        doorbell = self.doorbells[rank]
+        deadline = time.perf_counter() + self.spin_s
+        while time.perf_counter() < deadline:
+            if doorbell.acquire(block=False):
+                return
+        doorbell.acquire()
         return
-
-    def run_finished(self):
-        return len(np.unique(self.arr0)) == 1
-
-    def run_finished1(self):
-        return len(np.unique(self.arr1)) == 1
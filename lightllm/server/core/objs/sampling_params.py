@@ -1,4 +1,5 @@
 import os
+import json
 import ctypes
 from typing import List, Tuple, Union
 from transformers import GenerationConfig
@@ -12,11 +13,59 @@ SKIP_SPECIAL_TOKENS = os.getenv("SKIP_SPECIAL_TOKENS", "True").upper() in ["ON",
 STOP_SEQUENCE_MAX_LENGTH = int(os.getenv("LIGHTLLM_STOP_SEQUENCE_MAX_LENGTH", 256))
 ALLOWED_TOKEN_IDS_MAX_LENGTH = int(os.getenv("LIGHTLLM_ALLOWED_TOKEN_IDS_MAX_LENGTH", 256))
 MAX_STOP_SEQUENCES = int(os.getenv("LIGHTLLM_MAX_STOP_SEQUENCES", 10))
+STOP_STRING_MAX_BYTES = int(os.getenv("LIGHTLLM_STOP_STRING_MAX_BYTES", 256))
 REGULAR_CONSTRAINT_MAX_LENGTH = int(os.getenv("LIGHTLLM_REGULAR_CONSTRAINT_MAX_LENGTH", 2048))
 GRAMMAR_CONSTRAINT_MAX_LENGTH = int(os.getenv("LIGHTLLM_GRAMMAR_CONSTRAINT_MAX_LENGTH", 2048))
 JSON_SCHEMA_MAX_LENGTH = int(os.getenv("LIGHTLLM_JSON_SCHEMA_MAX_LENGTH", 2048))
 
 
+def parse_priority(priority) -> int:
+    """
+    priority 保存在 ctypes.c_int 中，超出范围的值写入时会被静默截断，需要在写入前转换并检查范围。
+    """
+    try:
+        priority = int(priority)
+    except (TypeError, ValueError):
+        raise ValueError(f"priority must be an integer, got {priority!r}")
+    if not (-(2 ** 31) <= priority < 2 ** 31):
+        raise ValueError(f"priority must be in [{-(2 ** 31)}, {2 ** 31 - 1}], got {priority}")
+    return priority
+
+
+def _is_dpda_constraint_mode():
+    # dpda 约束模式不使用 xgrammar, 需要使用各自的方式校验约束
+    if "LIGHTLLM_START_ARGS" not in os.environ:
+        return False
+    from lightllm.utils.envs_utils import get_env_start_args
+
+    return get_env_start_args().output_constraint_mode == "dpda"
+
+
+# 不影响 json 内容的注解字段
+_JSON_SCHEMA_ANNOTATION_KEYS = ("$schema", "$id", "title", "description")
+
+
+def check_dpda_json_schema(constraint: str):
+    """
+    dpda 模式下 guided_json 只能约束输出为合法的 json object / array, 不能保证输出满足 schema 的内容，
+    对内容有限制的 schema 直接报错，避免返回不满足 schema 的结果。
+    """
+    try:
+        schema = json.loads(constraint)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"guided_json '{constraint}' is not a valid json: {str(e)}")
+    if schema is True:
+        return
+    if isinstance(schema, dict):
+        schema = {k: v for k, v in schema.items() if k not in _JSON_SCHEMA_ANNOTATION_KEYS}
+        if schema in ({}, {"type": "object"}, {"type": "array"}):
+            return
+    raise ValueError(
+        "guided_json schema is not supported in --output_constraint_mode dpda, "
+        'only an unrestricted schema such as {}, {"type": "object"} or {"type": "array"} is allowed'
+    )
+
+
 class StopSequence(ctypes.Structure):
     _pack_ = 4
     _fields_ = [
@@ -34,11 +83,31 @@ class StopSequence(ctypes.Structure):
         return list(self.sequence[0 : self.size])
 
 
+class StopString(ctypes.Structure):
+    _pack_ = 4
+    _fields_ = [
+        ("data", ctypes.c_ubyte * STOP_STRING_MAX_BYTES),
+        ("length", ctypes.c_int),
+    ]
+
+    def initialize(self, stop_str: str):
+        str_bytes = stop_str.encode("utf-8")
+        assert len(str_bytes) <= STOP_STRING_MAX_BYTES, "stop string too long."
+        ctypes.memmove(self.data, str_bytes, len(str_bytes))
+        self.length = len(str_bytes)
+
+    def to_str(self):
+        return bytes(self.data[0 : self.length]).decode("utf-8")
+
+
 class StopSequenceGroups(ctypes.Structure):
     _pack_ = 4
     _fields_ = [
         ("groups", StopSequence * MAX_STOP_SEQUENCES),
         ("size", ctypes.c_int),
+        # 以字符串形式给出的停止序列，detokenization 进程用于在解码后的文本上匹配
+        ("stop_strs", StopString * MAX_STOP_SEQUENCES),
+        ("stop_str_size", ctypes.c_int),
     ]
 
     def initialize(self, stop_sequences: Union[str, List], tokenizer):
@@ -48,6 +117,14 @@ class StopSequenceGroups(ctypes.Structure):
         for group_idx in range(self.size):
             self.groups[group_idx].initialize(groups[group_idx])
 
+        if isinstance(stop_sequences, str):
+            stop_sequences = [stop_sequences]
+        stop_strs = [e for e in (stop_sequences or []) if isinstance(e, str) and len(e) > 0]
+        self.stop_str_size = len(stop_strs)
+        assert self.stop_str_size <= MAX_STOP_SEQUENCES, "Too many stop strings."
+        for str_idx in range(self.stop_str_size):
+            self.stop_strs[str_idx].initialize(stop_strs[str_idx])
+
     def stop_sentences_to_token_ids(self, stop_sequences, tokenizer):
         if stop_sequences is None:
             stop_sequences = []
@@ -75,6 +152,9 @@ class StopSequenceGroups(ctypes.Structure):
     def to_list(self):
         return [self.groups[i].to_list() for i in range(self.size)]
 
+    def to_str_list(self):
+        return [self.stop_strs[i].to_str() for i in range(self.stop_str_size)]
+
 
 class RegularConstraint(ctypes.Structure):
     _pack_ = 4
@@ -115,7 +195,11 @@ class GuidedGrammar(ctypes.Structure):
         ctypes.memmove(self.constraint, constraint_bytes, len(constraint_bytes))
         self.length = len(constraint_bytes)
         try:
-            if self.length > 0 and tokenizer is not None:
+            if self.length > 0 and tokenizer is not None and _is_dpda_constraint_mode():
+                from lightllm.common.dpda import get_builtin_grammar
+
+                get_builtin_grammar(constraint)
+            elif self.length > 0 and tokenizer is not None:
                 import xgrammar as xgr
 
                 tokenizer_info = xgr.TokenizerInfo.from_huggingface(tokenizer)
@@ -144,6 +228,9 @@ class GuidedJsonSchema(ctypes.Structure):
 
         ctypes.memmove(self.constraint, constraint_bytes, len(constraint_bytes))
         self.length = len(constraint_bytes)
+        if self.length > 0 and tokenizer is not None and _is_dpda_constraint_mode():
+            check_dpda_json_schema(constraint)
+            return
         try:
             if self.length > 0 and tokenizer is not None:
                 import xgrammar as xgr
@@ -281,6 +368,9 @@ class SamplingParams(ctypes.Structure):
             ctypes.c_bool,
         ),  # whether to add spaces between special tokens when decoding
         ("print_eos_token", ctypes.c_bool),  # eos_id will be always ignored except the value is set to True
+        ("priority", ctypes.c_int),  # larger value is scheduled first when --schedule_policy is priority
+        ("ttft_slo_ms", ctypes.c_int),  # used by --schedule_policy edf, 0 means use --default_ttft_slo_ms
+        ("tpot_slo_ms", ctypes.c_int),  # used by --schedule_policy edf, 0 means use --default_tpot_slo_ms
     ]
 
     _do_sample: bool = False
@@ -315,6 +405,9 @@ class SamplingParams(ctypes.Structure):
         self.add_special_tokens = kwargs.get("add_special_tokens", True)
         self.add_spaces_between_special_tokens = kwargs.get("add_spaces_between_special_tokens", True)
         self.print_eos_token = kwargs.get("print_eos_token", False)
+        self.priority = parse_priority(kwargs.get("priority", 0))
+        self.ttft_slo_ms = kwargs.get("ttft_slo_ms", 0)
+        self.tpot_slo_ms = kwargs.get("tpot_slo_ms", 0)
 
         self.exponential_decay_length_penalty = ExponentialDecayLengthPenalty()
         self.exponential_decay_length_penalty.initialize(kwargs.get("exponential_decay_length_penalty", (1, 1.0)))
@@ -400,6 +493,8 @@ class SamplingParams(ctypes.Structure):
             raise ValueError(
                 f"min_new_tokens must <= max_new_tokens, but got min {self.min_new_tokens}, max {self.max_new_tokens}."
             )
+        if self.ttft_slo_ms < 0 or self.tpot_slo_ms < 0:
+            raise ValueError(f"ttft_slo_ms and tpot_slo_ms must >= 0, got {self.ttft_slo_ms}, {self.tpot_slo_ms}.")
 
         self._verify_allowed_token_ids()
         self._verify_grammar_constraint()
@@ -451,6 +546,9 @@ class SamplingParams(ctypes.Structure):
             "add_special_tokens": self.add_special_tokens,
             "add_spaces_between_special_tokens": self.add_spaces_between_special_tokens,
             "print_eos_token": self.print_eos_token,
+            "priority": self.priority,
+            "ttft_slo_ms": self.ttft_slo_ms,
+            "tpot_slo_ms": self.tpot_slo_ms,
         }
 
     def to_origin_dict(self):
@@ -0,0 +1,118 @@
+import os
+import zmq
+import atomics
+import numpy as np
+from multiprocessing import shared_memory
+from lightllm.utils.log_utils import init_logger
+from .shm_array import ShmArray
+
+logger = init_logger(__name__)
+
+
+class ShmReadyList:
+    """
+    基于共享内存的就绪通知列表，用于 router -> detokenization -> httpserver 之间通知哪些请求有新的输出。
+    flags 数组按照 shm req 的 index_in_shm_mem 标记有新数据的请求，消费者每次只处理被标记的请求，不需要扫描所有
+    存活的请求。waiting 标记表示消费者已经处理完所有的就绪请求，正在阻塞等待，生产者只在消费者等待的时候通过 zmq
+    发送一个空的字节帧将其唤醒，避免每个推理步都发送 pickle 的通知消息。
+
+    生产者: 先写请求数据，再 mark_ready, 最后 notify。
+    消费者: set_waiting 后检查 has_ready, 没有就绪请求时阻塞等待唤醒，否则 clear_waiting 后 pop_ready_indexes,
+    先清除标记再读取请求数据，所以在读取期间新标记的请求会在下一轮被处理，不会丢失通知。
+    """
+
+    def __init__(self, name: str, max_req_num: int):
+        self.name = name
+        self.max_req_num = max_req_num
+        self.flags = ShmArray(f"{name}_flags", (max_req_num,), dtype=np.int8)
+        self.flags.create_shm()
+        self._init_waiting_shm()
+
+    def _init_waiting_shm(self):
+        waiting_name = f"{self.name}_waiting"
+        try:
+            shm = shared_memory.SharedMemory(name=waiting_name, create=True, size=4)
+            logger.info(f"create ready list shm {waiting_name}")
+        except:
+            shm = shared_memory.SharedMemory(name=waiting_name, create=False, size=4)
+            logger.info(f"link ready list shm {waiting_name}")
+        self.waiting_shm = shm
+        return
+
+    def mark_ready(self, shm_req_indexes):
+        if len(shm_req_indexes) != 0:
+            self.flags.arr[shm_req_indexes] = 1
+        return
+
+    def has_ready(self) -> bool:
+        return bool(self.flags.arr.any())
+
+    def pop_ready_indexes(self) -> np.ndarray:
+        ready_indexes = np.flatnonzero(self.flags.arr)
+        self.flags.arr[ready_indexes] = 0
+        return ready_indexes
+
+    def set_waiting(self):
+        with atomics.atomicview(buffer=self.waiting_shm.buf[0:4], atype=atomics.INT) as a:
+            a.store(1)
+        return
+
+    def clear_waiting(self):
+        with atomics.atomicview(buffer=self.waiting_shm.buf[0:4], atype=atomics.INT) as a:
+            a.store(0)
+        return
+
+    def notify(self, socket: zmq.Socket):
+        # 只有消费者处于等待状态时才需要发送唤醒消息
+        with atomics.atomicview(buffer=self.waiting_shm.buf[0:4], atype=atomics.INT) as a:
+            is_waiting = a.exchange(0) == 1
+        if is_waiting:
+            socket.send(b"")
+        return
+
+
+def get_detoken_ready_list_name(unique_name: str) -> str:
+    return f"{unique_name}_detoken_ready_list"
+
+
+def get_httpserver_ready_list_name(unique_name: str, httpserver_index: int) -> str:
+    return f"{unique_name}_httpserver_ready_list_{httpserver_index}"
+
+
+class HttpServerIndexAllocator:
+    """
+    为每个 httpserver 进程分配一个 [0, httpserver_workers) 中的编号。每个 httpserver 进程使用自己编号对应的就绪列表，
+    请求记录所属进程的编号，detokenization 进程只标记请求所属进程的就绪列表，避免一个进程取走其他进程请求的就绪标记。
+    每个编号对应共享内存中的一个槽位，记录占用的进程 pid, 进程退出后 gunicorn 重新拉起的进程可以复用该编号。
+    """
+
+    def __init__(self, name: str, worker_num: int):
+        self.worker_num = worker_num
+        self.pids = ShmArray(f"{name}_httpserver_pids", (worker_num,), dtype=np.int32)
+        self.pids.create_shm()
+
+    def reset(self):
+        # 由 detokenization 进程在 httpserver 进程启动前调用
+        self.pids.arr[:] = 0
+        return
+
+    def alloc(self) -> int:
+        pid = os.getpid()
+        for index in range(self.worker_num):
+            with atomics.atomicview(buffer=self.pids.shm.buf[index * 4 : index * 4 + 4], atype=atomics.INT) as a:
+                cur_pid = a.load()
+                if cur_pid != 0 and _is_alive(cur_pid):
+                    continue
+                if a.cmpxchg_strong(cur_pid, pid):
+                    return index
+        raise RuntimeError(f"no free httpserver index, httpserver worker num {self.worker_num}")
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,144 @@
+import numpy as np
+from typing import Optional
+from .shm_array import ShmArray
+from lightllm.utils.envs_utils import get_unique_server_name
+from lightllm.utils.log_utils import init_logger
+
+logger = init_logger(__name__)
+
+# 伙伴分配器的最小分配单位，单位为 token
+ARENA_BLOCK_TOKEN_NUM = 256
+
+
+class BuddyAllocator:
+    """
+    伙伴分配器，以 block 为单位管理 [0, block_num) 的空间，每次分配 2 的幂次个 block, 释放时与空闲的伙伴块合并。
+    block_num 不是 2 的幂次时，初始空间被拆分为若干个对齐的 2 的幂次块。分配状态保存在 state 数组中，
+    state[0][offset] 为从 offset 开始的空闲块的 order, state[1][offset] 为从 offset 开始的已分配块的 order,
+    不是块起始位置时为 -1。state 放在共享内存中时，多个进程可以在同一把锁的保护下共同使用一个分配器。
+    """
+
+    def __init__(self, block_num: int, state: Optional[np.ndarray] = None):
+        self.block_num = block_num
+        self.max_order = max(block_num.bit_length() - 1, 0)
+        if state is None:
+            state = np.empty((2, block_num), dtype=np.int8)
+        assert state.shape == (2, block_num)
+        self.free_orders = state[0]
+        self.alloced_orders = state[1]
+
+    def init_state(self):
+        self.free_orders[:] = -1
+        self.alloced_orders[:] = -1
+        offset = 0
+        for order in range(self.max_order, -1, -1):
+            if self.block_num - offset >= (1 << order):
+                self.free_orders[offset] = order
+                offset += 1 << order
+        return
+
+    def alloc(self, need_block_num: int) -> Optional[int]:
+        order = max(need_block_num - 1, 0).bit_length()
+        # 选择能够满足需求的最小空闲块
+        candidates = np.flatnonzero(self.free_orders >= order)
+        if len(candidates) == 0:
+            return None
+        offset = int(candidates[np.argmin(self.free_orders[candidates])])
+        cur_order = int(self.free_orders[offset])
+        self.free_orders[offset] = -1
+        # 将大块逐级拆分，后半部分放回空闲块
+        while cur_order > order:
+            cur_order -= 1
+            self.free_orders[offset + (1 << cur_order)] = cur_order
+        self.alloced_orders[offset] = order
+        return offset
+
+    def free(self, offset: int):
+        order = int(self.alloced_orders[offset])
+        assert order >= 0, f"block {offset} is not alloced"
+        self.alloced_orders[offset] = -1
+        while order < self.max_order:
+            buddy = offset ^ (1 << order)
+            if buddy >= self.block_num or self.free_orders[buddy] != order:
+                break
+            self.free_orders[buddy] = -1
+            offset = min(offset, buddy)
+            order += 1
+        self.free_orders[offset] = order
+        return
+
+    def get_free_block_num(self) -> int:
+        free_orders = self.free_orders[self.free_orders >= 0].astype(np.int64)
+        return int(np.sum(np.left_shift(1, free_orders)))
+
+
+class ShmArenaView:
+    """
+    arena 中一段连续空间的视图，与 ShmArray 一样通过 arr 访问数据。
+    """
+
+    def __init__(self, arr: np.ndarray):
+        self.arr = arr
+
+
+class ShmReqArena:
+    """
+    请求的 prompt ids 和 logprobs 使用的共享内存 arena, 每个进程在启动时只映射一次，请求的缓冲区是 arena 中的偏移量，
+    不再需要为每个请求创建和映射新的共享内存段。伙伴分配器的状态同样保存在共享内存中，开启多个 httpserver
+    进程时，各个进程在 lock (ShmReqManager 的 manager_lock) 的保护下进行分配和释放，其他进程只根据 Req 中
+    记录的偏移量访问数据。
+    """
+
+    def __init__(self, token_num: int, lock):
+        self.block_num = token_num // ARENA_BLOCK_TOKEN_NUM
+        self.token_num = self.block_num * ARENA_BLOCK_TOKEN_NUM
+        service_uni_name = get_unique_server_name()
+        self.prompt_ids = ShmArray(f"{service_uni_name}_req_arena_prompt_ids", (self.token_num,), dtype=np.int64)
+        self.prompt_ids.create_shm()
+        self.logprobs = ShmArray(f"{service_uni_name}_req_arena_logprobs", (self.token_num,), dtype=np.float32)
+        self.logprobs.create_shm()
+        self.allocator_state = ShmArray(
+            f"{service_uni_name}_req_arena_allocator_state", (2, self.block_num), dtype=np.int8
+        )
+        self.allocator_state.create_shm()
+        self.allocator = BuddyAllocator(self.block_num, self.allocator_state.arr)
+        # 与 ShmReqManager 中其他共享状态相同，在各个进程启动时初始化
+        self.allocator.init_state()
+        self.lock = lock
+
+    def alloc(self, token_num: int) -> int:
+        """
+        返回分配的 token 偏移量，空间不足时返回 -1, 调用方需要回退到单独创建共享内存段的方式。
+        """
+        need_block_num = (token_num + ARENA_BLOCK_TOKEN_NUM - 1) // ARENA_BLOCK_TOKEN_NUM
+        with self.lock:
+            block_offset = self.allocator.alloc(need_block_num)
+        if block_offset is None:
+            return -1
+        return block_offset * ARENA_BLOCK_TOKEN_NUM
+
+    def free(self, token_offset: int):
+        with self.lock:
+            self.allocator.free(token_offset // ARENA_BLOCK_TOKEN_NUM)
+        return
+
+    def get_prompt_ids_view(self, token_offset: int, token_num: int) -> ShmArenaView:
+        return ShmArenaView(self.prompt_ids.arr[token_offset : token_offset + token_num])
+
+    def get_logprobs_view(self, token_offset: int, token_num: int) -> ShmArenaView:
+        return ShmArenaView(self.logprobs.arr[token_offset : token_offset + token_num])
+
+
+g_req_shm_arena: ShmReqArena = None
+
+
+def init_req_shm_arena(token_num: int, lock):
+    global g_req_shm_arena
+    if g_req_shm_arena is None and token_num >= ARENA_BLOCK_TOKEN_NUM:
+        g_req_shm_arena = ShmReqArena(token_num, lock)
+        logger.info(f"req shm arena token num {g_req_shm_arena.token_num}")
+    return
+
+
+def get_req_shm_arena() -> Optional[ShmReqArena]:
+    return g_req_shm_arena
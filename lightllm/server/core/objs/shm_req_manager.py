@@ -5,6 +5,7 @@ from multiprocessing import shared_memory
 from lightllm.utils.log_utils import init_logger
 from .req import Req, NormalReq, ChunkedPrefillReq, TokenHealingReq
 from .shm_array import ShmArray
+from .shm_req_arena import init_req_shm_arena, get_req_shm_arena
 from .atomic_array_lock import AtomicShmArrayLock, AtomicLockItem
 from .atomic_lock import AtomicShmLock
 from .start_args_type import StartArgs
@@ -26,6 +27,7 @@ class ShmReqManager:
         self.init_to_req_locks()
         self.init_manager_lock()
         self.init_alloc_state_shm()
+        self.init_req_shm_arena()
         return
 
     def get_req_class_type(self):
@@ -68,6 +70,7 @@ class ShmReqManager:
         for i in range(self.max_req_num):
             self.reqs[i].ref_count = 0
             self.reqs[i].index_in_shm_mem = i
+            self.reqs[i].shm_arena_offset = -1
         return
 
     def init_to_req_locks(self):
@@ -78,6 +81,15 @@ class ShmReqManager:
     def get_req_lock_by_index(self, req_index_in_mem: int) -> AtomicLockItem:
         return self.reqs_lock.get_lock_context(req_index_in_mem)
 
+    def init_req_shm_arena(self):
+        # 每个进程只映射一次请求 prompt ids 和 logprobs 使用的共享内存 arena, arena 的分配和释放与请求索引的
+        # 分配和释放使用同一把锁，多个 httpserver 进程可以同时使用
+        args: StartArgs = get_env_start_args()
+        arena_token_num = args.get("req_shm_arena_token_num", None)
+        if arena_token_num is not None:
+            init_req_shm_arena(arena_token_num, self.manager_lock)
+        return
+
     def init_manager_lock(self):
         lock_name = f"{get_unique_server_name()}_shm_reqs_manager_lock"
         self.manager_lock = AtomicShmLock(lock_name)
@@ -110,6 +122,10 @@ class ShmReqManager:
 
     def release_req_index(self, req_index_in_mem):
         assert req_index_in_mem < self.max_req_num
+        req: Req = self.reqs[req_index_in_mem]
+        if req.shm_arena_offset >= 0:
+            get_req_shm_arena().free(req.shm_arena_offset)
+            req.shm_arena_offset = -1
         with self.manager_lock:
             assert self.alloc_state_shm.arr[req_index_in_mem] == 1
             self.alloc_state_shm.arr[req_index_in_mem] = 0
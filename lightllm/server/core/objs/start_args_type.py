@@ -9,6 +9,10 @@ class StartArgs:
     run_mode: str = field(default="normal", metadata={"choices": ["normal", "prefill", "decode", "pd_master"]})
     host: str = field(default="127.0.0.1")
     port: int = field(default=8000)
+    httpserver_workers: int = field(default=1)
+    tokenize_workers: int = field(default=0)
+    chat_template_cache_size: int = field(default=1024)
+    prompt_token_cache_size: int = field(default=256)
     zmq_mode: str = field(
         default="ipc:///tmp/",
         metadata={"help": "use socket mode or ipc mode, only can be set in ['tcp://', 'ipc:///tmp/']"},
@@ -28,6 +32,7 @@ class StartArgs:
     eos_id: List[int] = field(default_factory=list)
     tool_call_parser: Optional[str] = field(default=None, metadata={"choices": ["llama3", "qwen25", "mistral"]})
     running_max_req_size: int = field(default=1000)
+    req_shm_arena_token_num: Optional[int] = field(default=None)
     tp: int = field(default=1)
     dp: int = field(default=1)
     max_req_total_len: int = field(default=2048 + 1024)
@@ -42,12 +47,23 @@ class StartArgs:
     router_max_new_token_len: int = field(default=1024)
     router_max_wait_tokens: int = field(default=6)
     disable_aggressive_schedule: bool = field(default=False)
+    schedule_policy: str = field(default="fcfs", metadata={"choices": ["fcfs", "priority", "edf", "sjf"]})
+    default_ttft_slo_ms: int = field(default=3000)
+    default_tpot_slo_ms: int = field(default=100)
+    sjf_aging_tokens_per_second: float = field(default=500.0)
     disable_dynamic_prompt_cache: bool = field(default=False)
+    host_kv_cache_token_num: int = field(default=0)
+    kv_swap_host_token_num: int = field(default=0)
+    prefix_affinity_route: bool = field(default=False)
+    prefix_affinity_block_size: int = field(default=64)
+    prefix_affinity_load_weight: float = field(default=1.0)
+    kv_page_size: int = field(default=0)
     chunked_prefill_size: int = field(default=8192)
     disable_chunked_prefill: bool = field(default=False)
     diverse_mode: bool = field(default=False)
     token_healing_mode: bool = field(default=False)
-    output_constraint_mode: str = field(default="none", metadata={"choices": ["none", "simple", "xgrammar"]})
+    output_constraint_mode: str = field(default="none", metadata={"choices": ["none", "simple", "xgrammar", "dpda"]})
+    grammar_cache_size: int = field(default=256)
     first_token_constraint_mode: bool = field(default=False)
     enable_multimodal: bool = field(default=False)
     enable_tpsp_mix_mode: bool = field(default=False)
@@ -55,6 +71,9 @@ class StartArgs:
     enable_prefill_microbatch_overlap: bool = field(default=False)
     cache_capacity: int = field(default=200)
     cache_reserved_ratio: float = field(default=0.5)
+    embed_cache_impl: str = field(default="naive", metadata={"choices": ["naive", "disk"]})
+    embed_cache_disk_dir: Optional[str] = field(default=None)
+    embed_cache_disk_max_gb: float = field(default=64)
     data_type: Optional[str] = field(
         default=None, metadata={"choices": ["fp16", "float16", "bf16", "bfloat16", "fp32", "float32"]}
     )
@@ -75,6 +94,7 @@ class StartArgs:
     enable_monitor_auth: bool = field(default=False)
     disable_cudagraph: bool = field(default=False)
     graph_max_batch_size: int = field(default=16)
+    graph_batch_buckets: Optional[List[int]] = field(default=None)
     graph_max_len_in_batch: int = field(default=8192)
     quant_type: Optional[str] = field(default=None)
     quant_cfg: Optional[str] = field(default=None)
@@ -1,4 +1,4 @@
-from typing import Union, List
+from typing import Union, List, Dict, Tuple
 
 from transformers import PreTrainedTokenizer, PreTrainedTokenizerFast
 from .decode_req import DecodeReq
@@ -33,3 +33,84 @@ def decode_token(
         return new_text
     else:
         return ""
+
+
+class BatchDecoder:
+    """
+    批量的增量解码，每一轮为每个请求解码一个新的 token, 所有请求的解码窗口通过一次 tokenizer 的批量调用完成。
+    与 decode_token 的结果完全一致，但是前缀窗口的文本不再每次重新解码: 解码失败(输出了不完整的 utf-8 字符)
+    时前缀窗口不变，直接使用请求上缓存的前缀文本；解码成功后新的前缀窗口一般只包含一个 token, 使用按照 token id
+    缓存的单 token 文本。所以稳定状态下每个 token 只需要解码一次。
+    """
+
+    def __init__(self, tokenizer: Union[PreTrainedTokenizer, PreTrainedTokenizerFast]):
+        self.tokenizer = tokenizer
+        # 只有没有重写解码逻辑的 fast tokenizer 才能直接使用 rust 实现的批量解码，其他情况逐个调用 decode
+        self.use_rust_batch_decode = (
+            isinstance(tokenizer, PreTrainedTokenizerFast)
+            and type(tokenizer).decode is PreTrainedTokenizerFast.decode
+            and type(tokenizer)._decode is PreTrainedTokenizerFast._decode
+        )
+        self.single_token_text_cache: Dict[Tuple[int, bool, bool], str] = {}
+
+    def _batch_decode(self, token_ids_list: List[List[int]], skip_special_tokens: bool, spaces_between: bool):
+        if self.use_rust_batch_decode:
+            texts = self.tokenizer._tokenizer.decode_batch(token_ids_list, skip_special_tokens=skip_special_tokens)
+            if self.tokenizer.clean_up_tokenization_spaces:
+                texts = [self.tokenizer.clean_up_tokenization(text) for text in texts]
+            return texts
+        return [
+            self.tokenizer.decode(
+                token_ids,
+                skip_special_tokens=skip_special_tokens,
+                spaces_between_special_tokens=spaces_between,
+            )
+            for token_ids in token_ids_list
+        ]
+
+    def decode(self, decode_reqs: List[DecodeReq], new_token_ids: List[int], eos_id: List[int]) -> List[str]:
+        """
+        decode_reqs 中的请求都已经将 new_token_ids 中对应的 token 加入到了 output_ids 中，返回每个请求新增的文本。
+        """
+        ans = [""] * len(decode_reqs)
+        # (skip_special_tokens, spaces_between_special_tokens) -> [(item_index, token_ids, is_prefix)]
+        groups: Dict[Tuple[bool, bool], List[Tuple[int, List[int], bool]]] = {}
+        prefix_texts: List[str] = [None] * len(decode_reqs)
+        for i, (decode_req, new_token_id) in enumerate(zip(decode_reqs, new_token_ids)):
+            sample_params = decode_req.req.sample_params
+            if new_token_id in eos_id and not sample_params.print_eos_token:
+                continue
+
+            key = (sample_params.skip_special_tokens, sample_params.add_spaces_between_special_tokens)
+            group = groups.setdefault(key, [])
+            prefix_texts[i] = decode_req.get_cached_prefix_text()
+            if prefix_texts[i] is None and decode_req.read_offset - decode_req.prefix_offset == 1:
+                prefix_token_id = int(decode_req.req.shm_prompt_ids.arr[decode_req.prefix_offset])
+                prefix_texts[i] = self.single_token_text_cache.get((prefix_token_id,) + key, None)
+            if prefix_texts[i] is None:
+                group.append((i, decode_req.get_prefix_tokens(), True))
+            group.append((i, decode_req.get_read_tokens(), False))
+
+        read_texts: List[str] = [None] * len(decode_reqs)
+        for key, group in groups.items():
+            texts = self._batch_decode([e[1] for e in group], *key)
+            for (i, token_ids, is_prefix), text in zip(group, texts):
+                if is_prefix:
+                    prefix_texts[i] = text
+                    if len(token_ids) == 1:
+                        self.single_token_text_cache[(token_ids[0],) + key] = text
+                else:
+                    read_texts[i] = text
+
+        for i, decode_req in enumerate(decode_reqs):
+            if read_texts[i] is None:
+                continue
+            prefix_text, new_text = prefix_texts[i], read_texts[i]
+            if len(new_text) > len(prefix_text) and not new_text.endswith("\ufffd"):
+                ans[i] = new_text[len(prefix_text) :]
+                decode_req.prefix_offset = decode_req.read_offset
+                decode_req.read_offset = len(decode_req.output_ids) + decode_req.input_len
+            else:
+                # 前缀窗口没有变化，缓存前缀文本给下一次解码使用
+                decode_req.set_cached_prefix_text(prefix_text)
+        return ans
@@ -1,6 +1,7 @@
 import os
 from typing import List, Dict
 from lightllm.server.core.objs import Req
+from lightllm.utils.stop_sequence_utils import AhoCorasickMatcher, get_stop_sequence_matcher
 
 LIGHTLLM_DECODE_PREFIX_LENGTH = int(os.getenv("LIGHTLLM_DECODE_PREFIX_LENGTH", 5))
 
@@ -26,6 +27,15 @@ class DecodeReq:
         self.req = req
         self.input_len = self.req.input_len
         self.prefix_str = ""
+        # (prefix_offset, read_offset, prefix_text), 前缀窗口没有变化时可以直接使用缓存的前缀文本
+        self.cached_prefix_text = None
+        # 在解码后的文本上匹配停止字符串，可以匹配到跨越 token 边界或者与停止字符串编码方式不同的输出
+        stop_strs = req.sample_params.stop_sequences.to_str_list()
+        self.stop_str_matcher: AhoCorasickMatcher = None
+        if stop_strs:
+            self.stop_str_matcher = get_stop_sequence_matcher(tuple(stop_strs))
+        self.stop_str_matcher_state = AhoCorasickMatcher.ROOT_STATE
+        self.stop_str_matched = False
 
     def init_token_healing_prefix_str(self, token_id_to_token: Dict[int, str], tokenizer):
         tokens = [token_id_to_token[token_id] for token_id in self.req.prefix_token_ids.get_token_ids()]
@@ -52,6 +62,36 @@ class DecodeReq:
         read_tokens = self.req.shm_prompt_ids.arr[self.prefix_offset : self.input_len + len(self.output_ids)].tolist()
         return prefix_tokens, read_tokens
 
+    def get_prefix_tokens(self):
+        return self.req.shm_prompt_ids.arr[self.prefix_offset : self.read_offset].tolist()
+
+    def get_read_tokens(self):
+        return self.req.shm_prompt_ids.arr[self.prefix_offset : self.input_len + len(self.output_ids)].tolist()
+
+    def get_cached_prefix_text(self):
+        if self.cached_prefix_text is None:
+            return None
+        prefix_offset, read_offset, prefix_text = self.cached_prefix_text
+        if prefix_offset == self.prefix_offset and read_offset == self.read_offset:
+            return prefix_text
+        return None
+
+    def set_cached_prefix_text(self, prefix_text: str):
+        self.cached_prefix_text = (self.prefix_offset, self.read_offset, prefix_text)
+        return
+
+    def match_stop_str(self, new_text: str) -> str:
+        """
+        在新解码出的文本上继续匹配停止字符串，匹配到时标记 stop_str_matched, 返回截断到停止字符串结束位置的文本。
+        """
+        if self.stop_str_matcher is None or self.stop_str_matched:
+            return new_text
+        self.stop_str_matcher_state, match_index = self.stop_str_matcher.feed(self.stop_str_matcher_state, new_text)
+        if match_index != -1:
+            self.stop_str_matched = True
+            return new_text[: match_index + 1]
+        return new_text
+
     def can_set_release_mark(self):
         if self.req.is_aborted:
             return True
@@ -7,9 +7,16 @@ import zmq.asyncio
 import inspect
 from lightllm.server.core.objs import ShmReqManager
 from lightllm.server.core.objs.io_objs import GroupReqIndexes
+from lightllm.server.core.objs.shm_ready_list import (
+    ShmReadyList,
+    HttpServerIndexAllocator,
+    get_detoken_ready_list_name,
+    get_httpserver_ready_list_name,
+)
+from lightllm.utils.envs_utils import get_unique_server_name
 from lightllm.utils.graceful_utils import graceful_registry
-from typing import Union, Dict, List
-from .decode import decode_token
+from typing import Union, Dict, List, Tuple
+from .decode import BatchDecoder
 from .decode_mode_fix import decode_mode_fix
 from .decode_req import DecodeReq
 from ..tokenizer import get_tokenizer
@@ -41,51 +48,83 @@ class DeTokenizationManager:
         logger.info(f"pub_to_httpserver sendhwm {self.pub_to_httpserver.getsockopt(zmq.SNDHWM)}")
         self.tokenizer = get_tokenizer(model_weightdir, tokenizor_mode, trust_remote_code=trust_remote_code)
         self.all_special_ids = set(self.tokenizer.all_special_ids)
+        self.batch_decoder = BatchDecoder(self.tokenizer)
         self.req_id_to_out: Dict[int, DecodeReq] = {}
+        self.shm_index_to_out: Dict[int, DecodeReq] = {}
+        # 因为输出队列满了而没有处理完的请求，每次处理就绪请求的时候都会重试
+        self.blocked_req_ids = set()
         self.eos_id = eos_id
         self._init_get_token_id_to_token_str()
         self.is_pd_decode_mode = self.args.run_mode == "decode"
         self.shm_req_manager = ShmReqManager()
+        self.ready_list = ShmReadyList(get_detoken_ready_list_name(get_unique_server_name()), args.running_max_req_size)
+        # 每个 httpserver 进程一个就绪列表，请求的输出只通知其所属的进程
+        self.httpserver_ready_lists = [
+            ShmReadyList(get_httpserver_ready_list_name(get_unique_server_name(), i), args.running_max_req_size)
+            for i in range(args.httpserver_workers)
+        ]
+        HttpServerIndexAllocator(get_unique_server_name(), args.httpserver_workers).reset()
 
     def _init_get_token_id_to_token_str(self):
         self.token_id_to_token = {token_id: token for token, token_id in self.tokenizer.get_vocab().items()}
         return
 
+    def _add_group_req(self, recv_obj: GroupReqIndexes):
+        for req_index in recv_obj.shm_req_indexes:
+            req = self.shm_req_manager.get_req_obj_by_index(req_index)
+            req.link_prompt_ids_shm_array()
+            req.link_logprobs_shm_array()
+
+            logger.info(f"detokenization recv req id {req.request_id} cost time {time.time() - recv_obj.time_mark} s")
+
+            # p d 分离模式，decode节点的解码需要做一些特殊的修复。
+            decode_req = DecodeReq(req, self.is_pd_decode_mode)
+            if self.is_pd_decode_mode:
+                decode_req = decode_mode_fix(decode_req, self.tokenizer, self.eos_id)
+            # token_healing mode 的特殊初始化
+            if self.args.token_healing_mode:
+                decode_req.init_token_healing_prefix_str(self.token_id_to_token, self.tokenizer)
+
+            self.req_id_to_out[req.request_id] = decode_req
+            self.shm_index_to_out[req.index_in_shm_mem] = decode_req
+        return
+
+    async def _recv_from_router(self):
+        """
+        接收 router 发送过来的新请求和唤醒消息。没有就绪的请求时阻塞等待，否则只接收已经到达的消息，
+        保证在处理就绪请求之前，对应的新请求已经被注册。
+        """
+        self.ready_list.set_waiting()
+        block = not self.ready_list.has_ready()
+        if not block:
+            self.ready_list.clear_waiting()
+
+        while True:
+            try:
+                recv_bytes = await self.recv_from_router.recv(flags=0 if block else zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            block = False
+            # 空的字节帧是唤醒消息
+            if len(recv_bytes) != 0:
+                recv_obj: GroupReqIndexes = pickle.loads(recv_bytes)
+                self._add_group_req(recv_obj)
+        self.ready_list.clear_waiting()
+        return
+
     async def handle_loop(self):
 
         asyncio.create_task(self.timer_to_detoken())
 
         while True:
             try:
-                recv_obj: Union[None, GroupReqIndexes] = await self.recv_from_router.recv_pyobj()
-
-                if isinstance(recv_obj, GroupReqIndexes):
-                    for req_index in recv_obj.shm_req_indexes:
-                        req = self.shm_req_manager.get_req_obj_by_index(req_index)
-                        req.link_prompt_ids_shm_array()
-                        req.link_logprobs_shm_array()
-
-                        logger.info(
-                            f"detokenization recv req id {req.request_id} "
-                            f"cost time {time.time() - recv_obj.time_mark} s"
-                        )
-
-                        # p d 分离模式，decode节点的解码需要做一些特殊的修复。
-                        decode_req = DecodeReq(req, self.is_pd_decode_mode)
-                        if self.is_pd_decode_mode:
-                            decode_req = decode_mode_fix(decode_req, self.tokenizer, self.eos_id)
-                        # token_healing mode 的特殊初始化
-                        if self.args.token_healing_mode:
-                            decode_req.init_token_healing_prefix_str(self.token_id_to_token, self.tokenizer)
-
-                        self.req_id_to_out[req.request_id] = decode_req
-
-                if recv_obj is None:
-                    start_time = time.time()
-                    self.gen_token_out()
-                    cost_time = (time.time() - start_time) * 1000
-                    if cost_time > 50:
-                        logger.info(f"detokenize batch cost time {cost_time} ms")
+                await self._recv_from_router()
+
+                start_time = time.time()
+                self.gen_token_out(self.ready_list.pop_ready_indexes())
+                cost_time = (time.time() - start_time) * 1000
+                if cost_time > 50:
+                    logger.info(f"detokenize batch cost time {cost_time} ms")
 
             except Exception as e:
                 logger.exception(f"detoken process has exception {str(e)}")
@@ -108,61 +147,116 @@ class DeTokenizationManager:
             except BaseException as e:
                 logger.exception(str(e))
 
-    def gen_token_out(self):
-        exist_need_detoken = False
-        exist_decode = False
-        for decode_req in self.req_id_to_out.values():
-            if decode_req.need_detoken() and not decode_req.out_queue_is_full():
-                new_token_id, src_index = decode_req.get_next_token_id_and_index()
-                decode_req.output_ids.append(new_token_id)
-                special = new_token_id in self.all_special_ids
-                count_output_tokens = len(decode_req.output_ids)
-
-                exist_decode = True
-                new_text = decode_token(
-                    self.tokenizer,
-                    decode_req,
-                    int(new_token_id),
-                    self.eos_id,
-                )
-
-                # 对应 token_healing 的特殊处理
-                if self.args.token_healing_mode:
-                    if new_text.startswith(decode_req.prefix_str):
-                        new_text = new_text[len(decode_req.prefix_str) :]
-                        decode_req.prefix_str = ""
-                    elif decode_req.prefix_str.startswith(new_text):
-                        decode_req.prefix_str = decode_req.prefix_str[len(new_text) :]
-                        new_text = ""
-                    else:
-                        logger.error(
-                            f"error token healing state, prefix_str {decode_req.prefix_str} new_text {new_text}"
-                        )
-                decode_req.req.out_tokens_queue.push(new_text, src_index, special, count_output_tokens)
+    def gen_token_out(self, ready_shm_indexes=None):
+        """
+        ready_shm_indexes 为 None 时处理所有的请求，否则只处理被标记为就绪的请求和之前因为输出队列满了而没有处理完的请求。
+        """
+        if ready_shm_indexes is None:
+            decode_reqs = list(self.req_id_to_out.values())
+        else:
+            decode_req_dict = {}
+            for shm_index in ready_shm_indexes.tolist():
+                decode_req = self.shm_index_to_out.get(shm_index, None)
+                if decode_req is not None:
+                    decode_req_dict[decode_req.request_id] = decode_req
+            for req_id in self.blocked_req_ids:
+                decode_req = self.req_id_to_out.get(req_id, None)
+                if decode_req is not None:
+                    decode_req_dict[req_id] = decode_req
+            decode_reqs = list(decode_req_dict.values())
+
+        # 每一轮为所有可以输出的请求各解码一个 token, 通过一次批量调用完成，直到请求没有新的 token 或者输出队列满了
+        # updated_reqs: shm index -> 所属的 httpserver 进程编号
+        updated_reqs: Dict[int, int] = {}
+        active_reqs = [e for e in decode_reqs if e.need_detoken() and not e.out_queue_is_full()]
+        while len(active_reqs) != 0:
+            self._detoken_one_round(active_reqs)
+            for decode_req in active_reqs:
+                updated_reqs[decode_req.req.index_in_shm_mem] = decode_req.req.httpserver_index
+            active_reqs = [e for e in active_reqs if e.need_detoken() and not e.out_queue_is_full()]
 
+        exist_need_detoken = False
+        self.blocked_req_ids.clear()
+        for decode_req in decode_reqs:
             if decode_req.need_detoken():
                 exist_need_detoken = True
+                self.blocked_req_ids.add(decode_req.request_id)
 
-        # 通知 httpserver 进程
-        if exist_decode:
-            self.pub_to_httpserver.send_pyobj(None, protocol=pickle.HIGHEST_PROTOCOL)
+        updated_reqs.update(self.remove_finished_reqs(decode_reqs))
 
-        self.remove_finished_reqs()
+        # 通知请求所属的 httpserver 进程
+        if len(updated_reqs) != 0:
+            httpserver_to_shm_indexes: Dict[int, List[int]] = {}
+            for shm_index, httpserver_index in updated_reqs.items():
+                httpserver_to_shm_indexes.setdefault(httpserver_index, []).append(shm_index)
+            for httpserver_index, shm_indexes in httpserver_to_shm_indexes.items():
+                self.httpserver_ready_lists[httpserver_index].mark_ready(shm_indexes)
+                self.httpserver_ready_lists[httpserver_index].notify(self.pub_to_httpserver)
 
         return exist_need_detoken
 
-    def remove_finished_reqs(self):
+    def _detoken_one_round(self, decode_reqs: List[DecodeReq]):
+        run_reqs = []
+        new_token_ids = []
+        src_indexes = []
+        for decode_req in decode_reqs:
+            new_token_id, src_index = decode_req.get_next_token_id_and_index()
+            new_token_id = int(new_token_id)
+            decode_req.output_ids.append(new_token_id)
+            # 匹配到停止字符串之后推理进程还没有结束前生成的 token 不再输出
+            if decode_req.stop_str_matched:
+                continue
+            run_reqs.append(decode_req)
+            new_token_ids.append(new_token_id)
+            src_indexes.append(src_index)
+
+        if len(run_reqs) == 0:
+            return
+        new_texts = self.batch_decoder.decode(run_reqs, new_token_ids, self.eos_id)
+
+        for decode_req, new_token_id, src_index, new_text in zip(run_reqs, new_token_ids, src_indexes, new_texts):
+            special = new_token_id in self.all_special_ids
+            count_output_tokens = len(decode_req.output_ids)
+            # 对应 token_healing 的特殊处理
+            if self.args.token_healing_mode:
+                if new_text.startswith(decode_req.prefix_str):
+                    new_text = new_text[len(decode_req.prefix_str) :]
+                    decode_req.prefix_str = ""
+                elif decode_req.prefix_str.startswith(new_text):
+                    decode_req.prefix_str = decode_req.prefix_str[len(new_text) :]
+                    new_text = ""
+                else:
+                    logger.error(f"error token healing state, prefix_str {decode_req.prefix_str} new_text {new_text}")
+            new_text = decode_req.match_stop_str(new_text)
+            if decode_req.stop_str_matched:
+                # 先写入匹配位置再放入输出队列，httpserver 读取到这个 token 时以 stop 状态结束请求，
+                # router 进程读取到 stop_str_matched 后通知推理进程结束请求。
+                decode_req.req.stop_str_token_index = src_index
+                decode_req.req.stop_str_matched = True
+            decode_req.req.out_tokens_queue.push(new_text, src_index, special, count_output_tokens)
+        return
+
+    def remove_finished_reqs(self, decode_reqs: List[DecodeReq]) -> List[Tuple[int, int]]:
+        """
+        返回释放的请求的 (shm index, 所属的 httpserver 进程编号), 设置释放标记之后 httpserver 进程可能
+        复用这个 shm 请求，所以需要在设置标记之前读取编号。
+        """
         finished_reqs: List[DecodeReq] = []
-        for decode_req in self.req_id_to_out.values():
+        for decode_req in decode_reqs:
             if decode_req.can_set_release_mark():
                 finished_reqs.append(decode_req)
 
+        released_shm_indexes = []
         for decode_req in finished_reqs:
+            shm_index = decode_req.req.index_in_shm_mem
+            released_shm_indexes.append((shm_index, decode_req.req.httpserver_index))
             decode_req.req.can_released_mark = True
             logger.info(f"detoken release req id {decode_req.req.request_id}")
             self.shm_req_manager.put_back_req_obj(decode_req.req)
             self.req_id_to_out.pop(decode_req.request_id, None)
-        return
+            if self.shm_index_to_out.get(shm_index, None) is decode_req:
+                self.shm_index_to_out.pop(shm_index)
+        return released_shm_indexes
 
 
 def start_detokenization_process(args, detokenization_port, detokenization_pub_port, pipe_writer):
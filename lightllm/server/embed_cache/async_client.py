@@ -0,0 +1,64 @@
+import rpyc
+import asyncio
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncCacheClient:
+    """
+    CacheServer 的 asyncio 客户端，rpyc 的同步调用在单独的线程中执行(rpyc 连接不是线程安全的，所以只使用一个线程),
+    不阻塞事件循环。cache 已满时申请失败，等待在 capacity_cond 上，同一个进程中释放资源时会唤醒等待者，
+    其他进程释放的资源无法通知到，所以等待有超时时间，超时后重新尝试申请。
+    """
+
+    def __init__(self, port: int, wait_timeout: float = 1.0):
+        self.conn = rpyc.connect("localhost", port)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed_cache_client")
+        self.wait_timeout = wait_timeout
+        self.capacity_cond: asyncio.Condition = None
+
+    def _get_capacity_cond(self) -> asyncio.Condition:
+        # Condition 需要在事件循环中创建
+        if self.capacity_cond is None:
+            self.capacity_cond = asyncio.Condition()
+        return self.capacity_cond
+
+    async def _call(self, func_name: str, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: getattr(self.conn.root, func_name)(*args))
+
+    async def alloc_many(self, md5sums: List[str], token_nums: List[int]) -> List[dict]:
+        """
+        返回的 dict 包含 id, token_id, token_num 和 data(数据是否已经写入共享内存)。
+        cache 中的资源暂时不足时等待重试，新的数据项数量超过 cache 容量时 CacheServer 会抛出 ValueError。
+        """
+        while True:
+            records = await self._call("alloc_many", tuple(md5sums), tuple(token_nums))
+            if records is not None:
+                return [{"id": e[0], "token_id": e[1], "token_num": e[2], "data": e[3]} for e in records]
+            cond = self._get_capacity_cond()
+            async with cond:
+                try:
+                    await asyncio.wait_for(cond.wait(), timeout=self.wait_timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release_many(self, ids: List[int]):
+        if len(ids) == 0:
+            return
+        await self._call("release_many", tuple(ids))
+        cond = self._get_capacity_cond()
+        async with cond:
+            cond.notify_all()
+        return
+
+    async def set_item_data_many(self, ids: List[int]):
+        if len(ids) == 0:
+            return
+        await self._call("set_item_data_many", tuple(ids))
+        return
+
+    async def query_embed_many(self, ids: List[int]) -> List[bool]:
+        if len(ids) == 0:
+            return []
+        return list(await self._call("query_embed_many", tuple(ids)))
@@ -1 +1,2 @@
-from . import naive_memory_cache
\ No newline at end of file
+from . import naive_memory_cache
+from . import disk_cache
@@ -0,0 +1,243 @@
+import os
+import mmap
+import hashlib
+import queue
+import threading
+import collections
+import multiprocessing.shared_memory as shm
+from typing import Dict, List, Optional
+from ..interface import CacheManagerFactory
+from .naive_memory_cache import InMemoryCache, Record
+from ..utils import create_shm, get_shm_name_embed, parse_embed_header, get_embed_buffer_size
+from lightllm.utils.log_utils import init_logger
+
+logger = init_logger(__name__)
+
+
+class DiskEmbedStore:
+    """
+    以 md5sum 为 key 的 embed 文件存储，文件内容与 embed 共享内存的格式完全相同(头部加原始数据), 读取时通过 mmap
+    映射文件后直接拷贝到共享内存中。写入在后台线程中进行(write-behind), 总大小超过上限时按照最近访问时间淘汰文件。
+    文件先写入临时文件再重命名，多个副本可以共享同一个目录，本进程索引中没有的文件在读取时会检查磁盘。
+    """
+
+    def __init__(self, root_dir: str, max_bytes: int, write_queue_size: int = 1024):
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # md5sum -> file size, 按照访问顺序排列
+        self.files = collections.OrderedDict()
+        self.total_bytes = 0
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._scan()
+
+        self.write_queue = queue.Queue(maxsize=write_queue_size)
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def _get_path(self, md5sum: str) -> str:
+        return os.path.join(self.root_dir, md5sum[0:2], md5sum + ".emb")
+
+    def _scan(self):
+        file_infos = []
+        for dir_path, _, file_names in os.walk(self.root_dir):
+            for file_name in file_names:
+                if not file_name.endswith(".emb"):
+                    continue
+                stat = os.stat(os.path.join(dir_path, file_name))
+                file_infos.append((stat.st_mtime, file_name[0 : -len(".emb")], stat.st_size))
+        for _, md5sum, size in sorted(file_infos):
+            self._add_file(md5sum, size)
+        self._evict()
+        logger.info(f"disk embed store {self.root_dir} loaded {len(self.files)} files, {self.total_bytes} bytes")
+        return
+
+    def _add_file(self, md5sum: str, size: int):
+        if md5sum in self.files:
+            self.files.move_to_end(md5sum)
+            return
+        self.files[md5sum] = size
+        self.total_bytes += size
+        return
+
+    def _remove_file(self, md5sum: str):
+        size = self.files.pop(md5sum, None)
+        if size is not None:
+            self.total_bytes -= size
+        try:
+            os.remove(self._get_path(md5sum))
+        except FileNotFoundError:
+            pass
+        return
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.files) > 0:
+            md5sum = next(iter(self.files))
+            self._remove_file(md5sum)
+        return
+
+    def load_to_shm(self, md5sum: str, shm_name: str, token_num: int) -> bool:
+        """
+        将 md5sum 对应的 embed 读取到共享内存中，不存在或者校验失败时返回 False。
+        """
+        path = self._get_path(md5sum)
+        with self.lock:
+            if md5sum not in self.files:
+                if not os.path.exists(path):
+                    return False
+                # 其他副本写入的文件
+                self._add_file(md5sum, os.path.getsize(path))
+            else:
+                self.files.move_to_end(md5sum)
+
+        try:
+            with open(path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    dtype, shape = parse_embed_header(mm)
+                    if shape[0] != token_num or len(mm) != get_embed_buffer_size(dtype, shape):
+                        raise ValueError(f"embed file {path} shape {shape} mismatch with token num {token_num}")
+                    create_shm(shm_name, mm)
+            # 更新修改时间，重启后按照最近访问时间恢复 lru 顺序
+            os.utime(path)
+            return True
+        except BaseException as e:
+            logger.warning(f"load embed file {path} failed: {str(e)}")
+            with self.lock:
+                self._remove_file(md5sum)
+            return False
+
+    def write_behind(self, md5sum: str, shm_name: str):
+        """
+        将共享内存中的 embed 异步写入磁盘，队列满时直接丢弃，不阻塞调用方。
+        """
+        with self.lock:
+            if md5sum in self.files:
+                self.files.move_to_end(md5sum)
+                return
+        try:
+            self.write_queue.put_nowait((md5sum, shm_name))
+        except queue.Full:
+            logger.debug(f"disk embed store write queue is full, drop {md5sum}")
+        return
+
+    def _write_loop(self):
+        while True:
+            md5sum, shm_name = self.write_queue.get()
+            try:
+                self._write(md5sum, shm_name)
+            except BaseException as e:
+                logger.warning(f"write embed {md5sum} to disk failed: {str(e)}")
+            finally:
+                self.write_queue.task_done()
+
+    def _write(self, md5sum: str, shm_name: str):
+        with self.lock:
+            if md5sum in self.files:
+                return
+        try:
+            shared_memory = shm.SharedMemory(name=shm_name)
+        except FileNotFoundError:
+            # 写入前记录已经被淘汰
+            return
+
+        try:
+            dtype, shape = parse_embed_header(shared_memory.buf)
+            size = get_embed_buffer_size(dtype, shape)
+            path = self._get_path(md5sum)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(shared_memory.buf[0:size])
+            os.replace(tmp_path, path)
+        finally:
+            shared_memory.close()
+
+        with self.lock:
+            self._add_file(md5sum, size)
+            self._evict()
+        return
+
+
+def get_disk_cache_namespace(args) -> str:
+    """
+    不同模型的 embed 不能混用。只使用模型目录名时，不同路径下的同名模型(如不同版本的权重)会共用同一个目录，
+    所以目录名中额外加入模型的完整路径和 config.json 内容的哈希值。
+    """
+    model_dir = os.path.abspath(os.path.normpath(args.model_dir))
+    hasher = hashlib.md5(model_dir.encode("utf-8"))
+    config_path = os.path.join(model_dir, "config.json")
+    if os.path.exists(config_path):
+        with open(config_path, "rb") as f:
+            hasher.update(f.read())
+    return f"{os.path.basename(model_dir)}_{hasher.hexdigest()[0:16]}"
+
+
+@CacheManagerFactory.register("disk")
+class DiskBackedCache(InMemoryCache):
+    """
+    在 InMemoryCache 之上增加一层磁盘上的 embed 存储，新申请的记录如果在磁盘上已经有 embed, 直接读取到共享内存中并
+    标记 embed 已经就绪，visual server 不需要再次推理。set_item_embed 时将 embed 异步写入磁盘，不阻塞调用方。
+    磁盘的读取在 cache 的锁之外进行，读取期间命中同一条记录的申请会等待读取完成后再返回，避免 visual server 在
+    读取完成前重复推理同一个 embed。
+    """
+
+    def __init__(self, args) -> None:
+        super().__init__(args)
+        assert args.embed_cache_disk_dir is not None, "disk embed cache need --embed_cache_disk_dir"
+        root_dir = os.path.join(args.embed_cache_disk_dir, get_disk_cache_namespace(args))
+        self.disk_store = DiskEmbedStore(root_dir, int(args.embed_cache_disk_max_gb * 1024 * 1024 * 1024))
+        # 正在从磁盘读取的记录 id -> 读取完成的事件
+        self.loading_events: Dict[int, threading.Event] = {}
+        # 当前持有锁的申请中新创建的记录，在锁之外从磁盘读取
+        self.pending_load_records: List[Record] = []
+
+    def _alloc_record(self, md5sum: str, token_num: int) -> Record:
+        is_new = md5sum not in self._md5_to_record
+        record = super()._alloc_record(md5sum, token_num)
+        if is_new:
+            self.loading_events[record.id] = threading.Event()
+            self.pending_load_records.append(record)
+        return record
+
+    def alloc(self, md5sum: str, token_num: int) -> dict:
+        records = self.alloc_many([md5sum], [token_num])
+        if records is None:
+            return None
+        records[0].pop("data")
+        return records[0]
+
+    def alloc_many(self, md5sums: List[str], token_nums: List[int]) -> Optional[List[dict]]:
+        with self.lock:
+            try:
+                records = self._alloc_records(md5sums, token_nums)
+            finally:
+                load_records, self.pending_load_records = self.pending_load_records, []
+            if records is None:
+                return None
+            load_ids = set(record.id for record in load_records)
+            wait_events = [
+                self.loading_events[record.id]
+                for record in records
+                if record.id in self.loading_events and record.id not in load_ids
+            ]
+
+        for record in load_records:
+            is_loaded = self.disk_store.load_to_shm(record.md5sum, get_shm_name_embed(record.id), record.token_num)
+            with self.lock:
+                if is_loaded:
+                    record.embed = True
+                self.loading_events.pop(record.id).set()
+        for event in wait_events:
+            event.wait()
+
+        return [
+            {"id": record.id, "token_id": record.token_id, "token_num": record.token_num, "data": record.data}
+            for record in records
+        ]
+
+    def set_item_embed(self, id: int) -> None:
+        super().set_item_embed(id)
+        record: Optional[Record] = self._records.get(id)
+        if record is not None:
+            self.disk_store.write_behind(record.md5sum, get_shm_name_embed(id))
+        return
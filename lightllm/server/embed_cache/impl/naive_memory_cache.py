@@ -3,7 +3,7 @@ import threading
 import dataclasses
 import requests
 from ..interface import CacheManager, CacheManagerFactory
-from typing import Union
+from typing import Union, List, Optional
 import torch
 import time
 from collections import deque
@@ -89,49 +89,82 @@ class InMemoryCache(CacheManager):
                 if deleted >= max_delete:
                     break
 
+    def _alloc_record(self, md5sum: str, token_num: int) -> Record:
+        t = time.time()
+        # add new record
+        if md5sum not in self._md5_to_record:
+            id = uuid.uuid1()
+            id = id.int
+            self._check_and_set_new_id_range(token_num)
+            record = Record(
+                id=id,
+                md5sum=md5sum,
+                ref=1,
+                data=False,
+                embed=False,
+                createtime=t,
+                visittime=t,
+                token_id=self.token_id_range_start,
+                token_num=token_num,
+            )
+            self.token_id_range_start += token_num
+            self._records[id] = record
+            self._md5_to_record[md5sum] = record
+            self.occupied += 1
+
+        # cache hit
+        else:
+            record = self._md5_to_record[md5sum]
+            record.visittime = t
+            record.ref += 1
+        return record
+
     def alloc(self, md5sum: str, token_num: int) -> dict:
         with self.lock:
-            t = time.time()
-            # add new record
             if md5sum not in self._md5_to_record:
-
                 # full, need to clear some unused items
                 if self.occupied >= self.capacity:
                     self._clear()
                     if self.occupied >= self.capacity:
                         return None
 
-                id = uuid.uuid1()
-                id = id.int
-                self._check_and_set_new_id_range(token_num)
-                record = Record(
-                    id=id,
-                    md5sum=md5sum,
-                    ref=1,
-                    data=False,
-                    embed=False,
-                    createtime=t,
-                    visittime=t,
-                    token_id=self.token_id_range_start,
-                    token_num=token_num,
-                )
-                self.token_id_range_start += token_num
-                self._records[id] = record
-                self._md5_to_record[md5sum] = record
-                self.occupied += 1
-
-            # cache hit
-            else:
-                record = self._md5_to_record[md5sum]
-                record.visittime = t
-                record.ref += 1
-
+            record = self._alloc_record(md5sum, token_num)
             return {"id": record.id, "token_id": record.token_id, "token_num": record.token_num}
 
+    def _alloc_records(self, md5sums: List[str], token_nums: List[int]) -> Optional[List[Record]]:
+        # 调用者需要持有 self.lock, 要么全部申请成功，要么返回 None
+        new_num = len(set(md5sum for md5sum in md5sums if md5sum not in self._md5_to_record))
+        if new_num > self.capacity:
+            # 即使淘汰掉所有的记录也无法满足，返回 None 会使客户端一直等待
+            raise ValueError(f"too many new multimodal items {new_num} > cache capacity {self.capacity}")
+        while self.occupied + new_num > self.capacity:
+            last_occupied = self.occupied
+            self._clear()
+            if self.occupied == last_occupied:
+                return None
+            # 清理可能会移除本批次中命中的记录，需要重新计算
+            new_num = len(set(md5sum for md5sum in md5sums if md5sum not in self._md5_to_record))
+        return [self._alloc_record(md5sum, token_num) for md5sum, token_num in zip(md5sums, token_nums)]
+
+    def alloc_many(self, md5sums: List[str], token_nums: List[int]) -> Optional[List[dict]]:
+        with self.lock:
+            records = self._alloc_records(md5sums, token_nums)
+            if records is None:
+                return None
+            return [
+                {"id": record.id, "token_id": record.token_id, "token_num": record.token_num, "data": record.data}
+                for record in records
+            ]
+
     def release(self, id: int) -> None:
         with self.lock:
             self._records[id].ref -= 1
 
+    def release_many(self, ids: List[int]) -> None:
+        with self.lock:
+            for id in ids:
+                self._records[id].ref -= 1
+
     def set_item_data(self, id: int) -> None:
         self._records[id].data = True
 
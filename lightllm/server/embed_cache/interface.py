@@ -1,4 +1,4 @@
-from typing import Union
+from typing import Union, List, Optional
 
 class CacheManager(object):
     ''' Defines the interface of embedding cache manager.
@@ -24,6 +24,34 @@ class CacheManager(object):
     def get_item_embed(self, id: int) -> bool:
         pass
 
+    def alloc_many(self, md5sums: List[str], token_nums: List[int]) -> Optional[List[dict]]:
+        ''' 批量申请，要么全部申请成功，要么返回 None, 返回的 dict 中额外包含 data 字段表示数据是否已经写入。
+        返回 None 时客户端会等待资源释放后重试，所以永远无法满足的申请需要抛出异常。
+        '''
+        records = []
+        for md5sum, token_num in zip(md5sums, token_nums):
+            record = self.alloc(md5sum, token_num)
+            if record is None:
+                self.release_many([e["id"] for e in records])
+                return None
+            records.append(dict(record, data=self.get_item_data(record["id"])))
+        return records
+
+    def release_many(self, ids: List[int]) -> None:
+        for id in ids:
+            self.release(id)
+
+    def set_item_data_many(self, ids: List[int]) -> None:
+        for id in ids:
+            self.set_item_data(id)
+
+    def set_item_embed_many(self, ids: List[int]) -> None:
+        for id in ids:
+            self.set_item_embed(id)
+
+    def query_embed_many(self, ids: List[int]) -> List[bool]:
+        return [self.get_item_embed(id) for id in ids]
+
 
 class CacheManagerFactory(object):
     _impls = dict()
@@ -1,7 +1,7 @@
 import rpyc
 import uuid
 import inspect
-from typing import Union
+from typing import Union, Optional, Tuple
 from lightllm.utils.graceful_utils import graceful_registry
 from .interface import CacheManager
 from rpyc.utils.classic import obtain
@@ -48,6 +48,32 @@ class CacheServer(rpyc.Service):
         id = obtain(id)
         return self._impl.get_item_embed(id=id)
 
+    # 批量接口的参数和返回值都使用 tuple, rpyc 会按值传输，一次往返就可以完成所有的操作，
+    # 不需要再通过 netref 逐个访问。
+    def exposed_alloc_many(self, md5sums: Tuple[str], token_nums: Tuple[int]) -> Optional[Tuple[Tuple]]:
+        md5sums = obtain(md5sums)
+        token_nums = obtain(token_nums)
+        records = self._impl.alloc_many(list(md5sums), list(token_nums))
+        if records is None:
+            return None
+        return tuple((e["id"], e["token_id"], e["token_num"], e["data"]) for e in records)
+
+    def exposed_release_many(self, ids: Tuple[int]) -> None:
+        ids = obtain(ids)
+        return self._impl.release_many(list(ids))
+
+    def exposed_set_item_data_many(self, ids: Tuple[int]) -> None:
+        ids = obtain(ids)
+        return self._impl.set_item_data_many(list(ids))
+
+    def exposed_set_item_embed_many(self, ids: Tuple[int]) -> None:
+        ids = obtain(ids)
+        return self._impl.set_item_embed_many(list(ids))
+
+    def exposed_query_embed_many(self, ids: Tuple[int]) -> Tuple[bool]:
+        ids = obtain(ids)
+        return tuple(self._impl.query_embed_many(list(ids)))
+
 
 def start_cache_manager(port: int, args, pipe_writer):
     # 注册graceful 退出的处理
@@ -55,7 +81,7 @@ def start_cache_manager(port: int, args, pipe_writer):
 
     from .interface import CacheManagerFactory
 
-    manager_cls = CacheManagerFactory.get_impl("naive")
+    manager_cls = CacheManagerFactory.get_impl(args.embed_cache_impl)
     manager = manager_cls(args)
     service = CacheServer(manager)
     from rpyc.utils.server import ThreadedServer
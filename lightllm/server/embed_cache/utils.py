@@ -1,6 +1,8 @@
 import torch
+import struct
 import numpy as np
 from io import BytesIO
+from typing import List, Tuple
 import multiprocessing.shared_memory as shm
 
 
@@ -18,6 +20,97 @@ def bytes2tensor(b):
     return torch.load(BytesIO(b))
 
 
+# embed 共享内存的布局: 64 字节的头部(magic, dtype 编号, 维度数, 最多 6 维的 shape), 之后是连续的原始数据,
+# 生产者直接把 tensor 的数据拷贝进共享内存，消费者通过 torch.frombuffer 映射成 tensor, 不需要序列化和反序列化。
+EMBED_MAGIC = b"LLMEMB01"
+EMBED_HEADER_FORMAT = "<8sii6q"
+EMBED_HEADER_SIZE = 64
+EMBED_MAX_NDIM = 6
+EMBED_DTYPES = [torch.float16, torch.bfloat16, torch.float32, torch.float64, torch.int64, torch.int32, torch.uint8]
+
+assert struct.calcsize(EMBED_HEADER_FORMAT) == EMBED_HEADER_SIZE
+
+
+class PinnedStagingBuffer:
+    """
+    可复用的 pinned memory 中转缓冲区，gpu 上的 embed 通过一次 DMA 拷贝到这里，再写入共享内存，
+    避免每次都经过驱动内部的 pageable 内存中转。
+    """
+
+    def __init__(self):
+        self.buffer: torch.Tensor = None
+
+    def to_cpu(self, tensor: torch.Tensor) -> torch.Tensor:
+        """
+        返回的 tensor 是缓冲区的视图，下一次调用 to_cpu 之前有效。
+        """
+        if not tensor.is_cuda:
+            return tensor.contiguous()
+        nbytes = tensor.numel() * tensor.element_size()
+        if self.buffer is None or self.buffer.numel() < nbytes:
+            self.buffer = torch.empty(nbytes, dtype=torch.uint8, pin_memory=True)
+        cpu_tensor = self.buffer[0:nbytes].view(tensor.dtype).view(tensor.shape)
+        cpu_tensor.copy_(tensor, non_blocking=True)
+        torch.cuda.current_stream(tensor.device).synchronize()
+        return cpu_tensor
+
+
+def create_embed_shm(name, tensor: torch.Tensor):
+    assert tensor.dim() <= EMBED_MAX_NDIM, f"embed ndim {tensor.dim()} > {EMBED_MAX_NDIM}"
+    tensor = tensor.detach().cpu().contiguous()
+    nbytes = tensor.numel() * tensor.element_size()
+    try:
+        shared_memory = shm.SharedMemory(name=name, create=True, size=EMBED_HEADER_SIZE + max(nbytes, 1))
+    except FileExistsError:
+        print("Warning create shm {} failed because of FileExistsError!".format(name))
+        return
+
+    shape = list(tensor.shape) + [0] * (EMBED_MAX_NDIM - tensor.dim())
+    struct.pack_into(
+        EMBED_HEADER_FORMAT, shared_memory.buf, 0, EMBED_MAGIC, EMBED_DTYPES.index(tensor.dtype), tensor.dim(), *shape
+    )
+    if nbytes > 0:
+        dst = torch.frombuffer(shared_memory.buf, dtype=torch.uint8, count=nbytes, offset=EMBED_HEADER_SIZE)
+        dst.copy_(tensor.view(-1).view(torch.uint8))
+        del dst
+    shared_memory.close()
+    return
+
+
+def parse_embed_header(buf) -> Tuple[torch.dtype, List[int]]:
+    magic, dtype_index, ndim, *shape = struct.unpack_from(EMBED_HEADER_FORMAT, buf, 0)
+    assert magic == EMBED_MAGIC, "not an embed buffer"
+    return EMBED_DTYPES[dtype_index], shape[0:ndim]
+
+
+def get_embed_buffer_size(dtype: torch.dtype, shape: List[int]) -> int:
+    return EMBED_HEADER_SIZE + int(np.prod(shape)) * torch.empty((), dtype=dtype).element_size()
+
+
+def _map_embed_tensor(shared_memory: shm.SharedMemory) -> torch.Tensor:
+    dtype, shape = parse_embed_header(shared_memory.buf)
+    numel = int(np.prod(shape))
+    if numel == 0:
+        return torch.empty(shape, dtype=dtype)
+    return torch.frombuffer(shared_memory.buf, dtype=dtype, count=numel, offset=EMBED_HEADER_SIZE).view(shape)
+
+
+def read_embed_shm(name, device="cuda") -> torch.Tensor:
+    """
+    通过 torch.frombuffer 将共享内存映射为 tensor, 不经过反序列化，只发生一次拷贝到 device 上。
+    """
+    shared_memory = shm.SharedMemory(name=name)
+    mapped_tensor = _map_embed_tensor(shared_memory)
+    if torch.device(device).type == "cpu":
+        ans = mapped_tensor.clone()
+    else:
+        ans = mapped_tensor.to(device)
+    # 释放对共享内存的引用后才能关闭
+    del mapped_tensor
+    shared_memory.close()
+    return ans
+
+
 def create_shm(name, data):
     try:
         data_size = len(data)
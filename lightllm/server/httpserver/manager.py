@@ -3,13 +3,10 @@ import zmq
 import zmq.asyncio
 import asyncio
 import uvloop
-import rpyc
 import time
 import copy
-import hashlib
 import datetime
 import pickle
-from frozendict import frozendict
 
 asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 from typing import Union, List, Tuple, Dict, Optional
@@ -17,19 +14,29 @@ from fastapi import Request
 from ..tokenizer import get_tokenizer
 from ..pd_io_struct import NodeRole
 from ..embed_cache.utils import get_shm_name_data, create_shm
+from ..embed_cache.async_client import AsyncCacheClient
 from ..multimodal_params import AudioItem, MultimodalParams, ImageItem
 from ..req_id_generator import ReqIDGenerator
 from .async_queue import AsyncQueue
+from .tokenize_pool import init_tokenize_pool, get_tokenize_pool
+from .prompt_token_cache import PromptTokenCache, encode_with_offsets
 from lightllm.server.core.objs import Req, FinishStatus
 from lightllm.server.core.objs import SamplingParams
+from lightllm.server.core.objs.sampling_params import parse_priority
 from lightllm.server.core.objs.io_objs import GroupReqObjs
 from lightllm.server.core.objs.shm_req_manager import ShmReqManager
+from lightllm.server.core.objs.shm_ready_list import (
+    ShmReadyList,
+    HttpServerIndexAllocator,
+    get_httpserver_ready_list_name,
+)
 from lightllm.server.router.dynamic_prompt.shared_arr import SharedInt
 from lightllm.utils.log_utils import init_logger
 from lightllm.server.metrics.manager import MetricClient
 from lightllm.utils.statics_utils import MovingAverage
 from lightllm.utils.config_utils import get_vocab_size
 from lightllm.utils.envs_utils import get_unique_server_name
+from lightllm.utils.multimodal_utils import compute_md5, run_in_multimodal_executor
 
 logger = init_logger(__name__)
 
@@ -79,7 +86,7 @@ class HttpServerManager:
 
         self.enable_multimodal = enable_multimodal
         if self.enable_multimodal:
-            self.cache_client = rpyc.connect("localhost", cache_port)
+            self.cache_client = AsyncCacheClient(cache_port)
             self.send_to_visual = context.socket(zmq.PUSH)
             self.send_to_visual.connect(f"{args.zmq_mode}127.0.0.1:{visual_port}")
 
@@ -88,10 +95,27 @@ class HttpServerManager:
         self.recv_from_detokenization = context.socket(zmq.SUB)
         self.recv_from_detokenization.connect(f"{args.zmq_mode}127.0.0.1:{detokenization_pub_port}")
         self.recv_from_detokenization.setsockopt(zmq.SUBSCRIBE, b"")
+        # detokenization 进程通过共享内存标记有新输出的请求，开启多个 httpserver 进程时每个进程使用自己编号的就绪列表
+        self.httpserver_index = HttpServerIndexAllocator(get_unique_server_name(), args.httpserver_workers).alloc()
+        self.ready_list = ShmReadyList(
+            get_httpserver_ready_list_name(get_unique_server_name(), self.httpserver_index), args.running_max_req_size
+        )
 
         self.tokenizer = get_tokenizer(args.model_dir, args.tokenizer_mode, trust_remote_code=args.trust_remote_code)
+        # 纯文本 prompt 的 tokenize 在子进程中进行，不阻塞事件循环
+        init_tokenize_pool(args)
+        self.tokenize_pool = get_tokenize_pool()
+        # 多轮对话的 prompt 只需要 tokenize 新追加的部分，依赖 fast tokenizer 返回的字符偏移
+        self.prompt_token_cache = None
+        if args.get("prompt_token_cache_size", 0) > 0:
+            if getattr(self.tokenizer, "is_fast", False):
+                self.prompt_token_cache = PromptTokenCache(args.prompt_token_cache_size)
+            else:
+                logger.warning("prompt token cache is disabled, it needs a fast tokenizer")
 
         self.req_id_to_out_inf: Dict[int, ReqStatus] = {}  # value type (out_str, metadata, finished, event)
+        self.shm_index_to_out_inf: Dict[int, ReqStatus] = {}
+        self.may_release_group_req_ids = set()
         self.forwarding_queue: AsyncQueue = None  # p d 分离模式使用的转发队列, 需要延迟初始化
 
         self.max_req_total_len = args.max_req_total_len
@@ -112,32 +136,39 @@ class HttpServerManager:
         return
 
     # connect cache server, calculate md5, alloc resource, return uuid
-    async def _alloc_resource(self, item: Union[ImageItem, AudioItem]):
-        if isinstance(item, ImageItem):
-            data = item.read()
-            # must after init_imageitem_extral_params
-            num_tokens = self.tokenizer.get_image_token_length(item)
-        elif isinstance(item, AudioItem):
-            data = item.read()
-            num_tokens = self.tokenizer.get_audio_token_length(item)
-        else:
-            raise ValueError(f"unexpected item type {type(item)}")
-
-        md5sum = hashlib.md5(data).hexdigest() + "_" + str(hash(frozendict(item.extra_params)))
-        wait_time = 1
-        while True:
-            record = self.cache_client.root.alloc(md5sum, num_tokens)
-            # hit or new
-            if record:
-                uid = record["id"]
-                if not self.cache_client.root.get_item_data(uid):
-                    create_shm(get_shm_name_data(uid), data)
-                    self.cache_client.root.set_item_data(uid)
-                return record
-            # cache full
+    async def _alloc_resources(self, items: List[Union[ImageItem, AudioItem]]):
+        md5sums = []
+        token_nums = []
+        datas = []
+        for item in items:
+            if isinstance(item, ImageItem):
+                data = item.read()
+                # must after init_imageitem_extral_params
+                num_tokens = self.tokenizer.get_image_token_length(item)
+            elif isinstance(item, AudioItem):
+                data = item.read()
+                num_tokens = self.tokenizer.get_audio_token_length(item)
             else:
-                await asyncio.sleep(wait_time)
-                wait_time = min(wait_time + 2, 9)
+                raise ValueError(f"unexpected item type {type(item)}")
+
+            # md5 一般已经在 preload 阶段于线程池中计算好了
+            data_md5 = item.md5 if item.md5 is not None else await run_in_multimodal_executor(compute_md5, data)
+            # extra_params 使用稳定的哈希，使磁盘上的 embed 缓存在重启和多个副本之间可以复用
+            extra_params_md5 = compute_md5(str(sorted(item.extra_params.items())).encode("utf-8"))
+            md5sums.append(data_md5 + "_" + extra_params_md5)
+            token_nums.append(num_tokens)
+            datas.append(data)
+
+        # 一次往返申请所有的资源，cache 满时在客户端中等待资源释放
+        records = await self.cache_client.alloc_many(md5sums, token_nums)
+        need_set_data_ids = []
+        for record, data in zip(records, datas):
+            uid = record["id"]
+            if not record["data"] and uid not in need_set_data_ids:
+                create_shm(get_shm_name_data(uid), data)
+                need_set_data_ids.append(uid)
+        await self.cache_client.set_item_data_many(need_set_data_ids)
+        return records
 
     async def _alloc_multimodal_resources(self, multimodal_params: MultimodalParams, sampling_params: SamplingParams):
         # 只有 P 和 NORMAL 节点需要真的管理多模态资源
@@ -148,36 +179,32 @@ class HttpServerManager:
             async with self._resource_lock:
                 for img in multimodal_params.images:
                     self.tokenizer.init_imageitem_extral_params(img, multimodal_params, sampling_params)
-                    record = await self._alloc_resource(img)
-                    img.uuid = record["id"]
-                    img.token_id = record["token_id"]
-                    img.token_num = record["token_num"]
                 for audio in multimodal_params.audios:
                     self.tokenizer.init_audioitem_extral_params(audio, multimodal_params, sampling_params)
-                    record = await self._alloc_resource(audio)
-                    audio.uuid = record["id"]
-                    audio.token_id = record["token_id"]
-                    audio.token_num = record["token_num"]
+                items = multimodal_params.images + multimodal_params.audios
+                if len(items) == 0:
+                    return
+                records = await self._alloc_resources(items)
+                for item, record in zip(items, records):
+                    item.uuid = record["id"]
+                    item.token_id = record["token_id"]
+                    item.token_num = record["token_num"]
             return
 
     async def _release_multimodal_resources(self, multimodal_params: MultimodalParams):
         # 只有 P 和 NORMAL 节点需要真的管理多模态资源
         if self.pd_mode.is_P_or_NORMAL():
             if multimodal_params is not None:
-                for img in multimodal_params.images:
-                    if img.uuid is not None:
-                        self.cache_client.root.release(img.uuid)
+                release_ids = []
+                for item in multimodal_params.images + multimodal_params.audios:
+                    if item.uuid is not None:
+                        release_ids.append(item.uuid)
                         # 将 uuid 等 赋值为 None, 防止因为abort等异常情况造成重复释放异常
-                        img.uuid = None
-                        img.token_id = None
-                        img.token_num = None
-                for audio in multimodal_params.audios:
-                    if audio.uuid is not None:
-                        self.cache_client.root.release(audio.uuid)
-                        # 将 uuid 等 赋值为 None, 防止因为abort等异常情况造成重复释放异常
-                        audio.uuid = None
-                        audio.token_id = None
-                        audio.token_num = None
+                        item.uuid = None
+                        item.token_id = None
+                        item.token_num = None
+                if len(release_ids) > 0:
+                    await self.cache_client.release_many(release_ids)
         return
 
     def tokens(self, prompt, multimodal_params, samping_params: SamplingParams, kwargs=None):
@@ -255,6 +282,10 @@ class HttpServerManager:
         group_request_id = self.alloc_req_id(sampling_params, is_health_req)
 
         try:
+            if "X-Request-Priority" in request_headers:
+                # 请求头中的优先级覆盖请求参数中的 priority
+                sampling_params.priority = parse_priority(request_headers["X-Request-Priority"])
+
             original_multimodal_params = None
             if self.is_multinode_tp_master:
                 original_multimodal_params = copy.deepcopy(multimodal_params)
@@ -293,10 +324,13 @@ class HttpServerManager:
                     self.tokenizer,
                     chunked_prefill_size=self.args.chunked_prefill_size,
                 )
+                req_obj.httpserver_index = self.httpserver_index
                 req_objs.append(req_obj)
 
             req_status = ReqStatus(group_request_id, multimodal_params, req_objs, start_time)
             self.req_id_to_out_inf[group_request_id] = req_status
+            for req_obj in req_objs:
+                self.shm_index_to_out_inf[req_obj.index_in_shm_mem] = req_status
 
             await self.transfer_to_next_module_or_node(
                 prompt, sampling_params, original_multimodal_params, req_status.group_req_objs
@@ -352,6 +386,10 @@ class HttpServerManager:
                 prompt_ids = self.tokenizer.encode(
                     prompt, multimodal_params, add_special_tokens=sampling_params.add_special_tokens
                 )
+            elif self.prompt_token_cache is not None:
+                prompt_ids = await self._encode_with_prompt_token_cache(prompt, sampling_params.add_special_tokens)
+            elif self.tokenize_pool is not None:
+                prompt_ids = await self.tokenize_pool.encode(prompt, sampling_params.add_special_tokens)
             else:
                 prompt_ids = self.tokenizer.encode(prompt, add_special_tokens=sampling_params.add_special_tokens)
             return prompt_ids
@@ -369,6 +407,19 @@ class HttpServerManager:
             raise ValueError(f"prompt format error, get type{type(prompt)}")
         return
 
+    async def _encode_with_offsets(self, prompt: str, add_special_tokens: bool):
+        if self.tokenize_pool is not None:
+            return await self.tokenize_pool.encode(prompt, add_special_tokens, return_offsets=True)
+        return encode_with_offsets(self.tokenizer, prompt, add_special_tokens)
+
+    async def _encode_with_prompt_token_cache(self, prompt: str, add_special_tokens: bool):
+        prompt_ids, is_hit = await self.prompt_token_cache.encode(prompt, add_special_tokens, self._encode_with_offsets)
+        if is_hit:
+            self.metric_client.counter_inc("lightllm_prompt_token_cache_hit")
+        else:
+            self.metric_client.counter_inc("lightllm_prompt_token_cache_miss")
+        return prompt_ids
+
     async def _check_and_repair_length(self, prompt_ids: List[int], sampling_params: SamplingParams):
         if not prompt_ids:
             raise ValueError("prompt_ids is empty")
@@ -588,6 +639,7 @@ class HttpServerManager:
 
     async def recycle_resource_loop(self):
         pre_time_mark = time.time()
+        pre_full_scan_time_mark = time.time()
 
         while True:
 
@@ -597,14 +649,29 @@ class HttpServerManager:
                 pass
             self.recycle_event.clear()
 
-            # 清理已经处理完的可以删除的请求
+            # 清理已经处理完的可以删除的请求，正常情况下只检查有状态更新的请求，定期对所有的请求进行一次检查兜底
+            if time.time() - pre_full_scan_time_mark > 1:
+                pre_full_scan_time_mark = time.time()
+                check_req_status_list = list(self.req_id_to_out_inf.values())
+            else:
+                check_req_status_list = [
+                    self.req_id_to_out_inf[group_req_id]
+                    for group_req_id in self.may_release_group_req_ids
+                    if group_req_id in self.req_id_to_out_inf
+                ]
+            self.may_release_group_req_ids.clear()
+
             release_req_status: List[ReqStatus] = []
-            for req_status in self.req_id_to_out_inf.values():
+            for req_status in check_req_status_list:
                 if req_status.can_release():
                     release_req_status.append(req_status)
+                elif any(req.can_released_mark for req in req_status.group_req_objs.shm_req_objs):
+                    # detokenization 已经处理完，但是其他进程还没有释放引用，下一轮继续检查
+                    self.may_release_group_req_ids.add(req_status.group_req_objs.group_req_id)
             for req_status in release_req_status:
                 self.req_id_to_out_inf.pop(req_status.group_req_objs.group_req_id, None)
                 for req in req_status.group_req_objs.shm_req_objs:
+                    self.shm_index_to_out_inf.pop(req.index_in_shm_mem, None)
                     await self.shm_req_manager.async_put_back_req_obj(req)
                     await self.shm_req_manager.async_release_req_index(req.index_in_shm_mem)
                 await self._release_multimodal_resources(req_status.group_req_objs.multimodal_params)
@@ -620,6 +687,17 @@ class HttpServerManager:
                     )
         return
 
+    async def _wait_for_ready_reqs(self):
+        # 没有就绪的请求时等待 detokenization 进程的唤醒消息
+        self.ready_list.set_waiting()
+        if not self.ready_list.has_ready():
+            try:
+                await asyncio.wait_for(self.recv_from_detokenization.recv(), timeout=0.05)
+            except asyncio.TimeoutError:
+                pass
+        self.ready_list.clear_waiting()
+        return
+
     async def handle_loop(self):
         self.recycle_event = asyncio.Event()
         asyncio.create_task(self.recycle_resource_loop())
@@ -635,16 +713,20 @@ class HttpServerManager:
             asyncio.create_task(pd_handle_loop(self))
 
         while True:
-            try:
-                await asyncio.wait_for(self.recv_from_detokenization.recv_pyobj(), timeout=0.05)
-            except asyncio.TimeoutError:
-                pass
+            await self._wait_for_ready_reqs()
+
+            # 只处理被 detokenization 进程标记为有新输出的请求
+            ready_req_status_dict: Dict[int, ReqStatus] = {}
+            for shm_index in self.ready_list.pop_ready_indexes().tolist():
+                req_status = self.shm_index_to_out_inf.get(shm_index, None)
+                if req_status is not None:
+                    ready_req_status_dict[req_status.group_req_objs.group_req_id] = req_status
 
-            for req_status in self.req_id_to_out_inf.values():
+            for group_req_id, req_status in ready_req_status_dict.items():
                 token_list = []
                 for req in req_status.group_req_objs.shm_req_objs:
                     req_id = req.request_id
-                    if not req.out_tokens_queue.is_empty():
+                    while not req.out_tokens_queue.is_empty():
 
                         text, src_index, special, count_output_tokens = req.out_tokens_queue.peek()
                         req.cumlogprob += float(req.shm_logprobs.arr[src_index])
@@ -664,7 +746,10 @@ class HttpServerManager:
 
                         req.out_tokens_queue.pop_no_ret()
 
-                        if req.finish_token_index != src_index:
+                        if req.stop_str_token_index == src_index:
+                            # detokenization 进程在这个 token 上匹配到了停止字符串，之后不会再有输出
+                            token_list.append((req_id, text, metadata, FinishStatus(FinishStatus.FINISHED_STOP)))
+                        elif req.finish_token_index != src_index:
                             token_list.append((req_id, text, metadata, FinishStatus()))
                         else:
                             finish_status = FinishStatus(req.finish_status.status)
@@ -673,6 +758,7 @@ class HttpServerManager:
                 async with req_status.lock:
                     req_status.out_token_info_list.extend(token_list)
                     req_status.event.set()
+                self.may_release_group_req_ids.add(group_req_id)
 
             self.recycle_event.set()
         return
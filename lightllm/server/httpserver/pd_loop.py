@@ -5,17 +5,23 @@ import ujson as json
 import socket
 import httpx
 import base64
+import numpy as np
 from typing import Dict, Optional
 from lightllm.server.pd_io_struct import NodeRole, ObjType
 from lightllm.server.httpserver.async_queue import AsyncQueue
 from lightllm.utils.net_utils import get_hostname_ip
 from lightllm.utils.log_utils import init_logger
-from lightllm.utils.envs_utils import get_lightllm_websocket_max_message_size
+from lightllm.utils.envs_utils import get_lightllm_websocket_max_message_size, get_unique_server_name
+from lightllm.server.router.token_load import TokenLoad
+from lightllm.server.router.dynamic_prompt.prefix_summary import PrefixSummaryReadOnlyClient
 from lightllm.server.httpserver.manager import HttpServerManager
 from ..pd_io_struct import PD_Master_Obj
 
 logger = init_logger(__name__)
 
+# 前缀摘要的上报间隔，单位秒
+PREFIX_SUMMARY_UP_INTERVAL = 2
+
 
 async def timer_log(manager: HttpServerManager):
     while True:
@@ -69,6 +75,7 @@ async def _pd_handle_task(manager: HttpServerManager, pd_master_obj: PD_Master_O
 
     while True:
         forwarding_tokens_task = None
+        up_prefix_summary_task = None
         try:
             uri = f"ws://{pd_master_obj.host_ip_port}/pd_register"
             async with websockets.connect(
@@ -93,6 +100,8 @@ async def _pd_handle_task(manager: HttpServerManager, pd_master_obj: PD_Master_O
 
                 # 转发任务
                 forwarding_tokens_task = asyncio.create_task(_up_tokens_to_pd_master(forwarding_queue, websocket))
+                if manager.args.prefix_affinity_route:
+                    up_prefix_summary_task = asyncio.create_task(_up_prefix_summary_to_pd_master(manager, websocket))
 
                 # 接收 pd master 发来的请求，并推理后，将生成的token转发回pd master。
                 while True:
@@ -114,6 +123,8 @@ async def _pd_handle_task(manager: HttpServerManager, pd_master_obj: PD_Master_O
             logger.warning(f"forwarding_tokens_task {pd_master_obj} cancelled")
             if forwarding_tokens_task is not None:
                 forwarding_tokens_task.cancel()
+            if up_prefix_summary_task is not None:
+                up_prefix_summary_task.cancel()
             return
 
         except Exception as e:
@@ -121,6 +132,8 @@ async def _pd_handle_task(manager: HttpServerManager, pd_master_obj: PD_Master_O
             logger.exception(str(e))
             if forwarding_tokens_task is not None:
                 forwarding_tokens_task.cancel()
+            if up_prefix_summary_task is not None:
+                up_prefix_summary_task.cancel()
             await asyncio.sleep(10)
             await forwarding_queue.get_all_data()
             logger.info("reconnection to pd_master")
@@ -182,3 +195,19 @@ async def _up_tokens_to_pd_master(forwarding_queue: AsyncQueue, websocket):
         handle_list = await forwarding_queue.wait_to_get_all_data()
         if handle_list:
             await websocket.send(pickle.dumps((ObjType.TOKEN_PACKS, handle_list)))
+
+
+# 定时上报前缀摘要和负载信息的task, 用于 pd master 进行前缀亲和的节点选择
+async def _up_prefix_summary_to_pd_master(manager: HttpServerManager, websocket):
+    args = manager.args
+    dp_size_in_node = max(1, args.dp // args.nnodes)
+    prefix_summary_client = PrefixSummaryReadOnlyClient(
+        get_unique_server_name(), node_world_size=args.tp // args.nnodes, dp_world_size=args.tp // args.dp
+    )
+    shared_token_load = TokenLoad(f"{get_unique_server_name()}_shared_token_load", dp_size_in_node)
+    client_ip_port = f"{manager.host_ip}:{args.port}"
+    while True:
+        dp_hashes = [np.sort(prefix_summary_client.get_all_hashes(dp_index)) for dp_index in range(dp_size_in_node)]
+        dp_loads = [float(shared_token_load.get_current_load(dp_index)) for dp_index in range(dp_size_in_node)]
+        await websocket.send(pickle.dumps((ObjType.PREFIX_SUMMARY, (client_ip_port, dp_hashes, dp_loads))))
+        await asyncio.sleep(PREFIX_SUMMARY_UP_INTERVAL)
@@ -0,0 +1,150 @@
+import bisect
+import hashlib
+import collections
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+def encode_with_offsets(tokenizer, prompt: str, add_special_tokens: bool) -> Tuple[List[int], List[int], List[int]]:
+    """
+    返回 prompt 的 token ids 以及每个 token 在 prompt 中的字符起止位置，特殊 token 的起止位置相同。
+    只支持 fast tokenizer。
+    """
+    encoding = tokenizer(prompt, add_special_tokens=add_special_tokens, return_offsets_mapping=True)
+    offsets = encoding["offset_mapping"]
+    return list(encoding["input_ids"]), [e[0] for e in offsets], [e[1] for e in offsets]
+
+
+@dataclass
+class PromptTokenEntry:
+    text_len: int
+    ids: List[int]
+    starts: List[int]
+    ends: List[int]
+
+
+class PromptTokenCache:
+    """
+    多轮对话中每一轮都会重新发送完整的对话，渲染得到的 prompt 以上一轮的 prompt 为前缀。缓存最近 tokenize 过的
+    prompt 的 token ids 和字符偏移，key 为 prompt 文本的 md5, 新的 prompt 找到最长的已缓存前缀后，从前缀末尾往前
+    回退 backoff_token_num 个 token 的位置开始只对剩余的文本进行 tokenize, 然后拼接到前缀的 token ids 后面。
+
+    前缀末尾的 token 可能会和新追加的文本合并，所以回退若干个 token。拼接前会检查从回退位置开始 tokenize 的结果
+    重新产生了前缀中回退区域的 token(最后一个 token 除外), 说明回退位置是一个不受左侧上下文影响的稳定切分点，
+    否则退回到对完整 prompt 进行 tokenize, 保证结果与完整 tokenize 一致。
+    """
+
+    def __init__(self, capacity: int, backoff_token_num: int = 8):
+        self.capacity = capacity
+        self.backoff_token_num = backoff_token_num
+        self.entries: Dict[Tuple[bool, str], PromptTokenEntry] = collections.OrderedDict()
+        # 每种 add_special_tokens 设置下已缓存的 prompt 长度及其数量，用于增量计算前缀的哈希
+        self.text_len_counts: Dict[bool, Dict[int, int]] = {True: {}, False: {}}
+        self.sorted_text_lens: Dict[bool, List[int]] = {True: [], False: []}
+        self.hit_count = 0
+        self.miss_count = 0
+
+    async def encode(
+        self,
+        prompt: str,
+        add_special_tokens: bool,
+        encode_func: Callable[[str, bool], Awaitable[Tuple[List[int], List[int], List[int]]]],
+    ) -> Tuple[List[int], bool]:
+        """
+        encode_func(text, add_special_tokens) 返回 encode_with_offsets 格式的结果，返回 (token ids, 是否命中缓存)。
+        """
+        prompt_key, prefix_entry = self._match_prefix(prompt, add_special_tokens)
+        if prefix_entry is not None and prefix_entry.text_len == len(prompt):
+            self.hit_count += 1
+            return list(prefix_entry.ids), True
+
+        new_entry = None
+        if prefix_entry is not None:
+            new_entry = await self._encode_suffix(prompt, prefix_entry, encode_func)
+
+        is_hit = new_entry is not None
+        if is_hit:
+            self.hit_count += 1
+        else:
+            self.miss_count += 1
+            ids, starts, ends = await encode_func(prompt, add_special_tokens)
+            new_entry = PromptTokenEntry(len(prompt), ids, starts, ends)
+
+        self._put(prompt_key, new_entry)
+        return list(new_entry.ids), is_hit
+
+    def _match_prefix(self, prompt: str, add_special_tokens: bool):
+        # 按照已缓存的长度从短到长增量计算 prompt 前缀的哈希，只需要遍历一次 prompt
+        md5 = hashlib.md5()
+        hashed_len = 0
+        best_key = None
+        for text_len in self.sorted_text_lens[add_special_tokens]:
+            if text_len > len(prompt):
+                break
+            md5.update(prompt[hashed_len:text_len].encode("utf-8", errors="surrogatepass"))
+            hashed_len = text_len
+            key = (add_special_tokens, md5.hexdigest())
+            if key in self.entries:
+                best_key = key
+
+        md5.update(prompt[hashed_len:].encode("utf-8", errors="surrogatepass"))
+        prompt_key = (add_special_tokens, md5.hexdigest())
+        if best_key is None:
+            return prompt_key, None
+        self.entries.move_to_end(best_key)
+        return prompt_key, self.entries[best_key]
+
+    async def _encode_suffix(
+        self, prompt: str, prefix_entry: PromptTokenEntry, encode_func
+    ) -> Optional[PromptTokenEntry]:
+        ids, starts, ends = prefix_entry.ids, prefix_entry.starts, prefix_entry.ends
+        token_num = len(ids)
+        cut_index = token_num - self.backoff_token_num
+        # 前缀以特殊 token 结尾(例如自动添加的 eos)时不能拼接
+        if cut_index <= 0 or ends[-1] <= starts[-1]:
+            return None
+        # 切分点需要是一个文本 token 的开始位置，并且不能与前一个 token 重叠(byte fallback 拆分出的多个 token
+        # 对应同一段字符)
+        cut_pos = starts[cut_index]
+        if cut_pos <= starts[cut_index - 1] or ends[cut_index - 1] > cut_pos or ends[cut_index] <= cut_pos:
+            return None
+
+        tail_ids, tail_starts, tail_ends = await encode_func(prompt[cut_pos:], False)
+        check_num = token_num - 1 - cut_index
+        if tail_ids[0:check_num] != ids[cut_index : token_num - 1]:
+            return None
+
+        return PromptTokenEntry(
+            len(prompt),
+            ids[0:cut_index] + tail_ids,
+            starts[0:cut_index] + [e + cut_pos for e in tail_starts],
+            ends[0:cut_index] + [e + cut_pos for e in tail_ends],
+        )
+
+    def _put(self, key: Tuple[bool, str], entry: PromptTokenEntry):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return
+        self.entries[key] = entry
+        self._add_text_len(key[0], entry.text_len)
+        while len(self.entries) > self.capacity:
+            evict_key, evict_entry = self.entries.popitem(last=False)
+            self._remove_text_len(evict_key[0], evict_entry.text_len)
+        return
+
+    def _add_text_len(self, add_special_tokens: bool, text_len: int):
+        counts = self.text_len_counts[add_special_tokens]
+        if text_len not in counts:
+            counts[text_len] = 0
+            bisect.insort(self.sorted_text_lens[add_special_tokens], text_len)
+        counts[text_len] += 1
+        return
+
+    def _remove_text_len(self, add_special_tokens: bool, text_len: int):
+        counts = self.text_len_counts[add_special_tokens]
+        counts[text_len] -= 1
+        if counts[text_len] == 0:
+            del counts[text_len]
+            sorted_lens = self.sorted_text_lens[add_special_tokens]
+            sorted_lens.pop(bisect.bisect_left(sorted_lens, text_len))
+        return
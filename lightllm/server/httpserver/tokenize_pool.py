@@ -0,0 +1,135 @@
+import asyncio
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+from lightllm.utils.log_utils import init_logger
+from .prompt_token_cache import encode_with_offsets
+
+logger = init_logger(__name__)
+
+# 每个 tokenize 子进程中加载的 tokenizer
+g_worker_tokenizer = None
+
+
+def _init_worker(model_dir: str, tokenizer_mode: str, trust_remote_code: bool):
+    global g_worker_tokenizer
+    from lightllm.server.tokenizer import get_tokenizer
+
+    g_worker_tokenizer = get_tokenizer(model_dir, tokenizer_mode, trust_remote_code=trust_remote_code)
+    return
+
+
+def _encode_batch(prompts: List[str], add_special_tokens_list: List[bool], return_offsets_list: List[bool]) -> List:
+    # 单个 prompt 的异常作为结果返回，不影响同一批中的其他请求
+    ans = []
+    for prompt, add_special_tokens, return_offsets in zip(prompts, add_special_tokens_list, return_offsets_list):
+        try:
+            if return_offsets:
+                ans.append(encode_with_offsets(g_worker_tokenizer, prompt, add_special_tokens))
+            else:
+                ans.append(list(g_worker_tokenizer.encode(prompt, add_special_tokens=add_special_tokens)))
+        except Exception as e:
+            ans.append(e)
+    return ans
+
+
+def _render_chat_template(kwargs: dict, tools: Optional[list]):
+    from lightllm.server.build_prompt import render_chat_template
+
+    return render_chat_template(g_worker_tokenizer, kwargs, tools)
+
+
+class TokenizePool:
+    """
+    在固定数量的子进程中进行 tokenize 和 chat template 渲染，每个子进程启动时只加载一次 tokenizer,
+    避免长 prompt 的 tokenize 阻塞 httpserver 的事件循环，影响其他请求的流式输出。
+    同一轮事件循环中提交的 encode 请求会被合并，按照字符数均衡地拆分成最多 worker_num 个批次发送给子进程。
+    """
+
+    def __init__(self, args, worker_num: int):
+        self.worker_num = worker_num
+        self.executor = ProcessPoolExecutor(
+            max_workers=worker_num,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(args.model_dir, args.tokenizer_mode, args.trust_remote_code),
+        )
+        self.pending_encodes: List[Tuple[str, bool, bool, asyncio.Future]] = []
+        logger.info(f"tokenize pool started with {worker_num} workers")
+
+    async def encode(self, prompt: str, add_special_tokens: bool = True, return_offsets: bool = False):
+        """
+        return_offsets 为 True 时返回 encode_with_offsets 格式的结果，否则返回 token ids。
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if len(self.pending_encodes) == 0:
+            loop.call_soon(self._flush_pending_encodes)
+        self.pending_encodes.append((prompt, add_special_tokens, return_offsets, future))
+        return await future
+
+    async def apply_chat_template(self, kwargs: dict, tools: Optional[list]):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _render_chat_template, kwargs, tools)
+
+    def _split_batches(self, items: List[Tuple[str, bool, bool, asyncio.Future]]) -> List[List]:
+        batch_num = min(self.worker_num, len(items))
+        avg_char_num = sum(len(item[0]) for item in items) / batch_num
+        batches = [[]]
+        cur_char_num = 0
+        for item in items:
+            if cur_char_num >= avg_char_num and len(batches) < batch_num:
+                batches.append([])
+                cur_char_num = 0
+            batches[-1].append(item)
+            cur_char_num += len(item[0])
+        return batches
+
+    def _flush_pending_encodes(self):
+        items = self.pending_encodes
+        self.pending_encodes = []
+        loop = asyncio.get_running_loop()
+        for batch in self._split_batches(items):
+            prompts = [e[0] for e in batch]
+            add_special_tokens_list = [e[1] for e in batch]
+            return_offsets_list = [e[2] for e in batch]
+            exec_future = loop.run_in_executor(
+                self.executor, _encode_batch, prompts, add_special_tokens_list, return_offsets_list
+            )
+            asyncio.ensure_future(self._dispatch_results(exec_future, [e[3] for e in batch]))
+        return
+
+    async def _dispatch_results(self, exec_future, futures: List[asyncio.Future]):
+        try:
+            results = await exec_future
+        except Exception as e:
+            logger.exception(f"tokenize pool encode failed: {str(e)}")
+            results = [e] * len(futures)
+
+        for future, result in zip(futures, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        return
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        return
+
+
+g_tokenize_pool: TokenizePool = None
+
+
+def init_tokenize_pool(args):
+    global g_tokenize_pool
+    worker_num = getattr(args, "tokenize_workers", 0)
+    if g_tokenize_pool is None and worker_num > 0:
+        g_tokenize_pool = TokenizePool(args, worker_num)
+    return
+
+
+def get_tokenize_pool() -> Optional[TokenizePool]:
+    return g_tokenize_pool
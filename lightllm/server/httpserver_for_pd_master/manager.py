@@ -10,6 +10,10 @@ import datetime
 import aiohttp
 import ujson as json
 import pickle
+import random
+import functools
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 from typing import Union, List, Tuple, Dict
@@ -25,6 +29,11 @@ from lightllm.server.metrics.manager import MetricClient
 from lightllm.utils.statics_utils import MovingAverage
 from lightllm.server.httpserver.manager import AsyncQueue
 from lightllm.utils.error_utils import ServerBusyError
+from lightllm.server.router.dynamic_prompt.prefix_summary import (
+    compute_prefix_block_hashes,
+    match_block_num_in_sorted_hashes,
+    select_by_prefix_affinity,
+)
 
 logger = init_logger(__name__)
 
@@ -41,11 +50,15 @@ class HttpServerManagerForPDMaster:
         self.prefill_nodes: List[PD_Client_Obj] = []
         self.decode_nodes: List[PD_Client_Obj] = []
         self.url_to_pd_nodes: Dict[str, PD_Client_Obj] = {}
+        # 节点上报的各个 dp rank 的前缀摘要和负载信息，用于前缀亲和的节点选择
+        self.url_to_prefix_summary: Dict[str, Tuple[List[np.ndarray], List[float]]] = {}
 
         self.req_id_to_out_inf: Dict[int, ReqStatus] = {}
         self.infos_queues = None  # 这个需要延迟初始化，否则使用的loop不对
 
         self.tokenizer = get_tokenizer(args.model_dir, args.tokenizer_mode, trust_remote_code=args.trust_remote_code)
+        # 前缀亲和路由需要的 tokenize 在单独的线程中串行进行，不阻塞事件循环
+        self.route_tokenize_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pd_master_tokenize")
 
         self.first_time_costs = MovingAverage()
         self.per_token_costs = MovingAverage()
@@ -73,6 +86,7 @@ class HttpServerManagerForPDMaster:
             del self.url_to_pd_nodes[pd_client.client_ip_port]
         except:
             pass
+        self.url_to_prefix_summary.pop(pd_client.client_ip_port, None)
         self.prefill_nodes = [e for e in self.prefill_nodes if e.client_ip_port != pd_client.client_ip_port]
         self.decode_nodes = [e for e in self.decode_nodes if e.client_ip_port != pd_client.client_ip_port]
         logger.info(f"mode: {pd_client.mode} url: {pd_client.client_ip_port} removed")
@@ -105,15 +119,63 @@ class HttpServerManagerForPDMaster:
             audio_tokens += self.tokenizer.get_audio_token_length(audio)
         return len(prompt_ids) + image_tokens + img_count + audio_tokens + audio_count
 
-    async def select_p_d_node(
+    async def _encode_for_route(
         self, prompt: Union[str, List[int]], sampling_params: SamplingParams, multimodal_params: MultimodalParams
+    ) -> Tuple[Union[str, List[int]], List[int]]:
+        """
+        返回转发给 prefill 节点的 prompt 和用于前缀亲和路由的 token ids。纯文本请求直接转发 tokenize 的结果，
+        prefill 节点不需要再次进行 tokenize，多模态请求仍然转发原始的 prompt。
+        """
+        if not isinstance(prompt, str):
+            return prompt, prompt
+        prompt_ids = await asyncio.get_running_loop().run_in_executor(
+            self.route_tokenize_executor,
+            functools.partial(
+                self.tokenizer.encode, prompt, None, add_special_tokens=sampling_params.add_special_tokens
+            ),
+        )
+        if multimodal_params.images or multimodal_params.audios:
+            return prompt, prompt_ids
+        return prompt_ids, prompt_ids
+
+    async def select_p_d_node(
+        self, prompt_ids: List[int], sampling_params: SamplingParams, multimodal_params: MultimodalParams
     ) -> Tuple[PD_Client_Obj, PD_Client_Obj]:
-        import random
+        if self.args.prefix_affinity_route:
+            hashes = compute_prefix_block_hashes(prompt_ids, self.args.prefix_affinity_block_size)
+            if len(hashes) != 0:
+                p_node = self._select_node_by_prefix_affinity(self.prefill_nodes, hashes)
+                d_node = self._select_node_by_prefix_affinity(self.decode_nodes, hashes)
+                return p_node, d_node
 
         p_node = random.choice(self.prefill_nodes)
         d_node = random.choice(self.decode_nodes)
         return p_node, d_node
 
+    def _select_node_by_prefix_affinity(self, nodes: List[PD_Client_Obj], hashes: np.ndarray) -> PD_Client_Obj:
+        """
+        节点的前缀命中数量取其所有 dp rank 中命中最多的值，负载取对应 dp rank 的 token 使用率，
+        还没有上报过摘要的节点按照没有命中且负载为 0 处理。
+        """
+        match_block_nums = []
+        loads = []
+        for node in nodes:
+            dp_hashes, dp_loads = self.url_to_prefix_summary.get(node.client_ip_port, ([], []))
+            best_match_block_num, best_load = 0, min(dp_loads, default=0.0)
+            for sorted_hashes, load in zip(dp_hashes, dp_loads):
+                match_block_num = match_block_num_in_sorted_hashes(sorted_hashes, hashes)
+                if match_block_num > best_match_block_num:
+                    best_match_block_num, best_load = match_block_num, load
+            match_block_nums.append(best_match_block_num)
+            loads.append(best_load)
+        index = select_by_prefix_affinity(match_block_nums, loads, len(hashes), self.args.prefix_affinity_load_weight)
+        return nodes[index]
+
+    async def update_prefix_summary(self, client_ip_port: str, dp_hashes: List[np.ndarray], dp_loads: List[float]):
+        if client_ip_port in self.url_to_pd_nodes:
+            self.url_to_prefix_summary[client_ip_port] = (dp_hashes, dp_loads)
+        return
+
     async def generate(
         self,
         prompt: Union[str, List[int]],
@@ -131,7 +193,10 @@ class HttpServerManagerForPDMaster:
             self.metric_client.counter_inc("lightllm_request_count")
             self.metric_client.histogram_observe("lightllm_request_max_new_tokens", sampling_params.max_new_tokens)
 
-            p_node, d_node = await self.select_p_d_node(prompt, sampling_params, multimodal_params)
+            prompt_ids = None
+            if self.args.prefix_affinity_route:
+                prompt, prompt_ids = await self._encode_for_route(prompt, sampling_params, multimodal_params)
+            p_node, d_node = await self.select_p_d_node(prompt_ids, sampling_params, multimodal_params)
 
             results_generator = self._wait_to_token_package(
                 p_node,
@@ -378,6 +443,8 @@ class HttpServerManagerForPDMaster:
                                     req_status.event.set()
                             except:
                                 pass
+                    elif obj[0] == ObjType.PREFIX_SUMMARY:
+                        await self.update_prefix_summary(*obj[1])
                     else:
                         logger.error(f"recevie error obj {obj}")
             except BaseException as e:
@@ -4,7 +4,7 @@ import time
 import threading
 import inspect
 import functools
-import queue
+import collections
 from .metrics import Monitor
 from prometheus_client import generate_latest
 from rpyc import SocketStream
@@ -42,8 +42,8 @@ class MetricServer(rpyc.Service):
         # (to finalize the service, if needed)
         pass
 
-    def exposed_counter_inc(self, name: str, label: str = None) -> None:
-        return self.monitor.counter_inc(name, label)
+    def exposed_counter_inc(self, name: str, label: str = None, value: float = 1) -> None:
+        return self.monitor.counter_inc(name, label, value)
 
     def exposed_histogram_observe(self, name: str, value: float, label: str = None) -> None:
         return self.monitor.histogram_observe(name, value, label)
@@ -51,6 +51,25 @@ class MetricServer(rpyc.Service):
     def exposed_gauge_set(self, name: str, value: float) -> None:
         return self.monitor.gauge_set(name, value)
 
+    def exposed_batch_update(self, counters: tuple, histograms: tuple, gauges: tuple) -> None:
+        # 客户端在本地聚合后批量上报的数据，参数都是 tuple, 保证 rpyc 按值传输
+        # 每个操作单独处理异常，一个错误的操作(如未注册的指标名)不会导致整批数据被丢弃
+        for name, label, value in counters:
+            self._run_op(self.monitor.counter_inc, name, label, value)
+        for name, label, values in histograms:
+            for value in values:
+                self._run_op(self.monitor.histogram_observe, name, value, label)
+        for name, value in gauges:
+            self._run_op(self.monitor.gauge_set, name, value)
+        return
+
+    def _run_op(self, func, name, *args):
+        try:
+            func(name, *args)
+        except Exception as e:
+            logger.error(f"metric {name} update error {str(e)}")
+        return
+
     def exposed_generate_latest(self) -> bytes:
         data = generate_latest(self.monitor.registry)
         return data
@@ -71,9 +90,17 @@ class MetricServer(rpyc.Service):
 
 
 class MetricClient(threading.Thread):
-    def __init__(self, port):
+    """
+    热路径上的 counter_inc / histogram_observe / gauge_set 只是将操作追加到本地的 deque 中(线程安全且无锁),
+    后台线程每隔 flush_interval 秒将积累的操作聚合后通过一次 rpyc 调用批量合并到 MetricServer 中:
+    counter 累加, histogram 保留所有的观测值, gauge 保留最后一次设置的值, 所以导出的 Prometheus 数据与逐个上报一致。
+    deque 的长度有上限，MetricServer 处理不过来时超出的操作会被丢弃并计数，不会无限占用内存。
+    """
+
+    def __init__(self, port, flush_interval=0.2, max_pending_op_num=65536):
         super().__init__()
         self.port = port
+        self.flush_interval = flush_interval
         self.conn = rpyc.connect("localhost", self.port)
 
         def async_wrap(f):
@@ -87,8 +114,13 @@ class MetricClient(threading.Thread):
             return _func
 
         self._generate_latest = async_wrap(self.conn.root.generate_latest)
-
-        self.task_queue = queue.Queue(maxsize=4096)
+        # 元素为 (op_type, name, label, value)
+        self.max_pending_op_num = max_pending_op_num
+        self.pending_ops = collections.deque(maxlen=max_pending_op_num)
+        # 因为 deque 已满而被丢弃的操作数量, 只用于日志，不要求精确
+        self.dropped_op_num = 0
+        # 只有 flush 之间需要互斥，热路径上的追加操作不需要加锁
+        self.flush_lock = threading.Lock()
         self.daemon = True
         self.start()
 
@@ -96,39 +128,59 @@ class MetricClient(threading.Thread):
         ans = await self._generate_latest()
         return ans
 
-    def counter_inc(self, *args, **kwargs):
-        def inner_func():
-            return self.conn.root.counter_inc(*args, **kwargs)
-
-        self._append_task(inner_func)
+    def counter_inc(self, name: str, label: str = None, value: float = 1):
+        self._append_op((0, name, label, value))
         return
 
-    def histogram_observe(self, *args, **kwargs):
-        def inner_func():
-            return self.conn.root.histogram_observe(*args, **kwargs)
-
-        self._append_task(inner_func)
+    def histogram_observe(self, name: str, value: float, label: str = None):
+        self._append_op((1, name, label, value))
         return
 
-    def gauge_set(self, *args, **kwargs):
-        def inner_func():
-            return self.conn.root.gauge_set(*args, **kwargs)
+    def gauge_set(self, name: str, value: float):
+        self._append_op((2, name, None, value))
+        return
 
-        self._append_task(inner_func)
+    def _append_op(self, op):
+        if len(self.pending_ops) >= self.max_pending_op_num:
+            self.dropped_op_num += 1
+        self.pending_ops.append(op)
         return
 
-    def _append_task(self, task_func):
-        try:
-            self.task_queue.put_nowait(task_func)
-        except queue.Full as e:
-            logger.warning(f"monitor task queue is full, error {str(e)}")
+    def _collect_pending_ops(self):
+        counters = {}
+        histograms = {}
+        gauges = {}
+        op_num = len(self.pending_ops)
+        for _ in range(op_num):
+            op_type, name, label, value = self.pending_ops.popleft()
+            if op_type == 0:
+                counters[(name, label)] = counters.get((name, label), 0) + value
+            elif op_type == 1:
+                histograms.setdefault((name, label), []).append(value)
+            else:
+                gauges[name] = value
+        return (
+            tuple((name, label, value) for (name, label), value in counters.items()),
+            tuple((name, label, tuple(values)) for (name, label), values in histograms.items()),
+            tuple(gauges.items()),
+        )
+
+    def flush(self):
+        with self.flush_lock:
+            if self.dropped_op_num != 0:
+                dropped_op_num, self.dropped_op_num = self.dropped_op_num, 0
+                logger.warning(f"monitor pending ops is full, dropped {dropped_op_num} ops")
+            if len(self.pending_ops) == 0:
+                return
+            counters, histograms, gauges = self._collect_pending_ops()
+            self.conn.root.batch_update(counters, histograms, gauges)
         return
 
     def run(self):
         while True:
-            task_func = self.task_queue.get()
+            time.sleep(self.flush_interval)
             try:
-                task_func()
+                self.flush()
             except Exception as e:
                 logger.error(f"monitor error {str(e)}")
 
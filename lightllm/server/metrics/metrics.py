@@ -25,7 +25,11 @@ MONITOR_INFO = {
     "lightllm_batch_inference_duration_bucket": "Inference time of prefill step / decode step",
     "lightllm_cache_length": "Length of tokens which hit prompt cache",
     "lightllm_cache_ratio": "cache length / input_length",
+    "lightllm_cache_host_hit_tokens": "The number of prompt cache tokens reloaded from the host kv cache",
+    "lightllm_cache_host_evict_tokens": "The number of prompt cache tokens evicted from the host kv cache",
     "lightllm_batch_current_max_tokens": "dynamic max token used for current batch",
+    "lightllm_prompt_token_cache_hit": "The number of text prompts tokenized by reusing a cached prompt prefix",
+    "lightllm_prompt_token_cache_miss": "The number of text prompts fully tokenized",
 }
 
 
@@ -66,6 +70,10 @@ class Monitor:
         self.create_counter("lightllm_request_success")
         self.create_counter("lightllm_request_failure")
         self.create_counter("lightllm_batch_inference_count", labelnames=["method"])
+        self.create_counter("lightllm_cache_host_hit_tokens")
+        self.create_counter("lightllm_cache_host_evict_tokens")
+        self.create_counter("lightllm_prompt_token_cache_hit")
+        self.create_counter("lightllm_prompt_token_cache_miss")
 
         max_req_input_len = args.max_req_total_len
         input_len_buckets = [max_req_input_len / 100.0 * (i + 1) for i in range(-1, 100)]
@@ -114,11 +122,11 @@ class Monitor:
         gauge = Gauge(name, MONITOR_INFO[name], registry=self.registry)
         self.monitor_registry[name] = gauge
 
-    def counter_inc(self, name, label=None):
+    def counter_inc(self, name, label=None, value=1):
         if label is None:
-            self.monitor_registry[name].inc()
+            self.monitor_registry[name].inc(value)
         else:
-            self.monitor_registry[name].labels(method=label).inc()
+            self.monitor_registry[name].labels(method=label).inc(value)
 
     def histogram_observe(self, name, value, label=None):
         if label is None:
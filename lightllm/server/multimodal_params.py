@@ -1,17 +1,23 @@
 """Multimodal parameters for text generation."""
 import os
+import asyncio
 import librosa
 import base64
 from typing import List
 from io import BytesIO
 from PIL import Image
 from fastapi import Request
-from lightllm.utils.multimodal_utils import fetch_resource
+from lightllm.utils.multimodal_utils import fetch_resource, compute_md5, run_in_multimodal_executor
 from lightllm.utils.log_utils import init_logger
 
 logger = init_logger(__name__)
 
 
+def _load_audio_length(audio_data: bytes) -> int:
+    audio_values, _ = librosa.load(BytesIO(audio_data), sr=16000)
+    return audio_values.shape[0]
+
+
 class AudioItem:
     def __init__(self, **kwargs):
         self._type = kwargs["type"]
@@ -24,6 +30,8 @@ class AudioItem:
         self.token_num = None
         # the audio length
         self.audio_length = None
+        # the md5 of the audio bytes
+        self.md5 = None
 
         self._preload_data = None
         self.extra_params = {}
@@ -39,11 +47,14 @@ class AudioItem:
             else:
                 raise ValueError(f"cannot read audio which type is {self._type}!")
 
-            # check if valid audio bytes
-            audio_values, _ = librosa.load(BytesIO(audio_data), sr=16000)
+            # check if valid audio bytes, 音频解码和哈希计算都放到线程池中进行，不阻塞事件循环
+            audio_length, self.md5 = await asyncio.gather(
+                run_in_multimodal_executor(_load_audio_length, audio_data),
+                run_in_multimodal_executor(compute_md5, audio_data),
+            )
             from lightllm.models.whisper.defaults import MIN_AUDIO_LEN
 
-            self.audio_length = max(audio_values.shape[0], MIN_AUDIO_LEN)  # 如果音频过短，会被pad到480的长度
+            self.audio_length = max(audio_length, MIN_AUDIO_LEN)  # 如果音频过短，会被pad到480的长度
             self._preload_data = audio_data
             return
 
@@ -77,6 +88,8 @@ class ImageItem:
         self.token_num = None
         self.image_w = 0
         self.image_h = 0
+        # the md5 of the image bytes
+        self.md5 = None
 
         self._preload_data = None
         self.extra_params = {}
@@ -98,9 +111,10 @@ class ImageItem:
             else:
                 raise ValueError(f"cannot read image which type is {self._type}!")
 
-            # check if valid image bytes
+            # check if valid image bytes, Image.open 只解析图片头获取长宽，不会解码像素数据
             image = Image.open(BytesIO(img_data))
             self.image_w, self.image_h = image.size
+            self.md5 = await run_in_multimodal_executor(compute_md5, img_data)
             self._preload_data = img_data
             return
 
@@ -142,10 +156,10 @@ class MultimodalParams:
         return
 
     async def verify_and_preload(self, request: Request):
-        for image in self.images:
-            await image.preload(request)
-        for audio in self.audios:
-            await audio.preload(request)
+        # 所有的图片和音频并发下载和校验
+        await asyncio.gather(
+            *[image.preload(request) for image in self.images], *[audio.preload(request) for audio in self.audios]
+        )
         return
 
     def to_dict(self):
@@ -36,6 +36,7 @@ class ObjType(enum.Enum):
     ABORT = 1
     REQ = 2
     TOKEN_PACKS = 3
+    PREFIX_SUMMARY = 4
 
 
 @dataclass
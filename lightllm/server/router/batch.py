@@ -46,6 +46,9 @@ class Batch:
             # 更新aborted 标记，可以触发推理进程主动退出aborted的请求。
             if req.is_aborted:
                 req.router_aborted = True
+            # 更新停止字符串的匹配标记，推理进程读取后会结束请求。
+            if req.stop_str_matched:
+                req.router_stop_str_matched = True
 
             if req.shm_infer_released:
                 logger.info(f"router release req id {req.request_id}")
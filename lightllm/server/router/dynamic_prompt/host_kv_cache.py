@@ -0,0 +1,133 @@
+import torch
+from typing import Dict, List
+from lightllm.utils.log_utils import init_logger
+
+logger = init_logger(__name__)
+
+
+class HostKvCache:
+    """
+    radix cache 的第二级缓存，从 gpu 中淘汰出来的 radix cache 节点的 kv 数据会被复制到这个
+    pin memory 的 cpu 缓存池中，当后续请求再次命中这些节点时，再从这里拷贝回 gpu，避免重新 prefill。
+    缓存池的 buffer 布局与 mem_manager.get_index_kv_buffer 返回的 tensor 保持一致，所以可以兼容
+    int8kv 等带有 scale buffer 的 mem manager。管理方式和 MemoryManager 一样，使用 mem_state 栈
+    进行 index 的分配和回收。
+    host 上按 index 的 gather / scatter 不能直接和 gpu 进行异步拷贝(高级索引产生的临时 tensor 不是 pin memory),
+    所以拷贝都经过两块轮流使用的 pin memory 中转 buffer 分段进行，cpu 上的 gather / scatter 与上一段的 dma
+    拷贝可以重叠。
+    """
+
+    def __init__(self, size: int, mem_manager, staging_bytes: int = 64 * 1024 * 1024):
+        self.size = size
+        self.mem_manager = mem_manager
+        self.mem_state = torch.arange(0, self.size, dtype=torch.int64, device="cpu", requires_grad=False)
+        self.mark_start = 0
+        self.can_use_mem_size = self.size
+
+        self.use_cuda = torch.cuda.is_available()
+        self.host_buffers: Dict[str, torch.Tensor] = {}
+        for name, tensor in mem_manager.get_index_kv_buffer([0]).items():
+            shape = (tensor.shape[0], self.size) + tuple(tensor.shape[2:])
+            self.host_buffers[name] = torch.empty(shape, dtype=tensor.dtype, device="cpu", pin_memory=self.use_cuda)
+        self.token_bytes = sum(tensor[:, 0].numel() * tensor.element_size() for tensor in self.host_buffers.values())
+
+        # 中转 buffer 使用一维的存储，按照每段的 token 数量 view 成连续的 tensor
+        self.staging_token_num = max(1, min(self.size, staging_bytes // self.token_bytes))
+        self.staging_buffers: List[Dict[str, torch.Tensor]] = []
+        for _ in range(2):
+            self.staging_buffers.append(
+                {
+                    name: torch.empty(
+                        (tensor[:, 0].numel() * self.staging_token_num,),
+                        dtype=tensor.dtype,
+                        device="cpu",
+                        pin_memory=self.use_cuda,
+                    )
+                    for name, tensor in self.host_buffers.items()
+                }
+            )
+        # 记录每块中转 buffer 上最后一次 dma 拷贝的完成事件，cpu 再次写入前需要等待
+        self.staging_events = [None, None]
+
+        logger.info(f"host kv cache token num {self.size} staging token num {self.staging_token_num}")
+
+    def alloc(self, need_size) -> torch.Tensor:
+        assert need_size <= self.can_use_mem_size, f"error host alloc need {need_size} left {self.can_use_mem_size}"
+        start = self.mark_start
+        end = self.mark_start + need_size
+        ans = self.mem_state[start:end].clone()
+        self.mark_start += need_size
+        self.can_use_mem_size -= need_size
+        return ans
+
+    def free(self, free_index: torch.Tensor):
+        end = self.mark_start
+        start = self.mark_start - len(free_index)
+        assert start >= 0, f"error host free state start: {self.mark_start} free len {len(free_index)}"
+        self.mem_state[start:end] = free_index
+        self.mark_start -= len(free_index)
+        self.can_use_mem_size += len(free_index)
+        return
+
+    def _get_staging(self, slot: int, name: str, token_num: int) -> torch.Tensor:
+        host_tensor = self.host_buffers[name]
+        shape = (host_tensor.shape[0], token_num) + tuple(host_tensor.shape[2:])
+        return self.staging_buffers[slot][name][0 : host_tensor[:, 0].numel() * token_num].view(shape)
+
+    def _wait_staging(self, slot: int):
+        if self.staging_events[slot] is not None:
+            self.staging_events[slot].synchronize()
+            self.staging_events[slot] = None
+        return
+
+    def _record_staging(self, slot: int):
+        if self.use_cuda:
+            self.staging_events[slot] = torch.cuda.Event()
+            self.staging_events[slot].record()
+        return
+
+    def offload(self, gpu_index: torch.Tensor) -> torch.Tensor:
+        """
+        将 gpu_index 对应的 kv 数据复制到 host 缓存中，返回 host 端的 index。
+        调用者需要保证 host 缓存有足够的空间，返回时拷贝已经完成，gpu_index 可以被释放。
+        """
+        host_index = self.alloc(len(gpu_index))
+        pending = None
+        for i, start in enumerate(range(0, len(gpu_index), self.staging_token_num)):
+            end = min(start + self.staging_token_num, len(gpu_index))
+            slot = i % 2
+            self._wait_staging(slot)
+            for name, gpu_tensor in self.mem_manager.get_index_kv_buffer(gpu_index[start:end]).items():
+                self._get_staging(slot, name, end - start).copy_(gpu_tensor, non_blocking=True)
+            self._record_staging(slot)
+            # 当前段的 dma 拷贝进行时，将上一段从中转 buffer 写入 host 缓存
+            if pending is not None:
+                self._scatter_to_host(*pending)
+            pending = (slot, host_index[start:end])
+        if pending is not None:
+            self._scatter_to_host(*pending)
+        return host_index
+
+    def _scatter_to_host(self, slot: int, host_index: torch.Tensor):
+        self._wait_staging(slot)
+        for name, host_tensor in self.host_buffers.items():
+            host_tensor.index_copy_(1, host_index, self._get_staging(slot, name, len(host_index)))
+        return
+
+    def load(self, host_index: torch.Tensor, gpu_index: torch.Tensor):
+        """
+        将 host_index 对应的 kv 数据复制回 gpu_index 对应的 kv buffer 中，并释放 host_index。
+        从中转 buffer 到 gpu 的拷贝是异步的，后续在同一个 stream 上的计算可以直接使用这些 kv。
+        """
+        for i, start in enumerate(range(0, len(host_index), self.staging_token_num)):
+            end = min(start + self.staging_token_num, len(host_index))
+            slot = i % 2
+            self._wait_staging(slot)
+            for name, host_tensor in self.host_buffers.items():
+                staging = self._get_staging(slot, name, end - start)
+                torch.index_select(host_tensor, 1, host_index[start:end], out=staging)
+                gpu_buffer: torch.Tensor = getattr(self.mem_manager, name)
+                gpu_buffer[:, gpu_index[start:end]] = staging.to(gpu_buffer.device, non_blocking=True)
+            self._record_staging(slot)
+        self.free(host_index)
+        return
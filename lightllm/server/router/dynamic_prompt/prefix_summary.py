@@ -0,0 +1,127 @@
+import random
+import numpy as np
+from typing import List
+from .shared_arr import SharedArray
+
+# 摘要中只记录请求开头 PREFIX_SUMMARY_MAX_BLOCK_NUM 个 block 的前缀 hash, 足够区分不同的 system prompt 和对话
+PREFIX_SUMMARY_MAX_BLOCK_NUM = 32
+# 直接映射 hash 表的槽位数量，hash 冲突时新写入的值覆盖旧值，摘要只用于调度估计，允许存在误差
+PREFIX_SUMMARY_SLOT_NUM = 1 << 16
+
+_HASH_MASK = (1 << 64) - 1
+_HASH_MUL = 0x9E3779B97F4A7C15
+_block_powers_cache = {}
+
+
+def _get_block_powers(block_size: int) -> np.ndarray:
+    if block_size not in _block_powers_cache:
+        powers = np.full((block_size,), 1099511628211, dtype=np.uint64)
+        _block_powers_cache[block_size] = np.cumprod(powers, dtype=np.uint64)
+    return _block_powers_cache[block_size]
+
+
+def compute_prefix_block_hashes(token_ids, block_size: int, max_block_num=PREFIX_SUMMARY_MAX_BLOCK_NUM) -> np.ndarray:
+    """
+    将 token_ids 按照 block_size 切分，返回每个 block 对应的前缀 hash，第 i 个 hash 代表从开头到第 i 个
+    block 结束的完整前缀，不足一个 block 的尾部不参与计算。hash 的计算不依赖 python 的 hash 随机化，
+    保证不同进程和不同节点上计算的结果一致。返回值中不会出现 0, 0 用于表示摘要中的空槽位。
+    """
+    token_ids = np.asarray(token_ids, dtype=np.int64)
+    block_num = min(len(token_ids) // block_size, max_block_num)
+    if block_num == 0:
+        return np.zeros((0,), dtype=np.int64)
+
+    blocks = token_ids[0 : block_num * block_size].reshape(block_num, block_size).astype(np.uint64)
+    block_hashes = (blocks * _get_block_powers(block_size)).sum(axis=1, dtype=np.uint64)
+    ans = np.empty((block_num,), dtype=np.uint64)
+    cur_hash = 0
+    for i, block_hash in enumerate(block_hashes.tolist()):
+        cur_hash = ((cur_hash ^ block_hash) * _HASH_MUL) & _HASH_MASK
+        cur_hash ^= cur_hash >> 29
+        ans[i] = cur_hash
+    ans = ans.view(np.int64)
+    ans[ans == 0] = 1
+    return ans
+
+
+def get_leading_match_num(hit_mask: np.ndarray) -> int:
+    if hit_mask.all():
+        return len(hit_mask)
+    return int(np.argmin(hit_mask))
+
+
+class PrefixSummary:
+    """
+    radix cache 中缓存的前缀的紧凑摘要，使用共享内存中的直接映射 hash 表存储前缀 block hash，
+    由推理进程中的 RadixCache 在插入和淘汰节点时进行维护，router 和 httpserver 等进程只读使用，
+    用于将请求调度到已经缓存了其前缀的 dp rank 或者节点上。
+    """
+
+    def __init__(self, name, slot_num=PREFIX_SUMMARY_SLOT_NUM):
+        self.slot_num = slot_num
+        self.shared_hashes = SharedArray(name, (slot_num,), dtype=np.int64)
+
+    def add(self, hashes: np.ndarray):
+        self.shared_hashes.arr[hashes % self.slot_num] = hashes
+        return
+
+    def remove(self, hashes: np.ndarray):
+        slot_index = hashes % self.slot_num
+        hit_mask = self.shared_hashes.arr[slot_index] == hashes
+        self.shared_hashes.arr[slot_index[hit_mask]] = 0
+        return
+
+    def clear(self):
+        self.shared_hashes.arr[:] = 0
+        return
+
+    def match_block_num(self, hashes: np.ndarray) -> int:
+        """
+        返回 hashes 中从开头开始连续命中摘要的 block 数量。
+        """
+        if len(hashes) == 0:
+            return 0
+        return get_leading_match_num(self.shared_hashes.arr[hashes % self.slot_num] == hashes)
+
+    def get_all_hashes(self) -> np.ndarray:
+        arr = self.shared_hashes.arr
+        return arr[arr != 0].copy()
+
+
+class PrefixSummaryReadOnlyClient:
+    def __init__(self, unique_name, node_world_size, dp_world_size):
+        self.dp_rank_summaries: List[PrefixSummary] = [
+            PrefixSummary(f"{unique_name}_prefix_summary_{rank_in_node}")
+            for rank_in_node in range(0, node_world_size, dp_world_size)
+        ]
+
+    def match_block_num(self, dp_rank_in_node, hashes: np.ndarray) -> int:
+        return self.dp_rank_summaries[dp_rank_in_node].match_block_num(hashes)
+
+    def get_all_hashes(self, dp_rank_in_node) -> np.ndarray:
+        return self.dp_rank_summaries[dp_rank_in_node].get_all_hashes()
+
+
+def match_block_num_in_sorted_hashes(sorted_hashes: np.ndarray, hashes: np.ndarray) -> int:
+    """
+    pd master 收到的是节点上报的摘要快照(排序后的 hash 数组)，使用二分查找计算连续命中的 block 数量。
+    """
+    if len(hashes) == 0 or len(sorted_hashes) == 0:
+        return 0
+    pos = np.minimum(np.searchsorted(sorted_hashes, hashes), len(sorted_hashes) - 1)
+    return get_leading_match_num(sorted_hashes[pos] == hashes)
+
+
+def select_by_prefix_affinity(
+    match_block_nums: List[int], loads: List[float], total_block_num: int, load_weight: float
+) -> int:
+    """
+    综合前缀命中比例和负载选择目标，score = 命中的前缀 block 比例 - load_weight * 负载，
+    load 一般为 0 到 1 之间的 token 使用率。分数相同的候选随机选择，避免请求集中到同一个目标上。
+    """
+    scores = [
+        match_block_num / max(total_block_num, 1) - load_weight * load
+        for match_block_num, load in zip(match_block_nums, loads)
+    ]
+    max_score = max(scores)
+    return random.choice([i for i, score in enumerate(scores) if score == max_score])
@@ -1,48 +1,146 @@
 # Adapted from https://github.com/sgl-project/sglang/blob/main/python/sglang/srt/managers/router/radix_cache.py
+import heapq
 import torch
 import numpy as np
 from typing import Tuple, Dict, Set, List
-from sortedcontainers import SortedSet
 from .shared_arr import SharedArray
+from .host_kv_cache import HostKvCache
+from .prefix_summary import PrefixSummary, compute_prefix_block_hashes, PREFIX_SUMMARY_MAX_BLOCK_NUM
 from lightllm.common.mem_manager import MemoryManager
 
 
-class UniqueTimeIdGenerator:
-    def __init__(self):
-        self.counter = 0
-
-    def generate_time_id(self):
-        self.counter += 1
-        return self.counter
-
+class TreeNodeArrays:
+    """
+    radix 树节点的元信息(引用计数，时间戳，子节点数量，是否在 host 上等)使用扁平的 numpy 数组存储，
+    以节点的 node_id 作为下标。insert 和 match_prefix 时只需要更新数组中的值，不需要维护有序集合，
+    淘汰时直接在数组上进行向量化的筛选和排序，得到按照 lru 排序的可淘汰叶节点。
+    """
 
-time_gen = UniqueTimeIdGenerator()
+    def __init__(self, init_capacity=1024):
+        self.capacity = 0
+        self.ref_counter = np.zeros((0,), dtype=np.int64)
+        self.time_id = np.zeros((0,), dtype=np.int64)
+        self.child_num = np.zeros((0,), dtype=np.int32)
+        self.gpu_child_num = np.zeros((0,), dtype=np.int32)
+        self.is_host = np.zeros((0,), dtype=np.bool_)
+        self.alive = np.zeros((0,), dtype=np.bool_)
+        self.nodes: List["TreeNode"] = []
+        self.free_ids: List[int] = []
+        self.time_counter = 0
+        self._grow(init_capacity)
+
+    def _grow(self, new_capacity):
+        for name in ["ref_counter", "time_id", "child_num", "gpu_child_num", "is_host", "alive"]:
+            old_arr = getattr(self, name)
+            new_arr = np.zeros((new_capacity,), dtype=old_arr.dtype)
+            new_arr[: len(old_arr)] = old_arr
+            setattr(self, name, new_arr)
+        self.nodes.extend([None] * (new_capacity - self.capacity))
+        # 倒序放入，保证优先分配小的 node_id
+        self.free_ids.extend(range(new_capacity - 1, self.capacity - 1, -1))
+        self.capacity = new_capacity
+
+    def alloc(self, node: "TreeNode") -> int:
+        if len(self.free_ids) == 0:
+            self._grow(self.capacity * 2)
+        node_id = self.free_ids.pop()
+        self.nodes[node_id] = node
+        self.ref_counter[node_id] = 0
+        self.child_num[node_id] = 0
+        self.gpu_child_num[node_id] = 0
+        self.is_host[node_id] = False
+        self.alive[node_id] = True
+        self.update_time(node_id)
+        return node_id
+
+    def free(self, node_id: int):
+        self.alive[node_id] = False
+        self.nodes[node_id] = None
+        self.free_ids.append(node_id)
+
+    def update_time(self, node_id: int):
+        self.time_counter += 1
+        self.time_id[node_id] = self.time_counter
+
+    def get_lru_evict_node_ids(self, is_host: bool, exclude_node_id: int) -> np.ndarray:
+        """
+        返回引用计数为 0 的可淘汰叶节点，按照时间戳从旧到新排序。
+        is_host 为 False 时返回 gpu 上的叶节点(只挂有 host 子节点的 gpu 节点也是叶节点)，
+        is_host 为 True 时返回 host 上没有任何子节点的节点。
+        """
+        if is_host:
+            mask = self.alive & self.is_host & (self.child_num == 0)
+        else:
+            mask = self.alive & (~self.is_host) & (self.gpu_child_num == 0)
+        mask &= self.ref_counter == 0
+        mask[exclude_node_id] = False
+        node_ids = np.flatnonzero(mask)
+        return node_ids[np.argsort(self.time_id[node_ids])]
 
 
 class TreeNode:
-    def __init__(self):
+    __slots__ = (
+        "node_arrays",
+        "node_id",
+        "children",
+        "parent",
+        "token_id_key",
+        "token_mem_index_value",
+        "node_value_len",
+        "node_prefix_total_len",
+    )
+
+    def __init__(self, node_arrays: TreeNodeArrays):
+        self.node_arrays = node_arrays
+        self.node_id = node_arrays.alloc(self)
         self.children: Dict[int, TreeNode] = {}  # 这里的键 为 token_id_key 的第一个元素
         self.parent: TreeNode = None
-        self.token_id_key: torch.Tensor = None
-        self.token_mem_index_value: torch.Tensor = None  # 用于记录存储的 token_index 为每个元素在 token mem 中的index位置
-        self.ref_counter = 0
-        self.time_id = time_gen.generate_time_id()  # 用于标识时间周期
+        self.token_id_key: np.ndarray = None
+        # 用于记录存储的 token_index 为每个元素在 token mem 中的index位置, 开启 host kv cache 后，
+        # 被 gpu 淘汰的节点会被转移到 host 上，此时记录的是其在 HostKvCache 中的 index。host 节点
+        # 只会出现在树的底部，其子节点也一定是 host 节点。
+        self.token_mem_index_value: torch.Tensor = None
 
         self.node_value_len = 0
         self.node_prefix_total_len = 0
 
-    def get_compare_key(self):
-        return (0 if self.ref_counter == 0 else 1, len(self.children), self.time_id)
+    @property
+    def ref_counter(self):
+        return self.node_arrays.ref_counter[self.node_id]
+
+    @ref_counter.setter
+    def ref_counter(self, value):
+        self.node_arrays.ref_counter[self.node_id] = value
+
+    @property
+    def time_id(self):
+        return self.node_arrays.time_id[self.node_id]
+
+    @property
+    def is_host_node(self):
+        return self.node_arrays.is_host[self.node_id]
+
+    def set_host_node(self, is_host: bool):
+        if self.parent is not None:
+            self.node_arrays.gpu_child_num[self.parent.node_id] += -1 if is_host else 1
+        self.node_arrays.is_host[self.node_id] = is_host
+
+    def get_gpu_child_num(self):
+        return self.node_arrays.gpu_child_num[self.node_id]
 
     def split_node(self, prefix_len):
-        split_parent_node = TreeNode()
+        split_parent_node = TreeNode(self.node_arrays)
         split_parent_node.parent = self.parent
-        split_parent_node.parent.children[self.token_id_key[0].item()] = split_parent_node
+        split_parent_node.parent.children[int(self.token_id_key[0])] = split_parent_node
         split_parent_node.token_id_key = self.token_id_key[0:prefix_len]
         split_parent_node.token_mem_index_value = self.token_mem_index_value[0:prefix_len]
         split_parent_node.children = {}
-        split_parent_node.children[self.token_id_key[prefix_len].item()] = self
+        split_parent_node.children[int(self.token_id_key[prefix_len])] = self
         split_parent_node.ref_counter = self.ref_counter
+        # split_parent_node 替换 self 在父节点中的位置，父节点的子节点计数不变
+        self.node_arrays.is_host[split_parent_node.node_id] = self.is_host_node
+        self.node_arrays.child_num[split_parent_node.node_id] = 1
+        self.node_arrays.gpu_child_num[split_parent_node.node_id] = 0 if self.is_host_node else 1
 
         new_len = len(split_parent_node.token_mem_index_value)
         split_parent_node.node_value_len = new_len
@@ -57,13 +155,15 @@ class TreeNode:
         return split_parent_node
 
     def add_and_return_new_child(self, token_id_key, token_mem_index_value):
-        child = TreeNode()
+        child = TreeNode(self.node_arrays)
         child.token_id_key = token_id_key
         child.token_mem_index_value = token_mem_index_value
-        first_token_key = child.token_id_key[0].item()
+        first_token_key = int(child.token_id_key[0])
         assert first_token_key not in self.children.keys()
         self.children[first_token_key] = child
         child.parent = self
+        self.node_arrays.child_num[self.node_id] += 1
+        self.node_arrays.gpu_child_num[self.node_id] += 1
 
         new_len = len(child.token_mem_index_value)
         child.node_value_len = new_len
@@ -71,24 +171,31 @@ class TreeNode:
         return child
 
     def remove_child(self, child_node: "TreeNode"):
-        del self.children[child_node.token_id_key[0].item()]
+        del self.children[int(child_node.token_id_key[0])]
+        self.node_arrays.child_num[self.node_id] -= 1
+        if not child_node.is_host_node:
+            self.node_arrays.gpu_child_num[self.node_id] -= 1
         child_node.parent = None
+        self.node_arrays.free(child_node.node_id)
         return
 
     def update_time(self):
-        self.time_id = time_gen.generate_time_id()
+        self.node_arrays.update_time(self.node_id)
 
     def is_leaf(self):
-        return len(self.children) == 0
+        # 对于 gpu 的淘汰管理而言，只挂有 host 子节点的节点也是叶节点
+        return self.get_gpu_child_num() == 0
 
+    def is_host_leaf(self):
+        return self.is_host_node and len(self.children) == 0
 
-def match(key, seq):
-    i = 0
-    for k, w in zip(key, seq):
-        if k != w:
-            break
-        i += 1
-    return i
+
+def match(key: np.ndarray, seq: np.ndarray) -> int:
+    length = min(len(key), len(seq))
+    mismatch_index = np.flatnonzero(key[0:length] != seq[0:length])
+    if len(mismatch_index) == 0:
+        return length
+    return int(mismatch_index[0])
 
 
 class RadixCache:
@@ -96,19 +203,25 @@ class RadixCache:
     unique_name 主要用于解决单机，多实列部署时的shm冲突
     """
 
-    def __init__(self, unique_name, total_token_num, rank_in_node, mem_manager: MemoryManager = None):
+    def __init__(
+        self,
+        unique_name,
+        total_token_num,
+        rank_in_node,
+        mem_manager: MemoryManager = None,
+        host_cache_token_num=0,
+        prefix_summary_block_size=0,
+    ):
         self.mem_manager = mem_manager
-        self._key_dtype = torch.int64
+        self._key_dtype = np.int64
         self._value_dtype = torch.int64
 
-        self.root_node = TreeNode()
-        self.root_node.token_id_key = torch.zeros((0,), device="cpu", dtype=self._key_dtype)
+        self.node_arrays = TreeNodeArrays()
+        self.root_node = TreeNode(self.node_arrays)
+        self.root_node.token_id_key = np.zeros((0,), dtype=self._key_dtype)
         self.root_node.token_mem_index_value = torch.zeros((0,), device="cpu", dtype=self._value_dtype)
         self.root_node.ref_counter = 1  # 初始化为 1 保证永远不会被 evict 掉
 
-        self.evict_tree_set: Set[TreeNode] = SortedSet(key=lambda x: x.get_compare_key())  # 自定义比较器
-        self.evict_tree_set.add(self.root_node)
-
         self.refed_tokens_num = SharedArray(f"{unique_name}_refed_tokens_num_{rank_in_node}", (1,), dtype=np.int64)
         self.refed_tokens_num.arr[0] = 0
         self.tree_total_tokens_num = SharedArray(
@@ -116,72 +229,107 @@ class RadixCache:
         )
         self.tree_total_tokens_num.arr[0] = 0
 
+        # 二级 host kv cache，用于存放被 gpu 淘汰的节点，命中后重新加载回 gpu
+        self.host_cache: HostKvCache = None
+        if host_cache_token_num > 0:
+            assert mem_manager is not None
+            self.host_cache = HostKvCache(host_cache_token_num, mem_manager)
+        self.host_hit_tokens_num = SharedArray(
+            f"{unique_name}_host_hit_tokens_num_{rank_in_node}", (1,), dtype=np.int64
+        )
+        self.host_hit_tokens_num.arr[0] = 0
+        self.host_evict_tokens_num = SharedArray(
+            f"{unique_name}_host_evict_tokens_num_{rank_in_node}", (1,), dtype=np.int64
+        )
+        self.host_evict_tokens_num.arr[0] = 0
+
+        # gpu 上缓存前缀的摘要，供 router 和 pd master 进行前缀亲和的调度
+        self.prefix_summary: PrefixSummary = None
+        self.prefix_summary_block_size = prefix_summary_block_size
+        if prefix_summary_block_size > 0:
+            self.prefix_summary = PrefixSummary(f"{unique_name}_prefix_summary_{rank_in_node}")
+            self.prefix_summary.clear()
+
+    def _to_numpy_key(self, key) -> np.ndarray:
+        if isinstance(key, torch.Tensor):
+            return key.numpy()
+        return np.asarray(key, dtype=self._key_dtype)
+
     def insert(self, key, value=None):
         if value is None:
             value = key
+            if isinstance(value, torch.Tensor):
+                value = value.clone()
 
         assert len(key) == len(value)  # and len(key) >= 1
         if len(key) == 0:
             return 0
+        key = self._to_numpy_key(key)
+        if self.prefix_summary is not None:
+            self.prefix_summary.add(compute_prefix_block_hashes(key, self.prefix_summary_block_size))
         return self._insert_helper(self.root_node, key, value)
 
     def _insert_helper(self, node: TreeNode, key, value):
-        if node.is_leaf():
-            self.evict_tree_set.discard(node)
-
         try:
-            first_key_id = key[0].item()
-            if first_key_id in node.children.keys():
-                child: TreeNode = node.children[first_key_id]
-                prefix_len = match(key, child.token_id_key)
-                if prefix_len == len(key):
-                    if child.is_leaf():
-                        self.evict_tree_set.discard(child)
-                    child.update_time()
-                    if child.is_leaf():
-                        self.evict_tree_set.add(child)
-                    return prefix_len
-
-                elif prefix_len < len(key) and prefix_len < len(child.token_id_key):
-                    if child.is_leaf():
-                        self.evict_tree_set.discard(child)
-
-                    key = key[prefix_len:]
-                    value = value[prefix_len:]
-                    split_parent_node = child.split_node(prefix_len)
-                    new_node = split_parent_node.add_and_return_new_child(key, value)
-                    # update total token num
-                    self.tree_total_tokens_num.arr[0] += len(new_node.token_mem_index_value)
-
-                    if split_parent_node.is_leaf():
-                        self.evict_tree_set.add(split_parent_node)
-                    if new_node.is_leaf():
-                        self.evict_tree_set.add(new_node)
-
-                    if child.is_leaf():
-                        self.evict_tree_set.add(child)
-                    return prefix_len
-                elif prefix_len < len(key) and prefix_len == len(child.token_id_key):
-                    return prefix_len + self._insert_helper(child, key[prefix_len:], value[prefix_len:])
-                else:
-                    assert False, "can not run to here"
-
-            else:
+            first_key_id = int(key[0])
+            child: TreeNode = node.children.get(first_key_id, None)
+            if child is None:
                 new_node = node.add_and_return_new_child(key, value)
                 # update total token num
                 self.tree_total_tokens_num.arr[0] += len(new_node.token_mem_index_value)
-                if new_node.is_leaf():
-                    self.evict_tree_set.add(new_node)
                 return 0
+
+            if child.is_host_node:
+                return self._insert_to_host_node(child, key, value)
+
+            prefix_len = match(key, child.token_id_key)
+            if prefix_len == len(key):
+                child.update_time()
+                return prefix_len
+
+            elif prefix_len < len(key) and prefix_len < len(child.token_id_key):
+                key = key[prefix_len:]
+                value = value[prefix_len:]
+                split_parent_node = child.split_node(prefix_len)
+                new_node = split_parent_node.add_and_return_new_child(key, value)
+                # update total token num
+                self.tree_total_tokens_num.arr[0] += len(new_node.token_mem_index_value)
+                return prefix_len
+            elif prefix_len < len(key) and prefix_len == len(child.token_id_key):
+                return prefix_len + self._insert_helper(child, key[prefix_len:], value[prefix_len:])
+            else:
+                assert False, "can not run to here"
         finally:
             node.update_time()
-            if node.is_leaf():
-                self.evict_tree_set.add(node)
+
+    def _insert_to_host_node(self, host_node: TreeNode, key, value):
+        """
+        插入的 key 命中了 host 上的节点时，直接使用新插入的 gpu kv 数据替换 host 上的数据，
+        因为 host 节点只会出现在树的底部，所以这部分 token 都不计入返回的 prefix_len 中。
+        """
+        prefix_len = match(key, host_node.token_id_key)
+        if prefix_len < len(host_node.token_id_key):
+            host_node = host_node.split_node(prefix_len)
+        self.host_cache.free(host_node.token_mem_index_value)
+        host_node.token_mem_index_value = value[0:prefix_len]
+        host_node.set_host_node(False)
+        self.tree_total_tokens_num.arr[0] += prefix_len
+        if prefix_len < len(key):
+            ans = self._insert_helper(host_node, key[prefix_len:], value[prefix_len:])
+            assert ans == 0
+        return 0
 
     def match_prefix(self, key, update_refs=False):
+        """
+        开启 host kv cache 时，只有 update_refs 为 True 的匹配才会将命中的 host 节点重新加载
+        回 gpu，因为加载过程需要淘汰 gpu 上的节点来腾挪空间，需要通过引用计数来保护已匹配的路径。
+        """
         assert len(key) != 0
+        key = self._to_numpy_key(key)
         ans_value_list = []
         tree_node = self._match_prefix_helper(self.root_node, key, ans_value_list, update_refs=update_refs)
+        if self.host_cache is not None and update_refs:
+            tree_node = self._load_host_prefix(tree_node, key[tree_node.node_prefix_total_len :], ans_value_list)
         if tree_node != self.root_node:
             if len(ans_value_list) != 0:
                 value = torch.concat(ans_value_list)
@@ -193,9 +341,6 @@ class RadixCache:
             return None, 0, None
 
     def _match_prefix_helper(self, node: TreeNode, key, ans_value_list: list, update_refs=False) -> TreeNode:
-        if node.is_leaf():
-            self.evict_tree_set.discard(node)
-
         if update_refs:
             node.ref_counter += 1
             # from 0 to 1 need update refs token num
@@ -206,104 +351,238 @@ class RadixCache:
             if len(key) == 0:
                 return node
 
-            first_key_id = key[0].item()
-            if first_key_id not in node.children.keys():
+            child: TreeNode = node.children.get(int(key[0]), None)
+            if child is None or child.is_host_node:
                 return node
+
+            prefix_len = match(key, child.token_id_key)
+            if prefix_len == len(child.token_id_key):
+                ans_value_list.append(child.token_mem_index_value)
+                return self._match_prefix_helper(child, key[prefix_len:], ans_value_list, update_refs=update_refs)
+            elif prefix_len < len(child.token_id_key):
+                split_parent_node = child.split_node(prefix_len)
+                ans_value_list.append(split_parent_node.token_mem_index_value)
+
+                if update_refs:
+                    split_parent_node.ref_counter += 1
+                    # from 0 to 1 need update refs token num
+                    if split_parent_node.ref_counter == 1:
+                        self.refed_tokens_num.arr[0] += len(split_parent_node.token_mem_index_value)
+
+                return split_parent_node
             else:
-                child = node.children[first_key_id]
-                prefix_len = match(key, child.token_id_key)
-                if prefix_len == len(child.token_id_key):
-                    ans_value_list.append(child.token_mem_index_value)
-                    return self._match_prefix_helper(child, key[prefix_len:], ans_value_list, update_refs=update_refs)
-                elif prefix_len < len(child.token_id_key):
-                    if child.is_leaf():
-                        self.evict_tree_set.discard(child)
-
-                    split_parent_node = child.split_node(prefix_len)
-                    ans_value_list.append(split_parent_node.token_mem_index_value)
-
-                    if update_refs:
-                        split_parent_node.ref_counter += 1
-                        # from 0 to 1 need update refs token num
-                        if split_parent_node.ref_counter == 1:
-                            self.refed_tokens_num.arr[0] += len(split_parent_node.token_mem_index_value)
-
-                    if child.is_leaf():
-                        self.evict_tree_set.add(child)
-                    if split_parent_node.is_leaf():
-                        self.evict_tree_set.add(split_parent_node)
-
-                    return split_parent_node
-                else:
-                    assert False, "error state"
+                assert False, "error state"
         finally:
             node.update_time()
-            if node.is_leaf():
-                self.evict_tree_set.add(node)
+
+    def _load_host_prefix(self, node: TreeNode, key, ans_value_list: list) -> TreeNode:
+        """
+        node 为 gpu 上匹配到的最深节点(已经增加过引用计数)，继续在其 host 子节点中进行匹配，
+        将命中的 host 节点的 kv 数据加载回新申请的 gpu token 中，返回匹配到的最深节点。
+        """
+        host_nodes: List[TreeNode] = []
+        cur_node = node
+        while len(key) > 0:
+            child: TreeNode = cur_node.children.get(int(key[0]), None)
+            if child is None or not child.is_host_node:
+                break
+            prefix_len = match(key, child.token_id_key)
+            if prefix_len < len(child.token_id_key):
+                child = child.split_node(prefix_len)
+            host_nodes.append(child)
+            key = key[prefix_len:]
+            cur_node = child
+
+        if len(host_nodes) == 0:
+            return node
+
+        # 增加引用计数，防止在后续淘汰 gpu 节点腾挪空间的过程中，这些 host 节点被从 host 缓存中淘汰
+        for host_node in host_nodes:
+            host_node.ref_counter += 1
+
+        # gpu 上能腾挪出的空间不足时，只加载能放下的前缀部分
+        can_use_token_num = self.mem_manager.can_use_mem_size + self.get_tree_total_tokens_num()
+        can_use_token_num -= self.get_refed_tokens_num()
+        load_token_num = 0
+        load_node_num = 0
+        for host_node in host_nodes:
+            if load_token_num + host_node.node_value_len > can_use_token_num:
+                break
+            load_token_num += host_node.node_value_len
+            load_node_num += 1
+
+        for host_node in host_nodes[load_node_num:]:
+            host_node.ref_counter -= 1
+        host_nodes = host_nodes[0:load_node_num]
+        if len(host_nodes) == 0:
+            return node
+
+        self.free_radix_cache_to_get_enough_token(load_token_num)
+        gpu_mem_index = self.mem_manager.alloc(load_token_num).to(self._value_dtype)
+
+        start = 0
+        for host_node in host_nodes:
+            value = gpu_mem_index[start : start + host_node.node_value_len]
+            start += host_node.node_value_len
+            self.host_cache.load(host_node.token_mem_index_value, value)
+            host_node.token_mem_index_value = value
+            host_node.set_host_node(False)
+            host_node.update_time()
+            ans_value_list.append(value)
+
+        self.tree_total_tokens_num.arr[0] += load_token_num
+        self.refed_tokens_num.arr[0] += load_token_num
+        self.host_hit_tokens_num.arr[0] += load_token_num
+        return host_nodes[-1]
+
+    def _offload_node_to_host(self, node: TreeNode) -> bool:
+        need_token_num = node.node_value_len
+        if need_token_num > self.host_cache.size:
+            return False
+        self._free_host_cache_to_get_enough_token(need_token_num)
+        if self.host_cache.can_use_mem_size < need_token_num:
+            return False
+
+        node.token_mem_index_value = self.host_cache.offload(node.token_mem_index_value)
+        node.set_host_node(True)
+        return True
+
+    def _free_host_cache_to_get_enough_token(self, need_token_num):
+        if self.host_cache.can_use_mem_size >= need_token_num:
+            return
+        # 被淘汰节点的父节点可能成为新的可淘汰叶节点，使用小顶堆将其按照时间戳合并到淘汰顺序中
+        lru_node_ids = self.node_arrays.get_lru_evict_node_ids(is_host=True, exclude_node_id=self.root_node.node_id)
+        new_leaf_heap = []
+        lru_index = 0
+        while self.host_cache.can_use_mem_size < need_token_num:
+            node_id = self._pop_lru_node_id(lru_node_ids, lru_index, new_leaf_heap)
+            if node_id is None:
+                break
+            if len(new_leaf_heap) == 0 or node_id != new_leaf_heap[0][1]:
+                lru_index += 1
+            else:
+                heapq.heappop(new_leaf_heap)
+            node: TreeNode = self.node_arrays.nodes[node_id]
+            parent_node: TreeNode = node.parent
+            self._remove_host_node(node)
+            if parent_node.is_host_leaf() and parent_node.ref_counter == 0:
+                heapq.heappush(new_leaf_heap, (parent_node.time_id, parent_node.node_id))
+        return
+
+    def _pop_lru_node_id(self, lru_node_ids: np.ndarray, lru_index: int, new_leaf_heap: list):
+        if lru_index < len(lru_node_ids):
+            node_id = int(lru_node_ids[lru_index])
+            if len(new_leaf_heap) == 0 or self.node_arrays.time_id[node_id] < new_leaf_heap[0][0]:
+                return node_id
+        if len(new_leaf_heap) != 0:
+            return new_leaf_heap[0][1]
+        return None
+
+    def _remove_host_node(self, node: TreeNode):
+        assert node.is_host_leaf() and node.ref_counter == 0, "error evict host tree node state"
+        self.host_cache.free(node.token_mem_index_value)
+        self.host_evict_tokens_num.arr[0] += node.node_value_len
+        node.parent.remove_child(node)
+        return
+
+    def _remove_host_children(self, node: TreeNode):
+        for child in list(node.children.values()):
+            self._remove_host_children(child)
+            self._remove_host_node(child)
+        return
 
     def evict(self, need_remove_tokens, evict_callback):
         if self.tree_total_tokens_num.arr[0] - self.refed_tokens_num.arr[0] < need_remove_tokens:
             assert False, f"""can not free tree tokens {need_remove_tokens},
                               tree_total_tokens_num {self.tree_total_tokens_num.arr[0]},
                               refed_tokens_num {self.refed_tokens_num.arr[0]}"""
+        if self.host_cache is not None:
+            # 提前批量腾挪出 host 上的空间，避免每转移一个节点都进行一次 host 淘汰
+            self._free_host_cache_to_get_enough_token(min(need_remove_tokens, self.host_cache.size))
+
+        lru_node_ids = self.node_arrays.get_lru_evict_node_ids(is_host=False, exclude_node_id=self.root_node.node_id)
+        new_leaf_heap = []
+        lru_index = 0
         num_evicted = 0
         while num_evicted < need_remove_tokens:
-            node: TreeNode = self.evict_tree_set.pop(0)
-            assert (
-                node.ref_counter == 0 and len(node.children) == 0 and node != self.root_node
-            ), "error evict tree node state"
-            num_evicted += len(node.token_mem_index_value)
-            evict_callback(node.token_mem_index_value)
+            node_id = self._pop_lru_node_id(lru_node_ids, lru_index, new_leaf_heap)
+            assert node_id is not None, "error evict tree node state"
+            if len(new_leaf_heap) == 0 or node_id != new_leaf_heap[0][1]:
+                lru_index += 1
+            else:
+                heapq.heappop(new_leaf_heap)
+
+            node: TreeNode = self.node_arrays.nodes[node_id]
+            assert node.ref_counter == 0 and node.is_leaf() and node != self.root_node, "error evict tree node state"
+            gpu_mem_index = node.token_mem_index_value
+            num_evicted += len(gpu_mem_index)
             # update total token num
-            self.tree_total_tokens_num.arr[0] -= len(node.token_mem_index_value)
+            self.tree_total_tokens_num.arr[0] -= len(gpu_mem_index)
             parent_node: TreeNode = node.parent
-            parent_node.remove_child(node)
-            if parent_node.is_leaf():
-                self.evict_tree_set.add(parent_node)
+            if self.prefix_summary is not None:
+                self._remove_node_from_prefix_summary(node)
+            # 开启 host kv cache 时，先将 kv 数据转移到 host 上，转移失败的才真正从树中删除
+            if self.host_cache is None or not self._offload_node_to_host(node):
+                if self.host_cache is not None:
+                    self._remove_host_children(node)
+                parent_node.remove_child(node)
+            evict_callback(gpu_mem_index)
+            if parent_node.is_leaf() and parent_node.ref_counter == 0 and parent_node != self.root_node:
+                heapq.heappush(new_leaf_heap, (parent_node.time_id, parent_node.node_id))
 
         return
 
+    def _remove_node_from_prefix_summary(self, node: TreeNode):
+        # 只有起始位置在摘要记录范围内的节点才需要更新摘要, 与该节点存在重叠的 block 前缀都不再完整的缓存在 gpu 上
+        block_size = self.prefix_summary_block_size
+        node_start = node.node_prefix_total_len - node.node_value_len
+        if node_start >= block_size * PREFIX_SUMMARY_MAX_BLOCK_NUM:
+            return
+        keys = []
+        cur_node = node
+        while cur_node is not None:
+            keys.append(cur_node.token_id_key)
+            cur_node = cur_node.parent
+        prefix_key = np.concatenate(keys[::-1])
+        hashes = compute_prefix_block_hashes(prefix_key, block_size)
+        self.prefix_summary.remove(hashes[node_start // block_size :])
+        return
+
     def assert_leafs_is_right(self):
-        for node in self.evict_tree_set:
-            if node.is_leaf() and node.ref_counter == 0:
-                a = node.token_mem_index_value.cuda()
-                assert (self.mem_manager.mem_state[a] == 1).sum().item() == len(a)
+        for node_id in self.node_arrays.get_lru_evict_node_ids(is_host=False, exclude_node_id=self.root_node.node_id):
+            a = self.node_arrays.nodes[node_id].token_mem_index_value.cuda()
+            assert (self.mem_manager.mem_state[a] == 1).sum().item() == len(a)
 
     def clear_tree_nodes(self):
         """
         该函数只在测试时调用
         """
-        while True:
-            node: TreeNode = self.evict_tree_set.pop(0)
-            if node != self.root_node:
-                parent_node: TreeNode = node.parent
-                parent_node.remove_child(node)
-                if parent_node.is_leaf():
-                    self.evict_tree_set.add(parent_node)
-            else:
-                break
 
+        def _clear_helper(node: TreeNode):
+            for child in list(node.children.values()):
+                _clear_helper(child)
+                if child.is_host_node:
+                    self.host_cache.free(child.token_mem_index_value)
+                node.remove_child(child)
+
+        _clear_helper(self.root_node)
+        if self.prefix_summary is not None:
+            self.prefix_summary.clear()
         self.tree_total_tokens_num.arr[0] = 0
         self.refed_tokens_num.arr[0] = 0
+        self.host_hit_tokens_num.arr[0] = 0
+        self.host_evict_tokens_num.arr[0] = 0
         return
 
     def dec_node_ref_counter(self, node: TreeNode):
         if node is None:
             return
-        # 如果减引用的是叶节点，需要先从 evict_tree_set 中移除
-        old_node = node
-        if old_node.is_leaf():
-            self.evict_tree_set.discard(old_node)
 
         while node is not None:
             if node.ref_counter == 1:
                 self.refed_tokens_num.arr[0] -= len(node.token_mem_index_value)
             node.ref_counter -= 1
             node = node.parent
-
-        # 加回。
-        if old_node.is_leaf():
-            self.evict_tree_set.add(old_node)
         return
 
     def get_refed_tokens_num(self):
@@ -312,6 +591,12 @@ class RadixCache:
     def get_tree_total_tokens_num(self):
         return self.tree_total_tokens_num.arr[0]
 
+    def get_host_hit_tokens_num(self):
+        return self.host_hit_tokens_num.arr[0]
+
+    def get_host_evict_tokens_num(self):
+        return self.host_evict_tokens_num.arr[0]
+
     def print_self(self, indent=0):
         self._print_helper(self.root_node, indent)
 
@@ -320,7 +605,7 @@ class RadixCache:
             " " * indent,
             f"k: {node.token_id_key[0:10]} v: {node.token_mem_index_value[0:10]} refs: {node.ref_counter} \
             time_id: {node.time_id} prefix_total_len: {node.node_prefix_total_len} \
-            node_value_len: {node.node_value_len}",
+            node_value_len: {node.node_value_len} is_host_node: {node.is_host_node}",
         )
         for _, child in node.children.items():
             self._print_helper(child, indent=indent + 2)
@@ -328,8 +613,13 @@ class RadixCache:
 
     def free_radix_cache_to_get_enough_token(self, need_token_num):
         assert self.mem_manager is not None
-        if need_token_num > self.mem_manager.can_use_mem_size:
-            need_evict_token_num = need_token_num - self.mem_manager.can_use_mem_size
+        # 按页分配 kv cache 时，被淘汰的 token 所在的页中可能还有其他正在使用的 token, 一次淘汰后空闲的
+        # token 数量不一定足够，需要继续淘汰，直到足够或者树中没有可以淘汰的 token
+        while need_token_num > self.mem_manager.can_use_mem_size:
+            unrefed_tokens_num = self.get_tree_total_tokens_num() - self.get_refed_tokens_num()
+            if unrefed_tokens_num <= 0:
+                break
+            need_evict_token_num = min(need_token_num - self.mem_manager.can_use_mem_size, unrefed_tokens_num)
             release_mems = []
 
             def release_mem(mem_index):
@@ -352,6 +642,12 @@ class _RadixCacheReadOnlyClient:
         self.tree_total_tokens_num = SharedArray(
             f"{unique_name}_tree_total_tokens_num_{rank_in_node}", (1,), dtype=np.int64
         )
+        self.host_hit_tokens_num = SharedArray(
+            f"{unique_name}_host_hit_tokens_num_{rank_in_node}", (1,), dtype=np.int64
+        )
+        self.host_evict_tokens_num = SharedArray(
+            f"{unique_name}_host_evict_tokens_num_{rank_in_node}", (1,), dtype=np.int64
+        )
 
     def get_refed_tokens_num(self):
         return self.refed_tokens_num.arr[0]
@@ -362,6 +658,12 @@ class _RadixCacheReadOnlyClient:
     def get_unrefed_tokens_num(self):
         return self.tree_total_tokens_num.arr[0] - self.refed_tokens_num.arr[0]
 
+    def get_host_hit_tokens_num(self):
+        return self.host_hit_tokens_num.arr[0]
+
+    def get_host_evict_tokens_num(self):
+        return self.host_evict_tokens_num.arr[0]
+
 
 class RadixCacheReadOnlyClient:
     def __init__(self, unique_name, total_token_num, node_world_size, dp_world_size):
@@ -378,3 +680,9 @@ class RadixCacheReadOnlyClient:
 
     def get_unrefed_tokens_num(self, dp_rank_in_node):
         return self.dp_rank_clients[dp_rank_in_node].get_unrefed_tokens_num()
+
+    def get_host_hit_tokens_num(self, dp_rank_in_node):
+        return self.dp_rank_clients[dp_rank_in_node].get_host_hit_tokens_num()
+
+    def get_host_evict_tokens_num(self, dp_rank_in_node):
+        return self.dp_rank_clients[dp_rank_in_node].get_host_evict_tokens_num()
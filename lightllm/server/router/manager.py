@@ -22,10 +22,11 @@ from .model_infer.model_rpc import start_model_process, ModelRpcClient
 from .req_queue import build_req_queue
 from lightllm.utils.infer_utils import calculate_time
 from lightllm.server.core.objs.io_objs import GroupReqIndexes
-from lightllm.server.core.objs import ShmReqManager
+from lightllm.server.core.objs import ShmReqManager, RpcSyncBarrier
+from lightllm.server.core.objs.shm_ready_list import ShmReadyList, get_detoken_ready_list_name
 from .dynamic_prompt.radix_cache import RadixCacheReadOnlyClient
 from .stats import Stats
-from .pause_strategy import Fcfs, select_paused_reqs
+from .pause_strategy import build_pause_strategy, select_paused_reqs
 from lightllm.utils.log_utils import init_logger, log_time_ready
 from lightllm.server.router.token_load import TokenLoad
 from lightllm.server.metrics.manager import MetricClient
@@ -61,6 +62,9 @@ class RouterManager:
         self.read_only_statics_mem_manager = ReadOnlyStaticsMemoryManager()
         # 初始化 radix_cache_client 用于读取 prompt cache 的管理信息
         self.radix_cache_client = None
+        # 记录上次上报监控时 host kv cache 的命中和淘汰 token 数量，用于计算增量
+        self.last_host_hit_tokens = [0 for _ in range(self.dp_size_in_node)]
+        self.last_host_evict_tokens = [0 for _ in range(self.dp_size_in_node)]
 
         self.spec_step = args.spec_step
 
@@ -73,7 +77,7 @@ class RouterManager:
             self.shared_token_load.set_logical_max_load(0.0, dp_index)
             self.shared_token_load.set_dynamic_max_load(0.0, dp_index)
 
-        self.pause_strategy = Fcfs()
+        self.pause_strategy = build_pause_strategy(args)
         self.running_batch: Batch = None
         self.eos_id = args.eos_id
         self.has_wait_tokens = 0
@@ -84,6 +88,10 @@ class RouterManager:
 
         self.send_to_detokenization = context.socket(zmq.PUSH)
         self.send_to_detokenization.connect(f"{args.zmq_mode}127.0.0.1:{detokenization_port}")
+        # 通过共享内存标记有新输出的请求，代替每个推理步发送给 detokenization 的 None 消息
+        self.detoken_ready_list = ShmReadyList(
+            get_detoken_ready_list_name(get_unique_server_name()), args.running_max_req_size
+        )
 
         if self.is_multinode_tp:
             self.mulitnode_group = dist.init_process_group(
@@ -125,6 +133,7 @@ class RouterManager:
 
         assert (self.world_size % self.nnodes) == 0
         node_world_size = self.world_size // self.nnodes
+        self.rpc_sync_barrier = RpcSyncBarrier(node_world_size)
         for rank_id in range(self.node_rank * node_world_size, (self.node_rank + 1) * node_world_size):
             rpc_model = await start_model_process(
                 args=self.args,
@@ -133,6 +142,7 @@ class RouterManager:
                 node_world_size=node_world_size,
                 rpc_event=self.rpc_event,
                 rpc_finished_event=self.rpc_finished_event,
+                rpc_sync_barrier=self.rpc_sync_barrier,
                 info_queue=self.info_queue,
                 mem_queue=self.mem_queues[(rank_id % node_world_size)],
                 router_lock=self.router_lock,
@@ -166,10 +176,15 @@ class RouterManager:
             "return_all_prompt_logprobs": self.args.return_all_prompt_logprobs,
             "use_reward_model": self.args.use_reward_model,
             "disable_dynamic_prompt_cache": self.args.disable_dynamic_prompt_cache,
+            "host_kv_cache_token_num": self.args.host_kv_cache_token_num,
+            "kv_swap_host_token_num": self.args.kv_swap_host_token_num,
+            "prefix_summary_block_size": self.args.prefix_affinity_block_size if self.args.prefix_affinity_route else 0,
+            "kv_page_size": self.args.kv_page_size,
             "data_type": self.args.data_type,
             "eos_id": self.eos_id,
             "diverse_mode": self.args.diverse_mode,
             "graph_max_batch_size": self.args.graph_max_batch_size,
+            "graph_batch_buckets": self.args.graph_batch_buckets,
             "graph_max_len_in_batch": self.args.graph_max_len_in_batch,
             "disable_cudagraph": self.args.disable_cudagraph,
             "mem_fraction": self.args.mem_fraction,
@@ -180,6 +195,8 @@ class RouterManager:
             "spec_algo": self.args.spec_algo,
             "spec_weight_dir": self.args.spec_model_dir,
             "spec_step": self.args.spec_step,
+            "spec_ngram_min_n": self.args.spec_ngram_min_n,
+            "spec_ngram_max_n": self.args.spec_ngram_max_n,
         }
 
         await self.model_rpc_client.init_model(kvargs=kvargs)
@@ -258,6 +275,7 @@ class RouterManager:
                         self.metric_client.gauge_set(
                             "lightllm_batch_pause_size", self.req_queue.get_paused_req_num(d_i)
                         )
+                        self._report_host_cache_metrics(d_i)
                 # pd decode mode need to update token_load more frequently
                 self.req_queue.update_token_load(self.running_batch, force_update=self.is_pd_decode_mode)
                 self.stats_tool.print_stats()
@@ -288,6 +306,23 @@ class RouterManager:
             if self.running_batch is None:
                 await asyncio.sleep(0.01)  # 10ms
 
+    def _report_host_cache_metrics(self, dp_index):
+        if self.args.disable_dynamic_prompt_cache or self.args.host_kv_cache_token_num <= 0:
+            return
+        hit_tokens = int(self.radix_cache_client.get_host_hit_tokens_num(dp_index))
+        evict_tokens = int(self.radix_cache_client.get_host_evict_tokens_num(dp_index))
+        if hit_tokens > self.last_host_hit_tokens[dp_index]:
+            self.metric_client.counter_inc(
+                "lightllm_cache_host_hit_tokens", value=hit_tokens - self.last_host_hit_tokens[dp_index]
+            )
+        if evict_tokens > self.last_host_evict_tokens[dp_index]:
+            self.metric_client.counter_inc(
+                "lightllm_cache_host_evict_tokens", value=evict_tokens - self.last_host_evict_tokens[dp_index]
+            )
+        self.last_host_hit_tokens[dp_index] = hit_tokens
+        self.last_host_evict_tokens[dp_index] = evict_tokens
+        return
+
     async def get_schedule_result(self, running_batch: Batch):
         if self.schedule_task is None:
 
@@ -387,10 +422,8 @@ class RouterManager:
         reqs = [r.to_router_rpc_obj() for r in batch.reqs]
         self.overlap_event.set()
         await self.model_rpc_client.prefill(reqs)
+        self._notify_detokenization(batch)
         batch.filter_out_finished_req(self.shm_req_manager)
-        # 发spec_step + 1 个 None包触发一下detokenization
-        for _ in range(self.spec_step + 1):
-            self.send_to_detokenization.send_pyobj(None, protocol=pickle.HIGHEST_PROTOCOL)
 
         logger.debug(f"Prefill Batch: {batch.simple_log()} \n")
         self.metric_client.histogram_observe(
@@ -405,15 +438,20 @@ class RouterManager:
         await self.model_rpc_client.decode()
         # 在 self.is_multinode_and_multidp 为 True 时，传入的 batch 对象可能为 None。
         if batch is not None:
+            self._notify_detokenization(batch)
             batch.filter_out_finished_req(self.shm_req_manager)
-        # 发spec_step + 1 个 None包触发一下detokenization
-        for _ in range(self.spec_step + 1):
-            self.send_to_detokenization.send_pyobj(None, protocol=pickle.HIGHEST_PROTOCOL)
         self.metric_client.histogram_observe(
             "lightllm_batch_inference_duration_bucket", time.time() - start_time, "decode"
         )
         return
 
+    def _notify_detokenization(self, batch: Batch):
+        # 标记 batch 中的请求有新的输出(包括已经结束的请求)，detokenization 进程会一次处理完请求所有新的 token,
+        # 所以投机解码一次输出多个 token 时也只需要通知一次
+        self.detoken_ready_list.mark_ready([req.index_in_shm_mem for req in batch.reqs])
+        self.detoken_ready_list.notify(self.send_to_detokenization)
+        return
+
     async def _pause_reqs(self, pasue_reqs):
         pasue_req_ids = [r.request_id for r in pasue_reqs]
         await self.model_rpc_client.pause_reqs(pasue_req_ids)
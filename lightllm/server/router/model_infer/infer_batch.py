@@ -4,7 +4,6 @@ import time
 import torch
 import torch.distributed as dist
 import numpy as np
-import collections
 
 from dataclasses import dataclass, field
 from typing import List, Dict, Tuple, Optional, Union, Any
@@ -12,11 +11,13 @@ from lightllm.common.req_manager import ReqManager
 from lightllm.utils.infer_utils import mark_start, mark_end
 from lightllm.server.core.objs import Req, SamplingParams, FinishStatus, ShmReqManager
 from lightllm.server.router.dynamic_prompt.radix_cache import RadixCache, TreeNode
+from lightllm.server.router.model_infer.kv_swap_manager import KvSwapManager
 from lightllm.utils.log_utils import init_logger
 from lightllm.server.req_id_generator import convert_sub_id_to_group_id
 from lightllm.common.basemodel.infer_lock import g_infer_state_lock
 from lightllm.server.multimodal_params import MultimodalParams
 from lightllm.utils.custom_kernel_utis import custom_cat
+from lightllm.utils.stop_sequence_utils import AhoCorasickMatcher, get_stop_sequence_matcher
 
 logger = init_logger(__name__)
 
@@ -30,21 +31,31 @@ class InferenceContext:
     group_mapping = None  # 只有进行多输出模式下才有真的使用
     infer_req_ids = None
     vocab_size = None
+    kv_swap_manager: KvSwapManager = None  # 暂停请求的 kv 换出到 host 的管理对象，为 None 时暂停的请求恢复时重新计算
 
     overlap_stream: torch.cuda.Stream = None  # 一些情况下推理进程进行异步折叠操作的异步流对象。
 
     def register(
-        self, req_manager: ReqManager, radix_cache: RadixCache, shm_req_manager: ShmReqManager, vocab_size: int
+        self,
+        req_manager: ReqManager,
+        radix_cache: RadixCache,
+        shm_req_manager: ShmReqManager,
+        vocab_size: int,
+        kv_swap_manager: KvSwapManager = None,
     ):
         self.req_manager = req_manager
         self.radix_cache = radix_cache
         self.shm_req_manager = shm_req_manager
+        self.kv_swap_manager = kv_swap_manager
 
         self.requests_mapping = {}
         self.group_mapping: Dict[int, InferReqGroup] = {}
         self.infer_req_ids = []
 
         self.vocab_size = vocab_size
+        # 模型初始化时已经在估计 kv cache 容量之前创建，这里只处理没有预先创建的情况
+        if self.req_manager.req_sampling_params_manager is None:
+            self.req_manager.init_req_sampling_params_manager(vocab_size)
         return
 
     def get_overlap_stream(self) -> torch.cuda.Stream:
@@ -140,6 +151,9 @@ class InferenceContext:
                 self.free_a_req_mem(free_token_index, req, is_group_finished)
             else:
                 self.free_a_req_mem(free_token_index, req, True)
+            if self.kv_swap_manager is not None:
+                # 暂停期间被中止的请求，释放其换出到 host 的 kv
+                self.kv_swap_manager.drop(req.req_id)
             free_req_index.append(req.req_idx)
             # logger.info(f"infer release req id {req.shm_req.request_id}")
             req.shm_req.shm_infer_released = True
@@ -176,7 +190,8 @@ class InferenceContext:
 
             if req.initialized:
                 # 不支持多输出的情况的暂停
-                self.free_a_req_mem(free_token_index, req, is_group_finished=True)
+                if not self._swap_out_req_mem(free_token_index, req):
+                    self.free_a_req_mem(free_token_index, req, is_group_finished=True)
                 req.cur_kv_len = 0
                 req.shm_req.shm_cur_kv_len = req.cur_kv_len
                 req.paused = True  # 暂停信息标记。
@@ -189,6 +204,24 @@ class InferenceContext:
 
         return self
 
+    def _swap_out_req_mem(self, free_token_index: List, req: "InferReq") -> bool:
+        """
+        根据代价模型决定是否将请求私有的 kv 换出到 host, 换出后 gpu 上的 token 加入 free_token_index 中释放，
+        radix cache 共享的前缀只减少引用计数。返回 False 时由调用者按照重新计算的方式释放。
+        """
+        if self.kv_swap_manager is None:
+            return False
+        start = 0 if req.shared_kv_node is None else req.shared_kv_node.node_prefix_total_len
+        if not self.kv_swap_manager.should_swap(start, req.cur_kv_len):
+            return False
+        token_index = self.req_manager.req_to_token_indexs[req.req_idx][start : req.cur_kv_len]
+        self.kv_swap_manager.swap_out(req.req_id, token_index, start)
+        free_token_index.append(token_index)
+        if req.shared_kv_node is not None:
+            self.radix_cache.dec_node_ref_counter(req.shared_kv_node)
+            req.shared_kv_node = None
+        return True
+
 
 g_infer_context = InferenceContext()
 
@@ -265,12 +298,13 @@ class InferReq:
             self.shm_req.link_prompt_ids_shm_array()
             self.shm_req.link_logprobs_shm_array()
             self.sampling_param: InferSamplingParams = InferSamplingParams(self.shm_req, self.vocab_size)
-            if self.sampling_param.shm_param.input_penalty:
-                self.out_token_id_count = collections.Counter(self.shm_req.get_prompt_ids())
-            else:
-                self.out_token_id_count = collections.defaultdict(int)
-
             self.stop_sequences = self.sampling_param.shm_param.stop_sequences.to_list()
+            # 停止序列相同的请求共享编译好的自动机，每个请求只保存自动机的状态和已经输入的输出 token 数量
+            self.stop_matcher: AhoCorasickMatcher = None
+            if self.stop_sequences:
+                self.stop_matcher = get_stop_sequence_matcher(tuple(tuple(e) for e in self.stop_sequences))
+            self.stop_matcher_state = AhoCorasickMatcher.ROOT_STATE
+            self.stop_matcher_fed_len = 0
             # token healing mode 才被使用的管理对象
             if self.shm_req.prefix_token_ids.size != 0:
                 self.prefix_token_ids = self.shm_req.prefix_token_ids.get_token_ids()
@@ -297,12 +331,36 @@ class InferReq:
                     self.cur_kv_len = int(ready_cache_len)  # 序列化问题, 该对象可能为numpy.int64，用 int(*)转换
                     self.shm_req.prompt_cache_len = self.cur_kv_len  # 记录 prompt cache 的命中长度
 
+            if self.paused and g_infer_context.kv_swap_manager is not None:
+                self._swap_in_kv()
+
             self.shm_req.shm_cur_kv_len = self.cur_kv_len
 
         self.initialized = True
         self.paused = False
         return
 
+    def _swap_in_kv(self):
+        # 调用者已经持有 g_infer_state_lock
+        swap_in_len = g_infer_context.kv_swap_manager.get_swap_in_len(self.req_id, self.cur_kv_len)
+        if swap_in_len == 0:
+            return
+        req_manager = g_infer_context.req_manager
+        if g_infer_context.radix_cache is not None:
+            g_infer_context.radix_cache.free_radix_cache_to_get_enough_token(
+                req_manager.get_alloc_need_token_num([self.req_idx], [swap_in_len])
+            )
+        mem_indexes = req_manager.alloc_token_for_reqs([self.req_idx], [swap_in_len])
+        if mem_indexes is None:
+            # 按页分配时空闲页不足，放弃换入，剩余的部分退化为重新计算
+            g_infer_context.kv_swap_manager.drop(self.req_id)
+            return
+        mem_indexes = mem_indexes.cuda()
+        g_infer_context.kv_swap_manager.swap_in(self.req_id, mem_indexes, self.cur_kv_len)
+        req_manager.req_to_token_indexs[self.req_idx, self.cur_kv_len : self.cur_kv_len + swap_in_len] = mem_indexes
+        self.cur_kv_len += swap_in_len
+        return
+
     def is_uninitialized(self):
         return not self.initialized or self.paused
 
@@ -345,7 +403,7 @@ class InferReq:
         return self.shm_req.shm_prompt_ids.arr[self.shm_req.input_len + self.cur_output_len - 1]
 
     def update_finish_status(self, eos_ids):
-        if self._stop_sequences_matched():
+        if self._stop_sequences_matched() or self.shm_req.router_stop_str_matched:
             self.finish_status.set_status(FinishStatus.FINISHED_STOP)
         elif (
             self.cur_output_len > 0
@@ -361,16 +419,17 @@ class InferReq:
         return self.finish_status.is_finished() or self.shm_req.router_aborted
 
     def _stop_sequences_matched(self):
-        for stop_token_ids in self.stop_sequences:
-            stop_len = len(stop_token_ids)
-            output_len = self.cur_output_len
-            if stop_len > 0:
-                if output_len >= stop_len:
-                    input_token_ids = self.shm_req.shm_prompt_ids.arr[
-                        0 : (self.shm_req.input_len + self.cur_output_len)
-                    ]
-                    if all(input_token_ids[i] == stop_token_ids[i] for i in range(-1, -(stop_len + 1), -1)):
-                        return True
+        if self.stop_matcher is None:
+            return False
+        # 只把上一次检查之后新输出的 token 输入自动机, 一般每一步只有一个
+        if self.cur_output_len > self.stop_matcher_fed_len:
+            start = self.shm_req.input_len + self.stop_matcher_fed_len
+            end = self.shm_req.input_len + self.cur_output_len
+            self.stop_matcher_state, match_index = self.stop_matcher.feed(
+                self.stop_matcher_state, self.shm_req.shm_prompt_ids.arr[start:end].tolist()
+            )
+            self.stop_matcher_fed_len = self.cur_output_len
+            return match_index != -1
         return False
 
 
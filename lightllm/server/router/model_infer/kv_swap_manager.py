@@ -0,0 +1,121 @@
+import os
+import torch
+from dataclasses import dataclass
+from typing import Dict
+from lightllm.server.router.dynamic_prompt.host_kv_cache import HostKvCache
+from lightllm.utils.log_utils import init_logger
+
+logger = init_logger(__name__)
+
+
+class KvSwapCostModel:
+    """
+    估计暂停请求的 kv 换出到 host 并在恢复时换入的耗时，与恢复时重新 prefill 这些 token 的耗时，
+    选择代价更小的方式。
+    swap: 换出和换入各经过一次 pcie, 耗时为 2 * token_num * token_bytes / 带宽 + 两次拷贝的固定开销。
+    recompute: token_num / prefill 吞吐, 并按照平均上下文长度增加 attention 的开销，上下文长度为
+    attn_balance_len 时 attention 的耗时与其余部分相当。
+    短请求的固定开销占比大，倾向于重新计算；长请求重新计算的 attention 开销大，倾向于换出。
+    """
+
+    def __init__(
+        self,
+        token_bytes: int,
+        pcie_gbps: float = None,
+        prefill_tokens_per_second: float = None,
+        attn_balance_len: int = 8192,
+        copy_overhead_us: float = 50.0,
+    ):
+        self.token_bytes = token_bytes
+        if pcie_gbps is None:
+            pcie_gbps = float(os.getenv("LIGHTLLM_KV_SWAP_PCIE_GBPS", 16.0))
+        if prefill_tokens_per_second is None:
+            prefill_tokens_per_second = float(os.getenv("LIGHTLLM_KV_SWAP_PREFILL_TOKENS_PER_SECOND", 10000.0))
+        self.pcie_bytes_per_second = pcie_gbps * 1e9
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.attn_balance_len = attn_balance_len
+        self.copy_overhead_us = copy_overhead_us
+
+    def get_swap_cost_us(self, start: int, end: int) -> float:
+        token_num = end - start
+        return 2 * token_num * self.token_bytes / self.pcie_bytes_per_second * 1e6 + 2 * self.copy_overhead_us
+
+    def get_recompute_cost_us(self, start: int, end: int) -> float:
+        token_num = end - start
+        avg_context_len = (start + end) / 2
+        return token_num / self.prefill_tokens_per_second * 1e6 * (1 + avg_context_len / self.attn_balance_len)
+
+    def should_swap(self, start: int, end: int) -> bool:
+        if end <= start:
+            return False
+        return self.get_swap_cost_us(start, end) < self.get_recompute_cost_us(start, end)
+
+
+@dataclass
+class KvSwapRecord:
+    start: int  # 换出的 kv 在请求中的起始位置，之前的部分为 radix cache 共享的前缀
+    end: int
+    host_index: torch.Tensor
+
+
+class KvSwapManager:
+    """
+    被暂停请求私有的 kv (不被 radix cache 共享的部分) 的换出管理。换出时将 kv 从 mem_manager 的 kv buffer
+    复制到 pin memory 的 HostKvCache 缓存池中，并在 swap_table 中按照请求 id 记录位置，gpu 上的 token
+    随后可以被释放。恢复时根据 radix cache 重新匹配到的长度，为剩余的部分分配新的 token 并拷贝回去，
+    匹配长度比换出的起始位置短时无法拼接，记录被丢弃，请求退化为重新计算。
+    """
+
+    def __init__(self, host_token_num: int, mem_manager, cost_model: KvSwapCostModel = None):
+        self.host_cache = HostKvCache(host_token_num, mem_manager)
+        self.token_bytes = self.host_cache.token_bytes
+        self.cost_model = KvSwapCostModel(self.token_bytes) if cost_model is None else cost_model
+        self.swap_table: Dict[int, KvSwapRecord] = {}
+        logger.info(f"kv swap host token num {host_token_num} token bytes {self.token_bytes}")
+
+    def should_swap(self, start: int, end: int) -> bool:
+        if end - start > self.host_cache.can_use_mem_size:
+            return False
+        return self.cost_model.should_swap(start, end)
+
+    def swap_out(self, req_id: int, token_index: torch.Tensor, start: int):
+        """
+        将请求 [start, start + len(token_index)) 位置的 kv 复制到 host，返回后 token_index 可以被释放。
+        """
+        assert req_id not in self.swap_table
+        host_index = self.host_cache.offload(token_index.long())
+        self.swap_table[req_id] = KvSwapRecord(start=start, end=start + len(token_index), host_index=host_index)
+        return
+
+    def get_swap_in_len(self, req_id: int, cur_kv_len: int) -> int:
+        """
+        请求恢复时已经具有 cur_kv_len 长度的 kv, 返回可以从 host 换入的 token 数量，无法换入时丢弃记录并返回 0。
+        """
+        record = self.swap_table.get(req_id, None)
+        if record is None:
+            return 0
+        if not (record.start <= cur_kv_len < record.end):
+            self.drop(req_id)
+            return 0
+        return record.end - cur_kv_len
+
+    def swap_in(self, req_id: int, token_index: torch.Tensor, cur_kv_len: int):
+        """
+        将 [cur_kv_len, end) 位置的 kv 拷贝到新分配的 token_index 中，并释放该请求在 host 上的全部空间。
+        """
+        record = self.swap_table.pop(req_id)
+        offset = cur_kv_len - record.start
+        assert len(token_index) == record.end - cur_kv_len
+        if offset > 0:
+            self.host_cache.free(record.host_index[0:offset])
+        self.host_cache.load(record.host_index[offset:], token_index.long())
+        return
+
+    def drop(self, req_id: int):
+        record = self.swap_table.pop(req_id, None)
+        if record is not None:
+            self.host_cache.free(record.host_index)
+        return
+
+    def get_swapped_token_num(self) -> int:
+        return self.host_cache.size - self.host_cache.can_use_mem_size
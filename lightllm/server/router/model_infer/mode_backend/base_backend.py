@@ -12,6 +12,7 @@ from lightllm.utils.infer_utils import calculate_time, mark_start, mark_end
 from lightllm.utils.log_utils import init_logger
 from lightllm.models import get_model
 from lightllm.server.router.dynamic_prompt.radix_cache import RadixCache
+from lightllm.server.router.model_infer.kv_swap_manager import KvSwapManager
 from lightllm.server.router.model_infer.infer_batch import InferReq, InferSamplingParams
 from lightllm.server.router.token_load import TokenLoad
 from lightllm.common.basemodel.infer_lock import g_infer_state_lock, InferStateLock
@@ -104,6 +105,7 @@ class ModeBackend:
             "disable_chunked_prefill": self.disable_chunked_prefill,
             "data_type": kvargs.get("data_type", "float16"),
             "graph_max_batch_size": kvargs.get("graph_max_batch_size", 16),
+            "graph_batch_buckets": kvargs.get("graph_batch_buckets", None),
             "graph_max_len_in_batch": kvargs.get("graph_max_len_in_batch", 8196),
             "disable_cudagraph": kvargs.get("disable_cudagraph", False),
             "mem_fraction": kvargs.get("mem_fraction", 0.9),
@@ -114,6 +116,8 @@ class ModeBackend:
             "run_mode": self.run_mode,
         }
         self.model, self.is_multimodal = get_model(model_cfg, model_kvargs)
+        if kvargs.get("kv_page_size", 0) > 0:
+            self.model.mem_manager.enable_page_alloc(kvargs["kv_page_size"])
         set_random_seed(2147483647)
         self.radix_cache = (
             RadixCache(
@@ -121,6 +125,8 @@ class ModeBackend:
                 self.model.mem_manager.size,
                 self.rank_in_node,
                 mem_manager=self.model.mem_manager,
+                host_cache_token_num=kvargs.get("host_kv_cache_token_num", 0),
+                prefix_summary_block_size=kvargs.get("prefix_summary_block_size", 0),
             )
             if self.use_dynamic_prompt_cache
             else None
@@ -130,12 +136,19 @@ class ModeBackend:
             assert self.use_dynamic_prompt_cache
             self.preload_prompt_cache_kv_buffer(model_cfg)
 
+        self.kv_swap_manager = (
+            KvSwapManager(kvargs["kv_swap_host_token_num"], self.model.mem_manager)
+            if kvargs.get("kv_swap_host_token_num", 0) > 0
+            else None
+        )
+
         self.logger.info(f"loaded model class {self.model.__class__}")
         g_infer_context.register(
             req_manager=self.model.req_manager,
             radix_cache=self.radix_cache,
             shm_req_manager=self.shm_req_manager,
             vocab_size=self.model.vocab_size,
+            kv_swap_manager=self.kv_swap_manager,
         )
 
         self.init_custom()
@@ -283,7 +296,6 @@ class ModeBackend:
             req_obj.set_next_gen_token_id(next_token_id, next_token_logprob)
             req_obj.cur_output_len += 1
 
-            req_obj.out_token_id_count[next_token_id] += 1
             req_obj.update_finish_status(self.eos_id)
 
             if extra_post_req_handle_func is not None:
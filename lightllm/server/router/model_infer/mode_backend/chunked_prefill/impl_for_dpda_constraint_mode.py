@@ -0,0 +1,162 @@
+import torch
+from typing import List
+
+from .impl import ChunkedPrefillBackend
+from lightllm.server.router.model_infer.mode_backend.generic_pre_process import (
+    prepare_prefill_inputs,
+    prepare_decode_inputs,
+)
+from lightllm.utils.infer_utils import calculate_time
+from lightllm.server.router.model_infer.mode_backend.generic_post_process import sample
+from lightllm.server.router.model_infer.mode_backend.grammar_utils import get_grammar_cache, TokenBitmaskBuilder
+from lightllm.common.dpda import DpdaMatcher, build_token_table, get_token_bytes, get_default_cache_dir
+from lightllm.server.core.objs import FinishStatus
+from lightllm.server.router.model_infer.infer_batch import g_infer_context, InferReq
+from lightllm.server.tokenizer import get_tokenizer
+from lightllm.utils.log_utils import init_logger
+
+logger = init_logger(__name__)
+
+
+class DpdaConstraintBackend(ChunkedPrefillBackend):
+    """
+    使用 lightllm.common.dpda 中 lr(1) 下推自动机实现的约束输出，不依赖第三方库。guided_grammar 为内置文法的名字，
+    guided_json 的请求使用 json 文法约束输出为合法的 json object / array, 对内容有限制的 schema 在参数检查时
+    (check_dpda_json_schema) 就会被拒绝。
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+
+    def init_custom(self):
+        self.tokenizer = get_tokenizer(
+            self.args.model_dir, self.args.tokenizer_mode, trust_remote_code=self.args.trust_remote_code
+        )
+        self.token_bytes = get_token_bytes(self.tokenizer)
+        self.grammar_cache = get_grammar_cache(self.args.grammar_cache_size)
+        # 提前构建 json 文法的转移表，第一次构建后会缓存在磁盘上
+        self._get_token_table("json")
+        # 词表大小以 logits 的宽度为准，在第一次使用时创建
+        self.bitmask_builder: TokenBitmaskBuilder = None
+        logger.info(f"eos_ids {self.eos_id}")
+        return
+
+    def _get_token_table(self, grammar_name: str):
+        return self.grammar_cache.get_or_compile(
+            "dpda", grammar_name, lambda name: build_token_table(name, self.token_bytes, get_default_cache_dir())
+        )
+
+    @calculate_time(show=False, min_cost_ms=300)
+    def decode(self):
+
+        uninit_reqs, aborted_reqs, ok_finished_reqs, prefill_reqs, decode_reqs = self._get_classed_reqs(
+            g_infer_context.infer_req_ids
+        )
+
+        if aborted_reqs:
+            g_infer_context.filter_reqs(aborted_reqs)
+
+        # 先 decode
+        if decode_reqs:
+            model_input, run_reqs = prepare_decode_inputs(decode_reqs)
+            logits = self.model.forward(model_input).logits
+            self._overlap_req_init_and_filter(
+                uninit_reqs=uninit_reqs, ok_finished_reqs=ok_finished_reqs, clear_list=True
+            )
+
+            self._init_req_dpda_matchers(run_reqs=run_reqs)
+            all_has_no_constraint = all([not e.sampling_param.has_constraint_setting() for e in run_reqs])
+            if not all_has_no_constraint:
+                self._mask_logits(run_reqs, logits)
+
+            logits[logits == float("-inf")] = -1000000.0
+
+            next_token_ids, next_token_probs = sample(logits, run_reqs, self.eos_id)
+            next_token_ids = next_token_ids.detach().cpu().numpy()
+            next_token_logprobs = torch.log(next_token_probs).detach().cpu().numpy()
+            self._post_handle(
+                run_reqs,
+                next_token_ids,
+                next_token_logprobs,
+                is_chuncked_mode=False,
+                do_filter_finished_reqs=False,
+                extra_post_req_handle_func=self._update_dpda_fsm,
+            )
+            logits = None
+
+        # 再 prefill
+        if len(decode_reqs) == 0 or (self.forward_step % self.max_wait_step == 0) or (self.need_prefill_count > 0):
+            if prefill_reqs:
+                self.need_prefill_count -= 1
+                model_input, run_reqs = prepare_prefill_inputs(
+                    prefill_reqs, is_chuncked_mode=True, is_multimodal=self.is_multimodal
+                )
+                logits = self.model.forward(model_input).logits
+                self._overlap_req_init_and_filter(
+                    uninit_reqs=uninit_reqs, ok_finished_reqs=ok_finished_reqs, clear_list=True
+                )
+
+                self._init_req_dpda_matchers(run_reqs=run_reqs)
+                self._mask_logits(run_reqs, logits)
+
+                # fix the logics with -inf to a large negative value
+                logits[logits == float("-inf")] = -1000000.0
+
+                next_token_ids, next_token_probs = sample(logits, run_reqs, self.eos_id)
+                next_token_ids = next_token_ids.detach().cpu().numpy()
+                next_token_logprobs = torch.log(next_token_probs).detach().cpu().numpy()
+                self._post_handle(
+                    run_reqs,
+                    next_token_ids,
+                    next_token_logprobs,
+                    is_chuncked_mode=True,
+                    do_filter_finished_reqs=False,
+                    extra_post_req_handle_func=self._update_dpda_fsm,
+                )
+                logits = None
+
+        self._overlap_req_init_and_filter(uninit_reqs=uninit_reqs, ok_finished_reqs=ok_finished_reqs, clear_list=True)
+        self.forward_step += 1
+        return
+
+    def _update_dpda_fsm(self, req_obj: InferReq, next_token_id, next_token_logprob):
+        if not hasattr(req_obj.sampling_param, "dpda_matcher"):
+            return
+
+        next_token_id = int(next_token_id)
+        if next_token_id in self.eos_id:
+            return
+        matcher: DpdaMatcher = req_obj.sampling_param.dpda_matcher
+        assert matcher.accept_token(next_token_id)
+        if matcher.is_terminated():
+            req_obj.finish_status.set_status(FinishStatus.FINISHED_STOP)
+        return
+
+    def _mask_logits(self, run_reqs: List[InferReq], logits: torch.Tensor):
+        if self.bitmask_builder is None or self.bitmask_builder.vocab_size != logits.shape[-1]:
+            self.bitmask_builder = TokenBitmaskBuilder(logits.shape[-1])
+        # 每个有约束的请求拷贝栈顶状态预计算的位图，再加上依赖栈内容的 token 和可以结束时的 eos
+        self.bitmask_builder.reset(len(run_reqs))
+        for i, run_obj in enumerate(run_reqs):
+            if run_obj.get_chuncked_input_token_len() == run_obj.get_cur_total_len():
+                sample_params = run_obj.sampling_param
+                if hasattr(sample_params, "dpda_matcher"):
+                    matcher: DpdaMatcher = sample_params.dpda_matcher
+                    words, extra_token_ids = matcher.get_next_token_bitmask()
+                    if matcher.can_end():
+                        extra_token_ids.extend(self.eos_id)
+                    self.bitmask_builder.set_allowed_bitmask(i, words, extra_token_ids)
+        self.bitmask_builder.apply(logits)
+        return
+
+    def _init_req_dpda_matchers(self, run_reqs: List[InferReq]):
+        for i, run_obj in enumerate(run_reqs):
+            run_obj: InferReq = run_obj
+            sample_params = run_obj.sampling_param
+            if hasattr(sample_params, "dpda_matcher"):
+                continue
+            if sample_params.guided_grammar is not None:
+                sample_params.dpda_matcher = DpdaMatcher(self._get_token_table(sample_params.guided_grammar))
+            elif sample_params.guided_json is not None:
+                sample_params.dpda_matcher = DpdaMatcher(self._get_token_table("json"))
+        return
@@ -9,6 +9,7 @@ from lightllm.server.router.model_infer.mode_backend.generic_pre_process import
     prepare_decode_inputs,
 )
 from lightllm.server.router.model_infer.mode_backend.generic_post_process import sample
+from lightllm.server.router.model_infer.mode_backend.grammar_utils import get_grammar_cache, TokenBitmaskBuilder
 from lightllm.server.tokenizer import get_tokenizer
 from typing import List, Tuple
 from lightllm.utils.log_utils import init_logger
@@ -42,6 +43,9 @@ class OutlinesConstraintBackend(ChunkedPrefillBackend):
         # 添加多eos_id 的逻辑
         self.tokenizer.eos_token_ids = eos_token_ids
         logger.info(f"eos_ids {self.tokenizer.eos_token_ids}")
+        self.grammar_cache = get_grammar_cache(self.args.grammar_cache_size)
+        # 词表大小以 logits 的宽度为准，在第一次使用时创建
+        self.bitmask_builder: TokenBitmaskBuilder = None
         return
 
     def decode(self):
@@ -54,8 +58,8 @@ class OutlinesConstraintBackend(ChunkedPrefillBackend):
 
         # 先 decode
         if decode_reqs:
-            kwargs, run_reqs = prepare_decode_inputs(decode_reqs)
-            logits = self.model.forward(**kwargs)
+            model_input, run_reqs = prepare_decode_inputs(decode_reqs)
+            logits = self.model.forward(model_input).logits
             self._overlap_req_init_and_filter(
                 uninit_reqs=uninit_reqs, ok_finished_reqs=ok_finished_reqs, clear_list=True
             )
@@ -63,10 +67,7 @@ class OutlinesConstraintBackend(ChunkedPrefillBackend):
             self._init_guide_infos(run_reqs)
             all_has_no_constraint = all([not e.sampling_param.has_constraint_setting() for e in run_reqs])
             if not all_has_no_constraint:
-                mask = torch.ones_like(logits, dtype=torch.bool)
-                for i, run_obj in enumerate(run_reqs):
-                    self._mask_req_out_token(i, run_obj, mask)
-                logits[mask] = -1000000.0
+                self._mask_logits(run_reqs, logits)
 
             next_token_ids, next_token_probs = sample(logits, run_reqs, self.eos_id)
             next_token_ids = next_token_ids.detach().cpu().numpy()
@@ -85,20 +86,16 @@ class OutlinesConstraintBackend(ChunkedPrefillBackend):
         if len(decode_reqs) == 0 or (self.forward_step % self.max_wait_step == 0) or (self.need_prefill_count > 0):
             if prefill_reqs:
                 self.need_prefill_count -= 1
-                kwargs, run_reqs = prepare_prefill_inputs(
+                model_input, run_reqs = prepare_prefill_inputs(
                     prefill_reqs, is_chuncked_mode=True, is_multimodal=self.is_multimodal
                 )
-                logits = self.model.forward(**kwargs)
+                logits = self.model.forward(model_input).logits
                 self._overlap_req_init_and_filter(
                     uninit_reqs=uninit_reqs, ok_finished_reqs=ok_finished_reqs, clear_list=True
                 )
                 # 对于不能满足前缀匹配的logic位置，将其logics设置为一个较大负值，将其概率掩盖为 0
                 self._init_guide_infos(run_reqs)
-                mask = torch.ones_like(logits, dtype=torch.bool)
-                for i, run_obj in enumerate(run_reqs):
-                    self._mask_req_out_token(i, run_obj, mask)
-
-                logits[mask] = -1000000.0
+                self._mask_logits(run_reqs, logits)
 
                 next_token_ids, next_token_probs = sample(logits, run_reqs, self.eos_id)
                 next_token_ids = next_token_ids.detach().cpu().numpy()
@@ -127,23 +124,28 @@ class OutlinesConstraintBackend(ChunkedPrefillBackend):
                 req_obj.finish_status.set_status(FinishStatus.FINISHED_STOP)
         return
 
-    def _mask_req_out_token(self, i, run_obj: InferReq, mask):
+    def _mask_logits(self, run_reqs: List[InferReq], logits: torch.Tensor):
+        if self.bitmask_builder is None or self.bitmask_builder.vocab_size != logits.shape[-1]:
+            self.bitmask_builder = TokenBitmaskBuilder(logits.shape[-1])
+        self.bitmask_builder.reset(len(run_reqs))
+        for i, run_obj in enumerate(run_reqs):
+            self._set_req_allowed_tokens(i, run_obj)
+        self.bitmask_builder.apply(logits)
+        return
+
+    def _set_req_allowed_tokens(self, i, run_obj: InferReq):
         from outlines.fsm.guide import RegexGuide
 
+        # 没有到达输出阶段或者没有约束的请求保持全部允许
         if run_obj.get_chuncked_input_token_len() == run_obj.get_cur_total_len():
             # this run_obj is ready to gen next token.
             sample_params = run_obj.sampling_param
             if sample_params.regular_constraint is not None:
                 regex_guide: RegexGuide = sample_params.regex_guide
                 ok_token_id_list = regex_guide.get_next_instruction(sample_params.fsm_current_state).tokens
-                mask[i, ok_token_id_list] = False
+                self.bitmask_builder.set_allowed_token_ids(i, ok_token_id_list)
             elif sample_params.allowed_token_ids is not None:
-                mask[i, sample_params.allowed_token_ids] = False
-            else:
-                mask[i, :] = False
-        else:
-            # no constraint
-            mask[i, :] = False
+                self.bitmask_builder.set_allowed_token_ids(i, sample_params.allowed_token_ids)
         return
 
     def _init_guide_infos(self, run_reqs: List[InferReq]):
@@ -154,4 +156,8 @@ class OutlinesConstraintBackend(ChunkedPrefillBackend):
             sample_params = run_obj.sampling_param
             if sample_params.regular_constraint is not None:
                 if not hasattr(sample_params, "regex_guide"):
-                    sample_params.regex_guide = RegexGuide.from_regex(sample_params.regular_constraint, self.tokenizer)
+                    sample_params.regex_guide = self.grammar_cache.get_or_compile(
+                        "regex",
+                        sample_params.regular_constraint,
+                        lambda regex: RegexGuide.from_regex(regex, self.tokenizer),
+                    )
@@ -8,6 +8,7 @@ from lightllm.server.router.model_infer.mode_backend.generic_pre_process import
 )
 from lightllm.utils.infer_utils import calculate_time
 from lightllm.server.router.model_infer.mode_backend.generic_post_process import sample
+from lightllm.server.router.model_infer.mode_backend.grammar_utils import get_grammar_cache, TokenBitmaskBuilder
 from lightllm.server.core.objs import FinishStatus
 from lightllm.server.router.model_infer.infer_batch import g_infer_context, InferReq
 from lightllm.server.tokenizer import get_tokenizer
@@ -29,7 +30,9 @@ class XgrammarBackend(ChunkedPrefillBackend):
 
         tokenizer_info = xgr.TokenizerInfo.from_huggingface(self.tokenizer)
         self.xgrammar_compiler = xgr.GrammarCompiler(tokenizer_info, max_threads=8)
-        self.xgrammar_token_bitmask = xgr.allocate_token_bitmask(1, tokenizer_info.vocab_size)
+        self.grammar_cache = get_grammar_cache(self.args.grammar_cache_size)
+        # 与 xgr.allocate_token_bitmask 的格式相同，整个 batch 共用一个位图
+        self.bitmask_builder = TokenBitmaskBuilder(tokenizer_info.vocab_size)
 
         eos_token_ids = []
         eos_token_ids.append(self.tokenizer.eos_token_id)
@@ -48,8 +51,8 @@ class XgrammarBackend(ChunkedPrefillBackend):
 
         # 先 decode
         if decode_reqs:
-            kwargs, run_reqs = prepare_decode_inputs(decode_reqs)
-            logits = self.model.forward(**kwargs)
+            model_input, run_reqs = prepare_decode_inputs(decode_reqs)
+            logits = self.model.forward(model_input).logits
             self._overlap_req_init_and_filter(
                 uninit_reqs=uninit_reqs, ok_finished_reqs=ok_finished_reqs, clear_list=True
             )
@@ -57,8 +60,7 @@ class XgrammarBackend(ChunkedPrefillBackend):
             self._init_req_xgrammer_matcher_infos(run_reqs=run_reqs)
             all_has_no_constraint = all([not e.sampling_param.has_constraint_setting() for e in run_reqs])
             if not all_has_no_constraint:
-                for i, run_obj in enumerate(run_reqs):
-                    self._mask_req_out_token(i, run_obj, logits[i])
+                self._mask_logits(run_reqs, logits)
 
             logits[logits == float("-inf")] = -1000000.0
 
@@ -79,17 +81,16 @@ class XgrammarBackend(ChunkedPrefillBackend):
         if len(decode_reqs) == 0 or (self.forward_step % self.max_wait_step == 0) or (self.need_prefill_count > 0):
             if prefill_reqs:
                 self.need_prefill_count -= 1
-                kwargs, run_reqs = prepare_prefill_inputs(
+                model_input, run_reqs = prepare_prefill_inputs(
                     prefill_reqs, is_chuncked_mode=True, is_multimodal=self.is_multimodal
                 )
-                logits = self.model.forward(**kwargs)
+                logits = self.model.forward(model_input).logits
                 self._overlap_req_init_and_filter(
                     uninit_reqs=uninit_reqs, ok_finished_reqs=ok_finished_reqs, clear_list=True
                 )
 
                 self._init_req_xgrammer_matcher_infos(run_reqs=run_reqs)
-                for i, run_obj in enumerate(run_reqs):
-                    self._mask_req_out_token(i, run_obj, logits[i])
+                self._mask_logits(run_reqs, logits)
 
                 # fix the logics with -inf to a large negative value
                 logits[logits == float("-inf")] = -1000000.0
@@ -123,14 +124,17 @@ class XgrammarBackend(ChunkedPrefillBackend):
             req_obj.finish_status.set_status(FinishStatus.FINISHED_STOP)
         return
 
-    def _mask_req_out_token(self, i, run_obj: InferReq, logits):
+    def _mask_logits(self, run_reqs: List[InferReq], logits: torch.Tensor):
         import xgrammar as xgr
 
-        if run_obj.get_chuncked_input_token_len() == run_obj.get_cur_total_len():
-            sample_params = run_obj.sampling_param
-            if sample_params.guided_grammar is not None or sample_params.guided_json is not None:
-                sample_params.xgrammar_matcher.fill_next_token_bitmask(self.xgrammar_token_bitmask)
-                xgr.apply_token_bitmask_inplace(logits, self.xgrammar_token_bitmask.to(logits.device))
+        # 每个有约束的请求填充位图中自己的一行，没有约束的行保持全部允许，最后一次性应用到整个 batch 上
+        bitmask = self.bitmask_builder.reset(len(run_reqs))
+        for i, run_obj in enumerate(run_reqs):
+            if run_obj.get_chuncked_input_token_len() == run_obj.get_cur_total_len():
+                sample_params = run_obj.sampling_param
+                if sample_params.guided_grammar is not None or sample_params.guided_json is not None:
+                    sample_params.xgrammar_matcher.fill_next_token_bitmask(bitmask, i)
+        xgr.apply_token_bitmask_inplace(logits, bitmask.to(logits.device, non_blocking=True))
         return
 
     def _init_req_xgrammer_matcher_infos(self, run_reqs: List[InferReq]):
@@ -141,10 +145,14 @@ class XgrammarBackend(ChunkedPrefillBackend):
             sample_params = run_obj.sampling_param
             if sample_params.guided_grammar is not None:
                 if not hasattr(sample_params, "xgrammar_matcher"):
-                    xgrammar_compiled_grammar = self.xgrammar_compiler.compile_grammar(sample_params.guided_grammar)
+                    xgrammar_compiled_grammar = self.grammar_cache.get_or_compile(
+                        "ebnf", sample_params.guided_grammar, self.xgrammar_compiler.compile_grammar
+                    )
                     sample_params.xgrammar_matcher = xgr.GrammarMatcher(xgrammar_compiled_grammar)
             elif sample_params.guided_json is not None:
                 if not hasattr(sample_params, "xgrammar_matcher"):
-                    xgrammar_compiled_grammar = self.xgrammar_compiler.compile_json_schema(sample_params.guided_json)
+                    xgrammar_compiled_grammar = self.grammar_cache.get_or_compile(
+                        "json", sample_params.guided_json, self.xgrammar_compiler.compile_json_schema
+                    )
                     sample_params.xgrammar_matcher = xgr.GrammarMatcher(xgrammar_compiled_grammar)
         return
@@ -54,6 +54,7 @@ class ContinuesBatchWithMTPBackend(ModeBackend):
                 "disable_chunked_prefill": self.disable_chunked_prefill,
                 "data_type": kvargs.get("data_type", "float16"),
                 "graph_max_batch_size": kvargs.get("graph_max_batch_size", 16),
+                "graph_batch_buckets": kvargs.get("graph_batch_buckets", None),
                 "graph_max_len_in_batch": kvargs.get("graph_max_len_in_batch", 8196),
                 "disable_cudagraph": kvargs.get("disable_cudagraph", False),
                 "mem_fraction": kvargs["mem_fraction"],
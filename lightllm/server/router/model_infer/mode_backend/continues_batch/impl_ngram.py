@@ -0,0 +1,133 @@
+import torch
+import numpy as np
+from typing import List, Tuple
+from lightllm.server.router.model_infer.mode_backend.base_backend import ModeBackend
+from lightllm.utils.log_utils import init_logger
+from lightllm.server.router.model_infer.infer_batch import g_infer_context, InferReq
+from lightllm.server.router.model_infer.mode_backend.generic_pre_process import prepare_prefill_inputs
+from lightllm.server.router.model_infer.mode_backend.mtp_pre_process import (
+    prepare_draft_main_model_decode_inputs,
+    IS_NONE,
+)
+from lightllm.server.router.model_infer.mode_backend.ngram_proposer import NgramProposer, get_accepted_len
+from lightllm.server.router.model_infer.mode_backend.generic_post_process import sample
+from lightllm.common.basemodel.infer_lock import g_infer_state_lock
+
+logger = init_logger(__name__)
+
+
+class ContinuesBatchWithNgramBackend(ModeBackend):
+    """
+    使用 n-gram 匹配(prompt lookup)生成候选 token 的投机解码，不需要草稿模型，适用于所有模型。
+    decode 时每个请求输入上一个生成的 token 和 spec_step 个候选 token, 校验方式和 MTP 模式相同。
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+
+    def init_model(self, kvargs):
+        super().init_model(kvargs)
+        self.spec_step = kvargs.get("spec_step", 1)
+        self.spec_stride = self.spec_step + 1
+        self.proposer = NgramProposer(
+            self.spec_step, min_n=kvargs.get("spec_ngram_min_n", 1), max_n=kvargs.get("spec_ngram_max_n", 4)
+        )
+        max_req_num = kvargs.get("max_req_num", 1000)
+        self.draft_token_id_map = np.full((max_req_num, self.spec_step), fill_value=IS_NONE, dtype=np.int64)
+
+    def prefill(self, reqs: List[Tuple]):
+        self._init_reqs(reqs, init_req_obj=False)
+        return
+
+    def decode(self):
+        uninit_reqs, aborted_reqs, ok_finished_reqs, prefill_reqs, decode_reqs = self._get_classed_reqs(
+            g_infer_context.infer_req_ids
+        )
+
+        for req in aborted_reqs + ok_finished_reqs:
+            self.proposer.remove(req.req_idx)
+
+        if aborted_reqs:
+            g_infer_context.filter_reqs(aborted_reqs)
+
+        if prefill_reqs:
+            model_input, run_reqs = prepare_prefill_inputs(
+                prefill_reqs, is_chuncked_mode=False, is_multimodal=self.is_multimodal
+            )
+            model_output = self.model.forward(model_input)
+
+            self._overlap_req_init_and_filter(
+                uninit_reqs=uninit_reqs, ok_finished_reqs=ok_finished_reqs, clear_list=True
+            )
+
+            next_token_ids, next_token_probs = sample(model_output.logits, run_reqs, self.eos_id)
+            next_token_ids = next_token_ids.detach().cpu().numpy()
+            next_token_logprobs = torch.log(next_token_probs).detach().cpu().numpy()
+
+            self._post_handle(
+                run_reqs, next_token_ids, next_token_logprobs, is_chuncked_mode=False, do_filter_finished_reqs=False
+            )
+
+        if decode_reqs:
+            for req in decode_reqs:
+                self.draft_token_id_map[req.req_idx, :] = self.proposer.propose(
+                    req.req_idx, req.req_id, req.get_input_token_ids()
+                )
+            model_input, run_reqs, mem_indexes_cpu = prepare_draft_main_model_decode_inputs(
+                decode_reqs, self.draft_token_id_map
+            )
+            model_output = self.model.forward(model_input)
+            assert model_output.logits.shape[0] == len(decode_reqs) * self.spec_stride
+
+            self._overlap_req_init_and_filter(
+                uninit_reqs=uninit_reqs, ok_finished_reqs=ok_finished_reqs, clear_list=True
+            )
+
+            next_token_ids, next_token_probs = sample(model_output.logits, run_reqs, self.eos_id)
+            next_token_ids = next_token_ids.detach().cpu().numpy()
+            next_token_logprobs = torch.log(next_token_probs).detach().cpu().numpy()
+
+            # verify
+            start_kv_lens = [req.cur_kv_len for req in decode_reqs]
+            accepted_reqs, accepted_index = self.verify(next_token_ids, decode_reqs)
+            self._post_handle(
+                accepted_reqs,
+                next_token_ids[accepted_index],
+                next_token_logprobs[accepted_index],
+                is_chuncked_mode=False,
+                do_filter_finished_reqs=False,
+            )
+
+            need_free_mem_indexes = self._get_unused_mem_indexes(decode_reqs, start_kv_lens, mem_indexes_cpu)
+            if need_free_mem_indexes:
+                g_infer_state_lock.acquire()
+                g_infer_context.req_manager.mem_manager.free(need_free_mem_indexes)
+                g_infer_state_lock.release()
+
+        self._overlap_req_init_and_filter(uninit_reqs=uninit_reqs, ok_finished_reqs=ok_finished_reqs, clear_list=True)
+        return
+
+    def verify(self, next_token_ids, decode_reqs: List[InferReq]):
+        accepted_reqs = []
+        accepted_index = []
+        for i, req in enumerate(decode_reqs):
+            start = i * self.spec_stride
+            accepted_len = get_accepted_len(
+                self.draft_token_id_map[req.req_idx], next_token_ids[start : start + self.spec_step]
+            )
+            accepted_reqs.extend([req] * (accepted_len + 1))
+            accepted_index.extend(range(start, start + accepted_len + 1))
+            req.cur_accepted_len = accepted_len
+            if self.is_master_in_dp:
+                req.set_total_accepted_len()
+            req.cur_accepted_len = 0
+        return accepted_reqs, accepted_index
+
+    def _get_unused_mem_indexes(self, decode_reqs: List[InferReq], start_kv_lens: List[int], mem_indexes_cpu):
+        # 被拒绝的候选 token 以及请求结束后多接受的 token 占用的 kv 位置需要释放
+        need_free_mem_indexes = []
+        for i, req in enumerate(decode_reqs):
+            used_num = req.cur_kv_len - start_kv_lens[i]
+            start = i * self.spec_stride
+            need_free_mem_indexes.extend(mem_indexes_cpu[start + used_num : start + self.spec_stride].tolist())
+        return need_free_mem_indexes
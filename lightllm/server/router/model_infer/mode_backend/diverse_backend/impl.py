@@ -72,6 +72,8 @@ class DiversehBackend(ModeBackend):
             kwargs, group_run_reqs = prepare_prefill_inputs(
                 group_reqs, is_chuncked_mode=True, is_multimodal=self.is_multimodal
             )
+            # 按页分配 kv cache 时，空闲页不足可能只运行了排在前面的部分请求
+            groups = groups[0 : len(group_run_reqs)]
             logits = self.model.forward(**kwargs)
 
             uninit_req_ids = [req.req_id for req in uninit_reqs]
@@ -1,44 +1,35 @@
 import torch
 from typing import List
-from lightllm.common.basemodel.triton_kernel.apply_penalty import apply_penalty
+from lightllm.common.basemodel.triton_kernel.apply_penalty_gpu_cache import apply_penalty_gpu_cache
+from lightllm.common.req_manager import ReqSamplingParamsManager
 from dataclasses import dataclass
 from lightllm.server.router.model_infer.infer_batch import InferReq, g_infer_context
 from lightllm.utils.envs_utils import get_env_start_args
 
 
 def sample(logits, reqs, eos_id: List[int] = [2]):
-    (
-        presence_penalties,
-        frequency_penalties,
-        repetition_penalties,
-        exponential_decay_length_penalties,
-        temperatures,
-        top_ps,
-        top_ks,
-        p_token_ids,
-        p_token_counts,
-        p_cumsum_seq_len,
-        length_penalty_idx,
-        mask_eos_reqs,
-    ) = _get_post_sample_tensors(reqs)
+    # 采样参数和 token 计数按照 req_idx 保存在 ReqSamplingParamsManager 中，这里只需要同步新生成的 token
+    sampling_params_manager: ReqSamplingParamsManager = g_infer_context.req_manager.req_sampling_params_manager
+    b_req_idx = sampling_params_manager.prepare_sample_reqs(reqs)
 
     eos_ids = torch.tensor(eos_id, dtype=torch.int32, device="cpu", pin_memory=True).cuda(non_blocking=True)
 
     logits = logits.contiguous()
 
-    apply_penalty(
+    apply_penalty_gpu_cache(
         logits,
-        presence_penalties,
-        frequency_penalties,
-        repetition_penalties,
-        p_token_ids,
-        p_token_counts,
-        p_cumsum_seq_len,
-        exponential_decay_length_penalties,
-        length_penalty_idx,
+        b_req_idx,
+        sampling_params_manager.req_to_presence_penalty,
+        sampling_params_manager.req_to_frequency_penalty,
+        sampling_params_manager.req_to_repetition_penalty,
+        sampling_params_manager.req_to_exponential_decay_length_penalty,
+        sampling_params_manager.req_to_exponential_decay_start,
+        sampling_params_manager.req_to_min_new_tokens,
+        sampling_params_manager.req_to_out_token_len,
+        sampling_params_manager.req_to_out_token_id_counter,
         eos_ids,
-        mask_eos_reqs,
     )
+    temperatures, top_ps, top_ks = sampling_params_manager.get_sample_params(b_req_idx)
 
     logits.div_(temperatures.view((-1, 1)))
     probs = torch.softmax(logits, dim=-1)
@@ -79,70 +70,3 @@ def _top_p_top_k(probs: torch.Tensor, top_ps: torch.Tensor, top_ks: torch.Tensor
     probs_sort[torch.arange(0, probs.shape[-1], device="cuda").view(1, -1) >= top_ks.view(-1, 1)] = 0.0
 
     return probs_sort, probs_idx
-
-
-def _get_post_sample_tensors(reqs: List[InferReq]):
-    presence_penalties: List[float] = []
-    frequency_penalties: List[float] = []
-    repetition_penalties: List[float] = []
-    exponential_decay_length_penalties: List[float] = []
-    temperatures: List[float] = []
-    top_ps: List[float] = []
-    top_ks: List[int] = []
-    p_token_ids: List[int] = []
-    p_token_counts: List[int] = []
-    p_seq_len: List[int] = [
-        0,
-    ]
-    length_penalty_idx: List[int] = []
-    mask_eos_reqs: List[bool] = []
-    for i, req_obj in enumerate(reqs):
-        id_to_count = req_obj.out_token_id_count
-        sample_param = req_obj.sampling_param
-        presence_penalties.append(sample_param.shm_param.presence_penalty)
-        frequency_penalties.append(sample_param.shm_param.frequency_penalty)
-        repetition_penalties.append(sample_param.shm_param.repetition_penalty)
-        exponential_decay_length_penalty = sample_param.shm_param.exponential_decay_length_penalty.to_tuple()
-        exponential_decay_length_penalties.append(exponential_decay_length_penalty[1])
-        out_token_len = req_obj.get_cur_total_len() - req_obj.shm_req.input_len
-        length_penalty_idx.append(max(out_token_len - exponential_decay_length_penalty[0], 0))
-        mask_eos_reqs.append(out_token_len < sample_param.shm_param.min_new_tokens - 1)
-
-        temperatures.append(sample_param.shm_param.temperature)
-        top_ps.append(sample_param.shm_param.top_p)
-        top_ks.append(sample_param.shm_param.top_k)
-
-        p_token_ids.extend(list(id_to_count.keys()))
-        p_token_counts.extend(list(id_to_count.values()))
-        p_seq_len.append(len(id_to_count))
-
-    presence_penalties_cpu = torch.tensor(presence_penalties, dtype=torch.float, device="cpu", pin_memory=True)
-    frequency_penalties_cpu = torch.tensor(frequency_penalties, dtype=torch.float, device="cpu", pin_memory=True)
-    repetition_penalties_cpu = torch.tensor(repetition_penalties, dtype=torch.float, device="cpu", pin_memory=True)
-    exponential_decay_length_penalties_cpu = torch.tensor(
-        exponential_decay_length_penalties, dtype=torch.float, device="cpu", pin_memory=True
-    )
-    temperatures_cpu = torch.tensor(temperatures, dtype=torch.float, device="cpu", pin_memory=True)
-    top_ps_cpu = torch.tensor(top_ps, dtype=torch.float, device="cpu", pin_memory=True)
-    top_ks_cpu = torch.tensor(top_ks, dtype=torch.int32, device="cpu", pin_memory=True)
-    p_token_ids_cpu = torch.tensor(p_token_ids, dtype=torch.int32, device="cpu", pin_memory=True)
-    p_token_counts_cpu = torch.tensor(p_token_counts, dtype=torch.int32, device="cpu", pin_memory=True)
-    p_seq_len_cpu = torch.tensor(p_seq_len, dtype=torch.int32, device="cpu", pin_memory=True)
-    length_penalty_idx_cpu = torch.tensor(length_penalty_idx, dtype=torch.int32, device="cpu", pin_memory=True)
-    mask_eos_reqs_cpu = torch.tensor(mask_eos_reqs, dtype=torch.bool, device="cpu", pin_memory=True)
-    p_cumsum_seq_len_cpu = torch.cumsum(p_seq_len_cpu, dim=0, dtype=torch.int32).pin_memory()
-
-    return (
-        presence_penalties_cpu.cuda(non_blocking=True),
-        frequency_penalties_cpu.cuda(non_blocking=True),
-        repetition_penalties_cpu.cuda(non_blocking=True),
-        exponential_decay_length_penalties_cpu.cuda(non_blocking=True),
-        temperatures_cpu.cuda(non_blocking=True),
-        top_ps_cpu.cuda(non_blocking=True),
-        top_ks_cpu.cuda(non_blocking=True),
-        p_token_ids_cpu.cuda(non_blocking=True),
-        p_token_counts_cpu.cuda(non_blocking=True),
-        p_cumsum_seq_len_cpu.cuda(non_blocking=True),
-        length_penalty_idx_cpu.cuda(non_blocking=True),
-        mask_eos_reqs_cpu.cuda(non_blocking=True),
-    )
@@ -4,17 +4,19 @@ from typing import List
 from lightllm.server.router.model_infer.infer_batch import InferReq, g_infer_context
 from lightllm.common.basemodel.infer_lock import g_infer_state_lock
 from lightllm.common.basemodel.batch_objs import ModelInput
+from lightllm.utils.log_utils import init_logger
+
+logger = init_logger(__name__)
 
 
 def prepare_prefill_inputs(req_objs: List[InferReq], is_chuncked_mode: bool, is_multimodal=False):
     run_reqs = []
-    nopad_total_token_num = 0
-    nopad_max_len_in_batch = 0
     input_ids = []
     nopad_b_req_idx = []
     nopad_b_seq_len = []
     batch_multimodal_params = []
     b_ready_cache_len = []
+    need_token_sizes = []
     for req in req_objs:
 
         run_reqs.append(req)
@@ -33,24 +35,31 @@ def prepare_prefill_inputs(req_objs: List[InferReq], is_chuncked_mode: bool, is_
 
         nopad_b_seq_len.append(seq_len)
         input_ids.append(input_id)
-        nopad_total_token_num += seq_len
-        nopad_max_len_in_batch = max(nopad_max_len_in_batch, input_token_len)
+        need_token_sizes.append(input_token_len)
         b_ready_cache_len.append(req.cur_kv_len)
 
-    input_ids = np.concatenate(input_ids, dtype=np.int64)
+    # dynamic prompt cache 准备 token
+    g_infer_state_lock.acquire()
+    mem_indexes, run_req_num = _alloc_token_for_reqs(nopad_b_req_idx, need_token_sizes)
+    g_infer_state_lock.release()
+    mem_indexes = mem_indexes.cuda()
+
+    run_reqs = run_reqs[0:run_req_num]
+    batch_multimodal_params = batch_multimodal_params[0:run_req_num]
+    nopad_b_req_idx = nopad_b_req_idx[0:run_req_num]
+    nopad_b_seq_len = nopad_b_seq_len[0:run_req_num]
+    b_ready_cache_len = b_ready_cache_len[0:run_req_num]
+    input_ids = input_ids[0:run_req_num]
+    nopad_total_token_num = sum(nopad_b_seq_len)
+    nopad_max_len_in_batch = max(need_token_sizes[0:run_req_num], default=0)
 
+    input_ids = np.concatenate(input_ids, dtype=np.int64)
     input_ids = torch.tensor(input_ids, dtype=torch.int64, device="cuda")
+
     nopad_b_req_idx = torch.tensor(nopad_b_req_idx, dtype=torch.int32, device="cuda")
     nopad_b_seq_len = torch.tensor(nopad_b_seq_len, dtype=torch.int32, device="cuda")
     b_ready_cache_len = torch.tensor(b_ready_cache_len, dtype=torch.int32, device="cuda")
 
-    # dynamic prompt cache 准备 token
-    g_infer_state_lock.acquire()
-    if g_infer_context.radix_cache is not None:
-        g_infer_context.radix_cache.free_radix_cache_to_get_enough_token(input_ids.shape[0])
-    mem_indexes = g_infer_context.req_manager.mem_manager.alloc(input_ids.shape[0]).cuda()
-    g_infer_state_lock.release()
-
     model_input = ModelInput(
         batch_size=len(run_reqs),
         total_token_num=nopad_total_token_num,
@@ -70,8 +79,6 @@ def prepare_prefill_inputs(req_objs: List[InferReq], is_chuncked_mode: bool, is_
 
 def prepare_decode_inputs(req_objs: List[InferReq]):
     run_reqs = []
-    nopad_total_token_num = 0
-    nopad_max_len_in_batch = 0
     input_ids = []
     nopad_b_req_idx = []
     nopad_b_seq_len = []
@@ -83,19 +90,23 @@ def prepare_decode_inputs(req_objs: List[InferReq]):
         assert req.cur_kv_len == seq_len - 1
         nopad_b_seq_len.append(seq_len)
         input_ids.append(input_id)
-        nopad_total_token_num += seq_len
-        nopad_max_len_in_batch = max(nopad_max_len_in_batch, seq_len)
-
-    input_ids = torch.tensor(input_ids, dtype=torch.int64, device="cuda")
-    nopad_b_req_idx = torch.tensor(nopad_b_req_idx, dtype=torch.int32, device="cuda")
-    nopad_b_seq_len = torch.tensor(nopad_b_seq_len, dtype=torch.int32, device="cuda")
 
+    need_token_sizes = [1] * len(run_reqs)
     # dynamic prompt cache 准备 token
     g_infer_state_lock.acquire()
-    if g_infer_context.radix_cache is not None:
-        g_infer_context.radix_cache.free_radix_cache_to_get_enough_token(input_ids.shape[0])
-    mem_indexes = g_infer_context.req_manager.mem_manager.alloc(input_ids.shape[0]).cuda()
+    mem_indexes, run_req_num = _alloc_token_for_reqs(nopad_b_req_idx, need_token_sizes)
     g_infer_state_lock.release()
+    mem_indexes = mem_indexes.cuda()
+
+    run_reqs = run_reqs[0:run_req_num]
+    nopad_b_req_idx = nopad_b_req_idx[0:run_req_num]
+    nopad_b_seq_len = nopad_b_seq_len[0:run_req_num]
+    nopad_total_token_num = sum(nopad_b_seq_len)
+    nopad_max_len_in_batch = max(nopad_b_seq_len, default=0)
+    input_ids = torch.tensor(input_ids[0:run_req_num], dtype=torch.int64, device="cuda")
+
+    nopad_b_req_idx = torch.tensor(nopad_b_req_idx, dtype=torch.int32, device="cuda")
+    nopad_b_seq_len = torch.tensor(nopad_b_seq_len, dtype=torch.int32, device="cuda")
 
     model_input = ModelInput(
         batch_size=len(run_reqs),
@@ -108,3 +119,22 @@ def prepare_decode_inputs(req_objs: List[InferReq]):
         is_prefill=False,
     )
     return model_input, run_reqs
+
+
+def _alloc_token_for_reqs(req_idxs: List[int], need_token_sizes: List[int]):
+    """
+    调用者需要持有 g_infer_state_lock。按页分配时，页的取整和页内碎片可能使淘汰 radix cache 后的空闲页仍然
+    不足以满足全部请求，此时只为排在前面能够分配成功的请求分配 token，其余请求留到之后的步骤中再运行。
+    返回分配的 token index 和能够运行的请求数量。
+    """
+    req_manager = g_infer_context.req_manager
+    if g_infer_context.radix_cache is not None:
+        g_infer_context.radix_cache.free_radix_cache_to_get_enough_token(
+            req_manager.get_alloc_need_token_num(req_idxs, need_token_sizes)
+        )
+    run_req_num = req_manager.get_alloc_fit_req_num(req_idxs, need_token_sizes)
+    assert run_req_num > 0 or len(req_idxs) == 0, "no enough kv cache token to run any req"
+    if run_req_num < len(req_idxs):
+        logger.warning(f"no enough kv cache pages, run {run_req_num} of {len(req_idxs)} reqs in this step")
+    mem_indexes = req_manager.alloc_token_for_reqs(req_idxs[0:run_req_num], need_token_sizes[0:run_req_num])
+    return mem_indexes, run_req_num
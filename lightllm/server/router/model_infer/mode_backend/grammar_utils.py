@@ -0,0 +1,128 @@
+import hashlib
+import threading
+import collections
+import numpy as np
+import torch
+from typing import Any, Callable, List, Optional
+from lightllm.utils.log_utils import init_logger
+
+logger = init_logger(__name__)
+
+
+class GrammarCache:
+    """
+    进程内已编译的约束对象(outlines 的 RegexGuide, xgrammar 的 CompiledGrammar 等)的 lru 缓存，key 为约束类型
+    和约束文本(正则，json schema, ebnf 语法)的哈希值。这些对象本身不保存解码状态，可以被多个请求共享，重复使用
+    少量 schema 的 json 模式请求命中缓存时不需要再次编译。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.cache = collections.OrderedDict()
+        self.hit_count = 0
+        self.miss_count = 0
+
+    @staticmethod
+    def get_key(kind: str, text: str) -> str:
+        return kind + ":" + hashlib.md5(text.encode("utf-8")).hexdigest()
+
+    def get_or_compile(self, kind: str, text: str, compile_func: Callable[[str], Any]):
+        key = self.get_key(kind, text)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hit_count += 1
+                return self.cache[key]
+            self.miss_count += 1
+
+        compiled = compile_func(text)
+        if self.capacity <= 0:
+            return compiled
+
+        with self.lock:
+            self.cache[key] = compiled
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.capacity:
+                self.cache.popitem(last=False)
+        return compiled
+
+
+g_grammar_cache: Optional[GrammarCache] = None
+
+
+def get_grammar_cache(capacity: int = 256) -> GrammarCache:
+    global g_grammar_cache
+    if g_grammar_cache is None:
+        g_grammar_cache = GrammarCache(capacity)
+    return g_grammar_cache
+
+
+class TokenBitmaskBuilder:
+    """
+    将一个 batch 中每一行允许输出的 token 打包成 [batch, ceil(vocab_size / 32)] 的 int32 位图(与 xgrammar 的格式相同)，
+    第 i 个 token 对应第 i // 32 个字的第 i % 32 位，置 1 表示允许。位图在 cpu 上构建，每行的设置是一次 numpy
+    操作，构建完成后拷贝到 gpu 上用一次操作应用到整个 batch 的 logits 上。没有约束的行保持全 1。
+    """
+
+    def __init__(self, vocab_size: int):
+        self.vocab_size = vocab_size
+        self.word_num = (vocab_size + 31) // 32
+        self.bitmask: torch.Tensor = None
+        self.batch_size = 0
+
+    def reset(self, batch_size: int) -> torch.Tensor:
+        if self.bitmask is None or self.bitmask.shape[0] < batch_size:
+            self.bitmask = torch.empty(
+                (batch_size, self.word_num), dtype=torch.int32, pin_memory=torch.cuda.is_available()
+            )
+        self.batch_size = batch_size
+        self.bitmask[0:batch_size].fill_(-1)
+        return self.bitmask[0:batch_size]
+
+    def set_allowed_token_ids(self, row: int, token_ids: List[int]):
+        row_words = self.bitmask[row].numpy().view(np.uint32)
+        row_words[:] = 0
+        self._add_token_ids(row_words, token_ids)
+        return
+
+    def set_allowed_bitmask(self, row: int, words: np.ndarray, extra_token_ids: Optional[List[int]] = None):
+        """
+        使用预先计算好的 uint32 位图设置一行，位图比当前词表短的部分不允许，extra_token_ids 为额外允许的 token。
+        """
+        row_words = self.bitmask[row].numpy().view(np.uint32)
+        word_num = min(len(row_words), len(words))
+        row_words[0:word_num] = words[0:word_num]
+        row_words[word_num:] = 0
+        if extra_token_ids:
+            self._add_token_ids(row_words, extra_token_ids)
+        return
+
+    def _add_token_ids(self, row_words: np.ndarray, token_ids: List[int]):
+        token_ids = np.asarray(token_ids, dtype=np.int64)
+        token_ids = token_ids[token_ids < self.vocab_size]
+        if token_ids.size == 0:
+            return
+        np.bitwise_or.at(row_words, token_ids >> 5, np.left_shift(1, token_ids & 31).astype(np.uint32))
+        return
+
+    def apply(self, logits: torch.Tensor, fill_value: float = -1000000.0):
+        bitmask = self.bitmask[0 : self.batch_size].to(logits.device, non_blocking=True)
+        apply_token_bitmask(logits, bitmask, fill_value, vocab_size=self.vocab_size)
+        return
+
+
+def apply_token_bitmask(
+    logits: torch.Tensor, bitmask: torch.Tensor, fill_value: float = -1000000.0, vocab_size: Optional[int] = None
+):
+    """
+    将 [batch, word_num] 的 int32 位图解包为 [batch, vocab] 的 bool 掩码，把不允许的位置的 logits 设置为 fill_value。
+    只处理前 vocab_size 列，词表 padding 部分的 logits 列保持不变，vocab_size 为 None 时使用位图覆盖的列数。
+    """
+    shifts = torch.arange(32, dtype=torch.int32, device=bitmask.device)
+    allowed = ((bitmask.unsqueeze(-1) >> shifts) & 1).bool().view(bitmask.shape[0], -1)
+    if vocab_size is None:
+        vocab_size = allowed.shape[-1]
+    vocab_size = min(logits.shape[-1], allowed.shape[-1], vocab_size)
+    logits[:, 0:vocab_size].masked_fill_(~allowed[:, 0:vocab_size], fill_value)
+    return
@@ -0,0 +1,88 @@
+from typing import Dict, List, Sequence, Tuple
+
+
+class NgramIndex:
+    """
+    单个请求的 n-gram 索引，key 为长度在 [min_n, max_n] 之间的 n-gram, value 为该 n-gram 最近一次出现时
+    其后续 token 的起始位置。只有后续 token 已经存在时才会把 n-gram 加入索引，所以查询当前序列的后缀时
+    不会匹配到后缀自身。每追加一个 token 只需要更新 max_n - min_n + 1 个 key。
+    """
+
+    def __init__(self, min_n: int, max_n: int):
+        assert 1 <= min_n <= max_n
+        self.min_n = min_n
+        self.max_n = max_n
+        self.token_ids: List[int] = []
+        self.table: Dict[Tuple[int, ...], int] = {}
+
+    def __len__(self):
+        return len(self.token_ids)
+
+    def extend(self, token_ids: Sequence[int]):
+        for token_id in token_ids:
+            end = len(self.token_ids)
+            # 以 end 为后续起始位置的 n-gram 现在可以加入索引
+            for n in range(self.min_n, min(self.max_n, end) + 1):
+                self.table[tuple(self.token_ids[end - n : end])] = end
+            self.token_ids.append(int(token_id))
+        return
+
+    def propose(self, k: int) -> List[int]:
+        """
+        优先使用最长的后缀进行匹配，返回最多 k 个候选 token, 没有匹配时返回空列表。
+        """
+        token_num = len(self.token_ids)
+        for n in range(min(self.max_n, token_num), self.min_n - 1, -1):
+            start = self.table.get(tuple(self.token_ids[token_num - n : token_num]))
+            if start is not None:
+                return self.token_ids[start : start + k]
+        return []
+
+
+class NgramProposer:
+    """
+    不需要草稿模型的投机解码候选生成器(prompt lookup decoding)，在每个请求的 prompt 和已经生成的 token 上
+    建立 n-gram 索引，用当前序列的后缀查找之前出现过的相同片段，将其后续的 spec_step 个 token 作为候选。
+    适用于 RAG、代码编辑等输出大量复制输入内容的场景。索引按照 req_idx 保存，req_idx 被新的请求复用时重建。
+    """
+
+    def __init__(self, spec_step: int, min_n: int = 1, max_n: int = 4):
+        self.spec_step = spec_step
+        self.min_n = min_n
+        self.max_n = max_n
+        # req_idx -> (req_id, NgramIndex)
+        self.indexes: Dict[int, Tuple[int, NgramIndex]] = {}
+
+    def propose(self, req_idx: int, req_id: int, token_ids: Sequence[int]) -> List[int]:
+        """
+        token_ids 为请求当前完整的 token 序列(prompt 加上已经生成的 token)，返回长度固定为 spec_step 的候选
+        token 列表，匹配不足的位置使用最后一个 token 填充，这些位置在校验时大概率会被拒绝。
+        """
+        item = self.indexes.get(req_idx)
+        if item is None or item[0] != req_id or len(item[1]) > len(token_ids):
+            item = (req_id, NgramIndex(self.min_n, self.max_n))
+            self.indexes[req_idx] = item
+        index = item[1]
+        index.extend(token_ids[len(index) :])
+
+        draft_token_ids = index.propose(self.spec_step)
+        fill_token_id = draft_token_ids[-1] if draft_token_ids else int(token_ids[-1])
+        return draft_token_ids + [fill_token_id] * (self.spec_step - len(draft_token_ids))
+
+    def remove(self, req_idx: int):
+        self.indexes.pop(req_idx, None)
+        return
+
+
+def get_accepted_len(draft_token_ids: Sequence[int], verify_token_ids: Sequence[int]) -> int:
+    """
+    verify_token_ids[i] 为主模型在输入第 i 个位置(位置 0 为上一个生成的 token, 位置 i 为第 i 个候选 token)
+    后采样得到的 token, 第 i 个候选 token 只有在其前面的候选全部被接受并且与 verify_token_ids[i] 相同时才会被接受。
+    返回被接受的候选 token 数量，本轮实际输出 verify_token_ids[0 : accepted_len + 1]。
+    """
+    accepted_len = 0
+    for draft_token_id, verify_token_id in zip(draft_token_ids, verify_token_ids):
+        if draft_token_id != verify_token_id:
+            break
+        accepted_len += 1
+    return accepted_len
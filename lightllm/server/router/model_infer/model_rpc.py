@@ -15,6 +15,7 @@ from lightllm.server.router.model_infer.mode_backend import (
     TokenHealingBackend,
     OutlinesConstraintBackend,
     XgrammarBackend,
+    DpdaConstraintBackend,
     FirstTokenConstraintBackend,
     DPChunkedPrefillBackend,
     ContinuesBatchBackendForDecodeNode,
@@ -22,8 +23,9 @@ from lightllm.server.router.model_infer.mode_backend import (
     ChunckedPrefillForPrefillNode,
     DPChunkedForPrefillNode,
     ContinuesBatchWithMTPBackend,
+    ContinuesBatchWithNgramBackend,
 )
-from lightllm.server.core.objs import RpcShmParams, RpcShmResults, ShmSyncStatusArray
+from lightllm.server.core.objs import RpcShmParams, RpcShmResults, RpcSyncBarrier
 from lightllm.utils.log_utils import init_logger
 from lightllm.utils.graceful_utils import graceful_registry
 from lightllm.utils.process_check import start_parent_check_thread
@@ -40,6 +42,7 @@ class ModelRpcServer:
         node_world_size: int,
         rpc_event: multiprocessing.Event,
         rpc_finished_event: multiprocessing.Event,
+        rpc_sync_barrier: RpcSyncBarrier,
         info_queue: mp.Queue,
         mem_queue: mp.Queue,
     ):
@@ -50,13 +53,12 @@ class ModelRpcServer:
         self.mem_queue = mem_queue
         self.rpc_event = rpc_event
         self.rpc_finished_event = rpc_finished_event
+        self.rpc_sync_barrier = rpc_sync_barrier
 
         self.rpc_shm_params = RpcShmParams()
         self.rpc_shm_params.create_or_link_shm()
         self.rpc_shm_results = RpcShmResults()
         self.rpc_shm_results.create_or_link_shm()
-        self.rpc_shm_sync_status = ShmSyncStatusArray(self.node_world_size)
-        self.rpc_shm_sync_status.create_or_link_shm()
 
         self.rank = rank
         self.rank_in_node = rank_in_node
@@ -80,15 +82,11 @@ class ModelRpcServer:
                     self.rpc_shm_results.write_func_result(func_name=func_name, ret=ans)
 
                 # 下面得执行顺序不可随意交换, 否则容易出现同步或者死锁问题。
-                self.rpc_shm_sync_status.add_mark(self.rank_in_node)
-                while not self.rpc_shm_sync_status.run_finished():
-                    pass
+                self.rpc_sync_barrier.wait(self.rank_in_node)
 
                 self.rpc_event.clear()
 
-                self.rpc_shm_sync_status.add_mark1(self.rank_in_node)
-                while not self.rpc_shm_sync_status.run_finished1():
-                    pass
+                self.rpc_sync_barrier.wait(self.rank_in_node)
 
                 if self.rank_in_node == 0:
                     self.rpc_finished_event.set()
@@ -119,11 +117,13 @@ class ModelRpcServer:
             assert not (
                 is_outlines_constraint_mode and is_xgrammar_constraint_mode
             ), "only one constraint mode can be true"
+            is_dpda_constraint_mode = kvargs.get("args", None).output_constraint_mode == "dpda"
             is_prefill_node = kvargs.get("args", None).run_mode == "prefill"
             is_decode_node = kvargs.get("args", None).run_mode == "decode"
         else:
             is_outlines_constraint_mode = False
             is_xgrammar_constraint_mode = False
+            is_dpda_constraint_mode = False
             is_prefill_node = False
             is_decode_node = False
 
@@ -151,11 +151,15 @@ class ModelRpcServer:
             self.backend = OutlinesConstraintBackend()
         elif is_xgrammar_constraint_mode:
             self.backend = XgrammarBackend()
+        elif is_dpda_constraint_mode:
+            self.backend = DpdaConstraintBackend()
         elif is_first_token_constraint_mode:
             self.backend = FirstTokenConstraintBackend()
         elif disable_chunked_prefill:
             if kvargs.get("spec_algo", "NONE") == "MTP":
                 self.backend = ContinuesBatchWithMTPBackend()
+            elif kvargs.get("spec_algo", "NONE") == "NGRAM":
+                self.backend = ContinuesBatchWithNgramBackend()
             else:
                 self.backend = ContinuesBatchBackend()
         else:
@@ -282,6 +286,7 @@ def _init_env(
     router_lock,
     rpc_event: mp.Event,
     rpc_finished_event: mp.Event,
+    rpc_sync_barrier: RpcSyncBarrier,
     success_event: mp.Event,
 ):
     import lightllm.utils.rpyc_fix_utils as _
@@ -296,7 +301,15 @@ def _init_env(
     g_router_lock.obj = router_lock
 
     model_rpc_server = ModelRpcServer(
-        args, rank, rank_in_node, node_world_size, rpc_event, rpc_finished_event, info_queue, mem_queue
+        args,
+        rank,
+        rank_in_node,
+        node_world_size,
+        rpc_event,
+        rpc_finished_event,
+        rpc_sync_barrier,
+        info_queue,
+        mem_queue,
     )
     success_event.set()
 
@@ -311,6 +324,7 @@ async def start_model_process(
     node_world_size,
     rpc_event,
     rpc_finished_event,
+    rpc_sync_barrier,
     info_queue: mp.Queue,
     mem_queue: mp.Queue,
     router_lock: mp.Queue,
@@ -326,6 +340,7 @@ async def start_model_process(
             node_world_size,
             rpc_event,
             rpc_finished_event,
+            rpc_sync_barrier,
             info_queue,
             mem_queue,
         )
@@ -343,6 +358,7 @@ async def start_model_process(
             router_lock,
             rpc_event,
             rpc_finished_event,
+            rpc_sync_barrier,
             success_event,
         ),
     )
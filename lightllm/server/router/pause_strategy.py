@@ -4,6 +4,7 @@ from typing import List, Tuple
 from .batch import Batch, Req
 from lightllm.server.router.req_queue.base_queue import BaseQueue
 from lightllm.server.router.req_queue.dp_base_queue import DpQueue
+from lightllm.server.router.req_queue.schedule_policy import get_req_priority, get_req_deadline
 
 
 class Strategy:
@@ -19,6 +20,55 @@ class Fcfs(Strategy):
         return reqs[::-1]
 
 
+class LowestPriority(Strategy):
+    """
+    优先暂停 priority 最低的请求，相同 priority 时暂停最新的请求。
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+
+    def ordering_reqs(self, reqs: List[Req]):
+        return sorted(reqs[::-1], key=get_req_priority)
+
+
+class LatestDeadline(Strategy):
+    """
+    优先暂停截止时间最晚，也就是最有余量的请求。
+    """
+
+    def __init__(self, default_ttft_slo_ms: int, default_tpot_slo_ms: int) -> None:
+        super().__init__()
+        self.default_ttft_slo_ms = default_ttft_slo_ms
+        self.default_tpot_slo_ms = default_tpot_slo_ms
+
+    def ordering_reqs(self, reqs: List[Req]):
+        return sorted(reqs, key=lambda req: -get_req_deadline(req, self.default_ttft_slo_ms, self.default_tpot_slo_ms))
+
+
+class LeastRecompute(Strategy):
+    """
+    优先暂停已经占用 kv 最少，恢复时需要重新计算的 token 最少的请求。
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+
+    def ordering_reqs(self, reqs: List[Req]):
+        return sorted(reqs[::-1], key=lambda req: req.shm_cur_kv_len)
+
+
+def build_pause_strategy(args) -> Strategy:
+    # 与准入的调度策略相对应的暂停策略
+    if args.schedule_policy == "priority":
+        return LowestPriority()
+    if args.schedule_policy == "edf":
+        return LatestDeadline(args.default_ttft_slo_ms, args.default_tpot_slo_ms)
+    if args.schedule_policy == "sjf":
+        return LeastRecompute()
+    return Fcfs()
+
+
 def select_paused_reqs(
     batch: Batch, strategy: Strategy, req_queue: BaseQueue, max_total_token_num: int, dp_index: int
 ) -> List[Req]:
@@ -29,14 +79,11 @@ def select_paused_reqs(
     if len(reqs) == 0:
         return []
 
+    # 同一个 group 的请求需要一起暂停
     group_req_id = reqs[0].group_req_id
-    pause_reqs = []
-    for req in reqs:
-        if req.group_req_id == group_req_id:
-            pause_reqs.append(req)
-            batch.pop_req(req.request_id)
-        else:
-            break
+    pause_reqs = [req for req in reqs if req.group_req_id == group_req_id]
+    for req in pause_reqs:
+        batch.pop_req(req.request_id)
 
     # 更新请求状态
     for req in pause_reqs:
@@ -1,9 +1,13 @@
-from typing import List, Dict
+from typing import List, Dict, TYPE_CHECKING
 from lightllm.utils.infer_utils import calculate_time
 from ..batch import Batch, Req
 from lightllm.server.core.objs import FinishStatus
 from lightllm.common.basemodel.infer_lock import g_router_lock
 from lightllm.utils.config_utils import get_fixed_kv_len
+from .schedule_policy import build_schedule_policy
+
+if TYPE_CHECKING:
+    from lightllm.server.router.manager import RouterManager
 
 
 class BaseQueue:
@@ -11,14 +15,18 @@ class BaseQueue:
         self.args = args
         self.dp_index = dp_index
         self.dp_size_in_node = dp_size_in_node
-        from lightllm.server.router.manager import RouterManager
-
-        self.router: RouterManager = router
+        self.router: "RouterManager" = router
         # max_total_token_num - get_fixed_kv_len() 是为了减去被特定
         # 推理模式预先占用了部分token kv 资源，这会导致整体可用的kv 资源
         # 在极端情况下减少，在非特定模式下，get_fixed_kv_len() 返回的都是
         # 0， 不会有任何影响。
         self.max_total_tokens = args.max_total_token_num - get_fixed_kv_len()
+        # 按页分配 kv cache 时，尾部不足一页的 token 不会被使用，并且每个请求最后一页中还没有使用的位置
+        # 不能分给其他请求，调度时为每个请求多估计 kv_page_size - 1 个 token 的占用。
+        self.kv_page_added_len = 0
+        if args.kv_page_size > 0:
+            self.max_total_tokens -= args.max_total_token_num % args.kv_page_size
+            self.kv_page_added_len = args.kv_page_size - 1
         assert args.batch_max_tokens is not None
         self.batch_max_tokens = args.batch_max_tokens
         self.running_max_req_size = args.running_max_req_size  # Maximum number of concurrent requests
@@ -26,6 +34,7 @@ class BaseQueue:
         self.router_token_ratio = args.router_token_ratio  # ratio to determine whether the router is busy
         self.router_max_new_token_len = args.router_max_new_token_len
         self.pause_req_dict: Dict[int, Req] = {}  # List of paused requests
+        self.schedule_policy = build_schedule_policy(args)  # 决定等待队列中请求的准入顺序
 
     def append(self, req: Req):
         req.sample_params.suggested_dp_index = self.dp_index
@@ -52,6 +61,14 @@ class BaseQueue:
         self.waiting_req_list = req_list + self.waiting_req_list
         return
 
+    def _get_req_tuple_tokens(self, req: Req, is_busy):
+        a_len, b_len = req.get_tuple_tokens(is_busy, self.router_max_new_token_len)
+        return (a_len + self.kv_page_added_len, b_len)
+
+    def _order_waiting_req_list(self):
+        self.waiting_req_list = self.schedule_policy.ordering_reqs(self.waiting_req_list)
+        return
+
     def is_busy(self):
         # 计算当前所有的token使用量, 如果使用了dynamic prompt cache, 使用的token量中不包含，cache tree 中未被引用的数据。
         cur_all_used_tokens = self.router.get_used_tokens(self.dp_index)
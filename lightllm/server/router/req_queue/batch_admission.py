@@ -0,0 +1,82 @@
+import numpy as np
+from typing import List, Tuple
+
+
+def get_peak_token_num(has_run_lens: np.ndarray, left_out_lens: np.ndarray) -> int:
+    """
+    估计一组请求运行过程中 kv cache token 占用的峰值。按照剩余输出长度从大到小排序后，在第 i 个请求结束时，
+    前 i 个请求都还在运行，占用量为 left_out_lens[i] * (i + 1) + 前 i 个请求已经占用的 token 之和，峰值为其中的最大值。
+    剩余输出长度相同的请求之间的顺序不影响结果。
+    """
+    if len(has_run_lens) == 0:
+        return 0
+    order = np.argsort(-left_out_lens, kind="stable")
+    cum_run_len_array = np.cumsum(has_run_lens[order])
+    size_array = np.arange(1, len(order) + 1, 1)
+    return int((left_out_lens[order] * size_array + cum_run_len_array).max())
+
+
+class BatchAdmission:
+    """
+    批量的准入判断，计算等待队列中的候选请求从头开始最多可以有多少个加入运行 batch，结果与逐个请求判断完全一致。
+    token 峰值、请求数量和 prefill token 数量这三个条件随着加入的请求增多都是单调变化的，所以能够加入的请求
+    一定是候选请求的一个前缀，请求数量和 prefill token 数量的条件直接通过累加和向量化计算，token 峰值的条件
+    对前缀长度进行二分查找，每次只需要一次排序，不再需要每个候选请求都对整个列表重新排序。
+    候选请求可以分多次追加，已经确认可以加入的前缀长度会被保留，避免在等待队列很长的时候处理所有的请求。
+    """
+
+    def __init__(
+        self, cache_len_list: List[Tuple[int, int]], token_limit: int, req_num_limit: int, prefill_token_limit: int
+    ):
+        # token_limit: 峰值需要严格小于的值，req_num_limit: 新加入的请求数量(不含恢复的暂停请求)的上限
+        # prefill_token_limit: 新加入请求的首次 prefill token 数量之和的上限
+        self.run_len_array = np.array([e[0] for e in cache_len_list], dtype=np.int64)
+        self.left_len_array = np.array([e[1] for e in cache_len_list], dtype=np.int64)
+        self.token_limit = token_limit
+        self.req_num_limit = req_num_limit
+        self.prefill_token_limit = prefill_token_limit
+
+        self.cand_run_lens: List[int] = []
+        self.cand_left_lens: List[int] = []
+        self.cand_first_router_need_tokens: List[int] = []
+        self.cand_is_paused: List[bool] = []
+        self.admit_num = 0
+
+    def get_candidate_num(self):
+        return len(self.cand_run_lens)
+
+    def add_candidate(self, tuple_tokens: Tuple[int, int], first_router_need_tokens: int, is_paused: bool):
+        self.cand_run_lens.append(tuple_tokens[0])
+        self.cand_left_lens.append(tuple_tokens[1])
+        self.cand_first_router_need_tokens.append(first_router_need_tokens)
+        self.cand_is_paused.append(is_paused)
+        return
+
+    def get_peak_token_num(self, cand_num: int) -> int:
+        """
+        返回运行中的请求加上前 cand_num 个候选请求的 token 占用峰值。
+        """
+        has_run_lens = np.concatenate([self.run_len_array, np.array(self.cand_run_lens[0:cand_num], dtype=np.int64)])
+        left_out_lens = np.concatenate([self.left_len_array, np.array(self.cand_left_lens[0:cand_num], dtype=np.int64)])
+        return get_peak_token_num(has_run_lens, left_out_lens)
+
+    def get_admit_num(self) -> int:
+        cand_num = len(self.cand_run_lens)
+        if cand_num == self.admit_num:
+            return self.admit_num
+
+        # 恢复的暂停请求已经计入了暂停请求的数量中，不会增加请求总数
+        new_req_nums = np.arange(1, cand_num + 1, 1) - np.cumsum(np.array(self.cand_is_paused, dtype=np.int64))
+        prefill_tokens = np.cumsum(np.array(self.cand_first_router_need_tokens, dtype=np.int64))
+        ok_mask = (new_req_nums <= self.req_num_limit) & (prefill_tokens <= self.prefill_token_limit)
+        high = cand_num if ok_mask.all() else int(np.argmin(ok_mask))
+
+        low = self.admit_num
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.get_peak_token_num(mid) < self.token_limit:
+                low = mid
+            else:
+                high = mid - 1
+        self.admit_num = low
+        return self.admit_num
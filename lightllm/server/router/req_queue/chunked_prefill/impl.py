@@ -1,7 +1,9 @@
 import uuid
 import numpy as np
+from typing import List
 from ...batch import Batch, Req
 from lightllm.server.router.req_queue.base_queue import BaseQueue
+from lightllm.server.router.req_queue.batch_admission import BatchAdmission, get_peak_token_num
 
 
 class ChunkedPrefillQueue(BaseQueue):
@@ -11,7 +13,7 @@ class ChunkedPrefillQueue(BaseQueue):
     def _init_cache_list(self, current_batch: Batch, is_busy):
         if current_batch is not None:
             self.cache_len_list = [
-                req.get_tuple_tokens(is_busy, self.router_max_new_token_len)
+                self._get_req_tuple_tokens(req, is_busy)
                 for req in current_batch.reqs
                 if req.sample_params.suggested_dp_index == self.dp_index
             ]
@@ -20,40 +22,55 @@ class ChunkedPrefillQueue(BaseQueue):
         return
 
     # @calculate_time(show=True, min_cost_ms=0.1)
-    def _can_add_new_req(self, req: Req, is_busy, new_batch_first_router_need_tokens):
-        self.cache_len_list.append(req.get_tuple_tokens(is_busy, self.router_max_new_token_len))  # hard to analysis
-        self.cache_len_list.sort(key=lambda x: -x[1])
-
-        left_out_len_array = np.array([e[1] for e in self.cache_len_list])
-        # assert left_out_len_array.min() >= 0
-        has_run_len_array = np.array([e[0] for e in self.cache_len_list])
-        cum_run_len_array = np.cumsum(has_run_len_array)
-        size_array = np.arange(1, len(self.cache_len_list) + 1, 1)
-
-        need_max_token_num = (left_out_len_array * size_array + cum_run_len_array).max()
-        ok_token_num = (
-            need_max_token_num + self.router.shared_token_load.get_frozened_token_count(self.dp_index)
-            < self.max_total_tokens
+    def _get_can_run_reqs(self, waiting_queue: List[Req], is_busy, new_batch_first_router_need_tokens):
+        """
+        返回可以加入新 batch 的请求和在其之前已经 abort 的请求。候选请求按照倍增的数量从等待队列中取出，
+        由 BatchAdmission 一次性判断可以加入的前缀长度，判断结果与逐个请求调用 _get_req_tuple_tokens 进行判断一致。
+        """
+        frozened_token_count = self.router.shared_token_load.get_frozened_token_count(self.dp_index)
+        admission = BatchAdmission(
+            self.cache_len_list,
+            token_limit=self.max_total_tokens - frozened_token_count,
+            req_num_limit=self.running_max_req_size - len(self.cache_len_list) - len(self.pause_req_dict),
+            prefill_token_limit=self.batch_max_tokens - new_batch_first_router_need_tokens,
         )
+        candidate_reqs = []
+        abort_req_list = []
+        queue_index = 0
+        gather_num = 16
+        while True:
+            while queue_index < len(waiting_queue) and len(candidate_reqs) < gather_num:
+                req = waiting_queue[queue_index]
+                queue_index += 1
+                if req.is_aborted and not req.is_paused:
+                    # 由于管理的复杂性，只有没有被调度运行过的请求可以因为abort直接在队列中忽略掉.
+                    # 暂停的请求需要恢复后，由 router manager 部分来过滤。暂时保持这种处理方法, 否则会导致管理token的泄漏
+                    abort_req_list.append((queue_index, req))
+                    continue
+                candidate_reqs.append((queue_index, req))
+                admission.add_candidate(
+                    self._get_req_tuple_tokens(req, is_busy),
+                    req.get_first_router_need_tokens(),
+                    req.is_paused,
+                )
+            admit_num = admission.get_admit_num()
+            if admit_num < len(candidate_reqs) or queue_index == len(waiting_queue):
+                break
+            gather_num *= 2
 
-        if not req.is_paused:
-            ok_req_num = len(self.cache_len_list) + len(self.pause_req_dict) <= self.running_max_req_size
-        else:
-            ok_req_num = len(self.cache_len_list) + len(self.pause_req_dict) - 1 <= self.running_max_req_size
-
-        new_batch_first_router_need_tokens += req.get_first_router_need_tokens()
-        ok_prefill = new_batch_first_router_need_tokens <= self.batch_max_tokens
+        if admit_num < len(candidate_reqs):
+            # 只有排在第一个无法加入的请求之前的 abort 请求会被移出等待队列
+            stop_index = candidate_reqs[admit_num][0]
+            abort_req_list = [e for e in abort_req_list if e[0] < stop_index]
 
-        if ok_token_num and ok_req_num and ok_prefill:
+        if admit_num != 0:
+            need_max_token_num = admission.get_peak_token_num(admit_num)
             self.router.shared_token_load.set_estimated_peak_token_count(need_max_token_num, self.dp_index)
             self.router.shared_token_load.set_dynamic_max_load(
-                (need_max_token_num + self.router.shared_token_load.get_frozened_token_count(self.dp_index))
-                / self.max_total_tokens,
+                (need_max_token_num + frozened_token_count) / self.max_total_tokens,
                 self.dp_index,
             )
-            return True, new_batch_first_router_need_tokens
-        else:
-            return False, new_batch_first_router_need_tokens
+        return [e[1] for e in candidate_reqs[0:admit_num]], [e[1] for e in abort_req_list]
 
     # @calculate_time(show=True, min_cost_ms=10)
     def generate_new_batch(self, current_batch: Batch, limit_router_queue_length: int = None):
@@ -71,32 +88,21 @@ class ChunkedPrefillQueue(BaseQueue):
         )
 
         self._init_cache_list(current_batch, is_busy)
-        can_run_list = []
-        abort_req_list = []
-        aborted_count = 0
 
+        self._order_waiting_req_list()
         if limit_router_queue_length is None:
             waiting_queue = self.waiting_req_list
         else:
             waiting_queue = self.waiting_req_list[:limit_router_queue_length]
 
-        for req in waiting_queue:
-            if req.is_aborted and not req.is_paused:
-                # 由于管理的复杂性，只有没有被调度运行过的请求可以因为abort直接在队列中忽略掉.
-                # 暂停的请求需要恢复后，由 router manager 部分来过滤。暂时保持这种处理方法, 否则会导致管理token的泄漏
-                aborted_count += 1
-                abort_req_list.append(req)
-                continue
-            ok_insert, new_batch_first_router_need_tokens = self._can_add_new_req(
-                req, is_busy, new_batch_first_router_need_tokens
-            )
-            if ok_insert:
-                can_run_list.append(req)
-                if req.is_paused:
-                    self.pause_req_dict.pop(req.request_id)
-                    req.is_paused = False
-            else:
-                break
+        can_run_list, abort_req_list = self._get_can_run_reqs(
+            waiting_queue, is_busy, new_batch_first_router_need_tokens
+        )
+        aborted_count = len(abort_req_list)
+        for req in can_run_list:
+            if req.is_paused:
+                self.pause_req_dict.pop(req.request_id)
+                req.is_paused = False
 
         if len(can_run_list) != 0:
             new_batch = Batch(uuid.uuid4().int, can_run_list, dp_size_in_node=self.dp_size_in_node)
@@ -110,15 +116,10 @@ class ChunkedPrefillQueue(BaseQueue):
     def _calcu_batch_token_load_batch_not_none(self, current_batch: Batch):
         is_busy = self.is_busy()
         self._init_cache_list(current_batch, is_busy)
-        if len(self.cache_len_list) != 0:
-            self.cache_len_list.sort(key=lambda x: -x[1])
-            left_out_len_array = np.array([e[1] for e in self.cache_len_list])
-            has_run_len_array = np.array([e[0] for e in self.cache_len_list])
-            cum_run_len_array = np.cumsum(has_run_len_array)
-            size_array = np.arange(1, len(self.cache_len_list) + 1, 1)
-            need_max_token_num = (left_out_len_array * size_array + cum_run_len_array).max()
-        else:
-            need_max_token_num = 0
+        need_max_token_num = get_peak_token_num(
+            np.array([e[0] for e in self.cache_len_list], dtype=np.int64),
+            np.array([e[1] for e in self.cache_len_list], dtype=np.int64),
+        )
         return (
             need_max_token_num,
             (need_max_token_num + self.router.shared_token_load.get_frozened_token_count(self.dp_index))
@@ -77,6 +77,7 @@ class QueueForPDChunkedPrefill(BaseQueue):
         abort_req_list = []
         aborted_count = 0
 
+        self._order_waiting_req_list()
         if limit_router_queue_length is None:
             waiting_queue = self.waiting_req_list
         else:
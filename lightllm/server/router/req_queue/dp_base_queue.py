@@ -3,6 +3,12 @@ from typing import List
 from ..batch import Batch, Req
 from lightllm.server.router.req_queue.base_queue import BaseQueue
 from lightllm.common.basemodel.infer_lock import g_router_lock
+from lightllm.server.router.dynamic_prompt.prefix_summary import (
+    PrefixSummaryReadOnlyClient,
+    compute_prefix_block_hashes,
+    select_by_prefix_affinity,
+)
+from lightllm.utils.envs_utils import get_unique_server_name
 from lightllm.utils.log_utils import init_logger
 
 logger = init_logger(__name__)
@@ -20,6 +26,16 @@ class DpQueue:
             base_queue_class(args, router, dp_index, dp_size_in_node) for dp_index in range(self.dp_size_in_node)
         ]
 
+        # 前缀亲和调度，读取各个 dp rank 上 radix cache 发布的前缀摘要
+        self.prefix_summary_client: PrefixSummaryReadOnlyClient = None
+        if args.prefix_affinity_route and not args.disable_dynamic_prompt_cache:
+            self.prefix_affinity_block_size = args.prefix_affinity_block_size
+            self.prefix_affinity_load_weight = args.prefix_affinity_load_weight
+            self.prefix_summary_client = PrefixSummaryReadOnlyClient(
+                get_unique_server_name(),
+                node_world_size=self.router.node_world_size,
+                dp_world_size=self.router.world_size // self.router.dp_size,
+            )
         return
 
     def get_dp_queue(self, dp_index: int):
@@ -62,7 +78,7 @@ class DpQueue:
 
     def extend(self, req_group: List[Req]):
         # 同一个组的，要分配在同一个 dp 上，效率最高
-        index = self._get_suggest_dp_index()
+        index = self._get_suggest_dp_index(req_group[0])
         for req in req_group:
             suggested_dp_index = req.sample_params.suggested_dp_index
             if suggested_dp_index >= self.dp_size_in_node or suggested_dp_index < 0:
@@ -94,7 +110,12 @@ class DpQueue:
                     self.router.shared_token_load.set_dynamic_max_load(dynamic_max_load, dp_index)
         return
 
-    def _get_suggest_dp_index(self):
+    def _get_suggest_dp_index(self, req: Req = None):
+        if self.prefix_summary_client is not None and req is not None:
+            dp_index = self._get_prefix_affinity_dp_index(req)
+            if dp_index is not None:
+                return dp_index
+
         min_length = min(len(queue.waiting_req_list) for queue in self.inner_queues)
         select_dp_indexes = [
             i for i, queue in enumerate(self.inner_queues) if len(queue.waiting_req_list) == min_length
@@ -111,3 +132,26 @@ class DpQueue:
                 return next_dp_index
 
         return random.choice(select_dp_indexes)
+
+    def _get_prefix_affinity_dp_index(self, req: Req):
+        """
+        选择缓存了请求前缀的 dp rank，同时考虑各个 dp rank 的负载，负载为 token 使用率加上等待队列中请求的
+        输入 token 占比。没有任何 dp rank 命中前缀时返回 None，退回到按照等待队列长度的均衡选择。
+        """
+        req.link_prompt_ids_shm_array()
+        hashes = compute_prefix_block_hashes(req.shm_prompt_ids.arr[0 : req.input_len], self.prefix_affinity_block_size)
+        if len(hashes) == 0:
+            return None
+
+        match_block_nums = [
+            self.prefix_summary_client.match_block_num(dp_index, hashes) for dp_index in range(self.dp_size_in_node)
+        ]
+        if max(match_block_nums) == 0:
+            return None
+
+        loads = []
+        for dp_index, queue in enumerate(self.inner_queues):
+            wait_token_num = sum(wait_req.input_len for wait_req in queue.waiting_req_list)
+            load = self.router.shared_token_load.get_current_load(dp_index)
+            loads.append(load + wait_token_num / self.router.max_total_token_num)
+        return select_by_prefix_affinity(match_block_nums, loads, len(hashes), self.prefix_affinity_load_weight)
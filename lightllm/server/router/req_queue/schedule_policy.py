@@ -0,0 +1,81 @@
+import time
+from typing import List
+from ..batch import Req
+
+
+def get_req_priority(req: Req) -> int:
+    return req.sample_params.priority
+
+
+def get_req_deadline(req: Req, default_ttft_slo_ms: int, default_tpot_slo_ms: int) -> float:
+    """
+    请求下一个输出 token 的截止时间，还没有输出的请求使用 ttft slo，已经输出过 token 的请求(被暂停后重新
+    进入等待队列)在此基础上每个已经输出的 token 再加上一个 tpot slo。
+    """
+    ttft_slo_ms = req.sample_params.ttft_slo_ms if req.sample_params.ttft_slo_ms > 0 else default_ttft_slo_ms
+    tpot_slo_ms = req.sample_params.tpot_slo_ms if req.sample_params.tpot_slo_ms > 0 else default_tpot_slo_ms
+    return req.start_time + (ttft_slo_ms + tpot_slo_ms * req.shm_cur_output_len) / 1000.0
+
+
+def get_req_remaining_prompt_len(req: Req) -> int:
+    return max(0, req.input_len + req.shm_cur_output_len - req.shm_cur_kv_len)
+
+
+class SchedulePolicy:
+    """
+    决定等待队列中请求的准入顺序，队列按照排序后的顺序依次判断是否可以加入新的 batch，
+    遇到第一个放不下的请求就停止。排序都使用稳定排序，同一个 group 中的请求排序键相同，会保持相邻。
+    """
+
+    def __init__(self, args) -> None:
+        self.args = args
+
+    def ordering_reqs(self, reqs: List[Req]) -> List[Req]:
+        raise NotImplementedError()
+
+
+class FcfsSchedulePolicy(SchedulePolicy):
+    def ordering_reqs(self, reqs: List[Req]) -> List[Req]:
+        return reqs
+
+
+class PrioritySchedulePolicy(SchedulePolicy):
+    """
+    priority 越大越优先，相同 priority 的请求保持先来先服务。
+    """
+
+    def ordering_reqs(self, reqs: List[Req]) -> List[Req]:
+        return sorted(reqs, key=lambda req: -get_req_priority(req))
+
+
+class EdfSchedulePolicy(SchedulePolicy):
+    """
+    earliest deadline first, 截止时间由请求的 ttft_slo_ms / tpot_slo_ms 参数或者启动参数中的默认值决定。
+    """
+
+    def ordering_reqs(self, reqs: List[Req]) -> List[Req]:
+        default_ttft_slo_ms = self.args.default_ttft_slo_ms
+        default_tpot_slo_ms = self.args.default_tpot_slo_ms
+        return sorted(reqs, key=lambda req: get_req_deadline(req, default_ttft_slo_ms, default_tpot_slo_ms))
+
+
+class SjfSchedulePolicy(SchedulePolicy):
+    """
+    shortest remaining prompt first, 每等待一秒排序键减少 sjf_aging_tokens_per_second 个 token,
+    避免长 prompt 的请求一直得不到调度。
+    """
+
+    def ordering_reqs(self, reqs: List[Req]) -> List[Req]:
+        cur_time = time.time()
+        aging = self.args.sjf_aging_tokens_per_second
+        return sorted(reqs, key=lambda req: get_req_remaining_prompt_len(req) - aging * (cur_time - req.start_time))
+
+
+def build_schedule_policy(args) -> SchedulePolicy:
+    policy_classes = {
+        "fcfs": FcfsSchedulePolicy,
+        "priority": PrioritySchedulePolicy,
+        "edf": EdfSchedulePolicy,
+        "sjf": SjfSchedulePolicy,
+    }
+    return policy_classes[args.schedule_policy](args)
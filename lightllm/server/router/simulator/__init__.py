@@ -0,0 +1,3 @@
+from .trace import TraceReq, load_trace
+from .latency_model import LatencyModel
+from .simulator import Simulator, SimReport
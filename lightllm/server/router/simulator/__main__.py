@@ -0,0 +1,37 @@
+import json
+from lightllm.server.api_cli import make_argument_parser
+from .trace import load_trace
+from .latency_model import LatencyModel
+from .simulator import Simulator
+
+
+def add_simulator_arguments(parser):
+    parser.add_argument("--sim_trace", type=str, required=True, help="jsonl trace file, one request per line")
+    parser.add_argument("--sim_max_req_num", type=int, default=None, help="only replay the first n requests")
+    parser.add_argument(
+        "--sim_time_scale",
+        type=float,
+        default=1.0,
+        help="scale the arrival intervals of the trace, a value less than 1 increases the request rate",
+    )
+    parser.add_argument("--sim_output_json", type=str, default=None, help="dump the report into this json file")
+    parser.add_argument("--sim_prefill_base_ms", type=float, default=10.0)
+    parser.add_argument("--sim_prefill_ms_per_token", type=float, default=0.06)
+    parser.add_argument("--sim_prefill_ms_per_token_per_k_ctx", type=float, default=0.004)
+    parser.add_argument("--sim_decode_base_ms", type=float, default=12.0)
+    parser.add_argument("--sim_decode_ms_per_req", type=float, default=0.06)
+    parser.add_argument("--sim_decode_ms_per_k_kv", type=float, default=0.02)
+    return parser
+
+
+if __name__ == "__main__":
+    # 用法与启动服务相同，例如:
+    # python -m lightllm.server.router.simulator --max_total_token_num 120000 --sim_trace trace.jsonl
+    parser = add_simulator_arguments(make_argument_parser())
+    args = parser.parse_args()
+    trace_reqs = load_trace(args.sim_trace, max_req_num=args.sim_max_req_num, time_scale=args.sim_time_scale)
+    report = Simulator(args, trace_reqs, LatencyModel.from_args(args)).run()
+    print(report.format())
+    if args.sim_output_json is not None:
+        with open(args.sim_output_json, "w") as f:
+            json.dump(report.to_dict(), f, indent=4)
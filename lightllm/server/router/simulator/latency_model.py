@@ -0,0 +1,60 @@
+from typing import List, Tuple
+
+
+class LatencyModel:
+    """
+    推理一步的耗时模型，用于代替真实的推理后端。chunked prefill 后端每一步先对 decode 请求进行一次 forward,
+    再对 prefill 请求进行一次 forward, 两次 forward 的耗时分别估计:
+    prefill: prefill_base_ms + 每个新 token prefill_ms_per_token + 每个新 token 每 1k 上下文 prefill_ms_per_token_per_k_ctx
+    decode: decode_base_ms + 每个请求 decode_ms_per_req + 每 1k 读取的 kv token decode_ms_per_k_kv
+    默认值大致对应单卡 7B 模型，可以用真实服务的 profile 结果拟合这些参数。
+    """
+
+    def __init__(
+        self,
+        prefill_base_ms: float = 10.0,
+        prefill_ms_per_token: float = 0.06,
+        prefill_ms_per_token_per_k_ctx: float = 0.004,
+        decode_base_ms: float = 12.0,
+        decode_ms_per_req: float = 0.06,
+        decode_ms_per_k_kv: float = 0.02,
+    ):
+        self.prefill_base_ms = prefill_base_ms
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.prefill_ms_per_token_per_k_ctx = prefill_ms_per_token_per_k_ctx
+        self.decode_base_ms = decode_base_ms
+        self.decode_ms_per_req = decode_ms_per_req
+        self.decode_ms_per_k_kv = decode_ms_per_k_kv
+
+    @classmethod
+    def from_args(cls, args) -> "LatencyModel":
+        return cls(
+            prefill_base_ms=args.sim_prefill_base_ms,
+            prefill_ms_per_token=args.sim_prefill_ms_per_token,
+            prefill_ms_per_token_per_k_ctx=args.sim_prefill_ms_per_token_per_k_ctx,
+            decode_base_ms=args.sim_decode_base_ms,
+            decode_ms_per_req=args.sim_decode_ms_per_req,
+            decode_ms_per_k_kv=args.sim_decode_ms_per_k_kv,
+        )
+
+    def get_prefill_time(self, chunks: List[Tuple[int, int]]) -> float:
+        """
+        chunks 中每一项为 (已经有 kv 的长度, 本次 prefill 的 token 数量)，返回耗时，单位秒。
+        """
+        new_token_num = 0
+        ctx_token_product = 0.0
+        for ready_len, chunk_len in chunks:
+            new_token_num += chunk_len
+            ctx_token_product += chunk_len * (ready_len + chunk_len / 2)
+        cost_ms = (
+            self.prefill_base_ms
+            + self.prefill_ms_per_token * new_token_num
+            + self.prefill_ms_per_token_per_k_ctx * ctx_token_product / 1000
+        )
+        return cost_ms / 1000
+
+    def get_decode_time(self, batch_size: int, kv_token_num: int) -> float:
+        cost_ms = (
+            self.decode_base_ms + self.decode_ms_per_req * batch_size + self.decode_ms_per_k_kv * kv_token_num / 1000
+        )
+        return cost_ms / 1000
@@ -0,0 +1,334 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from lightllm.server.core.objs import Req, FinishStatus
+from .latency_model import LatencyModel
+from .trace import TraceReq
+
+
+class SimMemManager:
+    """
+    只记录 token 数量的 kv cache 管理，与 MemoryManager 一样，申请不到足够的 token 时说明调度出现了错误。
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.can_use_mem_size = size
+
+    def alloc(self, need_size: int):
+        if need_size > self.can_use_mem_size:
+            raise RuntimeError(f"simulated kv cache oom, need_size {need_size} left_size {self.can_use_mem_size}")
+        self.can_use_mem_size -= need_size
+        return
+
+    def free(self, free_size: int):
+        self.can_use_mem_size += free_size
+        assert self.can_use_mem_size <= self.size
+        return
+
+    def get_used_token_num(self) -> int:
+        return self.size - self.can_use_mem_size
+
+
+class _CacheNode:
+    def __init__(self, token_num: int, parent_key):
+        self.token_num = token_num
+        self.ref_counter = 0
+        self.parent_key = parent_key
+        self.child_num = 0
+
+
+class SimRadixCache:
+    """
+    按照 key 粗粒度模拟 RadixCache 的 prompt cache 行为，不保存 token id:
+    1. ("prefix", prefix_id) 节点保存 trace 中声明的共享前缀，被多个请求引用。
+    2. ("req", request_id) 节点保存被暂停请求的私有 kv, 挂在其前缀节点之下，请求恢复时重新取回。
+    与 RadixCache 相同，节点的引用计数为 0 时可以被淘汰，按照 lru 的顺序淘汰没有子节点的节点。
+    """
+
+    def __init__(self, mem_manager: SimMemManager):
+        self.mem_manager = mem_manager
+        self.nodes: "OrderedDict[Tuple, _CacheNode]" = OrderedDict()
+        self.refed_tokens_num = 0
+        self.tree_total_tokens_num = 0
+
+    def match(self, key) -> int:
+        node = self.nodes.get(key, None)
+        if node is None:
+            return 0
+        self.nodes.move_to_end(key)
+        if node.ref_counter == 0:
+            self.refed_tokens_num += node.token_num
+        node.ref_counter += 1
+        return node.token_num
+
+    def dec_node_ref_counter(self, key):
+        node = self.nodes[key]
+        node.ref_counter -= 1
+        if node.ref_counter == 0:
+            self.refed_tokens_num -= node.token_num
+        return
+
+    def insert(self, key, token_num: int, parent_key=None) -> bool:
+        """
+        插入成功时 token 的所有权转移给 cache, 返回 False 时节点已经存在，调用者需要自己释放这些 token。
+        """
+        if key in self.nodes or token_num <= 0:
+            return False
+        if parent_key is not None:
+            self.nodes[parent_key].child_num += 1
+        self.nodes[key] = _CacheNode(token_num, parent_key)
+        self.tree_total_tokens_num += token_num
+        return True
+
+    def take(self, key) -> int:
+        """
+        取走一个没有被引用的叶节点，token 的所有权转移给调用者，节点不存在时返回 0。
+        """
+        node = self.nodes.get(key, None)
+        if node is None:
+            return 0
+        assert node.ref_counter == 0 and node.child_num == 0
+        self._remove(key, node)
+        return node.token_num
+
+    def _remove(self, key, node: _CacheNode):
+        del self.nodes[key]
+        if node.parent_key is not None:
+            self.nodes[node.parent_key].child_num -= 1
+        self.tree_total_tokens_num -= node.token_num
+        return
+
+    def free_radix_cache_to_get_enough_token(self, need_token_num: int):
+        while need_token_num > self.mem_manager.can_use_mem_size:
+            evict_key = None
+            for key, node in self.nodes.items():
+                if node.ref_counter == 0 and node.child_num == 0:
+                    evict_key = key
+                    break
+            if evict_key is None:
+                break
+            node = self.nodes[evict_key]
+            self._remove(evict_key, node)
+            self.mem_manager.free(node.token_num)
+        return
+
+    def get_refed_tokens_num(self) -> int:
+        return self.refed_tokens_num
+
+    def get_tree_total_tokens_num(self) -> int:
+        return self.tree_total_tokens_num
+
+    def get_unrefed_tokens_num(self) -> int:
+        return self.tree_total_tokens_num - self.refed_tokens_num
+
+
+class SimInferReq:
+    """
+    推理进程中 InferReq 的模拟，kv 只记录数量，其中 shared_len 个 token 属于被引用的 cache 前缀节点。
+    """
+
+    def __init__(self, shm_req: Req, trace_req: TraceReq):
+        self.shm_req = shm_req
+        self.trace_req = trace_req
+        self.initialized = False
+        self.paused = False
+        self.cur_kv_len = 0
+        self.cur_output_len = 0
+        self.shared_key = None
+        self.shared_len = 0
+        self.paused_kv_len = 0
+        self.finished = False
+
+    def is_uninitialized(self):
+        return not self.initialized or self.paused
+
+    def get_cur_total_len(self):
+        return self.shm_req.input_len + self.cur_output_len
+
+    def get_prefix_key(self):
+        if self.trace_req.prefix_id is None or self.trace_req.prefix_len <= 0:
+            return None
+        return ("prefix", self.trace_req.prefix_id)
+
+
+class SimBackend:
+    """
+    模拟 ChunkedPrefillBackend 的调度行为: prefill 调用只注册请求，请求在随后的 decode 调用中完成初始化，
+    decode 调用先对 decode 请求 forward, 再按照相同的条件对 prefill 请求进行一次分块 prefill。
+    每次 decode 调用返回 LatencyModel 估计的耗时，以及这一步输出了第一个 token 和结束的请求。
+    """
+
+    def __init__(
+        self,
+        args,
+        mem_manager: SimMemManager,
+        radix_cache: Optional[SimRadixCache],
+        latency_model: LatencyModel,
+    ):
+        self.mem_manager = mem_manager
+        self.radix_cache = radix_cache
+        self.latency_model = latency_model
+        self.max_wait_step = args.router_max_wait_tokens
+        self.forward_step = 0
+        self.need_prefill_count = 0
+        self.requests_mapping: Dict[int, SimInferReq] = {}
+        self.infer_req_ids: List[int] = []
+
+        self.first_token_reqs: List[Req] = []
+        self.finished_reqs: List[Req] = []
+        self.recompute_token_num = 0
+        self.prompt_cache_hit_token_num = 0
+
+    def prefill(self, reqs: List[Req]):
+        for req in reqs:
+            if req.request_id not in self.requests_mapping:
+                self.requests_mapping[req.request_id] = SimInferReq(req, req.trace_req)
+            else:
+                assert self.requests_mapping[req.request_id].paused is True
+            self.infer_req_ids.append(req.request_id)
+        self.need_prefill_count += 1
+        return
+
+    def pause_reqs(self, reqs: List[Req]):
+        for req in reqs:
+            req_obj = self.requests_mapping[req.request_id]
+            self.infer_req_ids.remove(req.request_id)
+            # 恢复后还没有重新初始化的请求再次被暂停时，没有需要释放的 kv
+            if req_obj.initialized and not req_obj.paused:
+                req_obj.paused_kv_len = req_obj.cur_kv_len
+                self._free_req_mem(req_obj, keep_private=True)
+                req_obj.cur_kv_len = 0
+                req_obj.shm_req.shm_cur_kv_len = 0
+            req_obj.paused = True
+        return
+
+    def decode(self) -> float:
+        self.first_token_reqs = []
+        self.finished_reqs = []
+        uninit_reqs, ok_finished_reqs, prefill_reqs, decode_reqs = [], [], [], []
+        for request_id in self.infer_req_ids:
+            req_obj = self.requests_mapping[request_id]
+            if req_obj.is_uninitialized():
+                uninit_reqs.append(req_obj)
+            elif req_obj.finished:
+                ok_finished_reqs.append(req_obj)
+            elif req_obj.cur_kv_len + 1 == req_obj.get_cur_total_len():
+                decode_reqs.append(req_obj)
+            else:
+                prefill_reqs.append(req_obj)
+
+        cost_time = 0.0
+        if decode_reqs:
+            kv_token_num = sum(req_obj.cur_kv_len for req_obj in decode_reqs)
+            self._alloc(len(decode_reqs))
+            for req_obj in decode_reqs:
+                self._post_handle(req_obj, req_obj.cur_kv_len + 1)
+            cost_time += self.latency_model.get_decode_time(len(decode_reqs), kv_token_num)
+
+        if len(decode_reqs) == 0 or (self.forward_step % self.max_wait_step == 0) or (self.need_prefill_count > 0):
+            if prefill_reqs:
+                self.need_prefill_count -= 1
+                chunks = []
+                for req_obj in prefill_reqs:
+                    chunk_end = min(
+                        req_obj.get_cur_total_len(), req_obj.cur_kv_len + req_obj.shm_req.chunked_prefill_size
+                    )
+                    chunks.append((req_obj.cur_kv_len, chunk_end - req_obj.cur_kv_len))
+                self._alloc(sum(e[1] for e in chunks))
+                for req_obj, (ready_len, chunk_len) in zip(prefill_reqs, chunks):
+                    self._post_handle(req_obj, ready_len + chunk_len)
+                cost_time += self.latency_model.get_prefill_time(chunks)
+
+        for req_obj in uninit_reqs:
+            self._init_req(req_obj)
+        self._filter(ok_finished_reqs)
+        self.forward_step += 1
+        return cost_time
+
+    def _alloc(self, need_size: int):
+        if self.radix_cache is not None:
+            self.radix_cache.free_radix_cache_to_get_enough_token(need_size)
+        self.mem_manager.alloc(need_size)
+        return
+
+    def _post_handle(self, req_obj: SimInferReq, new_kv_len: int):
+        req_obj.cur_kv_len = new_kv_len
+        req_obj.shm_req.shm_cur_kv_len = new_kv_len
+        if req_obj.cur_kv_len < req_obj.get_cur_total_len():
+            return
+        req_obj.cur_output_len += 1
+        req_obj.shm_req.shm_cur_output_len = req_obj.cur_output_len
+        if req_obj.cur_output_len == 1:
+            self.first_token_reqs.append(req_obj.shm_req)
+        # 请求按照 trace 中的实际输出长度结束，模拟遇到 eos 的情况
+        if req_obj.cur_output_len >= req_obj.trace_req.output_len:
+            req_obj.finished = True
+            req_obj.shm_req.finish_status.set_status(FinishStatus.FINISHED_STOP)
+        elif req_obj.cur_output_len >= req_obj.shm_req.sample_params.max_new_tokens:
+            req_obj.finished = True
+            req_obj.shm_req.finish_status.set_status(FinishStatus.FINISHED_LENGTH)
+        if req_obj.finished:
+            req_obj.shm_req.finish_token_index = req_obj.get_cur_total_len() - 1
+            self.finished_reqs.append(req_obj.shm_req)
+        return
+
+    def _init_req(self, req_obj: SimInferReq):
+        # 与 InferReq.init_all 相同，新请求和恢复的请求都从 prompt cache 中匹配可以复用的 kv
+        if self.radix_cache is not None:
+            prefix_key = req_obj.get_prefix_key()
+            if prefix_key is not None:
+                req_obj.shared_len = self.radix_cache.match(prefix_key)
+                if req_obj.shared_len > 0:
+                    req_obj.shared_key = prefix_key
+            if req_obj.paused and (prefix_key is None or req_obj.shared_len > 0):
+                req_obj.cur_kv_len = req_obj.shared_len + self.radix_cache.take(("req", req_obj.shm_req.request_id))
+            else:
+                req_obj.cur_kv_len = req_obj.shared_len
+            self.prompt_cache_hit_token_num += req_obj.cur_kv_len
+            req_obj.shm_req.prompt_cache_len = req_obj.cur_kv_len
+        if req_obj.paused:
+            # 暂停前已经计算过，但是没有从 prompt cache 中恢复的部分需要重新计算
+            self.recompute_token_num += max(0, req_obj.paused_kv_len - req_obj.cur_kv_len)
+        req_obj.shm_req.shm_cur_kv_len = req_obj.cur_kv_len
+        req_obj.initialized = True
+        req_obj.paused = False
+        return
+
+    def _free_req_mem(self, req_obj: SimInferReq, keep_private: bool):
+        """
+        请求暂停或者结束时释放其 kv, 开启 prompt cache 时将共享前缀插入 cache, 暂停请求私有的部分也插入 cache,
+        以便恢复时复用。
+        """
+        owned_len = req_obj.cur_kv_len - req_obj.shared_len
+        if self.radix_cache is None:
+            self.mem_manager.free(owned_len)
+            return
+
+        prefix_key = req_obj.get_prefix_key()
+        parent_key = req_obj.shared_key
+        if prefix_key is not None and req_obj.shared_key is None and req_obj.cur_kv_len >= req_obj.trace_req.prefix_len:
+            # 第一个计算出共享前缀的请求负责将其插入 cache, 前缀节点已经存在时释放自己重复计算的部分
+            prefix_len = req_obj.trace_req.prefix_len
+            if not self.radix_cache.insert(prefix_key, prefix_len):
+                self.mem_manager.free(prefix_len)
+            parent_key = prefix_key
+            owned_len -= prefix_len
+        if keep_private and (prefix_key is None or parent_key is not None):
+            if not self.radix_cache.insert(("req", req_obj.shm_req.request_id), owned_len, parent_key=parent_key):
+                self.mem_manager.free(owned_len)
+        else:
+            self.mem_manager.free(owned_len)
+
+        if req_obj.shared_key is not None:
+            self.radix_cache.dec_node_ref_counter(req_obj.shared_key)
+            req_obj.shared_key = None
+            req_obj.shared_len = 0
+        return
+
+    def _filter(self, finished_reqs: List[SimInferReq]):
+        for req_obj in finished_reqs:
+            self._free_req_mem(req_obj, keep_private=False)
+            self.requests_mapping.pop(req_obj.shm_req.request_id)
+            self.infer_req_ids.remove(req_obj.shm_req.request_id)
+            req_obj.shm_req.shm_infer_released = True
+        return
@@ -0,0 +1,305 @@
+import time
+import numpy as np
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from lightllm.server.core.objs import SamplingParams, FinishStatus
+from lightllm.server.core.objs.req import ChunkedPrefillReq
+from lightllm.server.req_id_generator import MAX_BEST_OF, convert_sub_id_to_group_id
+from lightllm.server.router.batch import Batch
+from lightllm.server.router.token_load import TokenLoad
+from lightllm.server.router.req_queue.chunked_prefill.impl import ChunkedPrefillQueue
+from lightllm.server.router.pause_strategy import build_pause_strategy, select_paused_reqs
+from lightllm.utils.envs_utils import set_env_start_args, get_env_start_args
+from lightllm.utils.config_utils import get_fixed_kv_len
+from lightllm.utils.log_utils import init_logger
+from .latency_model import LatencyModel
+from .sim_backend import SimMemManager, SimRadixCache, SimBackend
+from .trace import TraceReq
+
+logger = init_logger(__name__)
+
+
+class SimReq(ChunkedPrefillReq):
+    _pack_ = 4
+
+    def init_sim(self, request_id: int, trace_req: TraceReq, chunked_prefill_size: int):
+        """
+        只初始化调度需要使用的字段，不创建 prompt ids 等共享内存。start_time 使用模拟的时钟。
+        """
+        self.request_id = request_id
+        self.group_req_id = convert_sub_id_to_group_id(request_id)
+        self.is_paused = False
+        self.finish_status = FinishStatus()
+        self.is_aborted = False
+        self.router_aborted = False
+        self.shm_infer_released = False
+        self.shm_cur_kv_len = 0
+        self.shm_cur_output_len = 0
+        self.candetoken_out_len = 0
+        self.prompt_cache_len = 0
+        self.finish_token_index = -1
+        self.sample_params = SamplingParams()
+        self.sample_params.init(
+            tokenizer=None,
+            max_new_tokens=trace_req.get_max_new_tokens(),
+            priority=trace_req.priority,
+            ttft_slo_ms=trace_req.ttft_slo_ms,
+            tpot_slo_ms=trace_req.tpot_slo_ms,
+        )
+        self.input_len = trace_req.input_len
+        self.chunked_prefill_size = chunked_prefill_size
+        self.trace_req = trace_req
+        self.start_time = trace_req.arrival_time
+        return
+
+
+class SimTokenLoad(TokenLoad):
+    # 与 TokenLoad 的接口相同，使用进程内的数组代替共享内存
+    def __init__(self, dp_size_in_node) -> None:
+        self.dp_size_in_node = dp_size_in_node
+        self.shared_token_load = SimpleNamespace(arr=np.zeros((dp_size_in_node, 3), dtype=np.float64))
+        self.shared_token_infos = SimpleNamespace(arr=np.zeros((dp_size_in_node, 2), dtype=np.int64))
+        self.last_dynamic_max_load_update_time = time.time()
+
+
+class _SimShmReqManager:
+    def put_back_req_obj(self, req):
+        return
+
+
+class _ReqRecord:
+    def __init__(self, req: SimReq):
+        self.req = req
+        self.arrival_time = req.trace_req.arrival_time
+        self.first_token_time: float = None
+        self.finish_time: float = None
+        self.pause_count = 0
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if len(values) == 0:
+        return {"mean": 0.0, "p50": 0.0, "p90": 0.0, "p99": 0.0}
+    arr = np.asarray(values, dtype=np.float64)
+    return {
+        "mean": float(arr.mean()),
+        "p50": float(np.percentile(arr, 50)),
+        "p90": float(np.percentile(arr, 90)),
+        "p99": float(np.percentile(arr, 99)),
+    }
+
+
+class SimReport:
+    def __init__(self, simulator: "Simulator"):
+        args = simulator.args
+        records = list(simulator.req_records.values())
+        self.req_num = len(records)
+        self.rejected_req_num = simulator.rejected_req_num
+        self.makespan_s = simulator.clock
+        self.step_num = simulator.step_num
+
+        ttfts_ms, tpots_ms = [], []
+        good_req_num = 0
+        output_token_num = 0
+        for record in records:
+            trace_req = record.req.trace_req
+            ttft_ms = (record.first_token_time - record.arrival_time) * 1000
+            output_len = record.req.shm_cur_output_len
+            tpot_ms = 0.0
+            if output_len > 1:
+                tpot_ms = (record.finish_time - record.first_token_time) * 1000 / (output_len - 1)
+                tpots_ms.append(tpot_ms)
+            ttfts_ms.append(ttft_ms)
+            output_token_num += output_len
+            ttft_slo_ms = trace_req.ttft_slo_ms if trace_req.ttft_slo_ms > 0 else args.default_ttft_slo_ms
+            tpot_slo_ms = trace_req.tpot_slo_ms if trace_req.tpot_slo_ms > 0 else args.default_tpot_slo_ms
+            if ttft_ms <= ttft_slo_ms and tpot_ms <= tpot_slo_ms:
+                good_req_num += 1
+
+        self.ttft_ms = _percentiles(ttfts_ms)
+        self.tpot_ms = _percentiles(tpots_ms)
+        makespan = max(self.makespan_s, 1e-9)
+        self.throughput_req_s = self.req_num / makespan
+        self.output_token_throughput = output_token_num / makespan
+        self.goodput_req_s = good_req_num / makespan
+        self.slo_attainment = good_req_num / max(self.req_num, 1)
+
+        # kv 使用量: used 不包含 prompt cache 中没有被引用的 token, 与 router 调度时的计算方式一致
+        self.kv_usage_mean = simulator.kv_used_time_sum / makespan / simulator.max_total_token_num
+        self.kv_usage_peak = simulator.kv_used_peak / simulator.max_total_token_num
+        self.kv_usage_with_cache_mean = simulator.kv_held_time_sum / makespan / simulator.max_total_token_num
+
+        self.pause_event_num = simulator.pause_event_num
+        self.paused_req_num = sum(1 for record in records if record.pause_count > 0)
+        self.pause_count = sum(record.pause_count for record in records)
+        self.recompute_token_num = simulator.backend.recompute_token_num
+        self.prompt_cache_hit_token_num = simulator.backend.prompt_cache_hit_token_num
+
+    def to_dict(self) -> Dict:
+        return dict(self.__dict__)
+
+    def format(self) -> str:
+        lines = [
+            f"requests: {self.req_num} (rejected {self.rejected_req_num}), steps: {self.step_num}, "
+            f"makespan: {self.makespan_s:.2f} s",
+            f"throughput: {self.throughput_req_s:.2f} req/s, {self.output_token_throughput:.1f} output tokens/s",
+            f"goodput: {self.goodput_req_s:.2f} req/s, slo attainment {self.slo_attainment * 100:.1f}%",
+        ]
+        for name, dist in (("ttft", self.ttft_ms), ("tpot", self.tpot_ms)):
+            lines.append(
+                f"{name} ms: mean {dist['mean']:.1f} p50 {dist['p50']:.1f} p90 {dist['p90']:.1f} p99 {dist['p99']:.1f}"
+            )
+        lines.append(
+            f"kv usage: mean {self.kv_usage_mean * 100:.1f}% peak {self.kv_usage_peak * 100:.1f}%, "
+            f"with unrefed prompt cache mean {self.kv_usage_with_cache_mean * 100:.1f}%"
+        )
+        lines.append(
+            f"pause: {self.pause_event_num} events, {self.pause_count} pauses of {self.paused_req_num} requests, "
+            f"recompute {self.recompute_token_num} tokens, prompt cache hit {self.prompt_cache_hit_token_num} tokens"
+        )
+        return "\n".join(lines)
+
+
+class Simulator:
+    """
+    离线的调度模拟器，使用模拟的时钟重放请求 trace。调度部分直接使用真实的 ChunkedPrefillQueue, Batch 和
+    暂停策略，按照 RouterManager._step 的流程进行调度，推理后端替换为根据 LatencyModel 估计耗时的 SimBackend。
+    Simulator 对象本身作为 req_queue 使用的 router 对象，提供 shared_token_load, get_used_tokens 等接口。
+    与真实服务的差异: 调度与推理的折叠执行被简化为同步执行，不模拟请求的 abort。
+    """
+
+    def __init__(self, args, trace_reqs: List[TraceReq], latency_model: Optional[LatencyModel] = None):
+        assert not args.disable_chunked_prefill, "simulator only support chunked prefill mode"
+        assert args.dp == 1 and args.run_mode == "normal", "simulator only support normal mode with dp 1"
+        assert args.max_total_token_num is not None, "simulator need --max_total_token_num"
+        if args.batch_max_tokens is None:
+            args.batch_max_tokens = min(args.max_req_total_len, 2 * args.chunked_prefill_size + 256)
+        # 请求对象和 req_queue 通过环境变量读取启动参数，同一进程中多次模拟时需要清理缓存
+        set_env_start_args(args)
+        get_env_start_args.cache_clear()
+        get_fixed_kv_len.cache_clear()
+
+        self.args = args
+        self.trace_reqs = trace_reqs
+        self.max_total_token_num = args.max_total_token_num
+        self.is_safe_schedule = args.router_token_ratio == 0.0
+        self.max_wait_tokens = args.router_max_wait_tokens
+        self.shared_token_load = SimTokenLoad(1)
+        self.shm_req_manager = _SimShmReqManager()
+        self.mem_manager = SimMemManager(args.max_total_token_num)
+        self.radix_cache = None if args.disable_dynamic_prompt_cache else SimRadixCache(self.mem_manager)
+        self.backend = SimBackend(
+            args, self.mem_manager, self.radix_cache, LatencyModel() if latency_model is None else latency_model
+        )
+        self.req_queue = ChunkedPrefillQueue(args, self, 0, 1)
+        self.pause_strategy = build_pause_strategy(args)
+        self.running_batch: Batch = None
+        self.has_wait_tokens = 0
+
+        self.clock = 0.0
+        self.step_num = 0
+        self.req_records: Dict[int, _ReqRecord] = {}
+        self.rejected_req_num = 0
+        self.pause_event_num = 0
+        self.kv_used_time_sum = 0.0
+        self.kv_held_time_sum = 0.0
+        self.kv_used_peak = 0
+
+    def get_used_tokens(self, dp_index):
+        used_tokens = self.mem_manager.get_used_token_num()
+        if self.radix_cache is not None:
+            used_tokens -= self.radix_cache.get_unrefed_tokens_num()
+        return used_tokens
+
+    def run(self) -> SimReport:
+        next_index = 0
+        while True:
+            while next_index < len(self.trace_reqs) and self.trace_reqs[next_index].arrival_time <= self.clock:
+                self._add_req(next_index, self.trace_reqs[next_index])
+                next_index += 1
+            if self.running_batch is None and self.req_queue.get_wait_req_num() == 0:
+                if next_index == len(self.trace_reqs):
+                    break
+                self.clock = self.trace_reqs[next_index].arrival_time
+                continue
+            self._step()
+        return SimReport(self)
+
+    def _add_req(self, index: int, trace_req: TraceReq):
+        # 与 httpserver 相同，拒绝总长度超过 max_req_total_len 的请求
+        if trace_req.input_len + trace_req.get_max_new_tokens() > self.args.max_req_total_len:
+            self.rejected_req_num += 1
+            return
+        req = SimReq()
+        req.init_sim((index + 1) * MAX_BEST_OF, trace_req, self.args.chunked_prefill_size)
+        self.req_records[req.request_id] = _ReqRecord(req)
+        self.req_queue.extend([req])
+        return
+
+    def _step(self):
+        # 与 RouterManager._step 相同的调度流程
+        if self.running_batch is None:
+            new_batch = self.req_queue.generate_new_batch(self.running_batch)
+            if new_batch is None:
+                raise RuntimeError(
+                    f"{self.req_queue.get_wait_req_num()} waiting reqs can not be scheduled on an idle server, "
+                    "please check max_total_token_num, batch_max_tokens and running_max_req_size"
+                )
+            self.running_batch = new_batch
+            self.backend.prefill(new_batch.reqs)
+            self._filter_runing_batch()
+            if not self.args.disable_aggressive_schedule:
+                self.has_wait_tokens = self.max_wait_tokens
+            return
+
+        if self.has_wait_tokens >= self.max_wait_tokens:
+            new_mini_batch = self.req_queue.generate_new_batch(self.running_batch)
+            self.has_wait_tokens = 0
+            if new_mini_batch is not None:
+                if not self.args.disable_aggressive_schedule:
+                    self.has_wait_tokens = self.max_wait_tokens
+                self.backend.prefill(new_mini_batch.reqs)
+                self.running_batch.merge(new_mini_batch)
+                return
+
+        while not self._can_decode(self.running_batch):
+            paused_reqs = select_paused_reqs(
+                self.running_batch, self.pause_strategy, self.req_queue, self.max_total_token_num, dp_index=0
+            )
+            self.backend.pause_reqs(paused_reqs)
+            self.pause_event_num += 1
+            for req in paused_reqs:
+                self.req_records[req.request_id].pause_count += 1
+            self.has_wait_tokens = 0
+
+        self._decode_batch(self.running_batch)
+        self._filter_runing_batch()
+        self.has_wait_tokens += 1
+        return
+
+    def _decode_batch(self, batch: Batch):
+        cost_time = self.backend.decode()
+        self.step_num += 1
+        # 按照这一步执行期间的 kv 占用统计时间加权的使用率
+        used_tokens = self.get_used_tokens(0)
+        self.kv_used_time_sum += used_tokens * cost_time
+        self.kv_held_time_sum += self.mem_manager.get_used_token_num() * cost_time
+        self.kv_used_peak = max(self.kv_used_peak, used_tokens)
+
+        self.clock += cost_time
+        for req in self.backend.first_token_reqs:
+            self.req_records[req.request_id].first_token_time = self.clock
+        for req in self.backend.finished_reqs:
+            self.req_records[req.request_id].finish_time = self.clock
+        for req in [req for req in batch.reqs if req.shm_infer_released]:
+            batch.pop_req(req.request_id)
+        return
+
+    def _filter_runing_batch(self):
+        if self.running_batch is not None and self.running_batch.is_clear():
+            self.running_batch = None
+        return
+
+    def _can_decode(self, batch: Batch):
+        if self.is_safe_schedule:
+            return True
+        return batch.get_batch_decode_need_tokens()[0] + self.get_used_tokens(0) <= self.max_total_token_num
@@ -0,0 +1,62 @@
+import json
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+@dataclass
+class TraceReq:
+    arrival_time: float  # 相对于 trace 开始的到达时间，单位秒
+    input_len: int
+    output_len: int  # 请求实际输出的 token 数量，模拟遇到 eos 结束
+    max_new_tokens: int = -1  # 请求参数中的 max_new_tokens, 小于等于 0 时使用 output_len
+    prefix_id: Optional[str] = None  # 具有相同 prefix_id 的请求共享长度为 prefix_len 的 prompt 前缀
+    prefix_len: int = 0
+    priority: int = 0
+    ttft_slo_ms: int = 0
+    tpot_slo_ms: int = 0
+
+    def get_max_new_tokens(self) -> int:
+        return self.max_new_tokens if self.max_new_tokens > 0 else self.output_len
+
+
+# 兼容常见的 trace 字段命名
+_FIELD_ALIASES = {
+    "timestamp": "arrival_time",
+    "prompt_len": "input_len",
+    "prompt_tokens": "input_len",
+    "completion_tokens": "output_len",
+}
+
+
+def parse_trace_line(line: str) -> TraceReq:
+    obj = json.loads(line)
+    kwargs = {_FIELD_ALIASES.get(k, k): v for k, v in obj.items()}
+    kwargs = {k: v for k, v in kwargs.items() if k in TraceReq.__dataclass_fields__}
+    req = TraceReq(**kwargs)
+    if req.prefix_id is not None:
+        req.prefix_id = str(req.prefix_id)
+    # 与 radix cache 相同，命中的前缀至少要留下一个 token 进行 prefill
+    req.prefix_len = max(0, min(req.prefix_len, req.input_len - 1))
+    assert req.input_len > 0 and req.output_len > 0, f"error trace line {line}"
+    return req
+
+
+def load_trace(path: str, max_req_num: int = None, time_scale: float = 1.0) -> List[TraceReq]:
+    """
+    读取 jsonl 格式的 trace, 每行一个请求，例如:
+    {"arrival_time": 0.12, "input_len": 512, "output_len": 128, "prefix_id": "sys_0", "prefix_len": 256}
+    返回按照到达时间排序，并平移到从 0 开始的请求列表。time_scale 用于缩放到达间隔，小于 1 时加大请求压力。
+    """
+    reqs = []
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                reqs.append(parse_trace_line(line))
+    reqs.sort(key=lambda req: req.arrival_time)
+    if max_req_num is not None:
+        reqs = reqs[0:max_req_num]
+    if reqs:
+        start_time = reqs[0].arrival_time
+        for req in reqs:
+            req.arrival_time = (req.arrival_time - start_time) * time_scale
+    return reqs
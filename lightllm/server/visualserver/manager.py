@@ -2,12 +2,12 @@ import zmq
 import zmq.asyncio
 import asyncio
 import uvloop
-import rpyc
 import pickle
 import inspect
 from typing import List
 from lightllm.server.core.objs.io_objs.group_req import GroupReqIndexes
 from lightllm.server.core.objs import ShmReqManager
+from lightllm.server.embed_cache.async_client import AsyncCacheClient
 
 asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 from lightllm.server.multimodal_params import MultimodalParams, ImageItem
@@ -35,7 +35,7 @@ class VisualManager:
 
         self.recv_from_httpserver = context.socket(zmq.PULL)
         self.recv_from_httpserver.bind(f"{args.zmq_mode}127.0.0.1:{visual_port}")
-        self.cache_client = rpyc.connect("localhost", cache_port)
+        self.cache_client = AsyncCacheClient(cache_port)
         self.cache_port = cache_port
         self.waiting_reqs: List[GroupReqIndexes] = []
         self.model_weightdir = args.model_dir
@@ -120,8 +120,10 @@ class VisualManager:
 
                     multimodal_params = group_req_indexes.multimodal_params
 
-                    for img in multimodal_params.images:
-                        if not self.cache_client.root.get_item_embed(img.uuid):
+                    # 一次往返查询这个请求所有的图片是否已经有 embed
+                    embed_readys = await self.cache_client.query_embed_many([e.uuid for e in multimodal_params.images])
+                    for img, embed_ready in zip(multimodal_params.images, embed_readys):
+                        if not embed_ready:
                             images_need_infer.append(img)
 
                         if len(images_need_infer) == self.infer_batch_size:
@@ -17,7 +17,7 @@ from lightllm.server.multimodal_params import MultimodalParams, ImageItem
 from lightllm.models.qwen2_vl.qwen2_visual import Qwen2VisionTransformerPretrainedModel
 from lightllm.models.qwen2_5_vl.qwen2_5_visual import Qwen2_5_VisionTransformerPretrainedModel
 from lightllm.models.tarsier2.tarsier2_visual import TarsierVisionTransformerPretrainedModel
-from lightllm.server.embed_cache.utils import tensor2bytes, read_shm, create_shm, get_shm_name_data, get_shm_name_embed
+from lightllm.server.embed_cache.utils import PinnedStagingBuffer, create_embed_shm, get_shm_name_embed
 from lightllm.utils.infer_utils import set_random_seed
 from lightllm.utils.infer_utils import calculate_time, mark_start, mark_end
 from lightllm.utils.dist_utils import init_vision_distributed_env
@@ -39,6 +39,7 @@ class VisualModelRpcServer(rpyc.Service):
         weight_dir = kvargs["weight_dir"]
         self.vit_rank_id = kvargs["vit_rank_id"]
         self.cache_client = rpyc.connect("localhost", self.cache_port)
+        self.staging_buffer = PinnedStagingBuffer()
         self.data_type = kvargs["data_type"]
 
         init_vision_distributed_env(kvargs)
@@ -93,15 +94,18 @@ class VisualModelRpcServer(rpyc.Service):
     def exposed_encode(self, images: List[ImageItem]):
         images = obtain(images)
         all_img_embeds, uuids, valid_ids = self.forward(images)
-        all_img_embeds = all_img_embeds.to(torch.device("cpu"))
         if self.tp_rank_id == 0:
+            # 整个 batch 的 embed 通过 pinned 缓冲区一次拷贝到 cpu, 再按原始数据格式写入共享内存
+            all_img_embeds = self.staging_buffer.to_cpu(all_img_embeds)
+            embed_readys = self.cache_client.root.query_embed_many(tuple(uuids))
+            set_embed_uids = []
             for i in range(len(uuids)):
                 uid = uuids[i]
-                if not self.cache_client.root.get_item_embed(uid):
+                if not embed_readys[i] and uid not in set_embed_uids:
                     start, end = valid_ids[i]
-                    cur_embed_bytes = tensor2bytes(all_img_embeds[start:end])
-                    create_shm(get_shm_name_embed(uuids[i]), cur_embed_bytes)
-                    self.cache_client.root.set_item_embed(uuids[i])
+                    create_embed_shm(get_shm_name_embed(uuids[i]), all_img_embeds[start:end])
+                    set_embed_uids.append(uid)
+            self.cache_client.root.set_item_embed_many(tuple(set_embed_uids))
         return
 
 
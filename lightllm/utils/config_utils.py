@@ -56,6 +56,9 @@ def get_dtype(model_path: str):
 @lru_cache(maxsize=None)
 def get_fixed_kv_len():
     start_args = get_env_start_args()
+    # 离线的调度模拟等场景不加载模型
+    if start_args.model_dir is None:
+        return 0
     model_cfg = get_config_json(start_args.model_dir)
     if "prompt_cache_token_ids" in model_cfg:
         return len(model_cfg["prompt_cache_token_ids"])
@@ -1,13 +1,23 @@
+import os
 import time
 import base64
 import httpx
+import asyncio
+import hashlib
 from PIL import Image
 from io import BytesIO
+from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import Request
 from lightllm.utils.log_utils import init_logger
 
 logger = init_logger(__name__)
 
+# 同一个进程中的下载请求共享连接池，按照 proxy 区分
+g_http_clients: Dict[Optional[str], httpx.AsyncClient] = {}
+# 多模态数据的哈希和音频解码在线程池中进行，hashlib 和音频解码库在计算时会释放 GIL
+g_multimodal_executor: ThreadPoolExecutor = None
+
 
 def image2base64(img_str: str):
     image_obj = Image.open(img_str)
@@ -18,23 +28,48 @@ def image2base64(img_str: str):
     return base64.b64encode(buffer.getvalue()).decode("utf-8")
 
 
+def _get_http_client(proxy: Optional[str]) -> httpx.AsyncClient:
+    if proxy not in g_http_clients:
+        max_connections = int(os.getenv("LIGHTLLM_MULTIMODAL_MAX_CONNECTIONS", "256"))
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections // 4)
+        g_http_clients[proxy] = httpx.AsyncClient(proxy=proxy, limits=limits)
+    return g_http_clients[proxy]
+
+
+def get_multimodal_executor() -> ThreadPoolExecutor:
+    global g_multimodal_executor
+    if g_multimodal_executor is None:
+        max_workers = int(os.getenv("LIGHTLLM_MULTIMODAL_WORKERS", "8"))
+        g_multimodal_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="multimodal_worker")
+    return g_multimodal_executor
+
+
+async def run_in_multimodal_executor(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_multimodal_executor(), func, *args)
+
+
+def compute_md5(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+
 async def fetch_resource(url, request: Request, timeout, proxy=None):
     logger.info(f"Begin to download resource from url: {url}")
     start_time = time.time()
-    async with httpx.AsyncClient(proxy=proxy) as client:
-        async with client.stream("GET", url, timeout=timeout) as response:
-            response.raise_for_status()
-            ans_bytes = []
-            async for chunk in response.aiter_bytes(chunk_size=1024 * 1024):
-                if request is not None and await request.is_disconnected():
-                    await response.aclose()
-                    raise Exception("Request disconnected. User cancelled download.")
-                ans_bytes.append(chunk)
-                # 接收的数据不能大于128M
-                if len(ans_bytes) > 128:
-                    raise Exception(f"url {url} recv data is too big")
-
-            content = b"".join(ans_bytes)
+    client = _get_http_client(proxy)
+    async with client.stream("GET", url, timeout=timeout) as response:
+        response.raise_for_status()
+        ans_bytes = []
+        async for chunk in response.aiter_bytes(chunk_size=1024 * 1024):
+            if request is not None and await request.is_disconnected():
+                await response.aclose()
+                raise Exception("Request disconnected. User cancelled download.")
+            ans_bytes.append(chunk)
+            # 接收的数据不能大于128M
+            if len(ans_bytes) > 128:
+                raise Exception(f"url {url} recv data is too big")
+
+        content = b"".join(ans_bytes)
     end_time = time.time()
     cost_time = end_time - start_time
     logger.info(f"Download url {url} resource cost time: {cost_time} seconds")
@@ -0,0 +1,70 @@
+from functools import lru_cache
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+
+class AhoCorasickMatcher:
+    """
+    多个停止序列的 Aho–Corasick 自动机，模式串可以是 token id 序列，也可以是字符串(按字符匹配)。
+    构建时把失配回退展开为确定的转移表，每个状态只保存结果不为根状态的转移，不在任何模式串中出现的符号
+    直接回到根状态，所以 step 每个新符号都是 O(1) 的字典查找。自动机本身无状态，使用者保存当前状态，
+    同一个自动机可以被所有停止序列相同的请求共享。
+    """
+
+    ROOT_STATE = 0
+
+    def __init__(self, patterns: Sequence[Sequence[Hashable]]):
+        self.patterns = [tuple(e) for e in patterns if len(e) > 0]
+        children: List[Dict[Hashable, int]] = [{}]
+        # 在每个状态结束的最长模式串的长度，包括 fail 链上的状态，0 表示没有模式串结束
+        self.match_len: List[int] = [0]
+        for pattern in self.patterns:
+            state = self.ROOT_STATE
+            for symbol in pattern:
+                next_state = children[state].get(symbol)
+                if next_state is None:
+                    next_state = len(children)
+                    children[state][symbol] = next_state
+                    children.append({})
+                    self.match_len.append(0)
+                state = next_state
+            self.match_len[state] = max(self.match_len[state], len(pattern))
+
+        # 按照 bfs 顺序计算 fail 和完整的转移表，子状态的转移表在 fail 状态转移表的基础上加上自己的子节点
+        self.transitions: List[Dict[Hashable, int]] = [dict(children[self.ROOT_STATE])] + [None] * (len(children) - 1)
+        queue = list(children[self.ROOT_STATE].values())
+        fail = [self.ROOT_STATE] * len(children)
+        for state in queue:
+            self.transitions[state] = {**self.transitions[fail[state]], **children[state]}
+            self.match_len[state] = max(self.match_len[state], self.match_len[fail[state]])
+            for symbol, child in children[state].items():
+                fail[child] = self.transitions[fail[state]].get(symbol, self.ROOT_STATE)
+                queue.append(child)
+        return
+
+    def step(self, state: int, symbol: Hashable) -> int:
+        return self.transitions[state].get(symbol, self.ROOT_STATE)
+
+    def feed(self, state: int, symbols: Sequence[Hashable]) -> Tuple[int, int]:
+        """
+        从 state 开始依次输入 symbols, 遇到第一个模式串结束的位置时停止。
+        返回 (新状态, 匹配结束的位置)，没有匹配时位置为 -1。
+        """
+        transitions = self.transitions
+        match_len = self.match_len
+        for i, symbol in enumerate(symbols):
+            state = transitions[state].get(symbol, self.ROOT_STATE)
+            if match_len[state] != 0:
+                return state, i
+        return state, -1
+
+    def is_match_state(self, state: int) -> bool:
+        return self.match_len[state] != 0
+
+
+@lru_cache(maxsize=1024)
+def get_stop_sequence_matcher(stop_sequences: Tuple[Tuple[Hashable, ...], ...]) -> AhoCorasickMatcher:
+    """
+    按照停止序列编译自动机并缓存，停止序列相同的请求共享同一个自动机。stop_sequences 为 token id 元组的元组，
+    或者字符串的元组。
+    """
+    return AhoCorasickMatcher(stop_sequences)
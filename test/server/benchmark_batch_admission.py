@@ -0,0 +1,71 @@
+"""
+router 准入判断微基准测试：对比逐个请求重新排序计算 token 峰值的原始判断方式与 BatchAdmission 批量判断的耗时，
+并校验两者的准入结果一致。
+"""
+import argparse
+import time
+import numpy as np
+from lightllm.server.router.req_queue.batch_admission import BatchAdmission
+
+
+def legacy_admit_num(cache_len_list, candidates, token_limit, req_num_limit, prefill_token_limit):
+    cache_len_list = list(cache_len_list)
+    base_req_num = len(cache_len_list)
+    paused_num = 0
+    prefill_tokens = 0
+    for admit_num, (tuple_tokens, first_router_need_tokens, is_paused) in enumerate(candidates):
+        cache_len_list.append(tuple_tokens)
+        cache_len_list.sort(key=lambda x: -x[1])
+        left_out_len_array = np.array([e[1] for e in cache_len_list])
+        has_run_len_array = np.array([e[0] for e in cache_len_list])
+        cum_run_len_array = np.cumsum(has_run_len_array)
+        size_array = np.arange(1, len(cache_len_list) + 1, 1)
+        need_max_token_num = (left_out_len_array * size_array + cum_run_len_array).max()
+        paused_num += int(is_paused)
+        prefill_tokens += first_router_need_tokens
+        ok_req_num = len(cache_len_list) - base_req_num - paused_num <= req_num_limit
+        if not (need_max_token_num < token_limit and ok_req_num and prefill_tokens <= prefill_token_limit):
+            return admit_num
+    return len(candidates)
+
+
+def batch_admit_num(cache_len_list, candidates, token_limit, req_num_limit, prefill_token_limit):
+    admission = BatchAdmission(cache_len_list, token_limit, req_num_limit, prefill_token_limit)
+    # 与 ChunkedPrefillQueue 中一样按照倍增的数量追加候选请求
+    gather_num = 16
+    index = 0
+    while True:
+        while index < len(candidates) and admission.get_candidate_num() < gather_num:
+            admission.add_candidate(*candidates[index])
+            index += 1
+        admit_num = admission.get_admit_num()
+        if admit_num < admission.get_candidate_num() or index == len(candidates):
+            return admit_num
+        gather_num *= 2
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--running_num", type=int, default=1000)
+    parser.add_argument("--waiting_num", type=int, default=1000)
+    parser.add_argument("--max_total_token_num", type=int, default=4000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    cache_len_list = [(int(a), int(b)) for a, b in rng.integers(1, 2048, size=(args.running_num, 2))]
+    candidates = [((int(a), int(b)), int(a), False) for a, b in rng.integers(1, 2048, size=(args.waiting_num, 2))]
+    limits = (args.max_total_token_num, args.running_num + args.waiting_num, 10**9)
+
+    for name, func in [("legacy", legacy_admit_num), ("batch", batch_admit_num)]:
+        cost_list = []
+        for _ in range(args.repeat):
+            start = time.time()
+            admit_num = func(cache_len_list, candidates, *limits)
+            cost_list.append(time.time() - start)
+        print(f"{name}: admit {admit_num} / {args.waiting_num} reqs, cost {np.median(cost_list) * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+约束输出掩码微基准测试：在 cpu 上对比 dpda, xgrammar, outlines 三种约束后端每一步生成允许 token 位图的耗时。
+使用固定的 json schema 随机生成 json 文档并用 tokenizer 编码，逐个 token 模拟解码过程，每一步先生成位图
+再接受文档中的下一个 token。dpda 只约束输出为合法的 json, xgrammar 和 outlines 会同时校验 schema,
+没有安装的后端会被跳过。
+"""
+import json
+import time
+import random
+import argparse
+from transformers import AutoTokenizer
+from lightllm.common.dpda import DpdaMatcher, build_token_table, get_token_bytes
+from lightllm.server.router.model_infer.mode_backend.grammar_utils import TokenBitmaskBuilder
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "age": {"type": "integer"},
+        "score": {"type": "number"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+        "address": {
+            "type": "object",
+            "properties": {"city": {"type": "string"}, "street": {"type": "string"}},
+            "required": ["city", "street"],
+        },
+    },
+    "required": ["name", "age", "score", "tags", "address"],
+}
+
+WORDS = ["alpha", "beta", "gamma", "delta", "上海", "北京", "road", "No. 42", 'say "hi"', "line\nbreak"]
+
+
+def gen_doc(rng: random.Random) -> str:
+    doc = {
+        "name": " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))),
+        "age": rng.randint(0, 100),
+        "score": round(rng.uniform(-100, 100), 3),
+        "tags": [rng.choice(WORDS) for _ in range(rng.randint(0, 6))],
+        "address": {"city": rng.choice(WORDS), "street": " ".join(rng.choice(WORDS) for _ in range(3))},
+    }
+    return json.dumps(doc, ensure_ascii=False, separators=(",", ":"))
+
+
+class DpdaRunner:
+    def __init__(self, tokenizer, vocab_size, cache_dir):
+        self.token_table = build_token_table("json", get_token_bytes(tokenizer), cache_dir=cache_dir)
+        self.builder = TokenBitmaskBuilder(vocab_size)
+
+    def new_matcher(self):
+        return DpdaMatcher(self.token_table)
+
+    def step(self, matcher: DpdaMatcher, next_token_id):
+        self.builder.reset(1)
+        words, extra_token_ids = matcher.get_next_token_bitmask()
+        matcher.can_end()
+        self.builder.set_allowed_bitmask(0, words, extra_token_ids)
+        return matcher.accept_token(next_token_id)
+
+
+class XgrammarRunner:
+    def __init__(self, tokenizer, vocab_size, cache_dir):
+        import xgrammar as xgr
+
+        self.xgr = xgr
+        tokenizer_info = xgr.TokenizerInfo.from_huggingface(tokenizer, vocab_size=vocab_size)
+        self.compiled = xgr.GrammarCompiler(tokenizer_info, max_threads=8).compile_json_schema(json.dumps(SCHEMA))
+        self.bitmask = xgr.allocate_token_bitmask(1, vocab_size)
+
+    def new_matcher(self):
+        return self.xgr.GrammarMatcher(self.compiled)
+
+    def step(self, matcher, next_token_id):
+        matcher.fill_next_token_bitmask(self.bitmask, 0)
+        return matcher.accept_token(next_token_id)
+
+
+class OutlinesRunner:
+    def __init__(self, tokenizer, vocab_size, cache_dir):
+        from outlines.fsm.guide import RegexGuide
+        from outlines.fsm.json_schema import build_regex_from_schema
+        from outlines.models.transformers import TransformerTokenizer
+
+        regex = build_regex_from_schema(json.dumps(SCHEMA))
+        self.guide = RegexGuide.from_regex(regex, TransformerTokenizer(tokenizer))
+        self.builder = TokenBitmaskBuilder(vocab_size)
+
+    def new_matcher(self):
+        return [self.guide.initial_state]
+
+    def step(self, matcher, next_token_id):
+        self.builder.reset(1)
+        self.builder.set_allowed_token_ids(0, self.guide.get_next_instruction(matcher[0]).tokens)
+        matcher[0] = self.guide.get_next_state(matcher[0], next_token_id)
+        return matcher[0] != -1
+
+
+RUNNERS = {"dpda": DpdaRunner, "xgrammar": XgrammarRunner, "outlines": OutlinesRunner}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokenizer", type=str, required=True)
+    parser.add_argument("--num_docs", type=int, default=100)
+    parser.add_argument("--modes", type=str, nargs="+", default=["dpda", "xgrammar", "outlines"])
+    parser.add_argument("--cache_dir", type=str, default=None, help="dpda token table disk cache dir")
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer, trust_remote_code=True)
+    vocab_size = max(len(tokenizer), max(tokenizer.get_vocab().values()) + 1)
+    rng = random.Random(0)
+    docs = [tokenizer.encode(gen_doc(rng), add_special_tokens=False) for _ in range(args.num_docs)]
+    print(f"vocab size {vocab_size}, docs {len(docs)}, tokens {sum(len(e) for e in docs)}")
+
+    for mode in args.modes:
+        try:
+            start_time = time.time()
+            runner = RUNNERS[mode](tokenizer, vocab_size, args.cache_dir)
+            build_time = time.time() - start_time
+        except ImportError as e:
+            print(f"{mode}: skipped, {str(e)}")
+            continue
+
+        step_num = 0
+        reject_num = 0
+        cost_time = 0.0
+        for token_ids in docs:
+            matcher = runner.new_matcher()
+            start_time = time.time()
+            for token_id in token_ids:
+                step_num += 1
+                if not runner.step(matcher, token_id):
+                    reject_num += 1
+                    break
+            cost_time += time.time() - start_time
+        print(
+            f"{mode}: build {build_time:.3f} s, steps {step_num}, rejected docs {reject_num}, "
+            f"mask per step {cost_time / max(step_num, 1) * 1000:.4f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
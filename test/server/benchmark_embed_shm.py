@@ -0,0 +1,113 @@
+"""
+embed 共享内存格式微基准测试：在 cpu 上对比旧版 torch.save / torch.load 的序列化格式与头部加原始数据的格式，
+统计一个 embed 写入共享内存再读取出来的往返耗时，以及每种格式在独立子进程中运行时每一轮往返的峰值 RSS 增量
+(包含映射到进程中的共享内存页)。
+"""
+import os
+import argparse
+import time
+import uuid
+import resource
+import multiprocessing as mp
+import torch
+from lightllm.server.embed_cache.utils import (
+    tensor2bytes,
+    bytes2tensor,
+    create_shm,
+    read_shm,
+    free_shm,
+    create_embed_shm,
+    read_embed_shm,
+)
+
+
+def torch_save_round_trip(name, embed):
+    create_shm(name, tensor2bytes(embed))
+    ans = bytes2tensor(read_shm(name))
+    free_shm(name)
+    return ans
+
+
+def raw_round_trip(name, embed):
+    create_embed_shm(name, embed)
+    ans = read_embed_shm(name, device="cpu")
+    free_shm(name)
+    return ans
+
+
+ROUND_TRIP_FUNCS = {"torch_save": torch_save_round_trip, "raw": raw_round_trip}
+
+
+def reset_peak_rss():
+    # linux 上写入 5 到 clear_refs 可以把峰值 RSS (VmHWM) 重置为当前的 RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_case(mode, token_num, hidden_size, repeat, result_queue):
+    # 直接以 bfloat16 创建 embed, 避免 float32 的临时 tensor 抬高峰值 RSS
+    embed = torch.empty((token_num, hidden_size), dtype=torch.bfloat16).normal_()
+    round_trip = ROUND_TRIP_FUNCS[mode]
+    # 预热一次，排除第一次调用时的一次性开销
+    assert torch.equal(round_trip(f"bench_embed_{uuid.uuid4().hex}", embed), embed)
+    cost_times, peak_rss_deltas = [], []
+    for _ in range(repeat):
+        name = f"bench_embed_{uuid.uuid4().hex}"
+        reset_peak_rss()
+        base_rss = get_peak_rss_kb()
+        start_time = time.time()
+        ans = round_trip(name, embed)
+        cost_times.append(time.time() - start_time)
+        # 每一轮单独统计峰值增量，不包含下面校验结果时的临时内存
+        peak_rss_deltas.append(get_peak_rss_kb() - base_rss)
+        assert torch.equal(ans, embed)
+        del ans
+    result_queue.put((sorted(cost_times)[len(cost_times) // 2], max(peak_rss_deltas)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--token_nums", type=int, nargs="+", default=[1024, 4096, 10240])
+    parser.add_argument("--hidden_size", type=int, default=4096)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # 固定 glibc 的 mmap 阈值，大块内存释放后立即归还系统，否则预热时释放的内存会被后面复用，峰值 RSS 统计偏小
+    os.environ.setdefault("MALLOC_MMAP_THRESHOLD_", str(128 * 1024))
+    ctx = mp.get_context("spawn")
+    outputs = []
+    for token_num in args.token_nums:
+        embed_mb = token_num * args.hidden_size * 2 / 1024 / 1024
+        for mode in ROUND_TRIP_FUNCS.keys():
+            # 每种情况在独立的子进程中运行，峰值 RSS 互不影响
+            result_queue = ctx.Queue()
+            process = ctx.Process(target=run_case, args=(mode, token_num, args.hidden_size, args.repeat, result_queue))
+            process.start()
+            cost_time, peak_rss_delta = result_queue.get()
+            process.join()
+            outputs.append(
+                f"token_num {token_num:6d} ({embed_mb:6.1f} MB) {mode:>10}: "
+                f"round trip {cost_time * 1000:8.2f} ms, peak rss delta {peak_rss_delta / 1024:8.1f} MB"
+            )
+
+    for line in outputs:
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
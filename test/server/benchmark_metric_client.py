@@ -0,0 +1,102 @@
+"""
+metric 上报微基准测试：在本地启动 MetricServer, 对比旧版逐个操作通过 rpyc 上报的客户端与在本地聚合后批量上报的
+MetricClient, 模拟每个请求的若干次上报，统计热路径上每个请求的耗时和所有数据到达 MetricServer 的总耗时，并校验
+两者导出的 Prometheus 数据一致。
+"""
+import argparse
+import queue
+import threading
+import time
+import rpyc
+from types import SimpleNamespace
+from rpyc.utils.server import ThreadedServer
+from lightllm.server.metrics.manager import MetricServer, MetricClient
+
+
+class LegacyMetricClient(threading.Thread):
+    # 旧版的实现，每个操作都是一次 rpyc 调用
+    def __init__(self, port):
+        super().__init__()
+        self.conn = rpyc.connect("localhost", port)
+        self.task_queue = queue.Queue(maxsize=4096 * 1024)
+        self.daemon = True
+        self.start()
+
+    def counter_inc(self, *args, **kwargs):
+        self.task_queue.put_nowait(lambda: self.conn.root.counter_inc(*args, **kwargs))
+
+    def histogram_observe(self, *args, **kwargs):
+        self.task_queue.put_nowait(lambda: self.conn.root.histogram_observe(*args, **kwargs))
+
+    def gauge_set(self, *args, **kwargs):
+        self.task_queue.put_nowait(lambda: self.conn.root.gauge_set(*args, **kwargs))
+
+    def flush(self):
+        self.task_queue.join()
+
+    def run(self):
+        while True:
+            task_func = self.task_queue.get()
+            task_func()
+            self.task_queue.task_done()
+
+
+def simulate_requests(client, num_requests):
+    # 与 httpserver 中一个请求的上报次数相当
+    for i in range(num_requests):
+        client.counter_inc("lightllm_request_count")
+        client.histogram_observe("lightllm_request_input_length", 100 + i % 1000)
+        client.histogram_observe("lightllm_request_max_new_tokens", 256)
+        client.histogram_observe("lightllm_request_first_token_duration", 0.01 * (i % 50))
+        client.histogram_observe("lightllm_request_generated_tokens", 128 + i % 64)
+        client.histogram_observe("lightllm_batch_inference_duration_bucket", 0.02, "decode")
+        client.counter_inc("lightllm_batch_inference_count", "decode")
+        client.gauge_set("lightllm_queue_size", i % 10)
+        client.counter_inc("lightllm_request_success")
+
+
+def start_server(port):
+    args = SimpleNamespace(
+        push_interval=10,
+        metric_gateway=None,
+        job_name="lightllm",
+        grouping_key=[],
+        enable_monitor_auth=False,
+        max_req_total_len=4096,
+    )
+    service = MetricServer(args)
+    server = ThreadedServer(service, port=port)
+    threading.Thread(target=server.start, daemon=True).start()
+    time.sleep(1)
+    return service
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_requests", type=int, default=5000)
+    parser.add_argument("--port", type=int, default=18888)
+    args = parser.parse_args()
+
+    outputs = []
+    for name, client_class in [("legacy", LegacyMetricClient), ("batched", MetricClient)]:
+        service = start_server(args.port)
+        client = client_class(args.port)
+        start = time.time()
+        simulate_requests(client, args.num_requests)
+        hot_path_cost = time.time() - start
+        client.flush()
+        total_cost = time.time() - start
+        # *_created 为指标的创建时间戳，两次启动的 MetricServer 一定不同，不参与比较
+        lines = service.exposed_generate_latest().decode().splitlines()
+        outputs.append([line for line in lines if "_created" not in line])
+        print(
+            f"{name}: hot path {hot_path_cost / args.num_requests * 1e6:.2f} us/req, "
+            f"all metrics merged after {total_cost:.3f} s"
+        )
+        args.port += 1
+
+    print(f"same prometheus output: {outputs[0] == outputs[1]}")
+
+
+if __name__ == "__main__":
+    main()
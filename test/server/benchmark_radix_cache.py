@@ -0,0 +1,269 @@
+"""
+radix cache 微基准测试：对比基于扁平数组存储节点信息的 RadixCache 与旧版基于 SortedSet 维护淘汰顺序、
+逐 token 进行 python 比较的实现，在模拟多轮对话场景下 insert / match_prefix / evict 的耗时。
+"""
+import argparse
+import time
+import torch
+import numpy as np
+from sortedcontainers import SortedSet
+from lightllm.server.router.dynamic_prompt.radix_cache import RadixCache
+
+
+class _LegacyTimeIdGenerator:
+    def __init__(self):
+        self.time_id = 0
+
+    def generate_time_id(self):
+        self.time_id += 1
+        return self.time_id
+
+
+_legacy_time_gen = _LegacyTimeIdGenerator()
+
+
+class _LegacyTreeNode:
+    def __init__(self):
+        self.children = {}
+        self.parent = None
+        self.token_id_key = None
+        self.token_mem_index_value = None
+        self.ref_counter = 0
+        self.time_id = _legacy_time_gen.generate_time_id()
+
+    def get_compare_key(self):
+        return (0 if self.ref_counter == 0 else 1, len(self.children), self.time_id)
+
+    def split_node(self, prefix_len):
+        split_parent_node = _LegacyTreeNode()
+        split_parent_node.parent = self.parent
+        split_parent_node.parent.children[self.token_id_key[0].item()] = split_parent_node
+        split_parent_node.token_id_key = self.token_id_key[0:prefix_len]
+        split_parent_node.token_mem_index_value = self.token_mem_index_value[0:prefix_len]
+        split_parent_node.children = {self.token_id_key[prefix_len].item(): self}
+        split_parent_node.ref_counter = self.ref_counter
+        self.token_id_key = self.token_id_key[prefix_len:]
+        self.token_mem_index_value = self.token_mem_index_value[prefix_len:]
+        self.parent = split_parent_node
+        return split_parent_node
+
+    def add_and_return_new_child(self, token_id_key, token_mem_index_value):
+        child = _LegacyTreeNode()
+        child.token_id_key = token_id_key
+        child.token_mem_index_value = token_mem_index_value
+        self.children[token_id_key[0].item()] = child
+        child.parent = self
+        return child
+
+    def is_leaf(self):
+        return len(self.children) == 0
+
+
+def _legacy_match(key, seq):
+    i = 0
+    for k, w in zip(key, seq):
+        if k != w:
+            break
+        i += 1
+    return i
+
+
+class LegacyRadixCache:
+    """
+    旧版实现的精简副本，只保留 insert / match_prefix / evict 的主流程，用于对比。
+    """
+
+    def __init__(self):
+        self.root_node = _LegacyTreeNode()
+        self.root_node.token_id_key = torch.zeros((0,), dtype=torch.int64)
+        self.root_node.token_mem_index_value = torch.zeros((0,), dtype=torch.int64)
+        self.root_node.ref_counter = 1
+        self.evict_tree_set = SortedSet(key=lambda x: x.get_compare_key())
+        self.evict_tree_set.add(self.root_node)
+        self.tree_total_tokens_num = 0
+
+    def insert(self, key):
+        return self._insert_helper(self.root_node, key, key.clone())
+
+    def _insert_helper(self, node, key, value):
+        if node.is_leaf():
+            self.evict_tree_set.discard(node)
+        try:
+            first_key_id = key[0].item()
+            if first_key_id in node.children.keys():
+                child = node.children[first_key_id]
+                prefix_len = _legacy_match(key, child.token_id_key)
+                if prefix_len == len(key):
+                    if child.is_leaf():
+                        self.evict_tree_set.discard(child)
+                    child.time_id = _legacy_time_gen.generate_time_id()
+                    if child.is_leaf():
+                        self.evict_tree_set.add(child)
+                    return prefix_len
+                elif prefix_len < len(child.token_id_key):
+                    if child.is_leaf():
+                        self.evict_tree_set.discard(child)
+                    split_parent_node = child.split_node(prefix_len)
+                    new_node = split_parent_node.add_and_return_new_child(key[prefix_len:], value[prefix_len:])
+                    self.tree_total_tokens_num += len(new_node.token_mem_index_value)
+                    if child.is_leaf():
+                        self.evict_tree_set.add(child)
+                    self.evict_tree_set.add(new_node)
+                    return prefix_len
+                else:
+                    return prefix_len + self._insert_helper(child, key[prefix_len:], value[prefix_len:])
+            new_node = node.add_and_return_new_child(key, value)
+            self.tree_total_tokens_num += len(new_node.token_mem_index_value)
+            self.evict_tree_set.add(new_node)
+            return 0
+        finally:
+            node.time_id = _legacy_time_gen.generate_time_id()
+            if node.is_leaf():
+                self.evict_tree_set.add(node)
+
+    def match_prefix(self, key):
+        ans_value_list = []
+        self._match_prefix_helper(self.root_node, key, ans_value_list)
+        return sum(len(v) for v in ans_value_list)
+
+    def _match_prefix_helper(self, node, key, ans_value_list):
+        if node.is_leaf():
+            self.evict_tree_set.discard(node)
+        try:
+            if len(key) == 0 or key[0].item() not in node.children.keys():
+                return node
+            child = node.children[key[0].item()]
+            prefix_len = _legacy_match(key, child.token_id_key)
+            if prefix_len == len(child.token_id_key):
+                ans_value_list.append(child.token_mem_index_value)
+                return self._match_prefix_helper(child, key[prefix_len:], ans_value_list)
+            if child.is_leaf():
+                self.evict_tree_set.discard(child)
+            split_parent_node = child.split_node(prefix_len)
+            ans_value_list.append(split_parent_node.token_mem_index_value)
+            if child.is_leaf():
+                self.evict_tree_set.add(child)
+            return split_parent_node
+        finally:
+            node.time_id = _legacy_time_gen.generate_time_id()
+            if node.is_leaf():
+                self.evict_tree_set.add(node)
+
+    def evict(self, need_remove_tokens, evict_callback):
+        num_evicted = 0
+        while num_evicted < need_remove_tokens:
+            node = self.evict_tree_set.pop(0)
+            assert node.ref_counter == 0 and node.is_leaf() and node != self.root_node
+            evict_callback(node.token_mem_index_value)
+            num_evicted += len(node.token_mem_index_value)
+            self.tree_total_tokens_num -= len(node.token_mem_index_value)
+            parent_node = node.parent
+            del parent_node.children[node.token_id_key[0].item()]
+            if parent_node.is_leaf():
+                self.evict_tree_set.add(parent_node)
+
+
+def gen_conversations(args):
+    """
+    生成模拟的多轮对话请求，所有对话共享一段 system prompt，每一轮的输入为上一轮输入加上新增的 token。
+    """
+    rng = np.random.default_rng(args.seed)
+    system_prompt = rng.integers(0, args.vocab_size, size=args.system_prompt_len)
+    conversations = []
+    for _ in range(args.num_conversations):
+        turns = []
+        prompt = system_prompt
+        for _ in range(args.num_turns):
+            new_tokens = rng.integers(0, args.vocab_size, size=args.turn_input_len)
+            prompt = np.concatenate([prompt, new_tokens])
+            turns.append(torch.from_numpy(prompt.copy()))
+        conversations.append(turns)
+    # 不同对话的轮次交错到达
+    requests = []
+    for turn_index in range(args.num_turns):
+        for conversation in conversations:
+            requests.append(conversation[turn_index])
+    return requests
+
+
+def run(tree, requests, args):
+    evict_token_num = 0
+    match_cost = 0.0
+    insert_cost = 0.0
+    evict_cost = 0.0
+    for key in requests:
+        start = time.time()
+        tree.match_prefix(key)
+        match_cost += time.time() - start
+
+        start = time.time()
+        tree.insert(key)
+        insert_cost += time.time() - start
+
+        total_tokens_num = tree.get_tree_total_tokens_num()
+        if total_tokens_num > args.capacity:
+            start = time.time()
+            tree.evict(total_tokens_num - args.capacity, lambda x: x)
+            evict_cost += time.time() - start
+            evict_token_num += total_tokens_num - args.capacity
+    return match_cost, insert_cost, evict_cost, evict_token_num
+
+
+class _LegacyWrapper:
+    def __init__(self):
+        self.tree = LegacyRadixCache()
+
+    def match_prefix(self, key):
+        return self.tree.match_prefix(key)
+
+    def insert(self, key):
+        return self.tree.insert(key)
+
+    def evict(self, need_remove_tokens, evict_callback):
+        return self.tree.evict(need_remove_tokens, evict_callback)
+
+    def get_tree_total_tokens_num(self):
+        return self.tree.tree_total_tokens_num
+
+
+class _RadixCacheWrapper:
+    def __init__(self):
+        self.tree = RadixCache("benchmark_radix_cache", 0, 0)
+
+    def match_prefix(self, key):
+        tree_node, size, _ = self.tree.match_prefix(key, update_refs=False)
+        return size
+
+    def insert(self, key):
+        return self.tree.insert(key)
+
+    def evict(self, need_remove_tokens, evict_callback):
+        return self.tree.evict(need_remove_tokens, evict_callback)
+
+    def get_tree_total_tokens_num(self):
+        return self.tree.get_tree_total_tokens_num()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_conversations", type=int, default=256)
+    parser.add_argument("--num_turns", type=int, default=8)
+    parser.add_argument("--system_prompt_len", type=int, default=512)
+    parser.add_argument("--turn_input_len", type=int, default=256)
+    parser.add_argument("--vocab_size", type=int, default=32000)
+    parser.add_argument("--capacity", type=int, default=200000, help="tree token capacity, exceed part is evicted")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    requests = gen_conversations(args)
+    for name, tree in [("legacy", _LegacyWrapper()), ("array", _RadixCacheWrapper())]:
+        match_cost, insert_cost, evict_cost, evict_token_num = run(tree, requests, args)
+        print(
+            f"{name:>8} requests: {len(requests)} match: {match_cost * 1000:.2f} ms "
+            f"insert: {insert_cost * 1000:.2f} ms evict: {evict_cost * 1000:.2f} ms "
+            f"evict tokens: {evict_token_num}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+推理进程之间同步的微基准测试，只使用 cpu: 对比以前在共享内存计数器上纯自旋等待与 RpcSyncBarrier (先自旋，
+之后阻塞在信号量上由最后到达的 rank 唤醒) 的 cpu 占用和唤醒延迟。
+子进程模拟先到达的 rank, 每一轮先通知主进程自己已经开始等待，主进程收到通知后等待 interval_ms 毫秒(模拟其他 rank
+推理的耗时)，再作为最后到达的 rank 唤醒子进程。每一轮的唤醒延迟单独统计。
+"""
+import time
+import argparse
+import multiprocessing as mp
+import numpy as np
+from lightllm.server.core.objs.rpc_shm import RpcSyncBarrier
+
+
+def _waiter_proc(mode: str, rounds: int, barrier, counter, stamp, ready, result_queue):
+    latencies = []
+    wait_cpu, wait_wall = 0.0, 0.0
+    for i in range(1, rounds + 1):
+        ready.release()
+        start_cpu, start_wall = time.process_time(), time.perf_counter()
+        if mode == "spin":
+            while counter.value < i:
+                pass
+        else:
+            barrier.wait(1)
+        end_wall = time.perf_counter()
+        wait_cpu += time.process_time() - start_cpu
+        wait_wall += end_wall - start_wall
+        latencies.append(end_wall - stamp.value)
+    result_queue.put((wait_cpu / wait_wall, latencies))
+    return
+
+
+def bench_wait(rounds: int, interval_ms: float, spin_us: int):
+    modes = [("spin", None), (f"barrier_spin_{spin_us}us", spin_us), ("barrier_block", 0)]
+    for mode, mode_spin_us in modes:
+        barrier = RpcSyncBarrier(2, spin_us=mode_spin_us or 0)
+        counter = mp.Value("q", 0, lock=False)
+        stamp = mp.Value("d", 0.0, lock=False)
+        ready = mp.Semaphore(0)
+        result_queue = mp.Queue()
+        proc = mp.Process(
+            target=_waiter_proc,
+            args=("spin" if mode_spin_us is None else "barrier", rounds, barrier, counter, stamp, ready, result_queue),
+        )
+        proc.start()
+        for i in range(1, rounds + 1):
+            # 等待子进程进入等待状态后才开始计时，子进程启动的耗时不计入唤醒延迟
+            ready.acquire()
+            time.sleep(interval_ms / 1000)
+            stamp.value = time.perf_counter()
+            if mode_spin_us is None:
+                counter.value = i
+            else:
+                barrier.wait(0)
+        cpu_ratio, latencies = result_queue.get()
+        proc.join()
+        latencies = np.array(latencies) * 1e6
+        print(
+            f"{mode:>20}: waiter cpu {cpu_ratio * 100:6.1f}%, wake latency mean {latencies.mean():8.1f} us, "
+            f"p50 {np.percentile(latencies, 50):8.1f} us, p99 {np.percentile(latencies, 99):8.1f} us, "
+            f"max {latencies.max():8.1f} us"
+        )
+    return
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--interval_ms", type=float, default=5.0)
+    parser.add_argument("--spin_us", type=int, default=200)
+    args = parser.parse_args()
+
+    # 与服务中一样使用 spawn 方式启动子进程
+    mp.set_start_method("spawn")
+    bench_wait(args.rounds, args.interval_ms, args.spin_us)
+
+
+if __name__ == "__main__":
+    main()
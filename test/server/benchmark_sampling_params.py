@@ -0,0 +1,102 @@
+"""
+采样参数准备微基准测试：对比以前每一步在 python 中遍历请求构造采样参数和展开 token 计数的方式与
+ReqSamplingParamsManager 按照 req_idx 保存参数、只同步新生成 token 的方式在长输出大 batch 下的每一步耗时。
+"""
+import argparse
+import collections
+import time
+import numpy as np
+import torch
+from types import SimpleNamespace
+from lightllm.common.req_manager import ReqSamplingParamsManager
+
+
+class FakeReq:
+    def __init__(self, req_idx, prompt_ids, max_new_tokens, rng):
+        self.req_idx = req_idx
+        self.cur_output_len = 0
+        decay = (int(rng.integers(0, 6)), 1.1)
+        shm_param = SimpleNamespace(
+            presence_penalty=float(rng.random()),
+            frequency_penalty=float(rng.random()),
+            repetition_penalty=1.0 + float(rng.random()),
+            exponential_decay_length_penalty=SimpleNamespace(to_tuple=lambda: decay),
+            min_new_tokens=1,
+            temperature=1.0,
+            top_p=1.0,
+            top_k=-1,
+            input_penalty=False,
+        )
+        self.sampling_param = SimpleNamespace(shm_param=shm_param)
+        arr = np.zeros((len(prompt_ids) + max_new_tokens,), dtype=np.int64)
+        arr[0 : len(prompt_ids)] = prompt_ids
+        self.shm_req = SimpleNamespace(input_len=len(prompt_ids), shm_prompt_ids=SimpleNamespace(arr=arr))
+        self.out_token_id_count = collections.defaultdict(int)
+
+    def gen_token(self, token_id):
+        self.shm_req.shm_prompt_ids.arr[self.shm_req.input_len + self.cur_output_len] = token_id
+        self.cur_output_len += 1
+        self.out_token_id_count[token_id] += 1
+
+
+def legacy_prepare(reqs):
+    params = collections.defaultdict(list)
+    p_token_ids, p_token_counts, p_seq_len = [], [], [0]
+    for req in reqs:
+        shm_param = req.sampling_param.shm_param
+        decay = shm_param.exponential_decay_length_penalty.to_tuple()
+        out_token_len = req.cur_output_len
+        params["presence"].append(shm_param.presence_penalty)
+        params["frequency"].append(shm_param.frequency_penalty)
+        params["repetition"].append(shm_param.repetition_penalty)
+        params["decay"].append(decay[1])
+        params["length_penalty_idx"].append(max(out_token_len - decay[0], 0))
+        params["mask_eos"].append(out_token_len < shm_param.min_new_tokens - 1)
+        params["temperature"].append(shm_param.temperature)
+        params["top_p"].append(shm_param.top_p)
+        params["top_k"].append(shm_param.top_k)
+        p_token_ids.extend(list(req.out_token_id_count.keys()))
+        p_token_counts.extend(list(req.out_token_id_count.values()))
+        p_seq_len.append(len(req.out_token_id_count))
+    torch.tensor(p_token_ids, dtype=torch.int32)
+    torch.tensor(p_token_counts, dtype=torch.int32)
+    return params, np.cumsum(p_seq_len)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch_size", type=int, default=256)
+    parser.add_argument("--out_len", type=int, default=2000)
+    parser.add_argument("--vocab_size", type=int, default=32000)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    manager = ReqSamplingParamsManager(args.batch_size, args.vocab_size, device="cpu")
+    reqs = [FakeReq(i, [1, 2, 3], args.out_len + args.steps, rng) for i in range(args.batch_size)]
+    manager.prepare_sample_reqs(reqs)
+    # 先生成 out_len 个 token, 测试长输出之后每一步的耗时
+    for req in reqs:
+        for token_id in rng.integers(0, args.vocab_size, size=args.out_len):
+            req.gen_token(int(token_id))
+    manager.prepare_sample_reqs(reqs)
+
+    legacy_cost_list, cost_list = [], []
+    for _ in range(args.steps):
+        for req in reqs:
+            req.gen_token(int(rng.integers(0, args.vocab_size)))
+        start = time.perf_counter()
+        legacy_prepare(reqs)
+        legacy_cost_list.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        manager.prepare_sample_reqs(reqs)
+        cost_list.append(time.perf_counter() - start)
+
+    print(f"batch_size {args.batch_size}, out_len {args.out_len}")
+    print(f"legacy prepare: {np.median(legacy_cost_list) * 1000:.3f} ms / step")
+    print(f"slot prepare: {np.median(cost_list) * 1000:.3f} ms / step")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+停止序列匹配微基准测试，只使用 cpu:
+1. token 级别: 对比以前每一步对每个请求的每个停止序列检查输出尾部的方式与 Aho–Corasick 自动机逐 token 输入的方式，
+   在一个 batch 的请求逐步解码时每一步的耗时。
+2. 字符串级别: 对比每次在累积的输出文本上对每个停止字符串调用 str.find 的方式与自动机增量匹配新文本的方式。
+"""
+import time
+import random
+import argparse
+from lightllm.utils.stop_sequence_utils import AhoCorasickMatcher, get_stop_sequence_matcher
+
+
+def legacy_token_matched(stop_sequences, token_ids, output_len):
+    # 以前 InferReq._stop_sequences_matched 的实现，token_ids[0:output_len] 为已经输出的 token
+    for stop_token_ids in stop_sequences:
+        stop_len = len(stop_token_ids)
+        if stop_len > 0 and output_len >= stop_len:
+            if all(token_ids[output_len + i] == stop_token_ids[i] for i in range(-1, -(stop_len + 1), -1)):
+                return True
+    return False
+
+
+def bench_token(batch_size, num_stops, stop_len, steps, vocab_size):
+    rng = random.Random(0)
+    # 不同的请求使用几组不同的停止序列，自动机按照停止序列缓存
+    stop_groups = [
+        [[rng.randrange(vocab_size) for _ in range(rng.randint(1, stop_len))] for _ in range(num_stops)]
+        for _ in range(4)
+    ]
+    req_stops = [stop_groups[i % len(stop_groups)] for i in range(batch_size)]
+    all_tokens = [[rng.randrange(vocab_size) for _ in range(steps)] for _ in range(batch_size)]
+
+    start = time.perf_counter()
+    for step in range(steps):
+        for i in range(batch_size):
+            legacy_token_matched(req_stops[i], all_tokens[i], step + 1)
+    legacy_cost = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matchers = [get_stop_sequence_matcher(tuple(tuple(e) for e in stops)) for stops in req_stops]
+    states = [AhoCorasickMatcher.ROOT_STATE] * batch_size
+    for step in range(steps):
+        for i in range(batch_size):
+            states[i], _ = matchers[i].feed(states[i], all_tokens[i][step : step + 1])
+    cost = time.perf_counter() - start
+    print(
+        f"token  batch {batch_size} stops {num_stops}: legacy {legacy_cost / steps * 1000:.3f} ms/step, "
+        f"aho-corasick {cost / steps * 1000:.3f} ms/step"
+    )
+
+
+def bench_str(batch_size, num_stops, stop_len, steps):
+    rng = random.Random(0)
+    alphabet = "abcdefghij <>/\n"
+    stop_strs = tuple("".join(rng.choice(alphabet) for _ in range(rng.randint(2, stop_len))) for _ in range(num_stops))
+    all_texts = [["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(steps)]]
+    all_texts = all_texts * batch_size
+
+    start = time.perf_counter()
+    outputs = [""] * batch_size
+    for step in range(steps):
+        for i in range(batch_size):
+            # 新文本可能与之前的输出组成停止字符串，需要从可能跨越边界的位置开始查找
+            search_start = max(0, len(outputs[i]) - stop_len)
+            outputs[i] += all_texts[i][step]
+            for stop_str in stop_strs:
+                outputs[i].find(stop_str, search_start)
+    legacy_cost = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = get_stop_sequence_matcher(stop_strs)
+    states = [AhoCorasickMatcher.ROOT_STATE] * batch_size
+    for step in range(steps):
+        for i in range(batch_size):
+            states[i], _ = matcher.feed(states[i], all_texts[i][step])
+    cost = time.perf_counter() - start
+    print(
+        f"string batch {batch_size} stops {num_stops}: find {legacy_cost / steps * 1000:.3f} ms/step, "
+        f"aho-corasick {cost / steps * 1000:.3f} ms/step"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[64, 256])
+    parser.add_argument("--num_stops", type=int, nargs="+", default=[1, 4, 10])
+    parser.add_argument("--stop_len", type=int, default=8)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--vocab_size", type=int, default=1000)
+    args = parser.parse_args()
+
+    for batch_size in args.batch_sizes:
+        for num_stops in args.num_stops:
+            bench_token(batch_size, num_stops, args.stop_len, args.steps, args.vocab_size)
+            bench_str(batch_size, num_stops, args.stop_len, args.steps)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import pytest
+import torch
+from lightllm.common.basemodel.batch_objs import ModelInput
+from lightllm.common.basemodel.cuda_graph_bucket import GraphBatchBuckets, build_graph_batch_buckets, pad_decode_batch
+
+
+def test_build_graph_batch_buckets():
+    assert build_graph_batch_buckets(4) == [1, 2, 3, 4]
+    # 超过 max_batch_size 的桶会被忽略，max_batch_size 总是会被加入
+    assert build_graph_batch_buckets(24, [16, 1, 8, 4, 32, 8]) == [1, 4, 8, 16, 24]
+    with pytest.raises(AssertionError):
+        build_graph_batch_buckets(8, [0, 8])
+
+
+def test_find_bucket_and_replay_stats():
+    buckets = GraphBatchBuckets([1, 4, 8], log_interval=0)
+    assert [buckets.find_bucket(bs) for bs in range(1, 10)] == [1, 4, 4, 4, 8, 8, 8, 8, None]
+    assert buckets.max_batch_size == 8
+
+    buckets.record_replay(4, 3)
+    buckets.record_replay(4, 4)
+    buckets.record_replay(8, 5)
+    assert buckets.get_replay_stats() == {1: (0, 0), 4: (2, 1), 8: (1, 3)}
+
+
+def test_pad_decode_batch():
+    model_input = ModelInput(
+        batch_size=3,
+        total_token_num=30,
+        max_len_in_batch=12,
+        input_ids=torch.tensor([5, 6, 7], dtype=torch.int64),
+        mem_indexes=torch.tensor([10, 11, 12], dtype=torch.int32),
+        b_req_idx=torch.tensor([0, 1, 2], dtype=torch.int32),
+        b_seq_len=torch.tensor([8, 10, 12], dtype=torch.int32),
+        hidden_states=torch.ones((3, 2), dtype=torch.float32),
+    )
+    assert pad_decode_batch(model_input, 3, hold_req_id=100, hold_mem_index=1000) is model_input
+
+    padded = pad_decode_batch(model_input, 5, hold_req_id=100, hold_mem_index=1000)
+    assert padded.batch_size == 5 and padded.total_token_num == 34 and padded.max_len_in_batch == 12
+    assert padded.input_ids.tolist() == [5, 6, 7, 1, 1]
+    assert padded.mem_indexes.tolist() == [10, 11, 12, 1000, 1000]
+    assert padded.b_req_idx.tolist() == [0, 1, 2, 100, 100]
+    assert padded.b_seq_len.tolist() == [8, 10, 12, 2, 2]
+    assert padded.b_req_idx.dtype == torch.int32
+    assert padded.hidden_states.shape == (5, 2) and padded.hidden_states[3:].sum().item() == 0
+    # 原对象不会被修改
+    assert model_input.batch_size == 3 and model_input.input_ids.shape[0] == 3
+
+
+if __name__ == "__main__":
+    pytest.main()
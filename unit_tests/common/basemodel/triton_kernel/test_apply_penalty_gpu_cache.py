@@ -0,0 +1,62 @@
+import torch
+import pytest
+from lightllm.common.basemodel.triton_kernel.apply_penalty import apply_penalty
+from lightllm.common.basemodel.triton_kernel.apply_penalty_gpu_cache import apply_penalty_gpu_cache
+
+
+def test_apply_penalty_gpu_cache():
+    torch.manual_seed(0)
+    max_request_num, vocab_size, batch_size = 32, 10000, 8
+    b_req_idx = torch.randperm(max_request_num, device="cuda")[0:batch_size]
+    req_to_presence_penalty = torch.rand((max_request_num,), device="cuda")
+    req_to_frequency_penalty = torch.rand((max_request_num,), device="cuda")
+    req_to_repetition_penalty = torch.rand((max_request_num,), device="cuda") + 1.0
+    req_to_exponential_decay_length_penalty = torch.rand((max_request_num,), device="cuda") * 0.2 + 1.0
+    req_to_exponential_decay_start = torch.randint(0, 5, (max_request_num,), dtype=torch.int32, device="cuda")
+    req_to_min_new_tokens = torch.randint(0, 5, (max_request_num,), dtype=torch.int32, device="cuda")
+    req_to_out_token_len = torch.randint(0, 10, (max_request_num,), dtype=torch.int32, device="cuda")
+    counter = torch.randint(0, 3, (max_request_num, vocab_size), dtype=torch.int32, device="cuda")
+    counter[torch.rand(counter.shape, device="cuda") < 0.9] = 0
+    eos_ids = torch.tensor([2, 9999], dtype=torch.int32, device="cuda")
+    logits = torch.randn((batch_size, vocab_size), dtype=torch.float32, device="cuda")
+
+    # 使用以前按照 token id 列表计算的 kernel 作为参照
+    b_counter = counter[b_req_idx]
+    p_seq_len = (b_counter > 0).sum(dim=1)
+    p_token_ids = torch.nonzero(b_counter > 0)[:, 1].int()
+    p_token_counts = b_counter[b_counter > 0].int()
+    p_cumsum_seq_len = torch.nn.functional.pad(torch.cumsum(p_seq_len, dim=0), (1, 0)).int()
+    out_len = req_to_out_token_len[b_req_idx]
+    expected = logits.clone()
+    apply_penalty(
+        expected,
+        req_to_presence_penalty[b_req_idx],
+        req_to_frequency_penalty[b_req_idx],
+        req_to_repetition_penalty[b_req_idx],
+        p_token_ids,
+        p_token_counts,
+        p_cumsum_seq_len,
+        req_to_exponential_decay_length_penalty[b_req_idx],
+        torch.clamp(out_len - req_to_exponential_decay_start[b_req_idx], min=0).int(),
+        eos_ids,
+        out_len < req_to_min_new_tokens[b_req_idx] - 1,
+    )
+
+    apply_penalty_gpu_cache(
+        logits,
+        b_req_idx,
+        req_to_presence_penalty,
+        req_to_frequency_penalty,
+        req_to_repetition_penalty,
+        req_to_exponential_decay_length_penalty,
+        req_to_exponential_decay_start,
+        req_to_min_new_tokens,
+        req_to_out_token_len,
+        counter,
+        eos_ids,
+    )
+    assert torch.allclose(logits, expected, atol=1e-5, rtol=1e-5)
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,111 @@
+import os
+import random
+import pytest
+from lightllm.common.dpda import DpdaMatcher, LRTable, build_token_table, get_builtin_grammar, get_token_bytes
+
+VALID_JSONS = [
+    "{}",
+    "[]",
+    '{"a": 1}',
+    '[1, -2.5e+10, "x\\n\\u00aF", true, false, null, {"k":[{}]}]',
+    '{ "中文": "值" , "b" :[ ] }',
+    "[0, 10, 0.5, 1E5]",
+]
+INVALID_JSONS = ["{", "1", '"a"', '{"a" 1}', "[01]", "[1,]", '{"a":1}}', "[tru]", '["\\x"]', '["a\nb"]', " {}", "[1.]"]
+
+
+def _parse(lr_table: LRTable, byte_to_term, text: str) -> bool:
+    from lightllm.common.dpda import T
+
+    stack = [0]
+    for b in text.encode("utf-8"):
+        if byte_to_term[b] is None:
+            return False
+        if lr_table.feed(stack, lr_table.term_to_id[T(byte_to_term[b])]) < 0:
+            return False
+    return lr_table.can_accept_end(stack)
+
+
+def test_json_lr_table():
+    grammar, terminals, byte_to_term = get_builtin_grammar("json")
+    lr_table = LRTable(grammar, terminals)
+    for text in VALID_JSONS:
+        assert _parse(lr_table, byte_to_term, text), text
+    for text in INVALID_JSONS:
+        assert not _parse(lr_table, byte_to_term, text), text
+    with pytest.raises(ValueError):
+        get_builtin_grammar("yaml")
+
+
+def _build_vocab():
+    random.seed(0)
+    pieces = ["{", "}", "[", "]", ",", ":", '"', " ", "\n", "a", "true", "false", "null", "0", "1", "23", "-", "."]
+    pieces += ["e", '"a', 'a"', '",', '":', '"}', '"]', "},", "],", '{"', '["', "\\", "\\n", "\\u", "00", "中", "1}"]
+    vocab = list(pieces)
+    for _ in range(1000):
+        vocab.append("".join(random.choice(pieces) for _ in range(random.randint(2, 4))))
+    # 包含控制字符的 token 和特殊 token(None) 永远不会被接受
+    vocab += ["\x01", None]
+    return vocab
+
+
+def test_token_table_match_brute_force(tmp_path):
+    vocab = _build_vocab()
+    token_bytes = [None if e is None else e.encode("utf-8") for e in vocab]
+    token_table = build_token_table("json", token_bytes, cache_dir=str(tmp_path))
+    assert len(os.listdir(tmp_path)) == 1
+    # 第二次从磁盘缓存加载
+    token_table = build_token_table("json", token_bytes, cache_dir=str(tmp_path))
+
+    for _ in range(50):
+        matcher = DpdaMatcher(token_table)
+        for _ in range(20):
+            words, extra_token_ids = matcher.get_next_token_bitmask()
+            allowed = set(extra_token_ids)
+            for token_id in range(len(vocab)):
+                if (int(words[token_id >> 5]) >> (token_id & 31)) & 1:
+                    allowed.add(token_id)
+            # 逐个 token 在当前栈上模拟的结果
+            expected = set()
+            for token_id in range(len(vocab)):
+                stack = list(matcher.stack)
+                terms = token_table.token_terms[token_id]
+                if terms is not None and token_table.lr_table.feed_terms(stack, terms):
+                    expected.add(token_id)
+            assert allowed == expected
+            if not allowed:
+                break
+            stack = list(matcher.stack)
+            assert not matcher.accept_token(len(vocab) - 1)
+            assert matcher.stack == stack
+            assert matcher.accept_token(random.choice(sorted(allowed)))
+
+
+def test_matcher_terminated():
+    vocab = ['{"', "a", '":', "1", "}", "}\n", " "]
+    token_table = build_token_table("json", [e.encode("utf-8") for e in vocab], cache_dir=None)
+    matcher = DpdaMatcher(token_table)
+    for token_id in range(4):
+        assert matcher.accept_token(token_id)
+        assert not matcher.can_end()
+    # 最外层结束后不能再输出空白
+    assert not matcher.accept_token(5)
+    assert matcher.accept_token(4)
+    assert matcher.can_end() and matcher.is_terminated()
+
+
+def test_get_token_bytes():
+    class FakeTokenizer:
+        all_special_ids = [3]
+
+        def get_vocab(self):
+            return {"Ġ{": 0, "a": 1, "Ċ": 2, "<|end|>": 3, "<0x0A>": 4, "<extra>": 5}
+
+        def get_added_vocab(self):
+            return {"<extra>": 5}
+
+    assert get_token_bytes(FakeTokenizer()) == [b" {", b"a", b"\n", None, b"\n", None]
+
+
+if __name__ == "__main__":
+    pytest.main()
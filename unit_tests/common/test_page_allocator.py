@@ -0,0 +1,86 @@
+import pytest
+import numpy as np
+from lightllm.common.page_allocator import PageAllocator
+
+
+def test_alloc_and_free():
+    allocator = PageAllocator(page_num=4, page_size=4)
+    token_indexes = allocator.alloc(6)
+    assert len(token_indexes) == 6 and allocator.get_can_use_token_num() == 8
+    assert (token_indexes // 4 == token_indexes[0] // 4).sum() == 4
+
+    # 页内的 token 没有全部释放时页不会被回收
+    allocator.free(token_indexes[0:5])
+    assert allocator.get_can_use_token_num() == 12
+    allocator.free(token_indexes[5:6])
+    assert allocator.get_can_use_token_num() == 16
+
+    with pytest.raises(AssertionError):
+        allocator.free(token_indexes[0:1])
+
+
+def test_alloc_append():
+    allocator = PageAllocator(page_num=8, page_size=4)
+    last_token_indexes = np.array([-1, -1], dtype=np.int64)
+    # prefill, 每个请求使用自己的页
+    assert allocator.get_append_need_token_num(last_token_indexes, np.array([3, 5])) == 12
+    token_indexes, last_token_indexes = allocator.alloc_append(last_token_indexes, np.array([3, 5]))
+    assert len(token_indexes) == 8 and allocator.get_can_use_token_num() == 20
+    assert len(set((token_indexes[0:3] // 4).tolist()) & set((token_indexes[3:8] // 4).tolist())) == 0
+    assert (last_token_indexes == token_indexes[[2, 7]]).all()
+
+    # decode, 两个请求都续用自己页中的空闲位置，第一个请求的页用完后再分配新页
+    assert allocator.get_append_need_token_num(last_token_indexes, np.array([1, 1])) == 0
+    token_indexes, last_token_indexes = allocator.alloc_append(last_token_indexes, np.array([1, 1]))
+    assert allocator.get_can_use_token_num() == 20
+    token_indexes, last_token_indexes = allocator.alloc_append(last_token_indexes, np.array([1, 1]))
+    assert allocator.get_can_use_token_num() == 16
+    assert (last_token_indexes % 4 == np.array([0, 2])).all()
+
+    allocator.free_all()
+    assert allocator.get_can_use_token_num() == 32
+
+
+def test_alloc_fail_and_fit_num():
+    allocator = PageAllocator(page_num=4, page_size=4)
+    token_indexes = allocator.alloc(10)
+    # 空闲页不足时返回 None, 分配器的状态不变
+    assert allocator.alloc(5) is None
+    assert allocator.alloc_append(np.array([-1, -1]), np.array([1, 4])) is None
+    assert allocator.get_can_use_token_num() == 4
+
+    # 第一个请求续用自己页中的空闲位置，第二个请求需要一个新页，第三个请求已经没有空闲页
+    last_token_indexes = np.array([token_indexes[9], -1, -1])
+    assert allocator.get_append_fit_num(last_token_indexes, np.array([2, 1, 1])) == 2
+    assert allocator.get_append_fit_num(last_token_indexes, np.array([3, 1, 1])) == 1
+    allocator.free(token_indexes)
+    assert allocator.get_can_use_token_num() == 16
+
+
+def test_append_tail_size():
+    page_size = 8
+    allocator = PageAllocator(page_num=16, page_size=page_size)
+    rng = np.random.default_rng(0)
+    token_indexes = allocator.alloc(allocator.token_num)
+    allocator.free(token_indexes[rng.random(len(token_indexes)) < 0.5])
+    used_indexes = np.flatnonzero(allocator.token_used)
+    last_token_indexes = np.concatenate([used_indexes, [-1]])
+
+    expected = []
+    for last_index in last_token_indexes:
+        tail_size = 0
+        if last_index >= 0:
+            index = last_index + 1
+            while index % page_size != 0 and not allocator.token_used[index]:
+                tail_size += 1
+                index += 1
+        expected.append(tail_size)
+    assert (allocator.get_append_tail_size(last_token_indexes) == np.array(expected)).all()
+
+    allocator.free(used_indexes)
+    assert allocator.get_can_use_token_num() == allocator.token_num
+    assert len(set(allocator.page_stack.tolist())) == allocator.page_num
+
+
+if __name__ == "__main__":
+    pytest.main()
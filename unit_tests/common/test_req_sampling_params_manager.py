@@ -0,0 +1,178 @@
+import random
+import pytest
+import collections
+import numpy as np
+import torch
+from types import SimpleNamespace
+from lightllm.common.req_manager import ReqSamplingParamsManager
+
+VOCAB_SIZE = 5000
+
+
+class FakeReq:
+    def __init__(self, req_idx, prompt_ids, max_new_tokens, input_penalty=False):
+        self.req_idx = req_idx
+        self.cur_output_len = 0
+        decay = (random.randint(0, 5), random.choice([1.0, 1.1]))
+        shm_param = SimpleNamespace(
+            presence_penalty=random.random(),
+            frequency_penalty=random.random(),
+            repetition_penalty=1.0 + random.random(),
+            exponential_decay_length_penalty=SimpleNamespace(to_tuple=lambda: decay),
+            min_new_tokens=random.randint(1, 4),
+            temperature=0.5 + random.random(),
+            top_p=random.random(),
+            top_k=random.randint(1, VOCAB_SIZE),
+            input_penalty=input_penalty,
+        )
+        self.sampling_param = SimpleNamespace(shm_param=shm_param)
+        arr = np.zeros((len(prompt_ids) + max_new_tokens,), dtype=np.int64)
+        arr[0 : len(prompt_ids)] = prompt_ids
+        self.shm_req = SimpleNamespace(input_len=len(prompt_ids), shm_prompt_ids=SimpleNamespace(arr=arr))
+        # 以前的实现中每个请求维护的 token 计数
+        self.out_token_id_count = collections.Counter(prompt_ids) if input_penalty else collections.defaultdict(int)
+
+    def gen_token(self, token_id):
+        self.shm_req.shm_prompt_ids.arr[self.shm_req.input_len + self.cur_output_len] = token_id
+        self.cur_output_len += 1
+        self.out_token_id_count[token_id] += 1
+
+
+def _legacy_sample_tensors(reqs):
+    # 以前每一步在 python 中遍历请求构造采样参数和展开 token 计数的实现
+    params = collections.defaultdict(list)
+    p_token_ids, p_token_counts, p_seq_len = [], [], [0]
+    for req in reqs:
+        shm_param = req.sampling_param.shm_param
+        decay = shm_param.exponential_decay_length_penalty.to_tuple()
+        out_token_len = req.cur_output_len
+        params["presence"].append(shm_param.presence_penalty)
+        params["frequency"].append(shm_param.frequency_penalty)
+        params["repetition"].append(shm_param.repetition_penalty)
+        params["decay"].append(decay[1])
+        params["length_penalty_idx"].append(max(out_token_len - decay[0], 0))
+        params["mask_eos"].append(out_token_len < shm_param.min_new_tokens - 1)
+        params["temperature"].append(shm_param.temperature)
+        params["top_p"].append(shm_param.top_p)
+        params["top_k"].append(shm_param.top_k)
+        p_token_ids.extend(list(req.out_token_id_count.keys()))
+        p_token_counts.extend(list(req.out_token_id_count.values()))
+        p_seq_len.append(len(req.out_token_id_count))
+    return params, p_token_ids, p_token_counts, np.cumsum(p_seq_len)
+
+
+def _legacy_apply_penalty(logits, params, p_token_ids, p_token_counts, p_cumsum_seq_len, eos_ids):
+    for i in range(logits.shape[0]):
+        ids = torch.tensor(p_token_ids[p_cumsum_seq_len[i] : p_cumsum_seq_len[i + 1]], dtype=torch.int64)
+        counts = torch.tensor(p_token_counts[p_cumsum_seq_len[i] : p_cumsum_seq_len[i + 1]], dtype=torch.float32)
+        cur = logits[i, ids]
+        cur = torch.where(cur > 0, cur / params["repetition"][i], cur * params["repetition"][i])
+        logits[i, ids] = cur - counts * params["frequency"][i] - params["presence"][i]
+        scale = params["decay"][i] ** params["length_penalty_idx"][i] - 1
+        for eos_id in eos_ids:
+            eos_logit = logits[i, eos_id] + abs(logits[i, eos_id]) * scale
+            logits[i, eos_id] = -10000000.0 if params["mask_eos"][i] else eos_logit
+    return logits
+
+
+def _dense_apply_penalty(logits, manager: ReqSamplingParamsManager, b_req_idx, eos_ids):
+    # 与 apply_penalty_gpu_cache kernel 相同的计算，使用 torch 在 cpu 上实现
+    counts = manager.req_to_out_token_id_counter[b_req_idx].float()
+    repetition = manager.req_to_repetition_penalty[b_req_idx].view(-1, 1)
+    rep_logits = torch.where(logits > 0, logits / repetition, logits * repetition)
+    pen_logits = (
+        rep_logits
+        - counts * manager.req_to_frequency_penalty[b_req_idx].view(-1, 1)
+        - manager.req_to_presence_penalty[b_req_idx].view(-1, 1)
+    )
+    logits = torch.where(counts > 0, pen_logits, logits)
+    out_len = manager.req_to_out_token_len[b_req_idx]
+    length_penalty = torch.clamp(out_len - manager.req_to_exponential_decay_start[b_req_idx], min=0)
+    scale = manager.req_to_exponential_decay_length_penalty[b_req_idx] ** length_penalty - 1
+    mask_eos = out_len < manager.req_to_min_new_tokens[b_req_idx] - 1
+    for eos_id in eos_ids:
+        eos_logits = logits[:, eos_id] + logits[:, eos_id].abs() * scale
+        logits[:, eos_id] = torch.where(mask_eos, torch.full_like(eos_logits, -10000000.0), eos_logits)
+    return logits
+
+
+def _triton_apply_penalty(logits, manager: ReqSamplingParamsManager, b_req_idx, eos_ids):
+    # 推理时实际使用的 kernel, 需要 gpu
+    from lightllm.common.basemodel.triton_kernel.apply_penalty_gpu_cache import apply_penalty_gpu_cache
+
+    logits = logits.cuda()
+    apply_penalty_gpu_cache(
+        logits,
+        b_req_idx.cuda(),
+        manager.req_to_presence_penalty.cuda(),
+        manager.req_to_frequency_penalty.cuda(),
+        manager.req_to_repetition_penalty.cuda(),
+        manager.req_to_exponential_decay_length_penalty.cuda(),
+        manager.req_to_exponential_decay_start.cuda(),
+        manager.req_to_min_new_tokens.cuda(),
+        manager.req_to_out_token_len.cuda(),
+        manager.req_to_out_token_id_counter.cuda(),
+        torch.tensor(eos_ids, dtype=torch.int32, device="cuda"),
+    )
+    return logits.cpu()
+
+
+@pytest.mark.parametrize(
+    "apply_penalty_func",
+    [
+        _dense_apply_penalty,
+        pytest.param(
+            _triton_apply_penalty, marks=pytest.mark.skipif(not torch.cuda.is_available(), reason="need cuda")
+        ),
+    ],
+)
+def test_sampling_params_equivalence(apply_penalty_func):
+    random.seed(0)
+    torch.manual_seed(0)
+    max_request_num = 16
+    manager = ReqSamplingParamsManager(max_request_num, VOCAB_SIZE, device="cpu")
+    free_slots = list(range(max_request_num))
+    reqs = []
+    eos_ids = [2, 7]
+    for step in range(60):
+        # 随机加入新请求，结束旧请求，slot 会被复用
+        while free_slots and random.random() < 0.5:
+            prompt_ids = [random.randint(0, VOCAB_SIZE - 1) for _ in range(random.randint(1, 50))]
+            reqs.append(FakeReq(free_slots.pop(), prompt_ids, 100, input_penalty=random.random() < 0.5))
+        finished = [req for req in reqs if random.random() < 0.05]
+        for req in finished:
+            reqs.remove(req)
+            free_slots.append(req.req_idx)
+        manager.free([req.req_idx for req in finished])
+
+        # 同一个请求可以在一个 batch 中出现多次
+        batch = reqs + reqs[0:2]
+        b_req_idx = manager.prepare_sample_reqs(batch)
+        assert b_req_idx.tolist() == [req.req_idx for req in batch]
+        params, p_token_ids, p_token_counts, p_cumsum_seq_len = _legacy_sample_tensors(batch)
+        temperatures, top_ps, top_ks = manager.get_sample_params(b_req_idx)
+        assert torch.allclose(temperatures, torch.tensor(params["temperature"]))
+        assert torch.allclose(top_ps, torch.tensor(params["top_p"]))
+        assert top_ks.tolist() == params["top_k"]
+        for req in reqs:
+            counter = manager.req_to_out_token_id_counter[req.req_idx]
+            assert counter.sum().item() == sum(req.out_token_id_count.values())
+            token_ids = list(req.out_token_id_count.keys())
+            assert counter[token_ids].tolist() == list(req.out_token_id_count.values())
+
+        logits = torch.randn((len(batch), VOCAB_SIZE))
+        ans = apply_penalty_func(logits.clone(), manager, b_req_idx, eos_ids)
+        expected = _legacy_apply_penalty(logits.clone(), params, p_token_ids, p_token_counts, p_cumsum_seq_len, eos_ids)
+        assert torch.allclose(ans, expected, atol=1e-4)
+
+        for req in reqs:
+            # 偶尔一步生成多个 token (如投机解码)，或者不生成 token (如分块 prefill 的中间块)
+            for _ in range(random.choice([0, 1, 1, 1, 3])):
+                req.gen_token(random.randint(0, 100))
+
+    manager.free_all()
+    assert (manager.synced_out_len == -1).all()
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,36 @@
+import pytest
+import multiprocessing as mp
+from lightllm.server.core.objs.rpc_shm import RpcSyncBarrier
+
+
+def _rank_loop(barrier: RpcSyncBarrier, rank: int, round_num: int, rounds, errors):
+    for i in range(1, round_num + 1):
+        rounds[rank] = i
+        barrier.wait(rank)
+        # 两次屏障之间所有 rank 都处于同一轮
+        if any(rounds[j] != i for j in range(barrier.world_size)):
+            errors.value += 1
+        barrier.wait(rank)
+
+
+@pytest.mark.parametrize("spin_us", [0, 200])
+def test_rpc_sync_barrier(spin_us):
+    world_size, round_num = 4, 200
+    barrier = RpcSyncBarrier(world_size, spin_us=spin_us)
+    rounds = mp.Array("i", world_size, lock=False)
+    errors = mp.Value("i", 0, lock=False)
+    procs = [
+        mp.Process(target=_rank_loop, args=(barrier, rank, round_num, rounds, errors)) for rank in range(world_size)
+    ]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join(timeout=60)
+        assert proc.exitcode == 0
+    assert errors.value == 0
+    assert list(rounds) == [round_num] * world_size
+    assert barrier.arrived_num.value == 0
+
+
+if __name__ == "__main__":
+    pytest.main()
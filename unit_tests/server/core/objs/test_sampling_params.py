@@ -14,6 +14,8 @@ from lightllm.server.core.objs.sampling_params import (
     ALLOWED_TOKEN_IDS_MAX_LENGTH,
     JSON_SCHEMA_MAX_LENGTH,
     GRAMMAR_CONSTRAINT_MAX_LENGTH,
+    parse_priority,
+    check_dpda_json_schema,
 )
 
 grammar_str = r"""root ::= (expr "=" term)+
@@ -98,6 +100,20 @@ def test_guided_json_schema_initialization():
         schema.initialize("a" * (JSON_SCHEMA_MAX_LENGTH + 1), None)
 
 
+@pytest.mark.parametrize(
+    "constraint", ["{}", "true", '{"type": "object"}', '{"type": "array", "title": "any", "description": "x"}']
+)
+def test_check_dpda_json_schema(constraint):
+    check_dpda_json_schema(constraint)
+
+
+@pytest.mark.parametrize("constraint", [schema_str, "1", "false", '{"type": "string"}', "{", '{"required": ["a"]}'])
+def test_check_dpda_json_schema_rejected(constraint):
+    # dpda 模式无法保证输出满足有内容限制的 schema, 需要直接报错
+    with pytest.raises(ValueError):
+        check_dpda_json_schema(constraint)
+
+
 def test_allowed_token_ids_initialization():
     allowed_ids = AllowedTokenIds()
     allowed_ids.initialize([1, 2, 3])
@@ -173,6 +189,19 @@ def test_sampling_params_initialization():
     assert params.stop_sequences.size == 2
 
 
+def test_parse_priority():
+    assert parse_priority("3") == 3
+    assert parse_priority(-2) == -2
+    assert parse_priority(2 ** 31 - 1) == 2 ** 31 - 1
+    for priority in ["high", "1.5", None, 2 ** 31, -(2 ** 31) - 1]:
+        with pytest.raises(ValueError):
+            parse_priority(priority)
+
+    params = SamplingParams()
+    with pytest.raises(ValueError):
+        params.init(None, priority=2 ** 40)
+
+
 # Mock tokenizer for testing
 class MockTokenizer:
     def encode(self, text, add_special_tokens=False):
@@ -0,0 +1,58 @@
+import pytest
+import subprocess
+from lightllm.server.core.objs.shm_ready_list import ShmReadyList, HttpServerIndexAllocator
+
+
+class _FakeSocket:
+    def __init__(self):
+        self.send_num = 0
+
+    def send(self, data):
+        assert data == b""
+        self.send_num += 1
+
+
+def test_mark_and_pop():
+    producer = ShmReadyList("test_shm_ready_list", 16)
+    consumer = ShmReadyList("test_shm_ready_list", 16)
+    consumer.pop_ready_indexes()
+
+    producer.mark_ready([1, 5])
+    producer.mark_ready([5, 7])
+    assert consumer.has_ready()
+    assert consumer.pop_ready_indexes().tolist() == [1, 5, 7]
+    assert not consumer.has_ready()
+
+
+def test_notify_only_when_waiting():
+    producer = ShmReadyList("test_shm_ready_list_notify", 16)
+    consumer = ShmReadyList("test_shm_ready_list_notify", 16)
+    socket = _FakeSocket()
+
+    consumer.clear_waiting()
+    producer.notify(socket)
+    assert socket.send_num == 0
+
+    # 等待中的消费者只会被唤醒一次
+    consumer.set_waiting()
+    producer.notify(socket)
+    producer.notify(socket)
+    assert socket.send_num == 1
+
+
+def test_httpserver_index_allocator():
+    allocator = HttpServerIndexAllocator("test_httpserver_index", 2)
+    allocator.reset()
+    # 已经退出的进程占用的编号可以被复用
+    exited_proc = subprocess.Popen(["true"])
+    exited_proc.wait()
+    allocator.pids.arr[0] = exited_proc.pid
+    assert allocator.alloc() == 0
+    assert allocator.alloc() == 1
+    with pytest.raises(RuntimeError):
+        allocator.alloc()
+    allocator.reset()
+
+
+if __name__ == "__main__":
+    pytest.main()
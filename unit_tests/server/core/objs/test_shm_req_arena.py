@@ -0,0 +1,58 @@
+import pytest
+import numpy as np
+from contextlib import nullcontext
+from lightllm.server.core.objs.shm_req_arena import BuddyAllocator, ShmReqArena, ARENA_BLOCK_TOKEN_NUM
+
+
+def test_buddy_allocator():
+    allocator = BuddyAllocator(block_num=6)
+    allocator.init_state()
+    assert allocator.get_free_block_num() == 6
+
+    a = allocator.alloc(3)
+    b = allocator.alloc(1)
+    c = allocator.alloc(1)
+    assert a == 0 and {b, c} == {4, 5}
+    assert allocator.alloc(1) is None
+
+    # 释放后与伙伴块合并，可以再次分配大块
+    allocator.free(b)
+    allocator.free(c)
+    assert allocator.alloc(2) == 4
+    allocator.free(a)
+    assert allocator.alloc(4) == 0
+    assert allocator.get_free_block_num() == 0
+
+
+def test_buddy_allocator_shared_state():
+    # 多个进程的分配器使用同一份状态时，不会分配出重叠的空间
+    state = np.empty((2, 8), dtype=np.int8)
+    allocator_0 = BuddyAllocator(8, state)
+    allocator_1 = BuddyAllocator(8, state)
+    allocator_0.init_state()
+    offsets = [allocator_0.alloc(2), allocator_1.alloc(2), allocator_0.alloc(1), allocator_1.alloc(1)]
+    assert sorted(offsets) == [0, 2, 4, 5]
+    assert allocator_0.get_free_block_num() == 2
+    # 一个进程分配的块可以由另一个进程释放
+    for offset in offsets:
+        allocator_1.free(offset)
+    assert allocator_0.alloc(8) == 0
+
+
+def test_shm_req_arena():
+    arena = ShmReqArena(4 * ARENA_BLOCK_TOKEN_NUM, nullcontext())
+    offset_0 = arena.alloc(ARENA_BLOCK_TOKEN_NUM + 1)
+    offset_1 = arena.alloc(ARENA_BLOCK_TOKEN_NUM)
+    assert offset_0 == 0 and offset_1 == 2 * ARENA_BLOCK_TOKEN_NUM
+    assert arena.alloc(2 * ARENA_BLOCK_TOKEN_NUM) == -1
+
+    view = arena.get_prompt_ids_view(offset_1, 10)
+    view.arr[:] = 7
+    assert (arena.prompt_ids.arr[offset_1 : offset_1 + 10] == 7).all()
+
+    arena.free(offset_0)
+    assert arena.alloc(2 * ARENA_BLOCK_TOKEN_NUM) == 0
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,90 @@
+import copy
+import pytest
+import numpy as np
+from types import SimpleNamespace
+from lightllm.server.detokenization.decode import BatchDecoder, decode_token
+from lightllm.server.detokenization.decode_req import DecodeReq
+
+# 每个 token 对应一段字节，"你" 的 utf-8 编码被拆成了两个 token
+VOCAB = [b"a", b" b", b"\xe4\xbd", b"\xa0", b"c", b"</s>"]
+
+
+class _FakeTokenizer:
+    def __init__(self):
+        self.decode_count = 0
+
+    def decode(self, token_ids, skip_special_tokens=True, spaces_between_special_tokens=True):
+        self.decode_count += 1
+        return b"".join(VOCAB[token_id] for token_id in token_ids).decode("utf-8", errors="replace")
+
+
+def _make_decode_req(request_id, token_ids, input_len, stop_strs=()):
+    sample_params = SimpleNamespace(
+        print_eos_token=False,
+        skip_special_tokens=True,
+        add_spaces_between_special_tokens=True,
+        stop_sequences=SimpleNamespace(to_str_list=lambda: list(stop_strs)),
+    )
+    req = SimpleNamespace(
+        request_id=request_id,
+        group_req_id=request_id,
+        input_len=input_len,
+        shm_prompt_ids=SimpleNamespace(arr=np.array(token_ids, dtype=np.int64)),
+        sample_params=sample_params,
+    )
+    return DecodeReq(req, is_pd_decode_mode=False)
+
+
+def test_batch_decoder_same_as_decode_token():
+    all_token_ids = [[0, 1, 2, 3, 4, 0, 5], [4, 2, 3, 1, 1, 0, 2, 3, 5]]
+    input_lens = [2, 1]
+    eos_id = [5]
+    decode_reqs = [_make_decode_req(i, all_token_ids[i], input_lens[i]) for i in range(len(all_token_ids))]
+    ref_decode_reqs = copy.deepcopy(decode_reqs)
+
+    tokenizer = _FakeTokenizer()
+    batch_decoder = BatchDecoder(tokenizer)
+    outs = [[] for _ in decode_reqs]
+    ref_outs = [[] for _ in decode_reqs]
+    for step in range(max(len(ids) - input_len for ids, input_len in zip(all_token_ids, input_lens))):
+        active = [i for i, e in enumerate(decode_reqs) if e.input_len + len(e.output_ids) < len(all_token_ids[i])]
+        new_token_ids = []
+        for i in active:
+            new_token_id = all_token_ids[i][decode_reqs[i].input_len + len(decode_reqs[i].output_ids)]
+            decode_reqs[i].output_ids.append(new_token_id)
+            ref_decode_reqs[i].output_ids.append(new_token_id)
+            new_token_ids.append(new_token_id)
+            ref_outs[i].append(decode_token(tokenizer, ref_decode_reqs[i], new_token_id, eos_id))
+        for i, text in zip(active, batch_decoder.decode([decode_reqs[i] for i in active], new_token_ids, eos_id)):
+            outs[i].append(text)
+
+    assert outs == ref_outs
+    assert "".join(outs[0]) == "你ca"
+
+
+def test_batch_decoder_decode_once_per_token():
+    decode_req = _make_decode_req(0, [0, 1, 4, 0, 1, 4, 0], input_len=1)
+    tokenizer = _FakeTokenizer()
+    batch_decoder = BatchDecoder(tokenizer)
+    for token_id in [1, 4, 0, 1, 4, 0]:
+        decode_req.output_ids.append(token_id)
+        batch_decoder.decode([decode_req], [token_id], eos_id=[5])
+    # 第一次需要解码前缀窗口，之后的前缀窗口都只有一个 token 且已经被缓存
+    assert tokenizer.decode_count == 6 + 3
+
+
+def test_match_stop_str_across_tokens():
+    # 停止字符串 "ca " 跨越了 "c", "a", " b" 三个 token, 输出在停止字符串结束的位置被截断
+    decode_req = _make_decode_req(0, [0, 1, 4, 0, 1, 4], input_len=1, stop_strs=["xyz", "ca "])
+    batch_decoder = BatchDecoder(_FakeTokenizer())
+    outs = []
+    for token_id in [1, 4, 0, 1]:
+        decode_req.output_ids.append(token_id)
+        new_text = batch_decoder.decode([decode_req], [token_id], eos_id=[5])[0]
+        outs.append(decode_req.match_stop_str(new_text))
+        assert decode_req.stop_str_matched == (len(outs) == 4)
+    assert "".join(outs) == " bca "
+
+
+if __name__ == "__main__":
+    pytest.main()
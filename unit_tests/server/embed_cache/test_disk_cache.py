@@ -0,0 +1,104 @@
+import uuid
+import pytest
+import torch
+from types import SimpleNamespace
+from lightllm.server.embed_cache.impl.disk_cache import DiskEmbedStore, DiskBackedCache, get_disk_cache_namespace
+from lightllm.server.embed_cache.utils import create_embed_shm, read_embed_shm, free_shm, get_shm_name_embed
+
+
+def _create_embed(token_num):
+    name = f"test_embed_{uuid.uuid4().hex}"
+    embed = torch.randn((token_num, 16), dtype=torch.float32).to(torch.bfloat16)
+    create_embed_shm(name, embed)
+    return name, embed
+
+
+def test_write_behind_and_load(tmp_path):
+    store = DiskEmbedStore(str(tmp_path), max_bytes=1 << 20)
+    name, embed = _create_embed(token_num=8)
+    store.write_behind("a" * 32, name)
+    store.write_queue.join()
+    free_shm(name)
+
+    # 重启后从目录中恢复索引
+    store = DiskEmbedStore(str(tmp_path), max_bytes=1 << 20)
+    assert "a" * 32 in store.files
+    load_name = f"test_embed_{uuid.uuid4().hex}"
+    assert not store.load_to_shm("a" * 32, load_name, token_num=4)
+    assert "a" * 32 not in store.files
+
+
+def test_load_and_evict(tmp_path):
+    store = DiskEmbedStore(str(tmp_path), max_bytes=2 * (64 + 8 * 16 * 2))
+    md5sums = ["a" * 32, "b" * 32, "c" * 32]
+    embeds = []
+    for md5sum in md5sums[0:2]:
+        name, embed = _create_embed(token_num=8)
+        store.write_behind(md5sum, name)
+        store.write_queue.join()
+        free_shm(name)
+        embeds.append(embed)
+
+    load_name = f"test_embed_{uuid.uuid4().hex}"
+    assert store.load_to_shm(md5sums[0], load_name, token_num=8)
+    try:
+        assert torch.equal(read_embed_shm(load_name, device="cpu"), embeds[0])
+    finally:
+        free_shm(load_name)
+
+    # 超过大小上限时淘汰最久没有访问的文件
+    name, _ = _create_embed(token_num=8)
+    store.write_behind(md5sums[2], name)
+    store.write_queue.join()
+    free_shm(name)
+    assert list(store.files.keys()) == [md5sums[0], md5sums[2]]
+    assert not store.load_to_shm(md5sums[1], load_name, token_num=8)
+
+
+def _make_args(tmp_path, model_dir):
+    return SimpleNamespace(
+        cache_capacity=4,
+        cache_reserved_ratio=0.5,
+        config_server_host=None,
+        config_server_port=None,
+        embed_cache_disk_dir=str(tmp_path / "embed_cache"),
+        embed_cache_disk_max_gb=1,
+        model_dir=str(model_dir),
+    )
+
+
+def test_namespace(tmp_path):
+    # 同名但路径或者配置不同的模型不能共用一个目录
+    for name in ["v1", "v2"]:
+        (tmp_path / name / "model").mkdir(parents=True)
+        (tmp_path / name / "model" / "config.json").write_text('{"hidden_size": 16}')
+    ns1 = get_disk_cache_namespace(_make_args(tmp_path, tmp_path / "v1" / "model"))
+    ns2 = get_disk_cache_namespace(_make_args(tmp_path, tmp_path / "v2" / "model"))
+    assert ns1.startswith("model_") and ns1 != ns2
+    assert ns1 == get_disk_cache_namespace(_make_args(tmp_path, str(tmp_path / "v1" / "model") + "/"))
+    (tmp_path / "v1" / "model" / "config.json").write_text('{"hidden_size": 32}')
+    assert ns1 != get_disk_cache_namespace(_make_args(tmp_path, tmp_path / "v1" / "model"))
+
+
+def test_disk_backed_cache_alloc(tmp_path):
+    (tmp_path / "model").mkdir()
+    cache = DiskBackedCache(_make_args(tmp_path, tmp_path / "model"))
+    name, embed = _create_embed(token_num=8)
+    cache.disk_store.write_behind("a" * 32, name)
+    cache.disk_store.write_queue.join()
+    free_shm(name)
+
+    records = cache.alloc_many(["a" * 32, "b" * 32], [8, 8])
+    try:
+        assert [cache.get_item_embed(e["id"]) for e in records] == [True, False]
+        assert torch.equal(read_embed_shm(get_shm_name_embed(records[0]["id"]), device="cpu"), embed)
+        assert not cache.loading_events and not cache.pending_load_records
+        # 再次命中时不会重复读取
+        record = cache.alloc("a" * 32, 8)
+        assert record["id"] == records[0]["id"] and "data" not in record
+    finally:
+        free_shm(get_shm_name_embed(records[0]["id"]))
+
+
+if __name__ == "__main__":
+    pytest.main()
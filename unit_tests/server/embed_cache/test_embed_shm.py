@@ -0,0 +1,30 @@
+import uuid
+import pytest
+import torch
+from lightllm.server.embed_cache.utils import create_embed_shm, read_embed_shm, free_shm
+
+
+@pytest.mark.parametrize("dtype", [torch.bfloat16, torch.float16, torch.float32])
+def test_embed_shm_round_trip(dtype):
+    name = f"test_embed_{uuid.uuid4().hex}"
+    embed = torch.randn((16, 3, 8), dtype=torch.float32).to(dtype)
+    create_embed_shm(name, embed[:, 1, :])
+    try:
+        ans = read_embed_shm(name, device="cpu")
+        assert ans.dtype == dtype and ans.shape == (16, 8)
+        assert torch.equal(ans, embed[:, 1, :])
+    finally:
+        free_shm(name)
+
+
+def test_empty_embed_shm():
+    name = f"test_embed_{uuid.uuid4().hex}"
+    create_embed_shm(name, torch.empty((0, 8), dtype=torch.bfloat16))
+    try:
+        assert read_embed_shm(name, device="cpu").shape == (0, 8)
+    finally:
+        free_shm(name)
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,44 @@
+import pytest
+from types import SimpleNamespace
+from lightllm.server.embed_cache.impl.naive_memory_cache import InMemoryCache
+
+
+def _make_cache(capacity):
+    args = SimpleNamespace(
+        cache_capacity=capacity, cache_reserved_ratio=0.5, config_server_host=None, config_server_port=None
+    )
+    return InMemoryCache(args)
+
+
+def test_alloc_many():
+    cache = _make_cache(capacity=3)
+    records = cache.alloc_many(["a", "b", "a"], [4, 8, 4])
+    b_id = records[1]["id"]
+    assert [e["token_num"] for e in records] == [4, 8, 4]
+    assert records[0]["id"] == records[2]["id"] and not records[0]["data"]
+    assert cache.occupied == 2
+
+    cache.set_item_data_many([records[0]["id"]])
+    records = cache.alloc_many(["a"], [4])
+    assert records[0]["data"]
+
+    # 容量不足时整批申请失败，不会留下部分申请的记录
+    assert cache.alloc_many(["c", "d"], [1, 1]) is None
+    assert cache.occupied == 2
+
+    # 释放后可以淘汰不再使用的记录
+    cache.release_many([b_id])
+    records = cache.alloc_many(["c", "d"], [1, 1])
+    assert records is not None and cache.occupied == 3
+    assert cache.query_embed_many([e["id"] for e in records]) == [False, False]
+
+    # 新的数据项数量超过容量时永远无法满足，直接抛出异常而不是返回 None
+    with pytest.raises(ValueError):
+        cache.alloc_many(["e", "f", "g", "h"], [1, 1, 1, 1])
+    # 已经在 cache 中的数据项不计入新的数量
+    cache.release_many([e["id"] for e in records])
+    assert cache.alloc_many(["a", "e", "e", "f"], [4, 1, 1, 1]) is not None
+
+
+if __name__ == "__main__":
+    pytest.main()
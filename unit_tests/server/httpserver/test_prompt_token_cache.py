@@ -0,0 +1,80 @@
+import re
+import asyncio
+import random
+import pytest
+from lightllm.server.httpserver.prompt_token_cache import PromptTokenCache, encode_with_offsets
+
+BOS_ID = 0
+
+
+class _FakeFastTokenizer:
+    """
+    连续的字母会合并成一个 token, 用于模拟前缀末尾的 token 与新追加的文本合并的情况。
+    """
+
+    is_fast = True
+
+    def __init__(self):
+        self.vocab = {}
+        self.encode_char_num = 0
+
+    def __call__(self, text, add_special_tokens=True, return_offsets_mapping=True):
+        self.encode_char_num += len(text)
+        input_ids = [BOS_ID] if add_special_tokens else []
+        offsets = [(0, 0)] if add_special_tokens else []
+        for match in re.finditer(r"[A-Za-z]+|\s+|.", text):
+            input_ids.append(self.vocab.setdefault(match.group(), len(self.vocab) + 1))
+            offsets.append(match.span())
+        return {"input_ids": input_ids, "offset_mapping": offsets}
+
+
+def _encode(cache, tokenizer, prompt, add_special_tokens=True):
+    async def encode_func(text, add_special_tokens):
+        return encode_with_offsets(tokenizer, text, add_special_tokens)
+
+    return asyncio.run(cache.encode(prompt, add_special_tokens, encode_func))
+
+
+def test_multi_turn_prompt():
+    tokenizer = _FakeFastTokenizer()
+    cache = PromptTokenCache(capacity=4, backoff_token_num=4)
+    prompt = "<system> you are a helpful assistant. <user> hello <assistant>"
+    ids, is_hit = _encode(cache, tokenizer, prompt)
+    assert not is_hit and ids == encode_with_offsets(tokenizer, prompt, True)[0]
+
+    for turn in range(5):
+        # 新追加的文本以字母开头，会与前缀末尾的 token 合并
+        prompt = prompt + f"ok{turn} <user> question {turn} <assistant>"
+        tokenizer.encode_char_num = 0
+        ids, is_hit = _encode(cache, tokenizer, prompt)
+        assert is_hit and tokenizer.encode_char_num < len(prompt) // 2
+        assert ids == encode_with_offsets(tokenizer, prompt, True)[0]
+
+    # 完全相同的 prompt 直接返回缓存的结果
+    tokenizer.encode_char_num = 0
+    assert _encode(cache, tokenizer, prompt) == (ids, True)
+    assert tokenizer.encode_char_num == 0
+    assert cache.hit_count == 6 and cache.miss_count == 1
+
+    # add_special_tokens 不同的 prompt 不能复用
+    ids, is_hit = _encode(cache, tokenizer, prompt + " next", add_special_tokens=False)
+    assert not is_hit and ids[0] != BOS_ID
+
+
+def test_random_appends_match_full_tokenize():
+    random.seed(0)
+    tokenizer = _FakeFastTokenizer()
+    cache = PromptTokenCache(capacity=8, backoff_token_num=2)
+    prompts = [""]
+    for _ in range(200):
+        base = random.choice(prompts)
+        prompt = base + "".join(random.choice("ab  .c") for _ in range(random.randint(1, 12)))
+        prompts.append(prompt)
+        ids, _ = _encode(cache, tokenizer, prompt)
+        assert ids == encode_with_offsets(tokenizer, prompt, True)[0]
+    assert len(cache.entries) == 8
+    assert sum(cache.text_len_counts[True].values()) == 8
+
+
+if __name__ == "__main__":
+    pytest.main()
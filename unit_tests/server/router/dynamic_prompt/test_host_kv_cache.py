@@ -0,0 +1,43 @@
+import pytest
+import torch
+from lightllm.server.router.dynamic_prompt.host_kv_cache import HostKvCache
+
+
+class _CpuMemManager:
+    # 使用 cpu tensor 模拟 MemoryManager 的接口，带有 scale_buffer 以覆盖 int8kv 等量化的 mem manager
+    def __init__(self, size):
+        self.kv_buffer = torch.randn((2, size + 1, 4, 8), dtype=torch.float32)
+        self.scale_buffer = torch.randn((2, size + 1, 4, 1), dtype=torch.float32)
+
+    def get_index_kv_buffer(self, index):
+        return {"kv_buffer": self.kv_buffer[:, index], "scale_buffer": self.scale_buffer[:, index]}
+
+
+@pytest.mark.parametrize("staging_token_num", [1, 3, 64])
+def test_offload_and_load(staging_token_num):
+    mem_manager = _CpuMemManager(64)
+    token_bytes = (2 * 4 * 8 + 2 * 4 * 1) * 4
+    host_cache = HostKvCache(32, mem_manager, staging_bytes=staging_token_num * token_bytes)
+    assert host_cache.token_bytes == token_bytes
+    assert host_cache.staging_token_num == min(staging_token_num, 32)
+
+    # host 上的 index 被打乱，gather / scatter 需要按照 index 进行
+    host_cache.free(host_cache.alloc(32)[torch.randperm(32)])
+    gpu_index = torch.randperm(64)[0:10]
+    origin = {k: v.clone() for k, v in mem_manager.get_index_kv_buffer(gpu_index).items()}
+    host_index = host_cache.offload(gpu_index)
+    assert host_cache.can_use_mem_size == 22
+    for name, tensor in origin.items():
+        assert torch.equal(host_cache.host_buffers[name][:, host_index], tensor)
+
+    mem_manager.kv_buffer.fill_(-1)
+    mem_manager.scale_buffer.fill_(-1)
+    new_gpu_index = torch.randperm(64)[0:10]
+    host_cache.load(host_index, new_gpu_index)
+    assert host_cache.can_use_mem_size == 32
+    for name, tensor in mem_manager.get_index_kv_buffer(new_gpu_index).items():
+        assert torch.equal(tensor, origin[name])
+
+
+if __name__ == "__main__":
+    pytest.main()
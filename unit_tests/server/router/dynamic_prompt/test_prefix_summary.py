@@ -0,0 +1,53 @@
+import pytest
+import torch
+import numpy as np
+from lightllm.server.router.dynamic_prompt.radix_cache import RadixCache
+from lightllm.server.router.dynamic_prompt.prefix_summary import (
+    PrefixSummaryReadOnlyClient,
+    compute_prefix_block_hashes,
+    match_block_num_in_sorted_hashes,
+    select_by_prefix_affinity,
+)
+
+
+def test_compute_prefix_block_hashes():
+    token_ids = np.arange(0, 10)
+    hashes = compute_prefix_block_hashes(token_ids, block_size=4)
+    assert len(hashes) == 2 and (hashes != 0).all()
+    # 前缀相同的 block hash 相同，分叉之后的 hash 都不相同
+    other_hashes = compute_prefix_block_hashes([0, 1, 2, 3, 9, 9, 9, 9], block_size=4)
+    assert other_hashes[0] == hashes[0] and other_hashes[1] != hashes[1]
+    assert len(compute_prefix_block_hashes([0, 1, 2], block_size=4)) == 0
+
+    sorted_hashes = np.sort(hashes)
+    assert match_block_num_in_sorted_hashes(sorted_hashes, other_hashes) == 1
+    assert match_block_num_in_sorted_hashes(sorted_hashes, hashes) == 2
+
+
+def test_radix_cache_prefix_summary():
+    tree = RadixCache("unique_name", 100, 4, prefix_summary_block_size=4)
+    client = PrefixSummaryReadOnlyClient("unique_name", node_world_size=5, dp_world_size=4)
+    key = torch.arange(0, 12, dtype=torch.int64)
+    key_hashes = compute_prefix_block_hashes(key.numpy(), block_size=4)
+    tree.insert(key)
+    assert client.match_block_num(1, key_hashes) == 3
+
+    # 分叉后只淘汰 [6, 12) 对应的节点，只有第一个 block 还完整的保留在缓存中
+    tree.insert(torch.tensor([0, 1, 2, 3, 4, 5, 20, 21, 22, 23, 24, 25], dtype=torch.int64))
+    tree.match_prefix(torch.tensor([0, 1, 2, 3, 4, 5, 20], dtype=torch.int64), update_refs=True)
+    tree.evict(6, lambda x: x)
+    assert client.match_block_num(1, key_hashes) == 1
+
+    tree.clear_tree_nodes()
+    assert client.match_block_num(1, key_hashes) == 0
+    return
+
+
+def test_select_by_prefix_affinity():
+    assert select_by_prefix_affinity([0, 4, 2], [0.1, 0.2, 0.1], total_block_num=4, load_weight=1.0) == 1
+    # 负载过高时选择命中较少但是更空闲的目标
+    assert select_by_prefix_affinity([0, 4, 2], [0.1, 0.9, 0.1], total_block_num=4, load_weight=1.0) == 2
+
+
+if __name__ == "__main__":
+    pytest.main()
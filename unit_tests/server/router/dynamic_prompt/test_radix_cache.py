@@ -91,5 +91,62 @@ def test_case4():
     return
 
 
+class _CpuMemManager:
+    # 使用 cpu tensor 模拟 MemoryManager 的接口，用于测试 host kv cache
+    def __init__(self, size):
+        self.size = size
+        self.kv_buffer = torch.arange((size + 1) * 4, dtype=torch.float32).view(1, size + 1, 2, 2)
+        self.mem_state = torch.arange(0, size, dtype=torch.int32)
+        self.mark_start = 0
+        self.can_use_mem_size = size
+
+    def alloc(self, need_size):
+        ans = self.mem_state[self.mark_start : self.mark_start + need_size]
+        self.mark_start += need_size
+        self.can_use_mem_size -= need_size
+        return ans
+
+    def free(self, free_index):
+        self.mem_state[self.mark_start - len(free_index) : self.mark_start] = free_index
+        self.mark_start -= len(free_index)
+        self.can_use_mem_size += len(free_index)
+
+    def get_index_kv_buffer(self, index):
+        return {"kv_buffer": self.kv_buffer[:, index]}
+
+
+def test_case5():
+    mem_manager = _CpuMemManager(10)
+    tree = RadixCache("unique_name", 10, 3, mem_manager=mem_manager, host_cache_token_num=8)
+    key = torch.tensor([0, 1, 2, 3, 4, 5], dtype=torch.int64, device="cpu")
+    value = mem_manager.alloc(6).to(torch.int64)
+    origin_kv = mem_manager.kv_buffer[:, value].clone()
+    assert tree.insert(key, value) == 0
+
+    # 淘汰出 gpu 的节点被转移到 host 上，树结构保持不变
+    tree.free_radix_cache_to_get_enough_token(10)
+    assert mem_manager.can_use_mem_size == 10
+    assert tree.get_tree_total_tokens_num() == 0
+    assert tree.root_node.children[0].is_host_node and tree.root_node.is_leaf()
+
+    # 带引用计数的匹配会将 host 上的节点重新加载回 gpu
+    mem_manager.kv_buffer.fill_(-1)
+    tree_node, size, values = tree.match_prefix(key[0:4], update_refs=True)
+    assert tree_node.node_prefix_total_len == 4 and size == 4
+    assert torch.equal(mem_manager.kv_buffer[:, values], origin_kv[:, 0:4])
+    assert tree.get_host_hit_tokens_num() == 4
+    assert tree.get_tree_total_tokens_num() == 4 and tree.get_refed_tokens_num() == 4
+    tree.dec_node_ref_counter(tree_node)
+
+    # host 缓存空间不足时，按照 lru 淘汰 host 上的叶节点
+    key2 = torch.tensor([7, 8, 9, 10, 11, 12], dtype=torch.int64, device="cpu")
+    tree.insert(key2, mem_manager.alloc(6).to(torch.int64))
+    tree.free_radix_cache_to_get_enough_token(10)
+    assert tree.get_host_evict_tokens_num() == 6
+    assert tree.root_node.children[7].is_host_node and 0 not in tree.root_node.children
+    tree.clear_tree_nodes()
+    return
+
+
 if __name__ == "__main__":
     pytest.main()
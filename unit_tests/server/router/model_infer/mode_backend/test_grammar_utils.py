@@ -0,0 +1,82 @@
+import pytest
+import torch
+from lightllm.server.router.model_infer.mode_backend.grammar_utils import (
+    GrammarCache,
+    TokenBitmaskBuilder,
+    apply_token_bitmask,
+)
+
+
+def test_grammar_cache_lru():
+    compile_texts = []
+
+    def compile_func(text):
+        compile_texts.append(text)
+        return {"compiled": text}
+
+    cache = GrammarCache(capacity=2)
+    a = cache.get_or_compile("json", "a", compile_func)
+    assert cache.get_or_compile("json", "a", compile_func) is a
+    # 不同类型的约束不会共用缓存
+    cache.get_or_compile("regex", "a", compile_func)
+    cache.get_or_compile("json", "b", compile_func)
+    assert compile_texts == ["a", "a", "b"]
+    # ("json", "a") 最久没有被访问，已经被淘汰
+    cache.get_or_compile("json", "a", compile_func)
+    assert compile_texts == ["a", "a", "b", "a"]
+    assert cache.hit_count == 1 and cache.miss_count == 4
+
+
+def test_token_bitmask_builder():
+    vocab_size = 70
+    builder = TokenBitmaskBuilder(vocab_size)
+    bitmask = builder.reset(3)
+    assert bitmask.shape == (3, 3)
+    builder.set_allowed_token_ids(0, [0, 31, 32, 69])
+    builder.set_allowed_token_ids(2, [])
+
+    # 多出的两列模拟词表 padding, 不会被修改
+    logits = torch.zeros((3, vocab_size + 2), dtype=torch.float32)
+    builder.apply(logits, fill_value=-100.0)
+    assert (logits[0, 0:vocab_size] == 0).nonzero().view(-1).tolist() == [0, 31, 32, 69]
+    assert (logits[1] == 0).all()
+    assert (logits[2, 0:vocab_size] == -100.0).all()
+    assert (logits[:, vocab_size:] == 0).all()
+
+    # 复用位图时之前的设置会被清除
+    builder.reset(2)
+    logits = torch.zeros((2, vocab_size), dtype=torch.float32)
+    builder.apply(logits)
+    assert (logits == 0).all()
+
+
+def test_token_bitmask_builder_set_allowed_bitmask():
+    import numpy as np
+
+    vocab_size = 70
+    builder = TokenBitmaskBuilder(vocab_size)
+    builder.reset(2)
+    # 预计算的位图只覆盖前 64 个 token, 超出部分不允许，额外允许 token 66, 超出词表的 id 被忽略
+    words = np.array([1 << 3, 1 << 31], dtype=np.uint32)
+    builder.set_allowed_bitmask(0, words, [66, 1000])
+    logits = torch.zeros((2, vocab_size), dtype=torch.float32)
+    builder.apply(logits, fill_value=-100.0)
+    assert (logits[0] == 0).nonzero().view(-1).tolist() == [3, 63, 66]
+    assert (logits[1] == 0).all()
+
+
+def test_apply_token_bitmask_match_dense_mask():
+    vocab_size = 100
+    allowed = torch.rand((4, vocab_size)) > 0.5
+    builder = TokenBitmaskBuilder(vocab_size)
+    builder.reset(4)
+    for i in range(4):
+        builder.set_allowed_token_ids(i, allowed[i].nonzero().view(-1).tolist())
+    logits = torch.randn((4, vocab_size))
+    expected = logits.masked_fill(~allowed, -1000000.0)
+    apply_token_bitmask(logits, builder.bitmask[0:4])
+    assert torch.equal(logits, expected)
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,55 @@
+import pytest
+from lightllm.server.router.model_infer.mode_backend.ngram_proposer import (
+    NgramIndex,
+    NgramProposer,
+    get_accepted_len,
+)
+
+
+def test_ngram_index_propose():
+    index = NgramIndex(min_n=1, max_n=3)
+    index.extend([1, 2, 3, 4, 5, 9, 2, 3])
+    # 后缀 [2, 3] 之前出现过，后续为 [4, 5, 9]
+    assert index.propose(3) == [4, 5, 9]
+    assert index.propose(10) == [4, 5, 9, 2, 3]
+
+    # 同一个 n-gram 使用最近一次出现的位置
+    index.extend([7, 2, 3, 8, 6, 2, 3])
+    assert index.propose(2) == [8, 6]
+    # 更长的后缀优先匹配
+    index.extend([4, 9, 2, 3])
+    assert index.propose(2) == [7, 2]
+
+    index = NgramIndex(min_n=2, max_n=3)
+    index.extend([1, 2, 3, 4])
+    assert index.propose(2) == []
+
+
+def test_ngram_proposer_incremental():
+    proposer = NgramProposer(spec_step=3, min_n=1, max_n=2)
+    tokens = [10, 11, 12, 13, 10, 11]
+    assert proposer.propose(0, req_id=100, token_ids=tokens) == [12, 13, 10]
+
+    # 增量追加生成的 token
+    tokens += [12, 13]
+    assert proposer.propose(0, req_id=100, token_ids=tokens) == [10, 11, 12]
+
+    # 没有匹配时使用最后一个 token 填充
+    assert proposer.propose(1, req_id=101, token_ids=[5, 6, 7]) == [7, 7, 7]
+    # 匹配的候选不足 spec_step 个时使用最后一个候选填充
+    assert proposer.propose(2, req_id=102, token_ids=[5, 6, 5]) == [6, 5, 5]
+
+    # req_idx 被新的请求复用时重建索引
+    assert proposer.propose(0, req_id=103, token_ids=[1, 2]) == [2, 2, 2]
+    proposer.remove(0)
+    assert 0 not in proposer.indexes
+
+
+def test_get_accepted_len():
+    assert get_accepted_len([4, 5, 6], [4, 5, 6, 7]) == 3
+    assert get_accepted_len([4, 5, 6], [4, 9, 6, 7]) == 1
+    assert get_accepted_len([4, 5, 6], [1, 5, 6, 7]) == 0
+
+
+if __name__ == "__main__":
+    pytest.main()
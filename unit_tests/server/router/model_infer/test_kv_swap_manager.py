@@ -0,0 +1,115 @@
+import pytest
+import torch
+from lightllm.server.router.model_infer.kv_swap_manager import KvSwapCostModel, KvSwapManager
+
+
+class _CpuMemManager:
+    # 使用 cpu tensor 模拟 MemoryManager 的接口，带有 scale_buffer 以覆盖 int8kv 等量化的 mem manager
+    def __init__(self, size):
+        self.size = size
+        self.kv_buffer = torch.randn((2, size + 1, 4, 8), dtype=torch.float32)
+        self.scale_buffer = torch.randn((2, size + 1, 4, 1), dtype=torch.float32)
+        self.mem_state = torch.randperm(size, dtype=torch.int64)
+        self.mark_start = 0
+        self.can_use_mem_size = size
+
+    def alloc(self, need_size):
+        ans = self.mem_state[self.mark_start : self.mark_start + need_size].clone()
+        self.mark_start += need_size
+        self.can_use_mem_size -= need_size
+        return ans
+
+    def free(self, free_index):
+        self.mem_state[self.mark_start - len(free_index) : self.mark_start] = free_index
+        self.mark_start -= len(free_index)
+        self.can_use_mem_size += len(free_index)
+
+    def get_index_kv_buffer(self, index):
+        return {"kv_buffer": self.kv_buffer[:, index], "scale_buffer": self.scale_buffer[:, index]}
+
+
+class _AlwaysSwap(KvSwapCostModel):
+    def should_swap(self, start, end):
+        return end > start
+
+
+def test_swap_round_trip():
+    mem_manager = _CpuMemManager(64)
+    manager = KvSwapManager(32, mem_manager, cost_model=_AlwaysSwap(0))
+    assert manager.token_bytes == (2 * 4 * 8 + 2 * 4 * 1) * 4
+
+    # 两个请求的私有 kv 分别从位置 0 和 5(前 5 个为共享前缀) 开始
+    token_index_a = mem_manager.alloc(10)
+    token_index_b = mem_manager.alloc(12)
+    origin_a = {k: v.clone() for k, v in mem_manager.get_index_kv_buffer(token_index_a).items()}
+    origin_b = {k: v.clone() for k, v in mem_manager.get_index_kv_buffer(token_index_b[5:]).items()}
+    assert manager.should_swap(0, 10) and manager.should_swap(5, 12)
+    manager.swap_out(1, token_index_a, 0)
+    manager.swap_out(2, token_index_b[5:], 5)
+    assert manager.get_swapped_token_num() == 17
+    mem_manager.free(token_index_a)
+    mem_manager.free(token_index_b)
+
+    # 其他请求复用释放的 token 并覆盖 kv
+    other = mem_manager.alloc(40)
+    mem_manager.kv_buffer.fill_(-1)
+    mem_manager.scale_buffer.fill_(-1)
+    mem_manager.free(other)
+
+    assert manager.get_swap_in_len(1, 0) == 10
+    new_index_a = mem_manager.alloc(10)
+    manager.swap_in(1, new_index_a, 0)
+    for name, tensor in mem_manager.get_index_kv_buffer(new_index_a).items():
+        assert torch.equal(tensor, origin_a[name])
+
+    # radix cache 恢复时匹配到的前缀比换出时更长，只换入剩余的部分
+    assert manager.get_swap_in_len(2, 8) == 4
+    new_index_b = mem_manager.alloc(4)
+    manager.swap_in(2, new_index_b, 8)
+    for name, tensor in mem_manager.get_index_kv_buffer(new_index_b).items():
+        assert torch.equal(tensor, origin_b[name][:, 3:])
+
+    assert len(manager.swap_table) == 0
+    assert manager.get_swapped_token_num() == 0
+
+
+def test_swap_capacity_and_drop():
+    mem_manager = _CpuMemManager(64)
+    manager = KvSwapManager(16, mem_manager, cost_model=_AlwaysSwap(0))
+    assert not manager.should_swap(0, 17)
+    manager.swap_out(1, mem_manager.alloc(12), 0)
+    assert not manager.should_swap(0, 5)
+    assert manager.should_swap(0, 4)
+
+    # 恢复时匹配到的前缀比换出的起始位置短，无法拼接，记录被丢弃
+    manager.swap_out(2, mem_manager.alloc(4), 3)
+    assert manager.get_swap_in_len(2, 2) == 0
+    assert 2 not in manager.swap_table
+    # 匹配长度已经覆盖全部换出的 kv
+    manager.swap_out(3, mem_manager.alloc(4), 3)
+    assert manager.get_swap_in_len(3, 7) == 0
+    assert manager.get_swap_in_len(4, 0) == 0
+
+    manager.drop(1)
+    manager.drop(1)
+    assert manager.get_swapped_token_num() == 0
+    assert len(manager.swap_table) == 0
+
+
+def test_cost_model():
+    # 7B 模型 fp16 每个 token 的 kv 大小为 2 * 32 * 4096 * 2 字节
+    cost_model = KvSwapCostModel(2 * 32 * 4096 * 2, pcie_gbps=16.0, prefill_tokens_per_second=10000.0)
+    # 短请求拷贝的固定开销占比大，重新计算
+    assert not cost_model.should_swap(0, 1)
+    assert not cost_model.should_swap(100, 100)
+    # 上下文越长，重新计算 attention 的开销越大
+    assert cost_model.should_swap(0, 4096)
+    assert cost_model.get_recompute_cost_us(4096, 4196) > cost_model.get_recompute_cost_us(0, 100)
+    assert cost_model.get_swap_cost_us(4096, 4196) == cost_model.get_swap_cost_us(0, 100)
+    # pcie 带宽很低时总是重新计算
+    slow_model = KvSwapCostModel(2 * 32 * 4096 * 2, pcie_gbps=0.1, prefill_tokens_per_second=10000.0)
+    assert not slow_model.should_swap(0, 4096)
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,93 @@
+import json
+import random
+import pytest
+from lightllm.server.api_cli import make_argument_parser
+from lightllm.server.router.simulator import Simulator, TraceReq, LatencyModel, load_trace
+
+
+def _make_args(*extra):
+    args = ["--max_total_token_num", "20000", "--max_req_total_len", "6000"] + list(extra)
+    return make_argument_parser().parse_args(args)
+
+
+def _make_trace(req_num, rate, max_new_tokens=-1, seed=0):
+    rand = random.Random(seed)
+    arrival_time = 0.0
+    trace_reqs = []
+    for i in range(req_num):
+        arrival_time += rand.expovariate(rate)
+        trace_reqs.append(
+            TraceReq(
+                arrival_time=arrival_time,
+                input_len=rand.randint(100, 1000),
+                output_len=rand.randint(50, 1000),
+                max_new_tokens=max_new_tokens,
+                prefix_id=f"sys_{i % 2}",
+                prefix_len=200,
+            )
+        )
+    return trace_reqs
+
+
+def test_all_reqs_finished():
+    trace_reqs = _make_trace(60, 5.0)
+    simulator = Simulator(_make_args(), trace_reqs)
+    report = simulator.run()
+    assert report.req_num == 60 and report.rejected_req_num == 0
+    assert simulator.running_batch is None and simulator.req_queue.get_wait_req_num() == 0
+    for record in simulator.req_records.values():
+        assert record.req.shm_cur_output_len == record.req.trace_req.output_len
+        assert record.arrival_time < record.first_token_time <= record.finish_time
+    # 所有请求结束后只剩下 prompt cache 中没有被引用的前缀
+    assert simulator.get_used_tokens(0) == 0
+    assert simulator.mem_manager.get_used_token_num() == 2 * 200
+    # 前缀在第一个计算出它的请求结束后才插入 cache, 之后到达的请求都可以命中
+    assert 0 < report.prompt_cache_hit_token_num <= 58 * 200
+    assert report.pause_event_num == 0
+    assert 0 < report.kv_usage_mean <= report.kv_usage_peak <= 1.0
+    assert report.ttft_ms["p50"] <= report.ttft_ms["p99"]
+
+
+def test_pause_under_tight_kv():
+    # 预估的输出长度远小于实际长度，kv 不足时需要暂停请求
+    trace_reqs = _make_trace(80, 10.0, max_new_tokens=2000)
+    for extra in [(), ("--disable_dynamic_prompt_cache",)]:
+        args = _make_args("--router_token_ratio", "0.99", "--router_max_new_token_len", "32", *extra)
+        simulator = Simulator(args, [TraceReq(**e.__dict__) for e in trace_reqs])
+        report = simulator.run()
+        assert report.req_num == 80
+        assert report.pause_event_num > 0 and report.paused_req_num > 0
+        assert report.recompute_token_num > 0
+        assert report.kv_usage_peak <= 1.0
+        for record in simulator.req_records.values():
+            assert record.req.shm_cur_output_len == record.req.trace_req.output_len
+
+
+def test_reject_and_latency():
+    trace_reqs = [
+        TraceReq(arrival_time=0.0, input_len=100, output_len=10),
+        TraceReq(arrival_time=0.0, input_len=5990, output_len=100),
+    ]
+    latency_model = LatencyModel(prefill_base_ms=100, decode_base_ms=10, decode_ms_per_req=0, decode_ms_per_k_kv=0)
+    report = Simulator(_make_args(), trace_reqs, latency_model).run()
+    assert report.req_num == 1 and report.rejected_req_num == 1
+    assert report.ttft_ms["mean"] == pytest.approx(100 + latency_model.prefill_ms_per_token * 100, rel=0.05)
+    assert report.tpot_ms["mean"] == pytest.approx(10)
+    assert report.slo_attainment == 1.0
+
+
+def test_load_trace(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    lines = [
+        {"timestamp": 12.0, "prompt_len": 64, "completion_tokens": 8},
+        {"arrival_time": 10.0, "input_len": 32, "output_len": 4, "prefix_id": 1, "prefix_len": 100, "other": 1},
+    ]
+    path.write_text("\n".join(json.dumps(e) for e in lines) + "\n")
+    trace_reqs = load_trace(str(path), time_scale=0.5)
+    assert [e.arrival_time for e in trace_reqs] == [0.0, 1.0]
+    assert trace_reqs[0].prefix_id == "1" and trace_reqs[0].prefix_len == 31
+    assert trace_reqs[1].input_len == 64 and trace_reqs[1].get_max_new_tokens() == 8
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,54 @@
+import pytest
+import numpy as np
+from lightllm.server.router.req_queue.batch_admission import BatchAdmission
+
+
+def _sequential_admit_num(cache_len_list, candidates, token_limit, req_num_limit, prefill_token_limit):
+    # 逐个请求重新排序计算峰值的原始判断方式
+    cache_len_list = list(cache_len_list)
+    base_req_num = len(cache_len_list)
+    paused_num = 0
+    prefill_tokens = 0
+    for admit_num, (tuple_tokens, first_router_need_tokens, is_paused) in enumerate(candidates):
+        cache_len_list.append(tuple_tokens)
+        cache_len_list.sort(key=lambda x: -x[1])
+        left_out_len_array = np.array([e[1] for e in cache_len_list])
+        cum_run_len_array = np.cumsum(np.array([e[0] for e in cache_len_list]))
+        size_array = np.arange(1, len(cache_len_list) + 1, 1)
+        need_max_token_num = (left_out_len_array * size_array + cum_run_len_array).max()
+        paused_num += int(is_paused)
+        prefill_tokens += first_router_need_tokens
+        ok_req_num = len(cache_len_list) - base_req_num - paused_num <= req_num_limit
+        if not (need_max_token_num < token_limit and ok_req_num and prefill_tokens <= prefill_token_limit):
+            return admit_num
+    return len(candidates)
+
+
+@pytest.mark.parametrize("seed", list(range(20)))
+def test_batch_admission_same_as_sequential(seed):
+    rng = np.random.default_rng(seed)
+    cache_len_list = [(int(a), int(b)) for a, b in rng.integers(1, 500, size=(rng.integers(0, 30), 2))]
+    candidates = [
+        ((int(rng.integers(1, 500)), int(rng.integers(6, 300))), int(rng.integers(1, 200)), bool(rng.random() < 0.2))
+        for _ in range(rng.integers(1, 60))
+    ]
+    token_limit = int(rng.integers(1000, 40000))
+    req_num_limit = int(rng.integers(0, 50))
+    prefill_token_limit = int(rng.integers(0, 6000))
+
+    admission = BatchAdmission(cache_len_list, token_limit, req_num_limit, prefill_token_limit)
+    # 分两次追加候选请求
+    split = len(candidates) // 2
+    for candidate in candidates[0:split]:
+        admission.add_candidate(*candidate)
+    admission.get_admit_num()
+    for candidate in candidates[split:]:
+        admission.add_candidate(*candidate)
+
+    assert admission.get_admit_num() == _sequential_admit_num(
+        cache_len_list, candidates, token_limit, req_num_limit, prefill_token_limit
+    )
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,66 @@
+import time
+import pytest
+from types import SimpleNamespace
+from lightllm.server.router.req_queue.schedule_policy import build_schedule_policy
+from lightllm.server.router.pause_strategy import build_pause_strategy
+
+
+def _make_req(request_id, start_time, input_len=100, priority=0, ttft_slo_ms=0, kv_len=0, group_req_id=None):
+    sample_params = SimpleNamespace(priority=priority, ttft_slo_ms=ttft_slo_ms, tpot_slo_ms=0)
+    return SimpleNamespace(
+        request_id=request_id,
+        group_req_id=request_id if group_req_id is None else group_req_id,
+        start_time=start_time,
+        input_len=input_len,
+        shm_cur_kv_len=kv_len,
+        shm_cur_output_len=0,
+        sample_params=sample_params,
+    )
+
+
+def _make_args(schedule_policy):
+    return SimpleNamespace(
+        schedule_policy=schedule_policy,
+        default_ttft_slo_ms=3000,
+        default_tpot_slo_ms=100,
+        sjf_aging_tokens_per_second=100.0,
+    )
+
+
+def _ids(reqs):
+    return [req.request_id for req in reqs]
+
+
+def test_schedule_policy_ordering():
+    cur_time = time.time()
+    reqs = [
+        _make_req(0, cur_time - 3, input_len=1000, priority=0),
+        _make_req(1, cur_time - 2, input_len=10, priority=1, ttft_slo_ms=5000),
+        _make_req(2, cur_time - 1, input_len=200, priority=1, ttft_slo_ms=100),
+    ]
+    assert _ids(build_schedule_policy(_make_args("fcfs")).ordering_reqs(reqs)) == [0, 1, 2]
+    # 相同 priority 的请求保持先来先服务
+    assert _ids(build_schedule_policy(_make_args("priority")).ordering_reqs(reqs)) == [1, 2, 0]
+    assert _ids(build_schedule_policy(_make_args("edf")).ordering_reqs(reqs)) == [2, 0, 1]
+    assert _ids(build_schedule_policy(_make_args("sjf")).ordering_reqs(reqs)) == [1, 2, 0]
+
+    # 等待足够长时间的长 prompt 请求会被提前
+    reqs[0].start_time = cur_time - 100
+    assert _ids(build_schedule_policy(_make_args("sjf")).ordering_reqs(reqs))[0] == 0
+
+
+def test_pause_strategy_ordering():
+    cur_time = time.time()
+    reqs = [
+        _make_req(0, cur_time - 3, priority=0, kv_len=300),
+        _make_req(1, cur_time - 2, priority=2, kv_len=100),
+        _make_req(2, cur_time - 1, priority=0, kv_len=200),
+    ]
+    assert _ids(build_pause_strategy(_make_args("fcfs")).ordering_reqs(reqs)) == [2, 1, 0]
+    assert _ids(build_pause_strategy(_make_args("priority")).ordering_reqs(reqs)) == [2, 0, 1]
+    assert _ids(build_pause_strategy(_make_args("edf")).ordering_reqs(reqs)) == [2, 1, 0]
+    assert _ids(build_pause_strategy(_make_args("sjf")).ordering_reqs(reqs)) == [1, 2, 0]
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+import lightllm.server.build_prompt as build_prompt_module
+from lightllm.server.build_prompt import ChatTemplateCache, build_prompt
+
+
+class _FakeTokenizer:
+    def __init__(self):
+        self.render_count = 0
+
+    def apply_chat_template(self, conversation, tokenize=False, add_generation_prompt=True, tools=None):
+        self.render_count += 1
+        return "".join(f"<{m['role']}>{m['content']}" for m in conversation) + "<assistant>"
+
+
+def _make_request(messages):
+    return SimpleNamespace(messages=messages, character_settings=None, role_settings=None, chat_template_kwargs=None)
+
+
+def test_chat_template_cache_lru():
+    cache = ChatTemplateCache(capacity=2)
+    keys = [ChatTemplateCache.get_key({"conversation": [{"role": "user", "content": str(i)}]}, None) for i in range(3)]
+    assert len(set(keys)) == 3
+    cache.put(keys[0], "0")
+    cache.put(keys[1], "1")
+    assert cache.get(keys[0]) == "0"
+    # keys[1] 最久没有被访问，会被淘汰
+    cache.put(keys[2], "2")
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == "0" and cache.get(keys[2]) == "2"
+
+
+def test_chat_template_cache_key():
+    from lightllm.server.api_models import Message, MessageContent
+
+    def make_messages(text):
+        return [
+            Message(role="system", content="hi"),
+            Message(role="user", content=[MessageContent(type="text", text=text)]),
+        ]
+
+    kwargs = {"conversation": make_messages("hello"), "enable_thinking": {"a": [1, 2]}}
+    key = ChatTemplateCache.get_key(kwargs, [{"name": "f"}])
+    assert key == ChatTemplateCache.get_key(dict(kwargs, conversation=make_messages("hello")), [{"name": "f"}])
+    assert key != ChatTemplateCache.get_key(dict(kwargs, conversation=make_messages("hello!")), [{"name": "f"}])
+    assert key != ChatTemplateCache.get_key(kwargs, None)
+    hash(key)
+
+
+def test_build_prompt_hit_cache():
+    tokenizer = _FakeTokenizer()
+    build_prompt_module.tokenizer = tokenizer
+    build_prompt_module.chat_template_cache = ChatTemplateCache(capacity=8)
+    try:
+        messages = [{"role": "system", "content": "hi"}, {"role": "user", "content": "hello"}]
+        prompt = asyncio.run(build_prompt(_make_request(messages), None))
+        assert prompt == "<system>hi<user>hello<assistant>"
+        assert asyncio.run(build_prompt(_make_request(list(messages)), None)) == prompt
+        assert tokenizer.render_count == 1
+
+        # 工具参数不同时不能命中缓存
+        asyncio.run(build_prompt(_make_request(messages), [{"name": "f"}]))
+        assert tokenizer.render_count == 2
+    finally:
+        build_prompt_module.tokenizer = None
+        build_prompt_module.chat_template_cache = None
+
+
+if __name__ == "__main__":
+    pytest.main()
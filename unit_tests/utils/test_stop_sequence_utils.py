@@ -0,0 +1,46 @@
+import random
+import pytest
+from lightllm.utils.stop_sequence_utils import AhoCorasickMatcher, get_stop_sequence_matcher
+
+
+def _first_match_end(patterns, symbols):
+    for end in range(len(symbols)):
+        for pattern in patterns:
+            if end + 1 >= len(pattern) and list(symbols[end + 1 - len(pattern) : end + 1]) == list(pattern):
+                return end
+    return -1
+
+
+def test_token_id_matcher_same_as_brute_force():
+    random.seed(0)
+    for _ in range(200):
+        patterns = [[random.randint(0, 5) for _ in range(random.randint(1, 4))] for _ in range(random.randint(1, 5))]
+        matcher = get_stop_sequence_matcher(tuple(tuple(e) for e in patterns))
+        token_ids = [random.randint(0, 7) for _ in range(random.randint(1, 40))]
+        # 每次输入一个或者多个 token, 与逐个检查输出尾部的结果一致
+        state, fed_len, match_end = AhoCorasickMatcher.ROOT_STATE, 0, -1
+        while fed_len < len(token_ids) and match_end == -1:
+            step_len = random.randint(1, 3)
+            state, match_index = matcher.feed(state, token_ids[fed_len : fed_len + step_len])
+            if match_index != -1:
+                match_end = fed_len + match_index
+            fed_len += step_len
+        assert match_end == _first_match_end(patterns, token_ids)
+
+
+def test_str_matcher():
+    matcher = get_stop_sequence_matcher(("he", "she", "his", "hers"))
+    assert get_stop_sequence_matcher(("he", "she", "his", "hers")) is matcher
+    state, match_index = matcher.feed(AhoCorasickMatcher.ROOT_STATE, "ush")
+    assert match_index == -1
+    # "she" 跨越了两次输入
+    state, match_index = matcher.feed(state, "ers")
+    assert match_index == 0 and matcher.is_match_state(state)
+
+    matcher = AhoCorasickMatcher(["</tool_call>", ""])
+    state, match_index = matcher.feed(AhoCorasickMatcher.ROOT_STATE, "a</tool_</tool_call>b")
+    assert match_index == len("a</tool_</tool_call>") - 1
+
+
+if __name__ == "__main__":
+    pytest.main()